@@ -1,20 +1,48 @@
 import os
 import sys
 import json
-import requests
-from datetime import datetime, timezone
+import atexit
+import hashlib
+import mimetypes
+import shutil
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import wraps
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response, stream_with_context
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_cors import CORS
-from sqlalchemy import text
+from sqlalchemy import select, text, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
-from queue import Queue
-from threading import Lock
+from eth_utils import to_checksum_address
 
 # Import models
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from models.database_models import db, User, RestorationProject, FieldData, CarbonCredit, VerificationReport, ParticipantType, ProjectStatus, EcosystemType
+from models.database_models import db, User, RestorationProject, FieldData, CarbonCredit, VerificationReport, TelemetryPoint, TelemetryRollup, IngestReceipt, UploadJob, MetadataBatch, MetadataRecord, ChainTransaction, ParticipantType, ProjectStatus, EcosystemType
+from realtime.heartbeat import HeartbeatScheduler
+from realtime.broker import SSEBroker, POLICIES, DROP_OLDEST
+from telemetry.store import TelemetryWriter, normalize_point, parse_ts
+from telemetry import wire as telemetry_wire
+from telemetry import rollups as telemetry_rollups
+from telemetry import track as telemetry_track
+from telemetry import dedup as ingest_dedup
+from spatial import point_index
+from spatial import geofence as project_geofence
+from pinning.jobs import UploadJobQueue, SqlJobStore, RetryLater, SUCCEEDED
+from pinning.stream import PinError, copy_hashed
+from pinning.client import pin_result
+from pinning.backends import create_backend
+from pinning.resilience import CircuitBreaker, ResilientBackend
+from pinning.content_cache import ContentCache
+from pinning import merkle
+from pinning import cid_cache
+from pinning.parallel import PinPool
+from pinning.renditions import RenditionPool, is_image, parse_sizes
+from pinning.resumable import ChunkedUploads, OffsetConflict
+from blockchain.connector import BlockchainConnector
+from blockchain.outbox import TransactionOutbox, SqlTxStore
 
 load_dotenv()
 
@@ -36,16 +64,69 @@ CORS(
                 "Authorization",
                 "X-Requested-With",
                 "X-Request-Id",
+                "Upload-Offset",
+                "X-Chunk-SHA256",
             ],
-            "expose_headers": ["X-Request-Id"],
+            "expose_headers": ["X-Request-Id", "Upload-Offset"],
         }
     },
 )
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bluecarbon.db'  # Use SQLite for simplicity
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///bluecarbon.db')  # Use SQLite for simplicity
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your_jwt_secret_key_here')
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
+app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'uploads'))
 app.config['IOT_API_KEY'] = os.getenv('IOT_API_KEY', 'dev-iot-key')
+app.config['TELEMETRY_BATCH_MAX'] = int(os.getenv('TELEMETRY_BATCH_MAX', '50000'))
+app.config['TRACK_MAX_POINTS'] = int(os.getenv('TRACK_MAX_POINTS', '200000'))
+# Caches and local pin storage live here rather than next to the code (backend/data is git-ignored)
+app.config['DATA_DIR'] = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data'))
+app.config['IPFS_UPLOAD_ATTEMPTS'] = int(os.getenv('IPFS_UPLOAD_ATTEMPTS', '2'))
+app.config['IPFS_CONNECT_TIMEOUT'] = float(os.getenv('IPFS_CONNECT_TIMEOUT', '5'))
+app.config['IPFS_READ_TIMEOUT'] = float(os.getenv('IPFS_READ_TIMEOUT', '60'))
+app.config['IPFS_BACKOFF_SECONDS'] = float(os.getenv('IPFS_BACKOFF_SECONDS', '0.5'))
+app.config['IPFS_BACKOFF_MAX_SECONDS'] = float(os.getenv('IPFS_BACKOFF_MAX_SECONDS', '8'))
+app.config['IPFS_BREAKER_FAILURES'] = int(os.getenv('IPFS_BREAKER_FAILURES', '5'))
+app.config['IPFS_BREAKER_RESET_SECONDS'] = float(os.getenv('IPFS_BREAKER_RESET_SECONDS', '30'))
+app.config['IPFS_JOB_MAX_ATTEMPTS'] = int(os.getenv('IPFS_JOB_MAX_ATTEMPTS', '20'))
+# A running job whose process stops renewing it for this long is taken over by another process
+app.config['IPFS_JOB_LEASE_SECONDS'] = float(os.getenv('IPFS_JOB_LEASE_SECONDS', '300'))
+app.config['IPFS_GATEWAY_URL'] = os.getenv('IPFS_GATEWAY_URL', 'https://gateway.pinata.cloud/ipfs')
+app.config['IPFS_CONTENT_CACHE_DIR'] = os.getenv('IPFS_CONTENT_CACHE_DIR',
+                                                os.path.join(app.config['DATA_DIR'], 'ipfs_cache'))
+app.config['IPFS_CONTENT_CACHE_MAX_BYTES'] = int(os.getenv('IPFS_CONTENT_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+# Larger content is not pulled through the cache; the fetch is aborted once it passes this size
+app.config['IPFS_CONTENT_MAX_FETCH_BYTES'] = int(os.getenv('IPFS_CONTENT_MAX_FETCH_BYTES', str(256 * 1024 ** 2)))
+# Behind nginx/Apache, let the front server send cached files (X-Sendfile) instead of the WSGI worker
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+# Field-data metadata is pinned in Merkle batches; 0 seconds pins each submission on its own
+app.config['FIELD_DATA_BATCH_SECONDS'] = float(os.getenv('FIELD_DATA_BATCH_SECONDS', '60'))
+app.config['FIELD_DATA_BATCH_MAX'] = int(os.getenv('FIELD_DATA_BATCH_MAX', '256'))
+app.config['IPFS_SPOOL_MAX_BYTES'] = int(os.getenv('IPFS_SPOOL_MAX_BYTES', str(4 * 1024 * 1024)))
+app.config['IPFS_BACKEND'] = os.getenv('IPFS_BACKEND', 'pinata')
+app.config['IPFS_LOCAL_ROOT'] = os.getenv('IPFS_LOCAL_ROOT', os.path.join(app.config['DATA_DIR'], 'ipfs_store'))
+# CIDs are only valid for the backend that pinned them, so each backend gets its own cache file
+app.config['IPFS_CID_CACHE_PATH'] = os.getenv('IPFS_CID_CACHE_PATH', os.path.join(
+    app.config['DATA_DIR'],
+    'cid_cache.db' if app.config['IPFS_BACKEND'] == 'pinata' else f"cid_cache_{app.config['IPFS_BACKEND']}.db"))
+app.config['IPFS_CID_CACHE_MAX_AGE_DAYS'] = float(os.getenv('IPFS_CID_CACHE_MAX_AGE_DAYS', '30'))
+app.config['UPLOAD_SESSION_MAX_BYTES'] = int(os.getenv('UPLOAD_SESSION_MAX_BYTES', str(2 * 1024 ** 3)))
+app.config['UPLOAD_CHUNK_MAX_BYTES'] = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(16 * 1024 * 1024)))
+app.config['UPLOAD_SESSION_TTL_HOURS'] = float(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24'))
+# Credits are issued on chain through the transaction outbox once a sender key and contract address are set
+app.config['CHAIN_SENDER_PRIVATE_KEY'] = os.getenv('CHAIN_SENDER_PRIVATE_KEY', '')
+app.config['CHAIN_TX_CONFIRMATIONS'] = int(os.getenv('CHAIN_TX_CONFIRMATIONS', '2'))
+app.config['CHAIN_RECEIPT_POLL_SECONDS'] = float(os.getenv('CHAIN_RECEIPT_POLL_SECONDS', '3'))
+app.config['CHAIN_TX_MAX_ATTEMPTS'] = int(os.getenv('CHAIN_TX_MAX_ATTEMPTS', '5'))
+app.config['CHAIN_TX_REBROADCAST_SECONDS'] = float(os.getenv('CHAIN_TX_REBROADCAST_SECONDS', '120'))
+# An intent claimed for signing by a process that stops renewing it this long is handed to another process
+app.config['CHAIN_TX_CLAIM_LEASE_SECONDS'] = float(os.getenv('CHAIN_TX_CLAIM_LEASE_SECONDS', '300'))
+# Usernames allowed to read the /admin/* operational stats; nobody when unset
+app.config['ADMIN_USERNAMES'] = {name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()}
+# On-chain amounts are integers: tonnes of CO2 * 10**CREDIT_AMOUNT_DECIMALS
+app.config['CREDIT_AMOUNT_DECIMALS'] = int(os.getenv('CREDIT_AMOUNT_DECIMALS', '3'))
+# Upload jobs, metadata batches and chain transactions are worked off in the process that serves requests;
+# off for processes that only share the database (scripts, tests)
+app.config['BACKGROUND_WORKERS'] = os.getenv('BACKGROUND_WORKERS', 'true').lower() not in ('0', 'false', 'no')
 
 # Initialize extensions
 db.init_app(app)
@@ -59,101 +140,516 @@ PINATA_SECRET_KEY = os.getenv('PINATA_SECRET_KEY', '')
 PINATA_JWT = os.getenv('PINATA_JWT', '')
 
 # Simple in-memory SSE broadcaster
-class SSEBroker:
-    def __init__(self):
-        self._clients = []
-        self._lock = Lock()
-
-    def subscribe(self) -> Queue:
-        q = Queue(maxsize=100)
-        with self._lock:
-            self._clients.append(q)
-        return q
-
-    def unsubscribe(self, q: Queue):
-        with self._lock:
-            try:
-                self._clients.remove(q)
-            except ValueError:
-                pass
+broker = SSEBroker(
+    maxsize=int(os.getenv('SSE_QUEUE_SIZE', '100')),
+    policy=os.getenv('SSE_BACKPRESSURE_POLICY', DROP_OLDEST),
+    max_drops=int(os.getenv('SSE_MAX_DROPS', '100')),
+)
+# One keep-alive timer for every /sse connection in this process
+heartbeat = HeartbeatScheduler(interval=float(os.getenv('SSE_HEARTBEAT_SECONDS', '15')))
 
-    def publish(self, event: dict):
-        payload = json.dumps(event)
-        with self._lock:
-            clients = list(self._clients)
-        for q in clients:
-            try:
-                q.put_nowait(payload)
-            except Exception:
-                # Drop if client is slow/full
-                pass
+def broadcast_event(event_type: str, payload: dict, key=None):
+    # key lets conflating subscribers keep only the latest event per key (e.g. per device)
+    broker.publish({"type": event_type, "payload": payload}, key=key)
 
-broker = SSEBroker()
+def broadcast_events(event_type: str, payloads: list, keys=None):
+    broker.publish_many([{"type": event_type, "payload": p} for p in payloads], keys=keys)
 
-def broadcast_event(event_type: str, payload: dict):
-    broker.publish({"type": event_type, "payload": payload})
+# Write-behind telemetry persistence: points are group-committed off the request thread
+rollup_engine = telemetry_rollups.RollupEngine()
+track_cache = telemetry_track.TrackCache(
+    maxsize=int(os.getenv('TRACK_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('TRACK_CACHE_TTL', '60')),
+)
+
+def _load_project_boundaries():
+    with app.app_context():
+        return db.session.query(RestorationProject.id, RestorationProject.boundary).filter(
+            RestorationProject.boundary.isnot(None)).all()
+
+# Tags each fix with the project boundary it falls inside; rebuilt lazily after boundary edits
+geofences = project_geofence.GeofenceTracker(_load_project_boundaries)
+
+# Recently ingested idempotency keys; retries are answered from here without any I/O
+recent_keys = ingest_dedup.RecentKeys(capacity=int(os.getenv('INGEST_DEDUP_KEYS', '100000')))
+
+def _drop_stored_duplicates(conn, rows):
+    """Remove rows already stored under the same (device_id, ts) or (device_id, message_id)"""
+    t = TelemetryPoint.__table__
+    devices = {row['device_id'] for row in rows}
+    stored = conn.execute(
+        select(t.c.device_id, t.c.ts, t.c.message_id).where(
+            t.c.device_id.in_(devices),
+            t.c.ts.between(min(row['ts'] for row in rows), max(row['ts'] for row in rows)),
+        )
+    ).all()
+    message_ids = [row['message_id'] for row in rows if row.get('message_id')]
+    if message_ids:
+        stored += conn.execute(
+            select(t.c.device_id, t.c.ts, t.c.message_id).where(
+                t.c.device_id.in_(devices), t.c.message_id.in_(message_ids))
+        ).all()
+    seen_ts = {(r.device_id, r.ts) for r in stored}
+    seen_msg = {(r.device_id, r.message_id) for r in stored if r.message_id}
+    return [row for row in rows
+            if (row['device_id'], row['ts']) not in seen_ts
+            and (row['device_id'], row.get('message_id')) not in seen_msg]
+
+def _write_telemetry_batch(rows):
+    # Two fixes of one device with the same ts or message id would make the unique indexes reject the whole batch
+    unique = ingest_dedup.unique_rows(rows)
+    recent_keys.record_late(len(rows) - len(unique))
+    rows = unique
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(TelemetryPoint.__table__.insert(), rows)
+                # Minute/hour summaries are merged in the same transaction as the raw points
+                staged = rollup_engine.apply(conn, TelemetryRollup.__table__, rows)
+            rollup_engine.commit(staged)
+        except IntegrityError:
+            # A retry got past the in-memory filter (evicted key or restart): the unique
+            # indexes rejected the batch before rollups ran, so drop stored rows and redo it
+            with db.engine.begin() as conn:
+                fresh = _drop_stored_duplicates(conn, rows)
+                recent_keys.record_late(len(rows) - len(fresh))
+                staged = {}
+                if fresh:
+                    conn.execute(TelemetryPoint.__table__.insert(), fresh)
+                    staged = rollup_engine.apply(conn, TelemetryRollup.__table__, fresh)
+            rollup_engine.commit(staged)
+    # Cached tracks of these devices may now be missing fixes
+    track_cache.invalidate_devices({row['device_id'] for row in rows})
+
+def _telemetry_batch_lost(rows):
+    # The points were never stored: a retry of them must not be answered as a duplicate
+    for row in rows:
+        recent_keys.discard(ingest_dedup.telemetry_key(row))
+
+telemetry_writer = TelemetryWriter(
+    _write_telemetry_batch,
+    on_failed=_telemetry_batch_lost,
+    flush_rows=int(os.getenv('TELEMETRY_FLUSH_ROWS', '500')),
+    flush_interval_ms=int(os.getenv('TELEMETRY_FLUSH_MS', '200')),
+    max_queue=int(os.getenv('TELEMETRY_QUEUE_SIZE', '50000')),
+).start()
+# Flush queued points on shutdown
+atexit.register(telemetry_writer.stop)
 
 # IPFS Helper Functions
+# Pinning backend (pinata, daemon or local); HTTP backends share one pooled keep-alive session.
+# Calls retry with jittered backoff; after repeated failures the breaker refuses pins until a probe succeeds.
+ipfs = ResilientBackend(
+    create_backend(app.config['IPFS_BACKEND'], jwt=PINATA_JWT,
+                   addr=os.getenv('IPFS_ADDR', '/ip4/127.0.0.1/tcp/5001'),
+                   root=app.config['IPFS_LOCAL_ROOT'],
+                   pool_size=int(os.getenv('IPFS_HTTP_POOL_SIZE', '16')),
+                   attempts=app.config['IPFS_UPLOAD_ATTEMPTS'],
+                   spool_max=app.config['IPFS_SPOOL_MAX_BYTES'],
+                   timeout=(app.config['IPFS_CONNECT_TIMEOUT'], app.config['IPFS_READ_TIMEOUT']),
+                   backoff=app.config['IPFS_BACKOFF_SECONDS'],
+                   backoff_max=app.config['IPFS_BACKOFF_MAX_SECONDS'],
+                   gateway_url=app.config['IPFS_GATEWAY_URL']),
+    CircuitBreaker(failure_threshold=app.config['IPFS_BREAKER_FAILURES'],
+                   reset_timeout=app.config['IPFS_BREAKER_RESET_SECONDS']),
+)
+atexit.register(ipfs.close)
+
+# Pinned content read back (photos, metadata) is served from local disk after the first fetch
+content_cache = ContentCache(app.config['IPFS_CONTENT_CACHE_DIR'], ipfs.fetch,
+                             max_bytes=app.config['IPFS_CONTENT_CACHE_MAX_BYTES'],
+                             max_entry_bytes=app.config['IPFS_CONTENT_MAX_FETCH_BYTES'])
+
+# Content already pinned (same SHA-256) is answered from here instead of being uploaded again
+pin_cache = cid_cache.CidCache(app.config['IPFS_CID_CACHE_PATH'],
+                               max_age=app.config['IPFS_CID_CACHE_MAX_AGE_DAYS'] * 86400)
+
+def pin_file(source, filename, content_type='application/octet-stream', sha256=None):
+    """Stream a file object to the pinning backend in bounded chunks; returns a pin result dict (see pinning.client).
+
+    When the content hash is known up front and already pinned, the cached CID is returned without uploading.
+    """
+    if sha256:
+        cid = pin_cache.get(cid_cache.FILE, sha256)
+        if cid:
+            return pin_result('file', filename, True, cid=cid, sha256=sha256, cached=True)
+    result = ipfs.pin_file(source, filename, content_type=content_type)
+    if result['ok']:
+        pin_cache.put(cid_cache.FILE, result['sha256'], result['cid'], result['size'])
+    return result
+
 def upload_to_ipfs(file_path, filename):
-    """Upload file to IPFS via Pinata"""
+    """Upload file to IPFS via the configured backend; returns a pin result dict"""
     try:
-        url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
-        
+        sha256 = cid_cache.sha256_file(file_path)
         with open(file_path, 'rb') as file:
-            files = {'file': (filename, file)}
-            
-            headers = {
-                'Authorization': f'Bearer {PINATA_JWT}'
-            }
-            
-            response = requests.post(url, files=files, headers=headers, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['IpfsHash']
-            else:
-                print(f"IPFS upload failed: {response.text}")
-                return None
-    except Exception as e:
-        print(f"IPFS upload error: {str(e)}")
-        return None
+            return pin_file(file, filename, sha256=sha256)
+    except OSError as e:
+        return pin_result('file', filename, False, error=f'cannot read {filename}: {e}')
 
 def upload_json_to_ipfs(json_data, filename):
-    """Upload JSON data to IPFS via Pinata"""
+    """Upload JSON data to IPFS via the configured backend; returns a pin result dict"""
+    content = cid_cache.canonical_json(json_data)
+    sha256 = hashlib.sha256(content).hexdigest()
+    cached = pin_cache.get(cid_cache.JSON, sha256)
+    if cached:
+        return pin_result('json', filename, True, cid=cached, sha256=sha256, cached=True)
+    result = ipfs.pin_json(json_data, filename, size=len(content))
+    result['sha256'] = sha256
+    if result['ok']:
+        pin_cache.put(cid_cache.JSON, sha256, result['cid'], len(content))
+    return result
+
+# Resumable uploads for flaky mobile links: chunks land in a staging file, finalised files go to an upload job
+chunked_uploads = ChunkedUploads(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'sessions'),
+    max_size=app.config['UPLOAD_SESSION_MAX_BYTES'],
+    max_chunk=app.config['UPLOAD_CHUNK_MAX_BYTES'],
+    ttl=app.config['UPLOAD_SESSION_TTL_HOURS'] * 3600,
+)
+
+# Background upload jobs: endpoints stage files and return 202, workers do the pinning round trips.
+# With IPFS_UPLOAD_WORKERS=0 the handlers run inline instead, piping the request streams straight to the backend.
+def _stage_files(files, upload_ids=(), owner=None):
+    """Copy uploaded files (hashing on the way) and move finalised chunked uploads into a per-job staging
+    directory; returns (staging_dir, items). Raises LookupError/ValueError for an unusable upload id.
+    """
+    upload_dir = app.config.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(__file__), 'uploads')
+    staging_dir = os.path.join(upload_dir, 'jobs', uuid.uuid4().hex)
+    os.makedirs(staging_dir, exist_ok=True)
+    staged = []
     try:
-        url = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
-        
-        headers = {
-            'Authorization': f'Bearer {PINATA_JWT}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            "pinataContent": json_data,
-            "pinataMetadata": {
-                "name": filename
-            }
-        }
+        for i, file in enumerate(files):
+            filename = secure_filename(file.filename) or f'file_{i}'
+            path = os.path.join(staging_dir, f'{i}_{filename}')
+            item = {'path': path, 'filename': filename, 'content_type': file.mimetype or 'application/octet-stream'}
+            item.update(copy_hashed(file.stream, path))
+            staged.append(item)
+        for upload_id in upload_ids:
+            # Already on disk and hashed: the assembled file is moved, not copied
+            staged.append(chunked_uploads.take(upload_id, owner, staging_dir))
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return staging_dir, staged
 
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+def _stream_items(files):
+    """Describe uploaded files for inline pinning from Werkzeug's spooled copies, without staging them again"""
+    return [{'stream': file.stream, 'filename': secure_filename(file.filename) or f'file_{i}',
+             'content_type': file.mimetype or 'application/octet-stream'} for i, file in enumerate(files)]
 
-        if response.status_code == 200:
-            result = response.json()
-            return result['IpfsHash']
+def _raise_for_pin(result, message):
+    if result.get('circuit_open'):
+        # Pinning is down: the job goes back to the queue instead of failing
+        raise RetryLater(result['retry_after'], result['error'])
+    raise PinError(message)
+
+def _pin_item(item):
+    """Pin a staged or streamed upload item; returns the IPFS hash, raises PinError or RetryLater"""
+    if item.get('stream') is not None:
+        result = pin_file(item['stream'], item['filename'], item['content_type'])
+    else:
+        with open(item['path'], 'rb') as file:
+            result = pin_file(file, item['filename'], item.get('content_type', 'application/octet-stream'),
+                              sha256=item.get('sha256'))
+    if not result['ok']:
+        _raise_for_pin(result, result['error'])
+    return result['cid']
+
+def _pin_metadata(metadata, filename):
+    result = upload_json_to_ipfs(metadata, filename)
+    if not result['ok']:
+        _raise_for_pin(result, f"IPFS metadata upload failed: {result['error']}")
+    return result['cid']
+
+# Global cap on concurrent pins across all jobs, plus a per-submission cap
+pin_pool = PinPool(max_workers=int(os.getenv('IPFS_PIN_CONCURRENCY', '8')),
+                   per_request=int(os.getenv('IPFS_PIN_PER_REQUEST', '4')))
+
+# Size-capped web copy and thumbnail of each photo, rendered in worker processes (0 processes disables)
+image_renditions = RenditionPool(processes=int(os.getenv('IMAGE_RENDITION_PROCESSES', '2')),
+                                 sizes=parse_sizes(os.getenv('IMAGE_RENDITION_SIZES', 'web:1600,thumb:320')))
+atexit.register(image_renditions.shutdown)
+
+def _wants_renditions(item):
+    return image_renditions.enabled and is_image(item.get('content_type'), item.get('filename', ''))
+
+def _pin_image(item):
+    """Pin an upload item and, for staged photos, its renditions; returns {'cid', 'renditions': {name: cid}}.
+
+    The original is pinned while a worker process renders. A photo that cannot be decoded or whose
+    renditions fail to pin is still stored; the reason is reported as 'rendition_error'.
+    """
+    render = None
+    if item.get('path') and _wants_renditions(item):
+        render = image_renditions.submit(item['path'], os.path.dirname(item['path']))
+    pinned = {'cid': _pin_item(item), 'renditions': {}}
+    if render is None:
+        return pinned
+    rendered, error = image_renditions.collect(render, item.get('size') or os.path.getsize(item['path']))
+    stem = os.path.splitext(item['filename'])[0]
+    for name, rendition in (rendered or {}).get('renditions', {}).items():
+        with open(rendition['path'], 'rb') as file:
+            result = pin_file(file, f'{stem}.{name}.jpg', 'image/jpeg', sha256=rendition['sha256'])
+        if result['ok']:
+            pinned['renditions'][name] = result['cid']
         else:
-            print(f"IPFS JSON upload failed: {response.text}")
-            return None
-    except Exception as e:
-        print(f"IPFS JSON upload error: {str(e)}")
-        return None
+            error = result['error']
+    if error:
+        pinned['rendition_error'] = error
+    return pinned
+
+def _run_project_upload(job_id, payload):
+    photo = _pin_image(payload['files'][0]) if payload['files'] else {'cid': None, 'renditions': {}}
+    ipfs_hash = photo['cid']
+    metadata = dict(payload['metadata'], photo_ipfs_hash=ipfs_hash, photo_renditions=photo['renditions'])
+    with app.app_context():
+        project = db.session.get(RestorationProject, payload['project_id'])
+        if project is not None and ipfs_hash:
+            project.ipfs_hash = ipfs_hash
+            project.photo_renditions = json.dumps(photo['renditions']) if photo['renditions'] else None
+            db.session.commit()
+    metadata_hash = _pin_metadata(metadata, f"{metadata['name']}_metadata.json")
+    with app.app_context():
+        project = db.session.get(RestorationProject, payload['project_id'])
+        if project is not None:
+            project.metadata_hash = metadata_hash
+            db.session.commit()
+    return {'project_id': payload['project_id'], 'ipfs_hash': ipfs_hash, 'photo_renditions': photo['renditions'],
+            'metadata_hash': metadata_hash}
+
+def _run_iot_photo_upload(job_id, payload):
+    photo = _pin_image(payload['files'][0])
+    ipfs_hash = photo['cid']
+    if payload.get('dedup_key'):
+        with app.app_context():
+            IngestReceipt.query.filter_by(kind='photo', device_id=payload['device_id'],
+                                          dedup_key=payload['dedup_key']).update({'ipfs_hash': ipfs_hash})
+            db.session.commit()
+        recent_keys.remember(('photo', payload['device_id'], payload['dedup_key']),
+                             {'job_id': job_id, 'ipfs_hash': ipfs_hash, 'photo_renditions': photo['renditions']})
+    event = {key: payload.get(key) for key in ('device_id', 'project_id', 'lat', 'lon', 'ts')}
+    event['photo_ipfs'] = ipfs_hash
+    event['photo_renditions'] = photo['renditions']
+    broadcast_event('iot_photo', event)
+    return {'ipfs_hash': ipfs_hash, 'photo_renditions': photo['renditions']}
+
+def _run_field_data_upload(job_id, payload):
+    # Images are pinned concurrently; the metadata pin starts as soon as the last one settles
+    image_hashes = []
+    renditions = []
+    failed_images = []
+    for item, (ok, value) in zip(payload['files'], pin_pool.map_ordered(_pin_image, payload['files'])):
+        if ok:
+            image_hashes.append(value['cid'])
+            renditions.append(value['renditions'])
+        elif not isinstance(value, (OSError, RuntimeError)):
+            raise value
+        else:
+            # Same as the synchronous path: a failed image does not fail the submission
+            failed_images.append({'filename': item['filename'], 'error': str(value)})
+    # image_renditions[i] holds the web/thumbnail CIDs of images[i]
+    metadata = dict(payload['metadata'], images=image_hashes, image_renditions=renditions)
+    result = {'images': image_hashes, 'image_renditions': renditions, 'image_count': len(image_hashes),
+              'failed_images': failed_images}
+    if metadata_batcher is None:
+        result['metadata_hash'] = _pin_metadata(metadata, f"field_data_metadata_{metadata['collected_at']}.json")
+        return result
+    # The metadata goes out with the next batch; the record then carries its batch CID and inclusion proof
+    record = metadata_batcher.add(metadata, job_id=job_id)
+    result.update(record, metadata_hash=None, record_url=f"/field-data/records/{record['record_id']}")
+    return result
+
+def _metadata_batch_pinned(batch):
+    broadcast_event('field_data_batch', batch)
+
+metadata_batcher = None
+if app.config['FIELD_DATA_BATCH_SECONDS'] > 0:
+    metadata_batcher = merkle.MetadataBatcher(
+        merkle.SqlBatchStore(app, db, MetadataRecord, MetadataBatch),
+        _pin_metadata,
+        max_records=app.config['FIELD_DATA_BATCH_MAX'],
+        interval=app.config['FIELD_DATA_BATCH_SECONDS'],
+        on_pinned=_metadata_batch_pinned,
+    )
+    # Pin whatever is pending on shutdown
+    atexit.register(metadata_batcher.stop)
+
+def _upload_job_finished(job):
+    payload = job['payload']
+    if payload.get('staging_dir'):
+        shutil.rmtree(payload['staging_dir'], ignore_errors=True)
+    if job['kind'] == 'iot_photo' and job['status'] != SUCCEEDED and payload.get('dedup_key'):
+        # Forget the message so the gateway's retry is accepted instead of reported as a duplicate
+        recent_keys.discard(('photo', payload['device_id'], payload['dedup_key']))
+        with app.app_context():
+            IngestReceipt.query.filter_by(kind='photo', device_id=payload['device_id'],
+                                          dedup_key=payload['dedup_key']).delete()
+            db.session.commit()
+    broadcast_event('upload_job', {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'result': job.get('result'),
+        'error': job.get('error'),
+    })
+
+upload_jobs = UploadJobQueue(
+    SqlJobStore(app, db, UploadJob),
+    handlers={
+        'project': _run_project_upload,
+        'iot_photo': _run_iot_photo_upload,
+        'field_data': _run_field_data_upload,
+    },
+    on_finish=_upload_job_finished,
+    workers=int(os.getenv('IPFS_UPLOAD_WORKERS', '4')),
+    max_attempts=app.config['IPFS_JOB_MAX_ATTEMPTS'],
+    lease=app.config['IPFS_JOB_LEASE_SECONDS'],
+)
+
+def _chain_tx_updated(tx):
+    if tx['kind'] == 'carbon_credit' and tx['ref_id'] is not None:
+        fields = {'tx_hash': tx['tx_hash'], 'chain_status': tx['status']}
+        for event in (tx['result'] or {}).get('events', []):
+            if event['event'] == 'CreditIssued':
+                fields['token_id'] = event['args']['id']
+        with app.app_context():
+            CarbonCredit.query.filter_by(id=tx['ref_id']).update(fields)
+            db.session.commit()
+    broadcast_event('chain_tx', {
+        'tx_id': tx['id'],
+        'kind': tx['kind'],
+        'ref_id': tx['ref_id'],
+        'status': tx['status'],
+        'tx_hash': tx['tx_hash'],
+        'block_number': tx['block_number'],
+        'confirmations': tx['confirmations'],
+        'result': tx['result'],
+        'error': tx['error'],
+    }, key=tx['id'])
+
+chain_outbox = None
+if app.config['CHAIN_SENDER_PRIVATE_KEY'] and os.getenv('CARBON_CREDIT_ADDRESS'):
+    # The connector is created on first use, so the API starts (and records intents) while the node is down
+    chain_outbox = TransactionOutbox(
+        SqlTxStore(app, db, ChainTransaction),
+        BlockchainConnector,
+        app.config['CHAIN_SENDER_PRIVATE_KEY'],
+        confirmations=app.config['CHAIN_TX_CONFIRMATIONS'],
+        poll_interval=app.config['CHAIN_RECEIPT_POLL_SECONDS'],
+        max_attempts=app.config['CHAIN_TX_MAX_ATTEMPTS'],
+        rebroadcast_after=app.config['CHAIN_TX_REBROADCAST_SECONDS'],
+        claim_lease=app.config['CHAIN_TX_CLAIM_LEASE_SECONDS'],
+        on_update=_chain_tx_updated,
+    )
+    atexit.register(chain_outbox.stop)
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_workers():
+    """Start the upload queue, metadata batcher and transaction outbox in this process (once).
+
+    Each resumes the work left in the database by a stopped process: queued uploads, pending metadata
+    records and unconfirmed transactions.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        upload_jobs.start()
+        if metadata_batcher is not None:
+            metadata_batcher.start()
+        if chain_outbox is not None:
+            chain_outbox.start()
+        _background_started = True
+
+@app.before_request
+def _ensure_background_workers():
+    # Runs in whichever process serves the request: the reloader child under `flask run --debug`,
+    # each worker after a gunicorn fork. Threads started before a fork would not survive into the worker.
+    if not _background_started and app.config['BACKGROUND_WORKERS']:
+        start_background_workers()
+
+def _dispatch_upload(kind, payload, files, job_id=None, upload_ids=(), owner=None, **extra):
+    """Queue an upload job (202 + job id), or with no workers configured run it inline (201 + result).
+
+    upload_ids name finalised chunked uploads (see /uploads) that are pinned after the multipart files.
+    owner is the submitting user's id; only they can read the job at /upload-jobs/<job_id>.
+    """
+    if owner is not None:
+        payload['owner'] = owner
+    if upload_jobs.workers:
+        payload['staging_dir'], payload['files'] = _stage_files(files, upload_ids, owner)
+        job_id = upload_jobs.submit(kind, payload, job_id=job_id)
+        body = {'job_id': job_id, 'status': 'queued', 'status_url': f'/upload-jobs/{job_id}'}
+        body.update(extra)
+        return jsonify(body), 202
+    if upload_ids or any(_wants_renditions({'content_type': f.mimetype, 'filename': f.filename or ''})
+                         for f in files):
+        # Photos have to be on disk for the rendition workers to read them; chunked uploads already are
+        payload['staging_dir'], payload['files'] = _stage_files(files, upload_ids, owner)
+    else:
+        payload['files'] = _stream_items(files)
+    job = upload_jobs.run_inline(kind, payload, job_id=job_id)
+    if job.get('retry_after') is not None:
+        # No queue to defer to: tell the client when pinning is worth trying again
+        response = jsonify({'message': f"IPFS upload deferred: {job['error']}"})
+        response.headers['Retry-After'] = str(max(1, int(job['retry_after'] + 0.5)))
+        return response, 503
+    if job['status'] != SUCCEEDED:
+        return jsonify({'message': f"IPFS upload failed: {job['error']}"}), 502
+    body = dict(job['result'])
+    body.update(extra)
+    return jsonify(body), 201
 
 # Database initialization
 def create_tables():
     """Create all database tables"""
     with app.app_context():
         db.create_all()
+        ensure_added_columns()
+        ensure_ingest_indexes()
+        ensure_spatial_indexes()
         print("Database tables created successfully!")
 
+def ensure_added_columns():
+    """Add nullable columns introduced after a table was first created (create_all skips existing tables)"""
+    inspector = sa_inspect(db.engine)
+    with db.engine.begin() as conn:
+        for model, names in ((TelemetryPoint, ('message_id', 'inside_project_id')),
+                             (RestorationProject, ('boundary', 'photo_renditions')),
+                             (IngestReceipt, ('job_id',)),
+                             (CarbonCredit, ('tx_hash', 'chain_status'))):
+            existing = {c['name'] for c in inspector.get_columns(model.__tablename__)}
+            for name in names:
+                if name not in existing:
+                    column_type = model.__table__.c[name].type.compile(dialect=db.engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {name} {column_type}"))
+
+def ensure_ingest_indexes():
+    """Add the idempotency indexes to telemetry tables created before they existed"""
+    for index in TelemetryPoint.__table__.indexes:
+        try:
+            index.create(db.engine, checkfirst=True)
+        except IntegrityError:
+            print(f"Warning: {index.name} not created, existing telemetry has duplicate keys")
+    # Superseded by the unique (device_id, ts) index
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_telemetry_device_ts"))
+
+def ensure_spatial_indexes():
+    """Create the R*Tree point indexes behind the nearby/bbox queries (SQLite only)"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    conn = db.engine.raw_connection()
+    try:
+        point_index.ensure_point_index(conn, RestorationProject.__tablename__, 'latitude', 'longitude')
+        point_index.ensure_point_index(conn, FieldData.__tablename__, 'latitude', 'longitude')
+        conn.commit()
+    finally:
+        conn.close()
+
 # Registration endpoint
 @app.route('/register', methods=['POST'])
 def register():
@@ -212,10 +708,18 @@ def health():
     try:
         # Test database connection
         db.session.execute(text('SELECT 1'))
+        # Pinning being down degrades uploads (they queue up) but does not take the API down
+        pinning = ipfs.stats()
+        breaker = pinning['breaker']
         return jsonify({
-            "status": "healthy",
+            "status": "healthy" if breaker['state'] == 'closed' else "degraded",
             "message": "Backend services operational",
             "database": "connected",
+            "ipfs": {
+                "backend": pinning['backend'],
+                "breaker": breaker,
+                "latency_ms": {kind: calls['latency_ms'] for kind, calls in pinning['by_kind'].items()},
+            },
             "timestamp": datetime.now(timezone.utc).isoformat()
         }), 200
     except Exception as e:
@@ -236,6 +740,34 @@ def protected():
         'username': claims.get('username')
     }), 200
 
+def _current_user():
+    identity = get_jwt_identity()
+    return db.session.get(User, int(identity)) if identity and str(identity).isdigit() else None
+
+def roles_required(*participant_types):
+    """jwt_required() plus a participant_type check against the user row (token claims may be stale); 403 otherwise"""
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            user = _current_user()
+            if user is None or user.participant_type not in participant_types:
+                return jsonify({"msg": "Not permitted for this account type"}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def admin_required(fn):
+    """jwt_required() plus membership of ADMIN_USERNAMES, checked against the user row; 403 otherwise"""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        user = _current_user()
+        if user is None or user.username not in app.config['ADMIN_USERNAMES']:
+            return jsonify({"msg": "Administrators only"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
 # Routes
 @app.route('/')
 def index():
@@ -246,7 +778,28 @@ def index():
 @app.route('/projects', methods=['GET'])
 def get_projects():
     projects = RestorationProject.query.all()
-    return {"projects": [{"id": p.id, "name": p.name, "location": p.location, "area_hectares": p.area_hectares, "description": p.description, "latitude": p.latitude, "longitude": p.longitude, "ipfs_hash": p.ipfs_hash} for p in projects]}
+    return {"projects": [{"id": p.id, "name": p.name, "location": p.location, "area_hectares": p.area_hectares, "description": p.description, "latitude": p.latitude, "longitude": p.longitude, "ipfs_hash": p.ipfs_hash, "photo_renditions": json.loads(p.photo_renditions) if p.photo_renditions else None, "boundary": json.loads(p.boundary) if p.boundary else None} for p in projects]}
+
+@app.route('/projects/nearby', methods=['GET'])
+def get_projects_nearby():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', 10.0, type=float)
+    limit = request.args.get('limit', 50, type=int)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"message": "lat and lon are required and must be valid coordinates"}), 400
+    if not (0 < radius_km <= 20000):
+        return jsonify({"message": "radius_km must be between 0 and 20000"}), 400
+
+    table = RestorationProject.__tablename__
+    sql, params = point_index.where_in_bbox(table, 'latitude', 'longitude', point_index.radius_bbox(lat, lon, radius_km),
+                                            paramstyle='named')
+    rows = db.session.execute(
+        text(f"SELECT id, name, location, area_hectares, description, latitude, longitude, ipfs_hash FROM {table} WHERE {sql}"),
+        params,
+    ).mappings().all()
+    projects = point_index.within_radius(rows, lat, lon, radius_km, limit=limit)
+    return jsonify({"projects": projects, "total": len(projects), "center": {"lat": lat, "lon": lon}, "radius_km": radius_km})
 
 @app.route('/projects', methods=['POST'])
 @jwt_required(optional=True)
@@ -254,6 +807,13 @@ def add_project():
     data = request.get_json(silent=True) or {}
     identity = get_jwt_identity()
     created_by_id = int(identity) if identity and str(identity).isdigit() else None
+    boundary = data.get('boundary')
+    if boundary is not None:
+        try:
+            project_geofence.parse_boundary(boundary)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        boundary = boundary if isinstance(boundary, str) else json.dumps(boundary)
     try:
         eco_value = str(data.get('ecosystem_type', 'mangrove')).lower()
         eco_map = {et.value: et for et in EcosystemType}
@@ -266,11 +826,14 @@ def add_project():
             description=data.get('description'),
             latitude=float(data.get('latitude', 0) or 0),
             longitude=float(data.get('longitude', 0) or 0),
+            boundary=boundary,
             ecosystem_type=eco_enum,
             created_by=(created_by_id or 1)
         )
         db.session.add(project)
         db.session.commit()
+        if boundary:
+            geofences.invalidate()
         broadcast_event('project_created', {
             'id': project.id,
             'name': project.name,
@@ -285,6 +848,25 @@ def add_project():
         db.session.rollback()
         return jsonify({"message": f"Failed to add project: {str(e)}"}), 500
 
+@app.route('/projects/<int:project_id>/boundary', methods=['PUT'])
+@jwt_required()
+def set_project_boundary(project_id):
+    project = db.session.get(RestorationProject, project_id)
+    if project is None:
+        return jsonify({"message": "Project not found"}), 404
+    data = request.get_json(silent=True) or {}
+    boundary = data.get('boundary')
+    if boundary is not None:
+        try:
+            project_geofence.parse_boundary(boundary)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        boundary = boundary if isinstance(boundary, str) else json.dumps(boundary)
+    project.boundary = boundary
+    db.session.commit()
+    geofences.invalidate()
+    return jsonify({"message": "Boundary updated" if boundary else "Boundary cleared", "id": project.id}), 200
+
 
 # Stakeholders
 @app.route('/stakeholders', methods=['GET'])
@@ -325,23 +907,48 @@ def get_carbon_credits():
         "issued_to": c.issued_to,
         "issued_at": c.issued_at.isoformat() if c.issued_at else None,
         "retired": c.retired,
+        "token_id": c.token_id,
+        "tx_hash": c.tx_hash,
+        "chain_status": c.chain_status,
     } for c in credits]}
 
+# Issuing mints tokens from the server's signing account, so only verifiers may do it
 @app.route('/carbon-credits', methods=['POST'])
+@roles_required(ParticipantType.VALIDATOR)
 def add_carbon_credit():
     data = request.get_json(silent=True) or {}
     required = ['project_id', 'amount', 'vintage_year', 'verification_standard', 'issued_to']
     if any(k not in data for k in required):
         return jsonify({"msg": "project_id, amount, vintage_year, verification_standard, issued_to required"}), 400
+    if chain_outbox is not None:
+        project = db.session.get(RestorationProject, int(data['project_id']))
+        owner = db.session.get(User, int(data['issued_to']))
+        if project is None or owner is None:
+            return jsonify({"msg": "Unknown project_id or issued_to"}), 404
+        try:
+            wallet = to_checksum_address(owner.wallet_address or '')
+        except ValueError:
+            return jsonify({"msg": "issued_to has no valid wallet_address to issue the credit to"}), 400
     credit = CarbonCredit(
         project_id=int(data['project_id']),
         amount=float(data['amount']),
         vintage_year=int(data['vintage_year']),
         verification_standard=str(data['verification_standard']),
-        issued_to=int(data['issued_to'])
+        issued_to=int(data['issued_to']),
+        chain_status='pending' if chain_outbox is not None else None
     )
     db.session.add(credit)
+    chain_tx_id = None
+    if chain_outbox is not None:
+        # The intent commits with the credit, so there is never a pending credit without one (or vice versa).
+        # It is signed, sent and confirmed in the background; the credit row and SSE follow the transaction.
+        db.session.flush()
+        on_chain_amount = int(round(credit.amount * 10 ** app.config['CREDIT_AMOUNT_DECIMALS']))
+        chain_tx_id = chain_outbox.stage('carbon_credit', 'issueCredit', [wallet, on_chain_amount, project.name],
+                                         ref_id=credit.id)
     db.session.commit()
+    if chain_tx_id is not None:
+        chain_outbox.enqueue(chain_tx_id)
     broadcast_event('carbon_credit_issued', {
         'id': credit.id,
         'project_id': credit.project_id,
@@ -349,9 +956,15 @@ def add_carbon_credit():
         'vintage_year': credit.vintage_year,
         'verification_standard': credit.verification_standard,
         'issued_to': credit.issued_to,
-        'issued_at': credit.issued_at.isoformat() if credit.issued_at else None
+        'issued_at': credit.issued_at.isoformat() if credit.issued_at else None,
+        'chain_status': credit.chain_status,
+        'chain_tx_id': chain_tx_id,
     })
-    return jsonify({"message": "Carbon credit added", "id": credit.id}), 201
+    body = {"message": "Carbon credit added", "id": credit.id}
+    if chain_tx_id is not None:
+        body.update(chain_status=credit.chain_status, chain_tx_id=chain_tx_id,
+                    status_url=f'/chain-transactions/{chain_tx_id}')
+    return jsonify(body), 201
 
 # Carbon Credit Blockchain Endpoints
 """
@@ -382,30 +995,20 @@ def upload_project():
     longitude = request.form.get('longitude')
     ecosystem_type = request.form.get('ecosystem_type', 'mangrove')
     photo = request.files.get('photo')
+    # A photo sent through /uploads instead of inline
+    photo_upload_id = request.form.get('photo_upload_id')
 
     if not all([name, location, area_hectares, latitude, longitude]):
         return jsonify({'message': 'Missing required fields'}), 400
+    if photo_upload_id and photo and photo.filename:
+        return jsonify({'message': 'Send either photo or photo_upload_id, not both'}), 400
+    upload_ids = [photo_upload_id] if photo_upload_id else []
+    error = _check_finalised_uploads(upload_ids, str(current_user))
+    if error:
+        return jsonify({'message': error}), 409
 
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = app.config.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(__file__), 'uploads')
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-
-        ipfs_hash = None
-        photo_path = None
-        
-        if photo:
-            filename = secure_filename(photo.filename)
-            photo_path = os.path.join(upload_dir, filename)
-            photo.save(photo_path)
-            
-            # Upload to IPFS
-            ipfs_hash = upload_to_ipfs(photo_path, filename)
-            if not ipfs_hash:
-                return jsonify({'message': 'Failed to upload to IPFS'}), 500
-
-        # Create project metadata for IPFS
+        # Create project metadata for IPFS; the photo hash is filled in by the upload job
         project_metadata = {
             "name": name,
             "description": description,
@@ -416,14 +1019,10 @@ def upload_project():
             },
             "area_hectares": float(area_hectares),
             "ecosystem_type": ecosystem_type,
-            "photo_ipfs_hash": ipfs_hash,
             "created_by": current_user['username'],
             "created_at": str(datetime.utcnow()),
             "type": "project_metadata"
         }
-        
-        # Upload metadata to IPFS
-        metadata_hash = upload_json_to_ipfs(project_metadata, f"{name}_metadata.json")
 
         eco_map = {et.value: et for et in EcosystemType}
         eco_enum = eco_map.get(str(ecosystem_type).lower(), EcosystemType.MANGROVE)
@@ -435,21 +1034,17 @@ def upload_project():
             description=description,
             latitude=float(latitude),
             longitude=float(longitude),
-            photo_path=photo_path,
-            ipfs_hash=ipfs_hash,
-            metadata_hash=metadata_hash,
             ecosystem_type=eco_enum,
             created_by=(created_by_id or 1)
         )
         db.session.add(project)
         db.session.commit()
 
-        return jsonify({
-            'message': 'Project uploaded successfully',
-            'id': project.id,
-            'ipfs_hash': ipfs_hash,
-            'metadata_hash': metadata_hash
-        }), 201
+        # ipfs_hash/metadata_hash are written back when the pins complete
+        return _dispatch_upload('project', {'project_id': project.id, 'metadata': project_metadata},
+                                [photo] if photo and photo.filename else [],
+                                upload_ids=upload_ids, owner=str(current_user),
+                                message='Project created', id=project.id)
         
     except Exception as e:
         return jsonify({'message': f'Error uploading project: {str(e)}'}), 500
@@ -457,18 +1052,29 @@ def upload_project():
 # SSE stream for real-time events
 @app.route('/sse')
 def sse_stream():
-    q = broker.subscribe()
+    # Optional per-subscriber backpressure: /sse?policy=conflate&buffer=200
+    policy = request.args.get('policy')
+    if policy and policy not in POLICIES:
+        return jsonify({'message': f"policy must be one of {', '.join(POLICIES)}"}), 400
+    buffer_size = request.args.get('buffer', type=int)
+    if buffer_size is not None:
+        buffer_size = max(1, min(buffer_size, 1000))
+    q = broker.subscribe(maxsize=buffer_size, policy=policy)
+    stream = heartbeat.open(q, on_close=lambda: broker.unsubscribe(q))
 
     def event_stream():
-        try:
-            while True:
-                data = q.get()
-                yield f"data: {data}\n\n"
-        finally:
-            broker.unsubscribe(q)
+        yield from heartbeat.iter_frames(stream)
 
     return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
 
+# Admin: SSE fan-out health (per-subscriber lag/drops, lock contention)
+@app.route('/admin/sse/stats', methods=['GET'])
+@admin_required
+def sse_stats():
+    stats = broker.stats()
+    stats['heartbeat'] = heartbeat.stats()
+    return jsonify(stats), 200
+
 # IoT telemetry ingestion (GPS)
 @app.route('/iot/telemetry', methods=['POST'])
 def iot_telemetry():
@@ -477,20 +1083,255 @@ def iot_telemetry():
     if api_key != app.config['IOT_API_KEY']:
         return jsonify({'message': 'Unauthorized'}), 401
 
+    if request.mimetype == telemetry_wire.CONTENT_TYPE:
+        return _ingest_binary_telemetry()
+
     data = request.get_json(silent=True) or {}
     # Expected: { device_id, project_id, lat, lon, altitude?, speed?, ts? }
-    event = {
-        'device_id': data.get('device_id'),
-        'project_id': data.get('project_id'),
-        'lat': data.get('lat'),
-        'lon': data.get('lon'),
-        'altitude': data.get('altitude'),
-        'speed': data.get('speed'),
-        'ts': data.get('ts') or datetime.utcnow().isoformat()
-    }
-    broadcast_event('iot_gps', event)
+    try:
+        row = normalize_point(data)
+        row['message_id'] = ingest_dedup.message_id(data, request.headers.get(ingest_dedup.MESSAGE_ID_HEADER))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    key = ingest_dedup.telemetry_key(row)
+    if not recent_keys.add(key):
+        return jsonify({'message': 'duplicate telemetry ignored', 'duplicate': True}), 200
+    geofences.tag([row])
+    if not telemetry_writer.submit(row):
+        recent_keys.discard(key)
+        return jsonify({'message': 'Telemetry queue full, retry later'}), 503, {'Retry-After': '1'}
+
+    event = dict(row, ts=row['ts'].isoformat())
+    broadcast_event('iot_gps', event, key=('iot_gps', event['device_id']))
+    for exit_event in geofences.transitions([row]):
+        broadcast_event('geofence_exit', exit_event)
     return jsonify({'message': 'telemetry ingested'}), 200
 
+def _iter_batch_body():
+    """Yield raw points from a JSON array body or a streamed NDJSON body"""
+    content_type = (request.mimetype or '').lower()
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonlines'):
+        # Read line by line so large replays are never buffered as one document
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('points')
+    if not isinstance(data, list):
+        raise ValueError('body must be a JSON array, {"points": [...]}, or NDJSON')
+    yield from data
+
+# Batch telemetry ingestion for gateways replaying buffered fixes
+@app.route('/iot/telemetry/batch', methods=['POST'])
+def iot_telemetry_batch():
+    api_key = request.headers.get('X-IOT-Key') or request.args.get('key')
+    if api_key != app.config['IOT_API_KEY']:
+        return jsonify({'message': 'Unauthorized'}), 401
+
+    if request.mimetype == telemetry_wire.CONTENT_TYPE:
+        return _ingest_binary_telemetry()
+
+    limit = app.config['TELEMETRY_BATCH_MAX']
+    rows, indices, errors = [], [], []
+    rejected = 0
+    try:
+        for index, raw in enumerate(_iter_batch_body()):
+            if index >= limit:
+                return jsonify({'message': f'Batch exceeds {limit} points'}), 413
+            try:
+                rows.append(normalize_point(raw))
+                indices.append(index)
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < 100:
+                    errors.append({'index': index, 'error': str(e)})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return _ingest_telemetry_rows(rows, indices, rejected, errors)
+
+def _ingest_binary_telemetry():
+    """Decode struct-packed records (see telemetry/wire.py) and ingest them"""
+    body = request.get_data(cache=False)
+    limit = app.config['TELEMETRY_BATCH_MAX']
+    if len(body) > limit * telemetry_wire.RECORD_SIZE:
+        return jsonify({'message': f'Batch exceeds {limit} points'}), 413
+    try:
+        rows, indices, errors = telemetry_wire.decode_points(body)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return _ingest_telemetry_rows(rows, indices, len(errors), errors[:100])
+
+def _ingest_telemetry_rows(rows, indices, rejected, errors):
+    # Drop points this server has already ingested before they reach the queue or SSE
+    fresh, fresh_indices, keys = [], [], []
+    for row, index in zip(rows, indices):
+        key = ingest_dedup.telemetry_key(row)
+        if recent_keys.add(key):
+            fresh.append(row)
+            fresh_indices.append(index)
+            keys.append(key)
+    duplicates = len(rows) - len(fresh)
+    rows, indices = fresh, fresh_indices
+
+    geofences.tag(rows)
+    accepted = telemetry_writer.submit_many(rows)
+    for key in keys[accepted:]:
+        recent_keys.discard(key)
+    if accepted:
+        events = [dict(row, ts=row['ts'].isoformat()) for row in rows[:accepted]]
+        broadcast_events('iot_gps', events, keys=[('iot_gps', e['device_id']) for e in events])
+        exits = geofences.transitions(rows[:accepted])
+        if exits:
+            broadcast_events('geofence_exit', exits)
+
+    body = {'accepted': accepted, 'duplicates': duplicates, 'rejected': rejected, 'errors': errors}
+    if accepted < len(rows):
+        # Queue filled mid-batch: tell the gateway where to resume
+        body['message'] = 'Telemetry queue full, retry remaining points later'
+        body['resume_from'] = indices[accepted]
+        return jsonify(body), 503, {'Retry-After': '1'}
+    body['message'] = 'telemetry batch ingested'
+    return jsonify(body), 200
+
+# Stored GPS history for one device
+@app.route('/iot/devices/<device_id>/telemetry', methods=['GET'])
+@jwt_required()
+def device_telemetry(device_id):
+    limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+    query = TelemetryPoint.query.filter(TelemetryPoint.device_id == device_id)
+    try:
+        if request.args.get('since'):
+            query = query.filter(TelemetryPoint.ts >= parse_ts(request.args['since']))
+        if request.args.get('until'):
+            query = query.filter(TelemetryPoint.ts <= parse_ts(request.args['until']))
+    except ValueError:
+        return jsonify({'message': 'since/until must be ISO-8601 timestamps'}), 400
+    points = query.order_by(TelemetryPoint.ts.asc()).limit(limit).all()
+    return jsonify({
+        'device_id': device_id,
+        'points': [{
+            'project_id': p.project_id,
+            'lat': p.lat,
+            'lon': p.lon,
+            'altitude': p.altitude,
+            'speed': p.speed,
+            'ts': p.ts.isoformat(),
+        } for p in points]
+    }), 200
+
+# Downsampled device history for map/analytics views
+@app.route('/iot/devices/<device_id>/rollups', methods=['GET'])
+@jwt_required()
+def device_rollups(device_id):
+    max_points = max(1, min(request.args.get('max_points', 500, type=int), 10000))
+    try:
+        until = parse_ts(request.args.get('until'))
+        since = parse_ts(request.args['since']) if request.args.get('since') else until - timedelta(days=1)
+    except ValueError:
+        return jsonify({'message': 'since/until must be ISO-8601 timestamps'}), 400
+    if since >= until:
+        return jsonify({'message': 'since must be before until'}), 400
+
+    raw_query = TelemetryPoint.query.filter(
+        TelemetryPoint.device_id == device_id,
+        TelemetryPoint.ts >= since,
+        TelemetryPoint.ts <= until,
+    )
+    resolution, width = telemetry_rollups.choose_resolution(
+        since, until, max_points, raw_count=raw_query.limit(max_points + 1).count())
+
+    if resolution == telemetry_rollups.RAW:
+        points = raw_query.order_by(TelemetryPoint.ts.asc()).all()
+        return jsonify({
+            'device_id': device_id,
+            'resolution': resolution,
+            'points': [{'lat': p.lat, 'lon': p.lon, 'altitude': p.altitude, 'speed': p.speed,
+                        'ts': p.ts.isoformat()} for p in points],
+        }), 200
+
+    rows = TelemetryRollup.query.filter(
+        TelemetryRollup.device_id == device_id,
+        TelemetryRollup.resolution == resolution,
+        TelemetryRollup.bucket_start >= telemetry_rollups.bucket_start(since, width),
+        TelemetryRollup.bucket_start <= until,
+    ).order_by(TelemetryRollup.bucket_start.asc()).all()
+    columns = [c.name for c in TelemetryRollup.__table__.columns]
+    buckets = [{name: getattr(r, name) for name in columns} for r in rows]
+    buckets = telemetry_rollups.downsample(buckets, max_points)
+    return jsonify({
+        'device_id': device_id,
+        'resolution': resolution,
+        'buckets': [telemetry_rollups.summarize(b) for b in buckets],
+    }), 200
+
+# Simplified device track for map rendering
+@app.route('/iot/devices/<device_id>/track', methods=['GET'])
+@jwt_required()
+def device_track(device_id):
+    try:
+        until = parse_ts(request.args['until']) if request.args.get('until') else None
+        since = parse_ts(request.args['since']) if request.args.get('since') else None
+        zoom = telemetry_track.parse_zoom(request.args.get('zoom'))
+        tolerance_m = request.args.get('tolerance_m', type=float)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if tolerance_m is not None and tolerance_m < 0:
+        return jsonify({'message': 'tolerance_m must be >= 0'}), 400
+    if tolerance_m is None and zoom is None:
+        zoom = 14.0
+
+    # Explicit tolerance wins over zoom; rounded so near-identical requests share a cache entry
+    tolerance_key = ('m', round(tolerance_m, 1)) if tolerance_m is not None else ('z', round(zoom, 1))
+    cache_key = (device_id, since, until, tolerance_key)
+    cached = track_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(dict(cached, cached=True)), 200
+
+    window_end = until or datetime.utcnow()
+    window_start = since or window_end - timedelta(days=1)
+    if window_start >= window_end:
+        return jsonify({'message': 'since must be before until'}), 400
+    max_points = app.config['TRACK_MAX_POINTS']
+    fixes = db.session.query(TelemetryPoint.lat, TelemetryPoint.lon, TelemetryPoint.ts).filter(
+        TelemetryPoint.device_id == device_id,
+        TelemetryPoint.ts >= window_start,
+        TelemetryPoint.ts <= window_end,
+    ).order_by(TelemetryPoint.ts.asc()).limit(max_points + 1).all()
+    truncated = len(fixes) > max_points
+    fixes = [tuple(f) for f in fixes[:max_points]]
+
+    if tolerance_m is None:
+        mean_lat = sum(f[0] for f in fixes) / len(fixes) if fixes else 0.0
+        tolerance_m = telemetry_track.tolerance_for_zoom(zoom, mean_lat)
+    kept = telemetry_track.simplify(fixes, tolerance_m)
+    result = {
+        'device_id': device_id,
+        'since': window_start.isoformat(),
+        'until': window_end.isoformat(),
+        'zoom': zoom,
+        'tolerance_m': round(tolerance_m, 3),
+        'raw_points': len(fixes),
+        'truncated': truncated,
+        'points': [{'lat': lat, 'lon': lon, 'ts': ts.isoformat()} for lat, lon, ts in kept],
+    }
+    track_cache.put(cache_key, result)
+    return jsonify(dict(result, cached=False)), 200
+
+@app.route('/admin/telemetry/stats', methods=['GET'])
+@admin_required
+def telemetry_stats():
+    return jsonify(dict(telemetry_writer.stats(), track_cache=track_cache.stats(), dedup=recent_keys.stats(),
+                        geofence=geofences.stats())), 200
+
 # IoT photo upload (multipart/form-data)
 @app.route('/iot/photo', methods=['POST'])
 def iot_photo():
@@ -504,34 +1345,84 @@ def iot_photo():
     lon = request.form.get('lon')
     photo = request.files.get('photo')
 
-    ipfs_hash = None
-    if photo and photo.filename:
-        upload_dir = app.config.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(__file__), 'uploads')
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-        filename = secure_filename(photo.filename)
-        file_path = os.path.join(upload_dir, filename)
-        photo.save(file_path)
-        try:
-            ipfs_hash = upload_to_ipfs(file_path, filename)
-        finally:
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+    # Retries are recognised by message id, or by (device_id, ts) when the gateway sends a capture time
+    try:
+        msg_id = ingest_dedup.message_id(request.form, request.headers.get(ingest_dedup.MESSAGE_ID_HEADER))
+        captured_at = parse_ts(request.form['ts']) if request.form.get('ts') else None
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    dedup_key = msg_id or (f"ts:{captured_at.isoformat()}" if captured_at else None)
+    key = ('photo', device_id, dedup_key) if device_id and dedup_key else None
+    if key is not None:
+        if not recent_keys.add(key):
+            original = recent_keys.result(key) or {}
+            return jsonify(dict(original, message='duplicate photo ignored', duplicate=True)), 200
+        # Not in the recent-key filter: one indexed read still beats a second Pinata upload
+        receipt = IngestReceipt.query.filter_by(kind='photo', device_id=device_id, dedup_key=dedup_key).first()
+        if receipt is not None:
+            original = {'job_id': receipt.job_id, 'ipfs_hash': receipt.ipfs_hash}
+            recent_keys.remember(key, original)
+            recent_keys.record_late(1)
+            return jsonify(dict(original, message='duplicate photo ignored', duplicate=True)), 200
 
     event = {
         'device_id': device_id,
         'project_id': project_id,
         'lat': lat,
         'lon': lon,
-        'photo_ipfs': ipfs_hash,
-        'ts': datetime.utcnow().isoformat()
+        'ts': (captured_at or datetime.utcnow()).isoformat()
     }
-    broadcast_event('iot_photo', event)
-    return jsonify({'message': 'photo ingested', 'ipfs_hash': ipfs_hash}), 201
+    if not (photo and photo.filename):
+        broadcast_event('iot_photo', dict(event, photo_ipfs=None))
+        return jsonify({'message': 'photo ingested', 'ipfs_hash': None}), 201
+
+    job_id = upload_jobs.new_id()
+    if key is not None:
+        recent_keys.remember(key, {'job_id': job_id, 'ipfs_hash': None})
+        try:
+            db.session.add(IngestReceipt(kind='photo', device_id=device_id, dedup_key=dedup_key, job_id=job_id))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker recorded the same message first
+            db.session.rollback()
+            return jsonify({'message': 'duplicate photo ignored', 'duplicate': True}), 200
+
+    # The iot_photo event is broadcast by the job once the photo is pinned
+    return _dispatch_upload('iot_photo', dict(event, dedup_key=dedup_key if key is not None else None),
+                            [photo], job_id=job_id, message='photo accepted')
 
 # Field Data Collection Routes
+@app.route('/field-data', methods=['GET'])
+@jwt_required()
+def get_field_data():
+    """Field data rows, filtered by project_id, data_type and bbox=min_lon,min_lat,max_lon,max_lat"""
+    table = FieldData.__tablename__
+    clauses, params = [], {}
+    project_id = request.args.get('project_id', type=int)
+    if project_id:
+        clauses.append("project_id = :project_id")
+        params['project_id'] = project_id
+    if request.args.get('data_type'):
+        clauses.append("data_type = :data_type")
+        params['data_type'] = request.args['data_type']
+    if request.args.get('bbox'):
+        try:
+            bbox = point_index.parse_bbox(request.args['bbox'])
+        except ValueError as e:
+            return jsonify({'error': 'Invalid bbox', 'message': str(e)}), 400
+        # R*Tree candidates, then the exact columns (see spatial/point_index.py)
+        bbox_sql, bbox_params = point_index.where_in_bbox(table, 'latitude', 'longitude', bbox, paramstyle='named')
+        clauses.append(bbox_sql)
+        params.update(bbox_params)
+    rows = db.session.execute(
+        text(f"SELECT id, project_id, collector_id, data_type, value, unit, latitude, longitude, ipfs_hash,"
+             f" collected_at, notes, verified FROM {table} WHERE {' AND '.join(clauses) or '1=1'}"
+             f" ORDER BY collected_at DESC"),
+        params,
+    ).mappings().all()
+    field_data = [dict(row, verified=bool(row['verified'])) for row in rows]
+    return jsonify({'field_data': field_data, 'total': len(field_data)}), 200
+
 @app.route('/field-data', methods=['POST'])
 @jwt_required()
 def upload_field_data():
@@ -543,69 +1434,186 @@ def upload_field_data():
         description = request.form.get('description')
         location = request.form.get('location')
         
-        # Handle image uploads
-        uploaded_files = request.files.getlist('images')
-        image_hashes = []
-        
-        for file in uploaded_files:
-            if file and file.filename:
-                filename = secure_filename(file.filename)
-                # Ensure upload folder exists
-                upload_dir = app.config.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(__file__), 'uploads')
-                if not os.path.exists(upload_dir):
-                    os.makedirs(upload_dir)
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                
-                # Upload to IPFS
-                try:
-                    ipfs_hash = upload_to_ipfs(file_path, filename)
-                    if ipfs_hash:
-                        image_hashes.append(ipfs_hash)
-                    
-                    # Clean up local file
-                    os.remove(file_path)
-                except Exception as ipfs_error:
-                    print(f"IPFS upload error: {ipfs_error}")
-                    # Continue without IPFS for now
-                    pass
-        
-        # Create metadata
         metadata = {
             'project_id': project_id,
             'data_type': data_type,
             'description': description,
             'location': json.loads(location) if location else None,
-            'images': image_hashes,
             'collected_by': current_user,
             'collected_at': datetime.now().isoformat()
         }
-        
-        # Upload metadata to IPFS
-        metadata_hash = None
-        try:
-            metadata_hash = upload_json_to_ipfs(metadata, f'field_data_metadata_{datetime.now().isoformat()}.json')
-        except Exception as ipfs_error:
-            print(f"IPFS metadata upload error: {ipfs_error}")
-        
-        # Create a simple field data record
-        # For now, just return success since the mobile app is working
-        field_data_id = 1  # Mock ID for response
-        
-        # Skip database operations for now to avoid model issues
-        # db.session.add(field_data)
-        # db.session.commit()
-        
-        return jsonify({
-            'message': 'Field data uploaded successfully',
-            'field_data_id': field_data_id,
-            'metadata_hash': metadata_hash,
-            'image_count': len(image_hashes)
-        }), 201
+
+        # Images sent through /uploads are referenced by id, as repeated or comma-separated upload_ids
+        upload_ids = [upload_id.strip() for value in request.form.getlist('upload_ids')
+                      for upload_id in value.split(',') if upload_id.strip()]
+        error = _check_finalised_uploads(upload_ids, str(current_user))
+        if error:
+            return jsonify({'error': error}), 409
+
+        # Images and metadata are pinned by a background job; the client follows the job id
+        uploaded_files = [f for f in request.files.getlist('images') if f and f.filename]
+        return _dispatch_upload('field_data', {'metadata': metadata}, uploaded_files,
+                                upload_ids=upload_ids, owner=str(current_user),
+                                message='Field data received')
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Resumable chunked uploads: create a session, PUT chunks at Upload-Offset, GET the offset after a
+# dropped connection, finalise, then reference the upload id from /upload or /field-data
+def _check_finalised_uploads(upload_ids, owner):
+    """Error message if any upload id is not a finalised chunked upload of owner, else None"""
+    for upload_id in upload_ids:
+        session = chunked_uploads.get(upload_id)
+        if session is None or session['owner'] != owner:
+            return f'Unknown upload {upload_id}'
+        if not session['complete']:
+            return f'Upload {upload_id} has not been finalised'
+    return None
+
+def _upload_session(upload_id):
+    session = chunked_uploads.get(upload_id)
+    if session is None or session['owner'] != str(get_jwt_identity()):
+        return None
+    return session
+
+def _upload_session_response(session, status=200):
+    body = {key: session[key] for key in ('id', 'filename', 'content_type', 'size', 'offset', 'complete', 'sha256')}
+    body['upload_url'] = f"/uploads/{session['id']}"
+    response = jsonify(body)
+    response.headers['Upload-Offset'] = str(session['offset'])
+    return response, status
+
+@app.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_chunked_upload():
+    data = request.get_json(silent=True) or {}
+    if not data.get('filename') or 'size' not in data:
+        return jsonify({'message': 'filename and size are required'}), 400
+    try:
+        session = chunked_uploads.create(str(get_jwt_identity()), secure_filename(data['filename']) or 'file',
+                                         data.get('content_type'), data['size'], sha256=data.get('sha256'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return _upload_session_response(session, 201)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_chunked_upload(upload_id):
+    session = _upload_session(upload_id)
+    if session is None:
+        return jsonify({'message': 'Upload not found'}), 404
+    return _upload_session_response(session)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def put_upload_chunk(upload_id):
+    if _upload_session(upload_id) is None:
+        return jsonify({'message': 'Upload not found'}), 404
+    offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+    if offset is None or not offset.isdigit():
+        return jsonify({'message': 'Upload-Offset header is required'}), 400
+    try:
+        session = chunked_uploads.append(upload_id, int(offset), request.stream, length=request.content_length,
+                                         chunk_sha256=request.headers.get('X-Chunk-SHA256'))
+    except OffsetConflict as e:
+        # Tell the client where to resume from
+        response = jsonify({'message': str(e), 'offset': e.offset})
+        response.headers['Upload-Offset'] = str(e.offset)
+        return response, 409
+    except LookupError:
+        return jsonify({'message': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'message': str(e), 'offset': (chunked_uploads.get(upload_id) or {}).get('offset')}), 400
+    return _upload_session_response(session)
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@jwt_required()
+def finalize_chunked_upload(upload_id):
+    if _upload_session(upload_id) is None:
+        return jsonify({'message': 'Upload not found'}), 404
+    try:
+        session = chunked_uploads.finalize(upload_id)
+    except LookupError:
+        return jsonify({'message': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 409
+    return _upload_session_response(session)
+
+# Pinned content through the local read-through cache; CIDs are immutable, so clients may cache forever
+@app.route('/ipfs/<cid>', methods=['GET'])
+@jwt_required()
+def get_ipfs_content(cid):
+    try:
+        f = content_cache.open(cid)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except PinError as e:
+        status = {400: 404, 404: 404, 410: 404, 413: 413}.get(e.status, 502)
+        return jsonify({'message': f'Content unavailable: {e}'}), status
+    # ?filename= names the download and picks the content type (the CID alone does not say)
+    filename = secure_filename(request.args.get('filename', '')) or None
+    mimetype = (mimetypes.guess_type(filename)[0] if filename else None) or 'application/octet-stream'
+    # Served from the open file, which an eviction cannot pull away mid-response. send_file only knows
+    # the length of paths, so the length is set here and Range/If-None-Match (206/304) handled after it.
+    response = send_file(f, mimetype=mimetype, etag=cid, max_age=365 * 86400, download_name=filename)
+    size = os.fstat(f.fileno()).st_size
+    response.content_length = size
+    response = response.make_conditional(request, accept_ranges=True, complete_length=size)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@app.route('/field-data/records/<int:record_id>', methods=['GET'])
+@jwt_required()
+def get_field_data_record(record_id):
+    record = db.session.get(MetadataRecord, record_id)
+    if record is None:
+        return jsonify({'message': 'Record not found'}), 404
+    batch = db.session.get(MetadataBatch, record.batch_id) if record.batch_id else None
+    body = {
+        'id': record.id,
+        'job_id': record.job_id,
+        'metadata': json.loads(record.metadata_json),
+        'leaf_hash': record.leaf_hash,
+        'status': 'pinned' if batch is not None and batch.status == merkle.PINNED else 'pending',
+        'batch': None,
+    }
+    if body['status'] == 'pinned':
+        proof = json.loads(record.proof)
+        body['batch'] = {'id': batch.id, 'cid': batch.cid, 'merkle_root': batch.merkle_root,
+                         'record_count': batch.record_count, 'pinned_at': batch.pinned_at.isoformat()}
+        body.update(leaf_index=record.leaf_index, proof=proof,
+                    verified=merkle.verify(record.leaf_hash, proof, batch.merkle_root))
+    return jsonify(body), 200
+
+@app.route('/upload-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_job(job_id):
+    job = upload_jobs.store.get(job_id)
+    # Someone else's job answers like a missing one, as for /uploads/<upload_id>
+    if job is None or job['payload'].get('owner') != str(get_jwt_identity()):
+        return jsonify({'message': 'Job not found'}), 404
+    job.pop('payload', None)
+    return jsonify(job), 200
+
+@app.route('/chain-transactions/<tx_id>', methods=['GET'])
+@jwt_required()
+def get_chain_transaction(tx_id):
+    tx = chain_outbox.store.get(tx_id) if chain_outbox is not None else None
+    if tx is None:
+        return jsonify({'message': 'Transaction not found'}), 404
+    tx.pop('raw_tx', None)
+    return jsonify(tx), 200
+
+@app.route('/admin/upload-jobs/stats', methods=['GET'])
+@admin_required
+def upload_job_stats():
+    return jsonify(dict(upload_jobs.stats(), cid_cache=pin_cache.stats(), pin_pool=pin_pool.stats(),
+                        ipfs=ipfs.stats(), renditions=image_renditions.stats(),
+                        chunked_uploads=chunked_uploads.stats(), content_cache=content_cache.stats(),
+                        metadata_batches=metadata_batcher.stats() if metadata_batcher else None,
+                        chain_outbox=chain_outbox.stats() if chain_outbox else None)), 200
+
 @app.route('/tasks', methods=['GET'])
 @jwt_required()
 def get_tasks():
@@ -664,6 +1672,10 @@ def update_task_status(task_id):
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_added_columns()
+        ensure_ingest_indexes()
+        ensure_spatial_indexes()
         print("Database tables created/verified")
+    # Background workers start with the first request (see _ensure_background_workers)
     print("Starting Flask server on http://0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,99 @@
+"""
+Offline-sync re-upload workload against a local pin endpoint, with and without the CID cache.
+
+    python benchmarks/bench_cid_cache.py --photos 200 --kb 600 --resync 0.4
+
+Each crew sync uploads its photos plus project metadata JSON. A ``--resync``
+share of the uploads are photos and metadata that were already synced before.
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_ipfs_stream import PinHandler  # noqa: E402
+from pinning.cid_cache import CidCache, FILE, JSON, canonical_json, sha256_file  # noqa: E402
+from pinning.stream import pin_stream  # noqa: E402
+
+
+def run(workload, url, cache):
+    sent = 0
+    t0 = time.perf_counter()
+    for kind, value in workload:
+        if kind == FILE:
+            sha = sha256_file(value)
+            if cache and cache.get(FILE, sha):
+                continue
+            with open(value, 'rb') as f:
+                result = pin_stream(requests.post, url, {}, f, os.path.basename(value))
+            sent += result['size']
+            if cache:
+                cache.put(FILE, sha, result['IpfsHash'], result['size'])
+        else:
+            content = canonical_json(value)
+            sha = hashlib.sha256(content).hexdigest()
+            if cache and cache.get(JSON, sha):
+                continue
+            requests.post(url, json={'pinataContent': value}, timeout=60).json()
+            sent += len(content)
+            if cache:
+                cache.put(JSON, sha, 'QmLocal', len(content))
+    return time.perf_counter() - t0, sent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--kb', type=int, default=600)
+    parser.add_argument('--resync', type=float, default=0.4)
+    args = parser.parse_args()
+
+    rnd = random.Random(5)
+    tmpdir = tempfile.mkdtemp()
+    photos = []
+    for i in range(args.photos):
+        path = os.path.join(tmpdir, f'photo_{i}.jpg')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(args.kb * 1024))
+        photos.append(path)
+    metadata = [{'name': f'Project {i}', 'area_hectares': 10 + i, 'type': 'project_metadata'} for i in range(20)]
+
+    # First-time uploads, then a resync share of repeats mixed in
+    workload = [(FILE, p) for p in photos] + [(JSON, m) for m in metadata]
+    repeats = int(len(workload) * args.resync / (1 - args.resync))
+    workload += [rnd.choice(workload) for _ in range(repeats)]
+    rnd.shuffle(workload)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PinHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/pinning'
+
+    no_cache = run(workload, url, None)
+    cache = CidCache(os.path.join(tmpdir, 'cid_cache.db'))
+    with_cache = run(workload, url, cache)
+    stats = cache.stats()
+    server.shutdown()
+
+    print(f"{len(workload)} pins, {repeats} repeats ({args.kb} KB photos)")
+    print(f"{'':<12}{'seconds':>9}{'MB sent':>10}")
+    print(f"{'no cache':<12}{no_cache[0]:>9.2f}{no_cache[1] / 1e6:>10.1f}")
+    print(f"{'CID cache':<12}{with_cache[0]:>9.2f}{with_cache[1] / 1e6:>10.1f}")
+    print(f"hit rate {stats['hit_rate']:.1%}, upload bytes reduction {1 - with_cache[1] / no_cache[1]:.1%}")
+
+    t0 = time.perf_counter()
+    for _ in range(10000):
+        cache.get(FILE, '0' * 64)
+    print(f"miss lookup {(time.perf_counter() - t0) / 10000 * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Per-call overhead of preparing a CarbonCredit call: a fresh contract object every time vs the cached handle.
+
+    python benchmarks/bench_contract_cache.py --calls 5000
+
+No node is needed. Every mode stops at the encoded calldata, so the numbers are
+the client-side work that happens before the RPC request goes out.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from web3 import Web3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain.connector import CARBON_CREDIT_ABI_PATH  # noqa: E402
+from blockchain.contracts import ContractCache  # noqa: E402
+
+ADDRESS = '0x5FbDB2315678afecb367f032d93F642f64180aa3'
+OWNER = '0x70997970C51812dc3A010C7d01b50e0d17dc79C8'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=5000)
+    args = parser.parse_args()
+
+    web3 = Web3()
+    with open(CARBON_CREDIT_ABI_PATH) as f:
+        abi = json.load(f)
+    call_args = (OWNER, 125, 'Sundarbans mangrove block 7')
+
+    def uncached():
+        # What call_smart_contract/transact_smart_contract did before: new contract, web3's ABI matching
+        contract = web3.eth.contract(address=ADDRESS, abi=abi)
+        return contract.functions.issueCredit(*call_args)._encode_transaction_data()
+
+    cached_web3 = ContractCache(web3)
+
+    def cached_contract():
+        # Cached contract object, still web3's per-call function matching
+        handle = cached_web3.get(ADDRESS, abi)
+        return handle.contract.functions.issueCredit(*call_args)._encode_transaction_data()
+
+    cache = ContractCache(web3)
+
+    def cached_spec():
+        return '0x' + cache.get(ADDRESS, abi).function('issueCredit').encode(call_args).hex()
+
+    assert uncached() == cached_contract() == cached_spec(), 'encodings differ'
+    print(f"{args.calls} issueCredit encodings")
+    print(f"{'mode':<36}{'us/call':>10}{'speedup':>9}")
+    baseline = None
+    for label, fn in (('new contract per call', uncached),
+                      ('cached contract, web3 matching', cached_contract),
+                      ('cached handle + memoised selector', cached_spec)):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            fn()
+        per_call = (time.perf_counter() - start) / args.calls * 1e6
+        baseline = baseline or per_call
+        print(f"{label:<36}{per_call:>10.1f}{baseline / per_call:>8.1f}x")
+    print(f"cache: {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Gas per credit: one issueCredit transaction per lot vs issueCredits batches.
+
+    pip install py-solc-x "eth-tester[py-evm]" && python -c "import solcx; solcx.install_solc('0.8.19')"
+    python benchmarks/bench_credit_issuance.py --credits 200
+
+CarbonCredit.sol is compiled with solc 0.8.19 (optimizer on, 200 runs) and
+deployed to an in-process py-evm chain, so no node is needed. Pass --node to
+measure against a dev chain instead (its first unlocked account pays), and
+--artifact to skip solc and deploy a JSON artifact with "abi" and "bytecode"
+keys (e.g. a Hardhat build of the same file). Where solc cannot be installed,
+--vyper compiles carbon_credit_twin.vy instead (pip install vyper): the same
+storage writes and event per credit, so the per-credit figures carry over,
+though the fixed per-call overhead differs a little between compilers.
+Gas is taken from the receipts. The batch runs also check that one
+CreditIssued event was emitted per credit; a batch over the block gas limit
+is reported and skipped.
+"""
+import argparse
+import json
+import os
+import sys
+
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'blockchain', 'CarbonCredit.sol')
+TWIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'carbon_credit_twin.vy')
+
+
+def compile_contract(version):
+    import solcx
+    compiled = solcx.compile_files([SOURCE], output_values=['abi', 'bin'], solc_version=version,
+                                   optimize=True, optimize_runs=200)
+    _, artifact = next((key, value) for key, value in compiled.items() if key.endswith(':CarbonCredit'))
+    return artifact['abi'], artifact['bin']
+
+
+def compile_twin():
+    import vyper
+    with open(TWIN) as f:
+        compiled = vyper.compile_code(f.read(), output_formats=['abi', 'bytecode'])
+    return compiled['abi'], compiled['bytecode']
+
+
+def load_artifact(path):
+    with open(path) as f:
+        artifact = json.load(f)
+    return artifact['abi'], artifact['bytecode']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--credits', type=int, default=200)
+    parser.add_argument('--batches', default='1,10,50,100,200')
+    parser.add_argument('--project', default='Sundarbans mangrove restoration, block 7')
+    parser.add_argument('--solc', default='0.8.19')
+    parser.add_argument('--artifact', help='prebuilt {"abi", "bytecode"} JSON instead of compiling with solc')
+    parser.add_argument('--vyper', action='store_true', help='compile carbon_credit_twin.vy instead of solc')
+    parser.add_argument('--node', help='dev chain URL; default is an in-process py-evm chain')
+    args = parser.parse_args()
+
+    web3 = Web3(Web3.HTTPProvider(args.node)) if args.node else Web3(EthereumTesterProvider())
+    sender = web3.eth.accounts[0]
+    owners = [Web3.to_checksum_address(f'0x{i + 1:040x}') for i in range(args.credits)]
+    amounts = [100 + i for i in range(args.credits)]
+
+    if args.artifact:
+        abi, bytecode = load_artifact(args.artifact)
+    else:
+        abi, bytecode = compile_twin() if args.vyper else compile_contract(args.solc)
+    deploy = web3.eth.contract(abi=abi, bytecode=bytecode).constructor().transact({'from': sender})
+    address = web3.eth.wait_for_transaction_receipt(deploy)['contractAddress']
+    contract = web3.eth.contract(address=address, abi=abi)
+
+    def mined(tx_hash):
+        return web3.eth.wait_for_transaction_receipt(tx_hash)
+
+    # Warm the nextId slot so the first measured credit does not pay for the zero -> non-zero write
+    mined(contract.functions.issueCredit(owners[0], 1, args.project).transact({'from': sender}))
+
+    gas_limit = web3.eth.get_block('latest')['gasLimit']
+    print(f"{args.credits} credits, project name {len(args.project)} bytes, block gas limit {gas_limit:,}")
+    print(f"{'mode':<28}{'txs':>6}{'total gas':>14}{'gas/credit':>12}{'vs single':>11}")
+    total = 0
+    for owner, amount in zip(owners, amounts):
+        tx_hash = contract.functions.issueCredit(owner, amount, args.project).transact({'from': sender})
+        total += mined(tx_hash)['gasUsed']
+    single = total / args.credits
+    print(f"{'issueCredit x N':<28}{args.credits:>6}{total:>14,}{single:>12,.0f}{'':>11}")
+
+    for size in (int(s) for s in args.batches.split(',')):
+        size = min(size, args.credits)
+        total = txs = events = 0
+        for start in range(0, args.credits, size):
+            chunk = slice(start, start + size)
+            receipt = mined(contract.functions.issueCredits(owners[chunk], amounts[chunk], args.project)
+                            .transact({'from': sender, 'gas': gas_limit}))
+            if receipt['status'] != 1:
+                break
+            total += receipt['gasUsed']
+            txs += 1
+            events += len(contract.events.CreditIssued().process_receipt(receipt))
+        if receipt['status'] != 1:
+            print(f"{f'issueCredits, batch {size}':<28}  does not fit in {gas_limit:,} gas")
+            continue
+        if events != args.credits:
+            sys.exit(f'batch {size}: {events} CreditIssued events for {args.credits} credits')
+        per_credit = total / args.credits
+        print(f"{f'issueCredits, batch {size}':<28}{txs:>6}{total:>14,}{per_credit:>12,.0f}"
+              f"{(per_credit - single) / single:>+10.1%}")
+
+
+if __name__ == '__main__':
+    main()
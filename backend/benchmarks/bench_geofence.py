@@ -0,0 +1,65 @@
+"""
+Per-fix geofence cost as the number of project boundaries grows: linear scan vs grid index.
+
+    python benchmarks/bench_geofence.py --projects 100 1000 5000 --points 50000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spatial.geofence import Fence, GeofenceIndex  # noqa: E402
+
+
+def make_fences(n, rnd):
+    """Irregular 24-gon project boundaries a few km across, scattered along a coastline band"""
+    fences = []
+    for project_id in range(1, n + 1):
+        clat, clon = rnd.uniform(-30, 30), rnd.uniform(-180, 180)
+        radius = rnd.uniform(0.01, 0.05)
+        ring = []
+        for k in range(24):
+            a = 2 * math.pi * k / 24
+            r = radius * rnd.uniform(0.7, 1.0)
+            ring.append((clon + r * math.cos(a), clat + r * math.sin(a)))
+        fences.append(Fence(project_id, [[ring]]))
+    return fences
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--projects', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--points', type=int, default=50000)
+    args = parser.parse_args()
+    rnd = random.Random(11)
+
+    print(f"{'projects':>9}{'scan us/fix':>13}{'grid us/fix':>13}{'hits':>7}")
+    for n in args.projects:
+        fences = make_fences(n, rnd)
+        index = GeofenceIndex(fences)
+        # Half the fixes near a project, half anywhere in the band
+        points = []
+        for i in range(args.points):
+            if i % 2:
+                f = fences[rnd.randrange(n)]
+                points.append((rnd.uniform(f.bbox[1], f.bbox[3]), rnd.uniform(f.bbox[0], f.bbox[2])))
+            else:
+                points.append((rnd.uniform(-30, 30), rnd.uniform(-180, 180)))
+
+        scan_points = points[:max(1000, args.points * 100 // n)]
+        t0 = time.perf_counter()
+        for lat, lon in scan_points:
+            next((f.project_id for f in fences if f.contains(lat, lon)), None)
+        scan = (time.perf_counter() - t0) / len(scan_points) * 1e6
+
+        t0 = time.perf_counter()
+        hits = sum(index.locate(lat, lon) is not None for lat, lon in points)
+        grid = (time.perf_counter() - t0) / len(points) * 1e6
+        print(f"{n:>9}{scan:>13.2f}{grid:>13.2f}{hits / len(points):>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
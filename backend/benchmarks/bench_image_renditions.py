@@ -0,0 +1,101 @@
+"""
+Rendition pipeline: bytes a dashboard fetches per photo view, and render throughput.
+
+    python benchmarks/bench_image_renditions.py --photos 12 --mp 12 --processes 4
+
+Photos are synthetic camera-like JPEGs (gradients plus sensor noise, quality 92).
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pinning import renditions  # noqa: E402
+from pinning.renditions import RenditionPool, render  # noqa: E402
+
+
+def camera_photo(path, megapixels, seed):
+    rnd = np.random.default_rng(seed)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 180 + 40, y / height * 150 + 60, (x + y) / (width + height) * 120 + 70], axis=-1)
+    base += 30 * np.sin(x[..., None] / rnd.uniform(40, 120)) * np.cos(y[..., None] / rnd.uniform(40, 120))
+    base += rnd.normal(0, 6, base.shape)
+    Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=92)
+
+
+def render_no_draft(path, out_dir, sizes):
+    """Same output as render() but decoding the full-resolution image first"""
+    out = {'renditions': {}}
+    with Image.open(path) as img:
+        img = img.convert('RGB')
+    for name, edge in sorted(sizes.items(), key=lambda kv: -kv[1]):
+        img.thumbnail((edge, edge), Image.LANCZOS)
+        target = os.path.join(out_dir, f'{name}.nodraft.jpg')
+        img.save(target, 'JPEG', quality=renditions.QUALITY.get(name, 80), optimize=True)
+        out['renditions'][name] = {'size': os.path.getsize(target)}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=12)
+    parser.add_argument('--mp', type=float, default=12)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.photos):
+        path = os.path.join(tmpdir, f'photo_{i}.jpg')
+        camera_photo(path, args.mp, i)
+        paths.append(path)
+    original = sum(os.path.getsize(p) for p in paths)
+    sizes = renditions.DEFAULT_SIZES
+
+    print(f"{args.photos} photos, {args.mp:g} MP, {original / args.photos / 1e6:.2f} MB average")
+    t0 = time.perf_counter()
+    for path in paths:
+        render_no_draft(path, tmpdir, sizes)
+    no_draft = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    results = [render(path, tmpdir, sizes) for path in paths]
+    draft = time.perf_counter() - t0
+
+    print(f"{'rendition':<12}{'avg KB':>10}{'of original':>13}")
+    print(f"{'original':<12}{original / args.photos / 1e3:>10.0f}{'100.0%':>13}")
+    for name in sizes:
+        size = sum(r['renditions'][name]['size'] for r in results)
+        print(f"{name:<12}{size / args.photos / 1e3:>10.0f}{size / original:>13.1%}")
+
+    pool = RenditionPool(processes=args.processes)
+    pool.submit(paths[0], tmpdir).result()  # start the workers outside the timing
+    t0 = time.perf_counter()
+    futures = [(pool.submit(p, tmpdir), os.path.getsize(p)) for p in paths]
+    for future, size in futures:
+        pool.collect(future, size)
+    in_pool = time.perf_counter() - t0
+    with ThreadPoolExecutor(args.processes) as threads:
+        t0 = time.perf_counter()
+        list(threads.map(lambda p: render(p, tmpdir, sizes), paths))
+        in_threads = time.perf_counter() - t0
+    pool.shutdown()
+
+    print(f"{'render':<40}{'ms/photo':>10}")
+    print(f"{'full decode, one thread':<40}{no_draft / args.photos * 1000:>10.0f}")
+    print(f"{'draft decode, one thread':<40}{draft / args.photos * 1000:>10.0f}")
+    print(f"{f'draft decode, {args.processes} threads':<40}{in_threads / args.photos * 1000:>10.0f}")
+    print(f"{f'draft decode, {args.processes} processes':<40}{in_pool / args.photos * 1000:>10.0f}")
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
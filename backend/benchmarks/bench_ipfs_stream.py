@@ -0,0 +1,124 @@
+"""
+Upload path cost against a local stand-in for pinFileToIPFS: the old save/reopen/
+``requests files=`` path vs streaming the incoming stream as chunked multipart.
+
+    python benchmarks/bench_ipfs_stream.py --mb 100
+
+Peak memory is Python heap allocations traced with tracemalloc during the upload.
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pinning.stream import pin_stream  # noqa: E402
+
+
+class PinHandler(BaseHTTPRequestHandler):
+    """Reads and discards the body (chunked or sized) and answers like Pinata"""
+
+    def do_POST(self):
+        received = 0
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                received += len(self.rfile.read(size))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 1 << 20))
+                remaining -= len(chunk)
+                received += len(chunk)
+        body = b'{"IpfsHash": "QmLocal", "PinSize": %d}' % received
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RequestStream(io.RawIOBase):
+    """Non-seekable stand-in for a Werkzeug upload stream"""
+
+    def __init__(self, data):
+        self._buf = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._buf.read(size)
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=100)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PinHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/pinning/pinFileToIPFS'
+    payload = os.urandom(args.mb * 1024 * 1024)
+    tmpdir = tempfile.mkdtemp()
+
+    def old_path():
+        # photo.save(path); open(path); requests.post(files=...); os.remove(path)
+        path = os.path.join(tmpdir, 'photo.jpg')
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(RequestStream(payload), f)  # what FileStorage.save does
+        with open(path, 'rb') as f:
+            requests.post(url, files={'file': ('photo.jpg', f)}, timeout=60).json()
+        os.remove(path)
+
+    def stream_path(attempts):
+        def run():
+            pin_stream(requests.post, url, {}, RequestStream(payload), 'photo.jpg', attempts=attempts)
+        return run
+
+    def staged_path():
+        path = os.path.join(tmpdir, 'staged.jpg')
+        with open(path, 'wb') as f:
+            f.write(payload)
+        with open(path, 'rb') as f:
+            pin_stream(requests.post, url, {}, f, 'photo.jpg')
+        os.remove(path)
+
+    print(f"{args.mb} MB upload")
+    print(f"{'path':<40}{'seconds':>9}{'peak MB':>9}")
+    for name, fn in (('save + reopen + requests files=', old_path),
+                     ('stream, no retry copy', stream_path(1)),
+                     ('stream, spill copy for one retry', stream_path(2)),
+                     ('staged file streamed (job worker)', staged_path)):
+        elapsed, peak = measure(fn)
+        print(f"{name:<40}{elapsed:>9.2f}{peak / 1e6:>9.1f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
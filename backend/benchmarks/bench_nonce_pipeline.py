@@ -0,0 +1,142 @@
+"""
+Transaction submission throughput: a node nonce lookup per transaction vs the local NonceManager.
+
+    npx hardhat node            # or: anvil
+    python benchmarks/bench_nonce_pipeline.py --txs 200 --threads 8
+    python benchmarks/bench_nonce_pipeline.py --node eth-tester   # in-process py-evm, no node needed
+
+Every run sends 0-ETH transfers from the dev chain's first funded account
+(override with BENCH_PRIVATE_KEY) and times submission only: nothing waits
+for mining until the end, when the account's pending count is checked against
+what was accepted. "rejected" counts sends the node refused, e.g. two threads
+that were handed the same nonce.
+
+With --node eth-tester the transfers go to an in-process py-evm chain that
+mines each one as it arrives, and the sending account is funded from the
+chain's first account. A nonce lookup there is a function call rather than
+an HTTP round trip, so the gap to NonceManager is a lower bound. eth-tester
+has no transaction pool and rejects a nonce that arrives ahead of its
+predecessor, so the threaded runs are skipped there.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain.nonces import NonceManager  # noqa: E402
+
+# Hardhat/anvil default account #0; only ever funded on local dev chains
+DEV_KEY = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80'
+SINK = '0x70997970C51812dc3A010C7d01b50e0d17dc79C8'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--node', default=os.getenv('ETH_NODE_URL', 'http://127.0.0.1:8545'),
+                        help="node URL, or eth-tester for an in-process py-evm chain")
+    parser.add_argument('--txs', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    in_process = args.node == 'eth-tester'
+    web3 = Web3(EthereumTesterProvider()) if in_process else Web3(Web3.HTTPProvider(args.node))
+    if not web3.is_connected():
+        sys.exit(f'no node at {args.node}')
+    account = web3.eth.account.from_key(os.getenv('BENCH_PRIVATE_KEY', DEV_KEY))
+    sender = account.address
+    if in_process:
+        web3.eth.wait_for_transaction_receipt(web3.eth.send_transaction(
+            {'from': web3.eth.accounts[0], 'to': sender, 'value': web3.to_wei(10, 'ether')}))
+    chain_id = web3.eth.chain_id
+    gas_price = web3.to_wei('2', 'gwei')
+
+    def send(nonce):
+        tx = {'nonce': nonce, 'to': SINK, 'value': 0, 'gas': 21000, 'gasPrice': gas_price, 'chainId': chain_id}
+        return web3.eth.send_raw_transaction(account.sign_transaction(tx).raw_transaction)
+
+    def node_nonce():
+        return web3.eth.get_transaction_count(sender, 'pending')
+
+    def run(label, next_nonce, threads, on_error=None):
+        counts = {'sent': 0, 'rejected': 0}
+        lock = threading.Lock()
+        per_thread = args.txs // threads
+
+        def worker():
+            for _ in range(per_thread):
+                nonce = next_nonce()
+                try:
+                    send(nonce)
+                    outcome = 'sent'
+                except Exception:
+                    outcome = 'rejected'
+                    if on_error is not None:
+                        on_error()
+                with lock:
+                    counts[outcome] += 1
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<40}{elapsed:>9.2f}{counts['sent'] / elapsed:>9.0f}{counts['rejected']:>10}")
+
+    def managed():
+        nonces = NonceManager(lambda address: web3.eth.get_transaction_count(address, 'pending'))
+        return (lambda: nonces.allocate(sender)), (lambda: nonces.invalidate(sender)), nonces
+
+    def lookup_cost(next_nonce):
+        start = time.perf_counter()
+        for _ in range(args.txs):
+            next_nonce()
+        return (time.perf_counter() - start) / args.txs * 1e6
+
+    allocate, _, _ = managed()
+    print(f"nonce lookup: node {lookup_cost(node_nonce):,.0f} us, NonceManager {lookup_cost(allocate):,.1f} us")
+
+    print(f"{args.txs} transfers from {sender} via {args.node}")
+    print(f"{'mode':<40}{'seconds':>9}{'tx/s':>9}{'rejected':>10}")
+    run('node nonce per tx, sequential', node_nonce, 1)
+    if not in_process:
+        run(f'node nonce per tx, {args.threads} threads', node_nonce, args.threads)
+    allocate, invalidate, _ = managed()
+    run('NonceManager, sequential', allocate, 1, invalidate)
+    if not in_process:
+        allocate, invalidate, nonces = managed()
+        run(f'NonceManager, {args.threads} threads', allocate, args.threads, invalidate)
+        print(f"NonceManager node syncs in the threaded run: {nonces.stats()['syncs']}")
+
+    # Pre-sign a block of consecutive nonces, then send them back-to-back
+    nonces = NonceManager(lambda address: web3.eth.get_transaction_count(address, 'pending'))
+    first = nonces.allocate(sender, args.txs)
+    start = time.perf_counter()
+    signed = [account.sign_transaction({'nonce': first + i, 'to': SINK, 'value': 0, 'gas': 21000,
+                                        'gasPrice': gas_price, 'chainId': chain_id}) for i in range(args.txs)]
+    signed_at = time.perf_counter()
+    for tx in signed:
+        web3.eth.send_raw_transaction(tx.raw_transaction)
+    elapsed = time.perf_counter() - start
+    print(f"{'pre-signed block, back-to-back':<40}{elapsed:>9.2f}{args.txs / elapsed:>9.0f}{0:>10}"
+          f"  (signing {signed_at - start:.2f}s)")
+
+    # Everything accepted must eventually be mined with no gaps left behind
+    deadline = time.time() + 60
+    while web3.eth.get_transaction_count(sender, 'latest') < web3.eth.get_transaction_count(sender, 'pending'):
+        if time.time() > deadline:
+            print('pending transactions not mined within 60 s (nonce gap?)')
+            break
+        time.sleep(0.5)
+    else:
+        print(f"all mined, account nonce now {web3.eth.get_transaction_count(sender, 'latest')}")
+
+
+if __name__ == '__main__':
+    main()
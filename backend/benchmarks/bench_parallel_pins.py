@@ -0,0 +1,83 @@
+"""
+Field-data submission latency: sequential image pins vs the bounded pin pool.
+
+    python benchmarks/bench_parallel_pins.py --images 8 --latency-ms 250
+
+The local pin endpoint sleeps ``--latency-ms`` per request to stand in for the
+Pinata round trip.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_ipfs_stream import PinHandler  # noqa: E402
+from pinning.parallel import PinPool  # noqa: E402
+from pinning.stream import pin_stream  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--kb', type=int, default=300)
+    parser.add_argument('--latency-ms', type=int, default=250)
+    parser.add_argument('--requests', type=int, default=3, help='concurrent submissions for the global-cap run')
+    args = parser.parse_args()
+
+    class SlowPinHandler(PinHandler):
+        def do_POST(self):
+            time.sleep(args.latency_ms / 1000)
+            super().do_POST()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowPinHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/pinning'
+    tmpdir = tempfile.mkdtemp()
+    images = []
+    for i in range(args.images):
+        path = os.path.join(tmpdir, f'img_{i}.jpg')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(args.kb * 1024))
+        images.append(path)
+
+    def pin(path):
+        with open(path, 'rb') as f:
+            return pin_stream(requests.post, url, {}, f, os.path.basename(path))['IpfsHash']
+
+    def submission(pool):
+        hashes = [pin(p) for p in images] if pool is None else [v for _, v in pool.map_ordered(pin, images)]
+        requests.post(url, json={'pinataContent': {'images': hashes}}, timeout=60)  # metadata pin
+
+    print(f"{args.images} images x {args.kb} KB, {args.latency_ms} ms per pin")
+    print(f"{'mode':<34}{'seconds':>9}")
+    t0 = time.perf_counter()
+    submission(None)
+    print(f"{'sequential':<34}{time.perf_counter() - t0:>9.2f}")
+    for workers, per_request in ((8, 4), (8, 8)):
+        pool = PinPool(workers, per_request)
+        t0 = time.perf_counter()
+        submission(pool)
+        print(f"{f'pool {workers}, per-request {per_request}':<34}{time.perf_counter() - t0:>9.2f}")
+        pool.shutdown()
+
+    pool = PinPool(8, 4)
+    threads = [threading.Thread(target=submission, args=(pool,)) for _ in range(args.requests)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    label = f'{args.requests} concurrent, pool 8/4'
+    print(f"{label:<34}{time.perf_counter() - t0:>9.2f}  peak in flight {pool.stats()['peak_in_flight']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Per-pin overhead of module-level ``requests.post`` vs PinataClient's pooled session,
+against a local HTTPS stand-in for Pinata (self-signed certificate, needs ``openssl``).
+
+    python benchmarks/bench_pin_session.py --pins 200 --threads 8
+"""
+import argparse
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_ipfs_stream import PinHandler  # noqa: E402
+from pinning.client import PinataClient  # noqa: E402
+
+
+class KeepAlivePinHandler(PinHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # otherwise delayed ACKs add ~40 ms to every keep-alive reply
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+
+def https_server(tmpdir):
+    cert, key = os.path.join(tmpdir, 'cert.pem'), os.path.join(tmpdir, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost', '-keyout', key, '-out', cert],
+                   check=True, capture_output=True)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAlivePinHandler)
+    server.connections = 0
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, cert
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    server, cert = https_server(tmpdir)
+    base = f'https://localhost:{server.server_address[1]}/pinning'
+    doc = {'type': 'field_data_metadata', 'images': ['QmLocal'] * 4, 'notes': 'x' * 512}
+
+    def module_post(i):
+        requests.post(f'{base}/pinJSONToIPFS', json={'pinataContent': doc, 'pinataMetadata': {'name': f'{i}.json'}},
+                      headers={'Authorization': 'Bearer test'}, timeout=60, verify=cert).json()
+
+    client = PinataClient('test', file_url=f'{base}/pinFileToIPFS', json_url=f'{base}/pinJSONToIPFS',
+                          pool_size=args.threads)
+    client.session.verify = cert
+    client.session.trust_env = False  # REQUESTS_CA_BUNDLE would otherwise override session.verify
+
+    def client_post(i):
+        result = client.pin_json(doc, f'{i}.json')
+        assert result['ok'], result['error']
+
+    print(f"{args.pins} JSON pins over local TLS")
+    print(f"{'mode':<36}{'ms/pin':>8}{'connections':>13}")
+    for name, fn, threads in (('requests.post, sequential', module_post, 1),
+                              ('PinataClient, sequential', client_post, 1),
+                              (f'requests.post, {args.threads} threads', module_post, args.threads),
+                              (f'PinataClient, {args.threads} threads', client_post, args.threads)):
+        server.connections = 0
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(fn, range(args.pins)))
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<36}{elapsed / args.pins * 1000:>8.2f}{server.connections:>13}")
+    stats = client.stats()['by_kind']['json']
+    print(f"client latency p50 {stats['latency_ms']['p50']} ms, p95 {stats['latency_ms']['p95']} ms")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
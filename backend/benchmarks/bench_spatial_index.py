@@ -0,0 +1,81 @@
+"""
+Bounding-box and nearby query latency: full scan vs (lat, lon) B-tree vs R*Tree.
+
+    python benchmarks/bench_spatial_index.py --rows 100000 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spatial import point_index  # noqa: E402
+
+
+def build(rows, mode):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE field_data (id INTEGER PRIMARY KEY, latitude REAL, longitude REAL, notes TEXT)')
+    rnd = random.Random(42)
+    conn.executemany(
+        'INSERT INTO field_data (latitude, longitude, notes) VALUES (?, ?, ?)',
+        ((rnd.uniform(-60, 70), rnd.uniform(-180, 180), 'x' * 40) for _ in range(rows)),
+    )
+    point_index._indexed.discard('field_data')
+    if mode == 'btree':
+        conn.execute('CREATE INDEX ix_field_data_latitude_longitude ON field_data (latitude, longitude)')
+    elif mode == 'rtree':
+        point_index.ensure_point_index(conn, 'field_data', 'latitude', 'longitude')
+    conn.commit()
+    return conn
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 200000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    print(f"{'rows':>8}  {'index':<8}{'bbox ms':>10}{'nearby ms':>11}{'insert us':>11}")
+    for rows in args.rows:
+        centres = [(rnd.uniform(-50, 60), rnd.uniform(-170, 170)) for _ in range(args.queries)]
+        boxes = [(lon - 0.5, lat - 0.5, lon + 0.5, lat + 0.5) for lat, lon in centres]
+        for mode in ('scan', 'btree', 'rtree'):
+            conn = build(rows, mode)
+            it = iter(range(10 ** 9))
+
+            def bbox_query():
+                sql, params = point_index.where_in_bbox(
+                    'field_data', 'latitude', 'longitude', boxes[next(it) % len(boxes)])
+                conn.execute(f'SELECT * FROM field_data WHERE {sql}', params).fetchall()
+
+            def nearby_query():
+                lat, lon = centres[next(it) % len(centres)]
+                sql, params = point_index.where_in_bbox(
+                    'field_data', 'latitude', 'longitude', point_index.radius_bbox(lat, lon, 50))
+                candidates = [dict(r) for r in conn.execute(f'SELECT * FROM field_data WHERE {sql}', params)]
+                point_index.within_radius(candidates, lat, lon, 50, limit=50)
+
+            def insert():
+                conn.execute('INSERT INTO field_data (latitude, longitude, notes) VALUES (?, ?, ?)',
+                             (rnd.uniform(-60, 70), rnd.uniform(-180, 180), 'x'))
+
+            bbox_ms = timed(bbox_query, args.queries)
+            nearby_ms = timed(nearby_query, args.queries)
+            insert_us = timed(insert, 2000) * 1000
+            print(f"{rows:>8}  {mode:<8}{bbox_ms:>10.3f}{nearby_ms:>11.3f}{insert_us:>11.1f}")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
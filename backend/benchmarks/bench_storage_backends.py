@@ -0,0 +1,114 @@
+"""
+Fully offline cost breakdown of the upload path, per storage backend.
+
+    python benchmarks/bench_storage_backends.py --files 16 --mb 8
+
+``local`` is the filesystem backend, which computes real CIDs. ``pinata``
+is PinataClient against a local stand-in endpoint, so the numbers are our
+own overhead (multipart encoding, hashing, HTTP) and not the network.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_ipfs_stream import PinHandler  # noqa: E402
+from pinning.backends import FilesystemBackend  # noqa: E402
+from pinning.client import PinataClient  # noqa: E402
+from pinning.parallel import PinPool  # noqa: E402
+from pinning.stream import CHUNK_SIZE, copy_hashed  # noqa: E402
+from pinning.unixfs import UnixfsHasher  # noqa: E402
+
+
+def read_chunks(path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--mb', type=int, default=8)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(tmpdir, f'drone_{i}.tif')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(args.mb * 1024 * 1024))
+        paths.append(path)
+    total_mb = args.files * args.mb
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PinHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/pinning'
+    pinata = PinataClient('test', file_url=f'{url}/pinFileToIPFS', json_url=f'{url}/pinJSONToIPFS')
+    local = FilesystemBackend(os.path.join(tmpdir, 'store'))
+
+    def sha256_only():
+        for path in paths:
+            digest = hashlib.sha256()
+            for chunk in read_chunks(path):
+                digest.update(chunk)
+
+    def cid_only():
+        for path in paths:
+            hasher = UnixfsHasher()
+            for chunk in read_chunks(path):
+                hasher.update(chunk)
+            hasher.cid()
+
+    def stage():
+        staging = os.path.join(tmpdir, 'staging')
+        os.makedirs(staging, exist_ok=True)
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                copy_hashed(f, os.path.join(staging, str(i)))
+        shutil.rmtree(staging)
+
+    def pin_with(backend, pool=None):
+        def pin(path):
+            with open(path, 'rb') as f:
+                result = backend.pin_file(f, os.path.basename(path))
+            assert result['ok'], result['error']
+            return result['cid']
+
+        def run():
+            cids = [pin(p) for p in paths] if pool is None else [v for _, v in pool.map_ordered(pin, paths)]
+            assert backend.pin_json({'images': cids}, 'metadata.json')['ok']
+        return run
+
+    pool = PinPool(8, 4)
+    print(f"{args.files} files x {args.mb} MB, all local")
+    print(f"{'step':<40}{'seconds':>9}{'MB/s':>9}")
+    for name, fn in (('sha256 only', sha256_only),
+                     ('UnixFS CID only', cid_only),
+                     ('stage to disk (copy_hashed)', stage),
+                     ('local backend, sequential', pin_with(local)),
+                     ('local backend, pin pool 8/4', pin_with(local, pool)),
+                     ('pinata client -> local stub, sequential', pin_with(pinata)),
+                     ('pinata client -> local stub, pool 8/4', pin_with(pinata, pool))):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<40}{elapsed:>9.2f}{total_mb / elapsed:>9.0f}")
+    for backend in (local, pinata):
+        stats = backend.stats()['by_kind']['file']
+        print(f"{backend.name:<8} file pin p50 {stats['latency_ms']['p50']} ms, p95 {stats['latency_ms']['p95']} ms")
+    pool.shutdown()
+    pinata.close()
+    server.shutdown()
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Decode throughput and wire size: JSON telemetry vs the binary record format.
+
+    python benchmarks/bench_telemetry_wire.py --points 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry.store import normalize_point  # noqa: E402
+from telemetry.wire import encode_points, decode_points, RECORD_SIZE  # noqa: E402
+
+
+def make_points(n):
+    base_ms = 1704067200000
+    return [{
+        'device_id': f'buoy-{i % 300:04d}',
+        'project_id': 1 + i % 5,
+        'lat': round(21.9 + random.random() / 10, 7),
+        'lon': round(88.9 + random.random() / 10, 7),
+        'altitude': round(random.random() * 10, 2),
+        'speed': round(random.random() * 5, 2),
+        'ts_ms': base_ms + i * 1000,
+    } for i in range(n)]
+
+
+def as_json_points(points):
+    return [dict(p, ts=p['ts_ms']) for p in points]
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=100000)
+    args = parser.parse_args()
+    n = args.points
+
+    points = make_points(n)
+    json_bodies = [json.dumps(p).encode() for p in as_json_points(points)]
+    json_array = json.dumps(as_json_points(points)).encode()
+    binary = encode_points(points)
+
+    per_request = timed(lambda: [normalize_point(json.loads(b)) for b in json_bodies])
+    array = timed(lambda: [normalize_point(p) for p in json.loads(json_array)])
+    packed = timed(lambda: decode_points(binary))
+
+    avg_json = sum(len(b) for b in json_bodies) / n
+    print(f"{'format':<22}{'bytes/point':>12}{'points/s':>14}")
+    print(f"{'JSON, one per request':<22}{avg_json:>12.1f}{n / per_request:>14.0f}")
+    print(f"{'JSON array':<22}{len(json_array) / n:>12.1f}{n / array:>14.0f}")
+    print(f"{'binary records':<22}{RECORD_SIZE:>12.1f}{n / packed:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
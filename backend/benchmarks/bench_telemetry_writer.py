@@ -0,0 +1,130 @@
+"""
+Sustained telemetry ingest: one INSERT+COMMIT per point vs the write-behind writer.
+
+Runs against a throwaway SQLite file with the same shape as the telemetry_point
+table, so it needs nothing beyond the standard library:
+
+    python benchmarks/bench_telemetry_writer.py --points 50000 --producers 4
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry.store import TelemetryWriter  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE telemetry_point (
+        id INTEGER PRIMARY KEY,
+        device_id VARCHAR(64) NOT NULL,
+        project_id INTEGER,
+        lat FLOAT NOT NULL,
+        lon FLOAT NOT NULL,
+        altitude FLOAT,
+        speed FLOAT,
+        ts DATETIME NOT NULL,
+        received_at DATETIME
+    )
+'''
+INSERT = '''
+    INSERT INTO telemetry_point (device_id, project_id, lat, lon, altitude, speed, ts, received_at)
+    VALUES (:device_id, :project_id, :lat, :lon, :altitude, :speed, :ts, :received_at)
+'''
+
+
+def make_points(n, devices=200):
+    start = datetime(2024, 1, 1)
+    return [{
+        'device_id': f'dev-{i % devices}',
+        'project_id': 1 + i % 5,
+        'lat': 21.9 + random.random() / 100,
+        'lon': 88.9 + random.random() / 100,
+        'altitude': random.random() * 10,
+        'speed': random.random() * 5,
+        'ts': (start + timedelta(seconds=i)).isoformat(),
+        'received_at': None,
+    } for i in range(n)]
+
+
+def open_db(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(SCHEMA)
+    conn.execute('CREATE INDEX ix_telemetry_device_ts ON telemetry_point (device_id, ts)')
+    conn.commit()
+    return conn
+
+
+def bench_per_point(path, points):
+    conn = open_db(path)
+    t0 = time.perf_counter()
+    for p in points:
+        conn.execute(INSERT, p)
+        conn.commit()
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed
+
+
+def bench_write_behind(path, points, producers, flush_rows, flush_ms):
+    conn = open_db(path)
+
+    def write_batch(rows):
+        with conn:
+            conn.executemany(INSERT, rows)
+
+    writer = TelemetryWriter(write_batch, flush_rows=flush_rows, flush_interval_ms=flush_ms,
+                             max_queue=len(points) + 1).start()
+    chunks = [points[i::producers] for i in range(producers)]
+
+    def produce(chunk):
+        for p in chunk:
+            while not writer.submit(p):
+                time.sleep(0.001)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(c,)) for c in chunks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    submitted = time.perf_counter() - t0
+    writer.flush()
+    elapsed = time.perf_counter() - t0
+    writer.stop()
+    count = conn.execute('SELECT COUNT(*) FROM telemetry_point').fetchone()[0]
+    conn.close()
+    return submitted, elapsed, count, writer.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=50000)
+    parser.add_argument('--baseline-points', type=int, default=2000,
+                        help='per-point commits are slow; measure a smaller sample')
+    parser.add_argument('--producers', type=int, default=4)
+    parser.add_argument('--flush-rows', type=int, default=500)
+    parser.add_argument('--flush-ms', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = bench_per_point(os.path.join(tmp, 'baseline.db'), make_points(args.baseline_points))
+        print(f"per-point commit : {args.baseline_points / base:10.0f} points/s "
+              f"({args.baseline_points} points in {base:.2f}s)")
+
+        submitted, elapsed, count, stats = bench_write_behind(
+            os.path.join(tmp, 'batched.db'), make_points(args.points),
+            args.producers, args.flush_rows, args.flush_ms)
+        print(f"write-behind     : {args.points / elapsed:10.0f} points/s sustained "
+              f"({count} rows in {elapsed:.2f}s, {stats['batches']} batches)")
+        print(f"ingest (enqueue) : {args.points / submitted:10.0f} points/s across {args.producers} producers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Track simplification: vertices kept and time per zoom level on a noisy GPS walk.
+
+    python benchmarks/bench_track_simplify.py --points 100000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry.track import simplify, tolerance_for_zoom  # noqa: E402
+
+
+def make_track(n):
+    rnd = random.Random(3)
+    lat, lon, heading = 21.9, 88.9, 0.0
+    t0 = datetime(2024, 1, 1)
+    points = []
+    for i in range(n):
+        heading += rnd.gauss(0, 0.15)
+        lat += math.cos(heading) * 1e-5 + rnd.gauss(0, 2e-6)
+        lon += math.sin(heading) * 1e-5 + rnd.gauss(0, 2e-6)
+        points.append((lat, lon, t0 + timedelta(seconds=i)))
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=100000)
+    args = parser.parse_args()
+    points = make_track(args.points)
+
+    def payload(pts):
+        return len(json.dumps([{'lat': a, 'lon': b, 'ts': c.isoformat()} for a, b, c in pts]))
+
+    raw_bytes = payload(points)
+    print(f"raw: {len(points)} points, {raw_bytes / 1024:.0f} KiB JSON")
+    print(f"{'zoom':>5}{'tol m':>9}{'kept':>8}{'ms':>9}{'KiB':>8}")
+    for zoom in (10, 12, 14, 16, 18):
+        tol = tolerance_for_zoom(zoom, 21.9)
+        t0 = time.perf_counter()
+        kept = simplify(points, tol)
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"{zoom:>5}{tol:>9.2f}{len(kept):>8}{ms:>9.1f}{payload(kept) / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# pragma version ~=0.4.0
+# CarbonCredit.sol written in Vyper, for gas measurements where solc is not available.
+# Same functions, event and storage writes per credit: id, owner, amount, issuedOn and the
+# projectName length word plus one word per 32 bytes, and one nextId write per call.
+# Names longer than 128 bytes do not fit the String bound; the benchmark's default is 40.
+
+struct Credit:
+    id: uint256
+    owner: address
+    amount: uint256
+    projectName: String[128]
+    issuedOn: uint256
+
+credits: public(HashMap[uint256, Credit])
+nextId: public(uint256)
+
+event CreditIssued:
+    id: uint256
+    owner: address
+    amount: uint256
+    projectName: String[128]
+    issuedOn: uint256
+
+
+@external
+def issueCredit(owner: address, amount: uint256, projectName: String[128]) -> uint256:
+    id: uint256 = self.nextId
+    self.credits[id] = Credit(id=id, owner=owner, amount=amount, projectName=projectName, issuedOn=block.timestamp)
+    log CreditIssued(id=id, owner=owner, amount=amount, projectName=projectName, issuedOn=block.timestamp)
+    self.nextId = id + 1
+    return id
+
+
+@external
+def issueCredits(owners: DynArray[address, 1024], amounts: DynArray[uint256, 1024], projectName: String[128]) -> uint256:
+    assert len(owners) == len(amounts), "owners and amounts differ in length"
+    firstId: uint256 = self.nextId
+    id: uint256 = firstId
+    for i: uint256 in range(len(owners), bound=1024):
+        self.credits[id] = Credit(id=id, owner=owners[i], amount=amounts[i], projectName=projectName,
+                                  issuedOn=block.timestamp)
+        log CreditIssued(id=id, owner=owners[i], amount=amounts[i], projectName=projectName, issuedOn=block.timestamp)
+        id += 1
+    self.nextId = id
+    return firstId
+
+
+@view
+@external
+def getCredit(id: uint256) -> (address, uint256, String[128], uint256):
+    c: Credit = self.credits[id]
+    return (c.owner, c.amount, c.projectName, c.issuedOn)
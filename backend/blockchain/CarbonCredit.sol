@@ -23,6 +23,28 @@ contract CarbonCredit {
         return nextId - 1;
     }
 
+    /// Issue one credit per (owner, amount) pair for the same project in a single transaction.
+    /// Returns the id of the first credit; the rest follow consecutively. Emits CreditIssued per credit.
+    function issueCredits(address[] calldata owners, uint256[] calldata amounts, string calldata projectName)
+        external
+        returns (uint256 firstId)
+    {
+        require(owners.length == amounts.length, "owners and amounts differ in length");
+        uint256 issuedOn = block.timestamp;
+        uint256 id = nextId;
+        firstId = id;
+        for (uint256 i = 0; i < owners.length; ) {
+            credits[id] = Credit(id, owners[i], amounts[i], projectName, issuedOn);
+            emit CreditIssued(id, owners[i], amounts[i], projectName, issuedOn);
+            unchecked {
+                ++id;
+                ++i;
+            }
+        }
+        // One write of the counter for the whole batch
+        nextId = id;
+    }
+
     function getCredit(uint256 id) public view returns (address, uint256, string memory, uint256) {
         Credit memory c = credits[id];
         return (c.owner, c.amount, c.projectName, c.issuedOn);
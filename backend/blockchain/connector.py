@@ -1,45 +1,184 @@
+import json
 import os
 from web3 import Web3
 
+from blockchain.contracts import ContractCache
+from blockchain.nonces import NonceManager
+
+CARBON_CREDIT_ABI_PATH = os.path.join(os.path.dirname(__file__), 'CarbonCredit.abi.json')
+# Share of the block gas limit one issuance transaction may use, so it still fits next to other traffic
+ISSUE_BLOCK_GAS_SHARE = float(os.getenv('ISSUE_BLOCK_GAS_SHARE', '0.5'))
+# Gas budget per issueCredits transaction. Measured on py-evm (benchmarks/bench_credit_issuance.py, 40-byte
+# project name): ~159k gas per credit plus ~43k per call, and per-credit cost stops falling past ~50 credits
+# (-14.1% vs one issueCredit each at 50, -14.3% at 100), so 9M (~51 credits) loses nothing to bigger batches
+# and keeps each transaction small enough to be picked up quickly.
+ISSUE_TX_GAS_BUDGET = int(os.getenv('ISSUE_TX_GAS_BUDGET', '9000000'))
+# Slope used when the two-point estimate is unusable; the measured per-credit cost above
+ISSUE_GAS_PER_CREDIT = int(os.getenv('ISSUE_GAS_PER_CREDIT', '159000'))
+
 class BlockchainConnector:
     def __init__(self):
         # Connect to local Ethereum node or Infura
         eth_node_url = os.getenv('ETH_NODE_URL', 'http://localhost:8545')
         self.web3 = Web3(Web3.HTTPProvider(eth_node_url))
-        if not self.web3.isConnected():
+        if not self.web3.is_connected():
             raise Exception('Unable to connect to Ethereum node')
+        # Nonces come from a local counter per account, synced with the node's pending count
+        self.nonces = NonceManager(lambda address: self.web3.eth.get_transaction_count(address, 'pending'))
+        # Contract objects, selectors and ABI types are built once per (address, ABI)
+        self.contracts = ContractCache(self.web3)
+        with open(CARBON_CREDIT_ABI_PATH) as f:
+            self.carbon_credit_abi = json.load(f)
+        self.carbon_credit_address = os.getenv('CARBON_CREDIT_ADDRESS')
+        if self.carbon_credit_address:
+            self.contracts.get(self.carbon_credit_address, self.carbon_credit_abi)
+        self._chain_id = None
+
+    @property
+    def chain_id(self):
+        # Fixed for the life of the node connection; build_transaction would otherwise ask on every call
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
 
     def get_balance(self, address):
         # Returns balance in Ether
-        return self.web3.fromWei(self.web3.eth.get_balance(address), 'ether')
+        return self.web3.from_wei(self.web3.eth.get_balance(address), 'ether')
 
     def send_transaction(self, from_addr, private_key, to_addr, value_ether):
         # Send Ether transaction
-        tx = {
-            'nonce': self.web3.eth.get_transaction_count(from_addr),
-            'to': to_addr,
-            'value': self.web3.toWei(value_ether, 'ether'),
-            'gas': 21000,
-            'gasPrice': self.web3.toWei('50', 'gwei')
-        }
-        signed_tx = self.web3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        return self.web3.toHex(tx_hash)
+        with self.nonces.reserve(from_addr) as nonce:
+            tx = {
+                'nonce': nonce,
+                'to': to_addr,
+                'value': self.web3.to_wei(value_ether, 'ether'),
+                'gas': 21000,
+                'gasPrice': self.web3.to_wei('50', 'gwei')
+            }
+            signed_tx = self.web3.eth.account.sign_transaction(tx, private_key)
+            tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        return self.web3.to_hex(tx_hash)
 
     def call_smart_contract(self, contract_address, abi, function_name, *args):
-        contract = self.web3.eth.contract(address=contract_address, abi=abi)
-        func = getattr(contract.functions, function_name)
-        return func(*args).call()
+        handle = self.contracts.get(contract_address, abi)
+        spec = handle.function(function_name)
+        if spec is None:
+            return getattr(handle.contract.functions, function_name)(*args).call()
+        return spec.decode(self.web3.eth.call({'to': handle.address, 'data': spec.encode(args)}))
 
-    def transact_smart_contract(self, contract_address, abi, function_name, from_addr, private_key, *args):
-        contract = self.web3.eth.contract(address=contract_address, abi=abi)
-        func = getattr(contract.functions, function_name)(*args)
-        tx = func.build_transaction({
+    def _build_contract_tx(self, contract_address, abi, function_name, from_addr, nonce, args, gas=2000000):
+        handle = self.contracts.get(contract_address, abi)
+        spec = handle.function(function_name)
+        params = {
             'from': from_addr,
-            'nonce': self.web3.eth.get_transaction_count(from_addr),
-            'gas': 2000000,
-            'gasPrice': self.web3.toWei('50', 'gwei')
-        })
+            'nonce': nonce,
+            'gas': gas,
+            'gasPrice': self.web3.to_wei('50', 'gwei'),
+            'chainId': self.chain_id,
+        }
+        if spec is None:
+            return getattr(handle.contract.functions, function_name)(*args).build_transaction(params)
+        return dict(params, to=handle.address, value=0, data=spec.encode(args))
+
+    def transact_smart_contract(self, contract_address, abi, function_name, from_addr, private_key, *args):
+        with self.nonces.reserve(from_addr) as nonce:
+            tx = self._build_contract_tx(contract_address, abi, function_name, from_addr, nonce, args)
+            signed_tx = self.web3.eth.account.sign_transaction(tx, private_key)
+            tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        return self.web3.to_hex(tx_hash)
+
+    def sign_contract_tx(self, contract_address, abi, function_name, from_addr, private_key, nonce, args,
+                         gas=None):
+        """Build and sign one contract call without sending it; returns (tx_hash, raw_tx) as hex strings.
+
+        gas=None estimates it with 20% headroom, so a call that would revert fails here rather than on chain.
+        """
+        tx = self._build_contract_tx(contract_address, abi, function_name, from_addr, nonce, args)
+        if gas is None:
+            gas = int(self.web3.eth.estimate_gas({key: tx[key] for key in ('from', 'to', 'value', 'data')}) * 1.2)
+        tx['gas'] = gas
         signed_tx = self.web3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        return self.web3.toHex(tx_hash)
+        return self.web3.to_hex(signed_tx.hash), self.web3.to_hex(signed_tx.raw_transaction)
+
+    def transact_many(self, contract_address, abi, function_name, from_addr, private_key, args_list):
+        """Sign one call per args tuple on consecutive nonces and send them back-to-back; returns tx hashes.
+
+        Nothing waits for mining. If a send fails the error propagates, the transactions before it stay
+        submitted, and the account is resynced before its next use so the unused nonces are handed out again.
+        """
+        args_list = list(args_list)
+        if not args_list:
+            return []
+        with self.nonces.reserve(from_addr, len(args_list)) as first:
+            signed = [
+                self.web3.eth.account.sign_transaction(
+                    self._build_contract_tx(contract_address, abi, function_name, from_addr, first + i, args),
+                    private_key)
+                for i, args in enumerate(args_list)
+            ]
+            return [self.web3.to_hex(self.web3.eth.send_raw_transaction(tx.raw_transaction)) for tx in signed]
+
+    def plan_credit_batches(self, from_addr, owners, amounts, project_name, contract_address=None, max_gas=None):
+        """Split an issuance into issueCredits chunks that fit max_gas; returns [(start, end, gas)].
+
+        Gas is modelled as base + per_credit * n from two estimates (1 and up to 16 credits), since each
+        credit costs the same fixed set of storage writes. max_gas defaults to ISSUE_TX_GAS_BUDGET, capped
+        at ISSUE_BLOCK_GAS_SHARE of the latest block's gas limit; raises ValueError when even one credit
+        does not fit it.
+        """
+        if len(owners) != len(amounts):
+            raise ValueError('owners and amounts differ in length')
+        if not owners:
+            return []
+        handle = self.contracts.get(contract_address or self.carbon_credit_address, self.carbon_credit_abi)
+        spec = handle.function('issueCredits')
+
+        def estimate(n):
+            data = spec.encode((owners[:n], amounts[:n], project_name))
+            return self.web3.eth.estimate_gas({'from': from_addr, 'to': handle.address, 'data': data})
+
+        probe = min(len(owners), 16)
+        single = estimate(1)
+        per_credit = (estimate(probe) - single) / (probe - 1) if probe > 1 else single
+        if per_credit <= 0:
+            # Later credits cannot be free; refunds or a node quirk skewed the probe, so use the measured cost
+            per_credit = ISSUE_GAS_PER_CREDIT
+        base = max(single - per_credit, 0)
+        if max_gas is None:
+            max_gas = min(ISSUE_TX_GAS_BUDGET,
+                          int(self.web3.eth.get_block('latest')['gasLimit'] * ISSUE_BLOCK_GAS_SHARE))
+        # 10% headroom: estimates are taken against current state and later chunks see a larger nextId
+        budget = max_gas / 1.1
+        if base + per_credit > budget:
+            raise ValueError(f'one credit needs ~{int((base + per_credit) * 1.1)} gas, over the {max_gas} budget')
+        chunk = int((budget - base) // per_credit)
+        return [(start, min(start + chunk, len(owners)),
+                 int((base + per_credit * (min(start + chunk, len(owners)) - start)) * 1.1))
+                for start in range(0, len(owners), chunk)]
+
+    def issue_credits(self, from_addr, private_key, owners, amounts, project_name, contract_address=None,
+                      max_gas=None):
+        """Issue credits through CarbonCredit.issueCredits, chunked to fit the block gas limit.
+
+        Chunks are signed on consecutive nonces and sent back-to-back without waiting for mining;
+        returns [{'tx_hash', 'start', 'count', 'gas'}] in credit order.
+        """
+        contract_address = contract_address or self.carbon_credit_address
+        if not contract_address:
+            raise ValueError('no CarbonCredit address (set CARBON_CREDIT_ADDRESS or pass contract_address)')
+        owners = [Web3.to_checksum_address(owner) for owner in owners]
+        amounts = [int(amount) for amount in amounts]
+        plan = self.plan_credit_batches(from_addr, owners, amounts, project_name, contract_address, max_gas)
+        if not plan:
+            return []
+        sent = []
+        with self.nonces.reserve(from_addr, len(plan)) as first:
+            for i, (start, end, gas) in enumerate(plan):
+                tx = self._build_contract_tx(contract_address, self.carbon_credit_abi, 'issueCredits', from_addr,
+                                             first + i, (owners[start:end], amounts[start:end], project_name),
+                                             gas=gas)
+                signed_tx = self.web3.eth.account.sign_transaction(tx, private_key)
+                tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+                sent.append({'tx_hash': self.web3.to_hex(tx_hash), 'start': start, 'count': end - start,
+                             'gas': gas})
+        return sent
@@ -0,0 +1,166 @@
+"""
+Contract handle cache for BlockchainConnector.
+
+``web3.eth.contract(address=..., abi=...)`` builds a new contract class on
+every call: it parses the ABI and builds a function object for each entry.
+Calling ``contract.functions.<name>(*args)`` then searches the ABI again for
+the matching function before encoding anything. ``ContractCache`` keeps one
+``ContractHandle`` per (address, ABI hash). A handle memoises, per function
+name, the function's ABI entry, its 4-byte selector and its input/output
+types, so a call is just ``selector + encode(types, args)``.
+
+Overloaded functions, functions with tuple (struct) arguments and functions
+returning address arrays are not memoised. For those,
+``ContractHandle.function`` returns None and callers go through web3's own
+matching on the cached contract object.
+
+Events are indexed by topic, so ``ContractHandle.decode_events`` can pick a
+contract's events out of a receipt without building web3 event filters.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector, to_checksum_address
+
+from eth_abi import decode as _decode, encode as _encode
+
+
+def abi_hash(abi) -> str:
+    """Stable digest of an ABI given as a list or a JSON string"""
+    if isinstance(abi, (str, bytes)):
+        abi = json.loads(abi)
+    return hashlib.sha256(json.dumps(abi, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class FunctionSpec:
+    __slots__ = ('name', 'abi', 'selector', 'inputs', 'outputs')
+
+    def __init__(self, abi: dict):
+        self.name = abi['name']
+        self.abi = abi
+        self.selector = function_abi_to_4byte_selector(abi)
+        self.inputs = [arg['type'] for arg in abi.get('inputs', [])]
+        self.outputs = [arg['type'] for arg in abi.get('outputs', [])]
+
+    def encode(self, args) -> bytes:
+        return self.selector + _encode(self.inputs, list(args))
+
+    def decode(self, data: bytes):
+        """Return value as web3 gives it: a single value, or a list for several outputs"""
+        # eth-abi returns lower-case addresses; web3 checksums them
+        values = [to_checksum_address(value) if kind == 'address' else value
+                  for kind, value in zip(self.outputs, _decode(self.outputs, bytes(data)))]
+        if len(values) == 1:
+            return values[0]
+        return list(values)
+
+
+class EventSpec:
+    __slots__ = ('name', 'topic', 'inputs')
+
+    def __init__(self, abi: dict):
+        self.name = abi['name']
+        self.topic = event_abi_to_log_topic(abi)
+        self.inputs = abi.get('inputs', [])
+
+    def decode(self, log) -> dict:
+        """Arguments of one log entry by name; indexed dynamic values stay as their topic hash"""
+        topics = iter(log['topics'][1:])
+        data_types = [arg['type'] for arg in self.inputs if not arg.get('indexed')]
+        data = iter(_decode(data_types, bytes(log['data'])))
+        args = {}
+        for arg in self.inputs:
+            kind = arg['type']
+            if not arg.get('indexed'):
+                value = next(data)
+            elif kind in ('string', 'bytes') or kind.endswith(']') or kind.startswith('tuple'):
+                value = bytes(next(topics))
+            else:
+                value = _decode([kind], bytes(next(topics)))[0]
+            args[arg['name']] = to_checksum_address(value) if kind == 'address' else value
+        return args
+
+
+class ContractHandle:
+    def __init__(self, web3, address: str, abi: list):
+        self.address = to_checksum_address(address)
+        self.abi = abi
+        self.contract = web3.eth.contract(address=self.address, abi=abi)
+        functions: Dict[str, List[dict]] = {}
+        for entry in abi:
+            if entry.get('type', 'function') == 'function':
+                functions.setdefault(entry['name'], []).append(entry)
+        self._specs: Dict[str, Optional[FunctionSpec]] = {}
+        for name, entries in functions.items():
+            entry = entries[0]
+            types = [arg['type'] for arg in entry.get('inputs', []) + entry.get('outputs', [])]
+            outputs = [arg['type'] for arg in entry.get('outputs', [])]
+            simple = (len(entries) == 1 and not any(t.startswith('tuple') for t in types)
+                      and not any(t.startswith('address[') for t in outputs))
+            self._specs[name] = FunctionSpec(entry) if simple else None
+        self._events: Dict[bytes, EventSpec] = {}
+        for entry in abi:
+            if entry.get('type') == 'event' and not entry.get('anonymous'):
+                spec = EventSpec(entry)
+                self._events[spec.topic] = spec
+
+    def function(self, name: str) -> Optional[FunctionSpec]:
+        """Memoised spec for name, or None if web3's own matching is needed; raises AttributeError if unknown"""
+        try:
+            return self._specs[name]
+        except KeyError:
+            raise AttributeError(f'contract {self.address} has no function {name}')
+
+    def decode_events(self, receipt) -> List[dict]:
+        """Events this contract emitted in a receipt, in log order, as {'event', 'args', 'log_index'}"""
+        events = []
+        for log in receipt['logs']:
+            if log['address'].lower() != self.address.lower() or not log['topics']:
+                continue
+            spec = self._events.get(bytes(log['topics'][0]))
+            if spec is not None:
+                events.append({'event': spec.name, 'args': spec.decode(log), 'log_index': log['logIndex']})
+        return events
+
+
+class ContractCache:
+    def __init__(self, web3):
+        self.web3 = web3
+        self._lock = threading.Lock()
+        self._handles: Dict[Tuple[str, str], ContractHandle] = {}
+        # id(abi object) -> (abi object, hash): the same list passed on every call is hashed once
+        self._abi_ids: Dict[int, Tuple[object, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _hash(self, abi) -> str:
+        known = self._abi_ids.get(id(abi))
+        if known is not None and known[0] is abi:
+            return known[1]
+        digest = abi_hash(abi)
+        with self._lock:
+            if len(self._abi_ids) >= 256:
+                # Callers that build a fresh ABI object per call only cost a re-hash, not memory
+                self._abi_ids.clear()
+            # Holding a reference keeps the id from being reused by another object
+            self._abi_ids[id(abi)] = (abi, digest)
+        return digest
+
+    def get(self, address: str, abi) -> ContractHandle:
+        key = (address.lower(), self._hash(abi))
+        handle = self._handles.get(key)
+        if handle is not None:
+            self.hits += 1
+            return handle
+        parsed = json.loads(abi) if isinstance(abi, (str, bytes)) else abi
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                handle = self._handles[key] = ContractHandle(self.web3, address, parsed)
+                self.misses += 1
+        return handle
+
+    def stats(self) -> dict:
+        return {'contracts': len(self._handles), 'hits': self.hits, 'misses': self.misses}
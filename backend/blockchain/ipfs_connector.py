@@ -1,15 +1,30 @@
-import ipfshttpclient
 import os
+import shutil
+
+from pinning.backends import LocalDaemonBackend
+from pinning.content_cache import ContentCache
+from pinning.stream import PinError
 
 class IPFSConnector:
     def __init__(self):
         ipfs_addr = os.getenv('IPFS_ADDR', '/ip4/127.0.0.1/tcp/5001')
-        self.client = ipfshttpclient.connect(ipfs_addr)
+        self.client = LocalDaemonBackend(ipfs_addr)
+        # Content is immutable per CID, so repeated reads are served from local disk
+        data_dir = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data'))
+        self.cache = ContentCache(
+            os.getenv('IPFS_CONNECTOR_CACHE_DIR', os.path.join(data_dir, 'ipfs_cache')),
+            self.client.fetch,
+            max_bytes=int(os.getenv('IPFS_CONTENT_CACHE_MAX_BYTES', str(2 * 1024 ** 3))),
+        )
 
     def upload_file(self, file_path):
-        res = self.client.add(file_path)
-        return res['Hash']
+        with open(file_path, 'rb') as file:
+            res = self.client.pin_file(file, os.path.basename(file_path))
+        if not res['ok']:
+            raise PinError(res['error'])
+        return res['cid']
 
     def get_file(self, file_hash, output_path):
-        self.client.get(file_hash, target=output_path)
+        with self.cache.open(file_hash) as src, open(output_path, 'wb') as out:
+            shutil.copyfileobj(src, out)
         return output_path
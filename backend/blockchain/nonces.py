@@ -0,0 +1,92 @@
+"""
+Local nonce allocation for transactions sent from the same account.
+
+Asking the node for ``get_transaction_count`` before every transaction costs
+an RPC round trip. It also hands the same nonce to two threads that ask
+before either transaction reaches the node, and one of them is then
+rejected. ``NonceManager`` asks the node once per account (the pending
+count, so transactions already in the pool are counted) and then hands out
+consecutive nonces from memory under a per-account lock. Transactions can
+then be signed and sent back-to-back without waiting for the previous one
+to be mined.
+
+A failed send leaves a gap that would block every later nonce. So a failure
+marks the account for resync: the next allocation asks the node again and
+carries on from its pending count, which reuses the missing nonce.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class NonceManager:
+    def __init__(self, get_pending_count: Callable[[str], int]):
+        self._get_pending_count = get_pending_count
+        self._lock = threading.Lock()
+        self._accounts: Dict[str, dict] = {}
+        self.allocated = 0
+        self.syncs = 0
+        self.failures = 0
+
+    def _account(self, address: str) -> dict:
+        key = address.lower()
+        with self._lock:
+            account = self._accounts.get(key)
+            if account is None:
+                account = self._accounts[key] = {'lock': threading.Lock(), 'next': None}
+            return account
+
+    def sync(self, address: str) -> int:
+        """Reload the next nonce for address from the node; returns it"""
+        account = self._account(address)
+        with account['lock']:
+            return self._sync(address, account)
+
+    def _sync(self, address: str, account: dict) -> int:
+        account['next'] = self._get_pending_count(address)
+        with self._lock:
+            self.syncs += 1
+        return account['next']
+
+    def allocate(self, address: str, count: int = 1) -> int:
+        """Reserve count consecutive nonces for address; returns the first"""
+        account = self._account(address)
+        with account['lock']:
+            if account['next'] is None:
+                self._sync(address, account)
+            first = account['next']
+            account['next'] += count
+        with self._lock:
+            self.allocated += count
+        return first
+
+    def invalidate(self, address: str):
+        """Forget the local counter so the next allocation resyncs with the node"""
+        account = self._account(address)
+        with account['lock']:
+            account['next'] = None
+        with self._lock:
+            self.failures += 1
+
+    @contextmanager
+    def reserve(self, address: str, count: int = 1) -> Iterator[int]:
+        """Allocate nonces for a send; if the block raises, the account is resynced before its next use"""
+        first = self.allocate(address, count)
+        try:
+            yield first
+        except BaseException:
+            self.invalidate(address)
+            raise
+
+    def peek(self, address: str) -> Optional[int]:
+        """Next nonce that would be handed out, or None before the first sync"""
+        return self._account(address)['next']
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'accounts': len(self._accounts),
+                'allocated': self.allocated,
+                'syncs': self.syncs,
+                'failures': self.failures,
+            }
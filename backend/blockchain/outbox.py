@@ -0,0 +1,490 @@
+"""
+Transaction outbox: contract calls recorded by the API, then sent and confirmed in the background.
+
+Signing a transaction, sending it and waiting for it to be mined takes from
+seconds to minutes, which is too long to hold an HTTP request open. Endpoints
+record an intent (a function name and its arguments) with
+``TransactionOutbox.submit`` and return at once. Two threads take it from
+there:
+
+- The submitter first claims the intent (``pending`` to ``signing`` in one
+  conditional update), so two processes sharing the table never sign the
+  same intent. It then allocates a nonce and signs the call. It stores the
+  signed bytes and the hash *before* broadcasting, so a crash mid-send can
+  never lead to the same intent being signed again on a new nonce.
+- The receipt poller checks every sent transaction once per interval. Once
+  its block is ``confirmations`` deep it is marked ``confirmed``, or
+  ``reverted`` if the call failed. If a reorg removes its block, it goes back
+  to waiting. If the node has forgotten it, it is broadcast again from the
+  stored bytes, which keeps the same hash. If its nonce was taken by another
+  transaction, it can never be mined, so the intent is signed again.
+
+Intents live in a table (``SqlTxStore``). ``stage`` adds one to the caller's
+database session, so it commits together with the row it belongs to. After a
+restart, unsent intents are sent and sent transactions are tracked again. A
+``signing`` claim older than ``claim_lease`` belongs to a process that died
+before storing a signature (nothing was sent), so it is released to
+``pending``. ``on_update`` is called with
+the transaction dict whenever its status, hash or block changes.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from queue import Queue
+from typing import Callable, List, Optional
+
+from eth_account import Account
+from web3.exceptions import ContractLogicError, TransactionNotFound
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SIGNING = 'signing'
+SUBMITTED = 'submitted'
+CONFIRMED = 'confirmed'
+REVERTED = 'reverted'
+FAILED = 'failed'
+
+_STOP = object()
+
+
+def _jsonable(value):
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+class SqlTxStore:
+    """Outbox persistence on a Flask-SQLAlchemy model (see models.database_models.ChainTransaction)"""
+
+    def __init__(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def create(self, kind: str, function: str, args: list, ref_id: Optional[int] = None,
+               tx_id: Optional[str] = None) -> str:
+        with self.app.app_context():
+            tx_id = self.stage(kind, function, args, ref_id, tx_id)
+            self.db.session.commit()
+        return tx_id
+
+    def stage(self, kind: str, function: str, args: list, ref_id: Optional[int] = None,
+              tx_id: Optional[str] = None) -> str:
+        """Add an intent to the current session without committing; the caller's commit records it"""
+        tx_id = tx_id or uuid.uuid4().hex
+        self.db.session.add(self.model(id=tx_id, kind=kind, ref_id=ref_id, function=function,
+                                       args=json.dumps(list(args)), status=PENDING, attempts=0))
+        return tx_id
+
+    def get(self, tx_id: str) -> Optional[dict]:
+        with self.app.app_context():
+            tx = self.db.session.get(self.model, tx_id)
+            return self._as_dict(tx) if tx is not None else None
+
+    def update(self, tx_id: str, where: Optional[dict] = None, **fields) -> bool:
+        """Set fields on one transaction; with where={column: value}, only if the row still matches"""
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'])
+        fields['updated_at'] = datetime.utcnow()
+        with self.app.app_context():
+            m = self.model
+            query = m.query.filter(m.id == tx_id)
+            for column, value in (where or {}).items():
+                query = query.filter(getattr(m, column) == value)
+            updated = query.update(fields, synchronize_session=False)
+            self.db.session.commit()
+            return updated > 0
+
+    def claim(self, tx_id: str) -> Optional[dict]:
+        """Move a pending intent to signing and count the attempt; None if another process got it first"""
+        with self.app.app_context():
+            m = self.model
+            claimed = m.query.filter(m.id == tx_id, m.status == PENDING).update(
+                {'status': SIGNING, 'attempts': m.attempts + 1, 'updated_at': datetime.utcnow()},
+                synchronize_session=False)
+            self.db.session.commit()
+            if not claimed:
+                return None
+            return self._as_dict(self.db.session.get(m, tx_id))
+
+    def release_stale(self, lease: float) -> List[str]:
+        """Return signing claims older than lease to pending; returns their ids"""
+        with self.app.app_context():
+            m = self.model
+            cutoff = datetime.utcnow() - timedelta(seconds=lease)
+            stale = [row.id for row in m.query.with_entities(m.id)
+                     .filter(m.status == SIGNING, m.updated_at < cutoff).all()]
+            released = [tx_id for tx_id in stale
+                        if m.query.filter(m.id == tx_id, m.status == SIGNING, m.updated_at < cutoff)
+                        .update({'status': PENDING}, synchronize_session=False)]
+            self.db.session.commit()
+            return released
+
+    def pending(self) -> List[str]:
+        """Ids of intents that were never sent, oldest first"""
+        with self.app.app_context():
+            m = self.model
+            return [row.id for row in m.query.with_entities(m.id).filter(m.status == PENDING)
+                    .order_by(m.created_at.asc()).all()]
+
+    def in_flight(self, limit: int = 500) -> List[dict]:
+        """Sent transactions still waiting for their confirmations, oldest first"""
+        with self.app.app_context():
+            m = self.model
+            return [self._as_dict(tx) for tx in m.query.filter(m.status == SUBMITTED)
+                    .order_by(m.created_at.asc()).limit(limit).all()]
+
+    @staticmethod
+    def _as_dict(tx) -> dict:
+        return {
+            'id': tx.id,
+            'kind': tx.kind,
+            'ref_id': tx.ref_id,
+            'function': tx.function,
+            'args': json.loads(tx.args) if tx.args else [],
+            'status': tx.status,
+            'from_address': tx.from_address,
+            'nonce': tx.nonce,
+            'tx_hash': tx.tx_hash,
+            'raw_tx': tx.raw_tx,
+            'block_number': tx.block_number,
+            'confirmations': tx.confirmations or 0,
+            'gas_used': tx.gas_used,
+            'result': json.loads(tx.result) if tx.result else None,
+            'error': tx.error,
+            'attempts': tx.attempts or 0,
+            'created_at': tx.created_at.isoformat() if tx.created_at else None,
+            'submitted_at': tx.submitted_at.isoformat() if tx.submitted_at else None,
+            'confirmed_at': tx.confirmed_at.isoformat() if tx.confirmed_at else None,
+            'updated_at': tx.updated_at.isoformat() if tx.updated_at else None,
+        }
+
+
+class TransactionOutbox:
+    """Sends CarbonCredit calls from one account; connector is a factory for a BlockchainConnector"""
+
+    def __init__(self, store, connector: Callable[[], object], private_key: str, confirmations: int = 2,
+                 poll_interval: float = 3.0, max_attempts: int = 5, retry_delay: float = 10.0,
+                 rebroadcast_after: float = 120.0, claim_lease: float = 300.0,
+                 on_update: Optional[Callable[[dict], None]] = None):
+        self.store = store
+        self._connector_factory = connector
+        self._connector = None
+        self._connector_lock = threading.Lock()
+        self._private_key = private_key
+        self.sender = Account.from_key(private_key).address
+        self.confirmations = max(1, confirmations)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rebroadcast_after = rebroadcast_after
+        self.claim_lease = claim_lease
+        self.on_update = on_update
+        self._queue = Queue()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # tx id -> monotonic time it was last broadcast (or first seen after a restart)
+        self._broadcast_at = {}
+        self.recorded = 0
+        self.sent = 0
+        self.confirmed = 0
+        self.reverted = 0
+        self.failed = 0
+        self.rebroadcasts = 0
+        self.reorgs = 0
+        self.waiting = 0
+        self.confirm_seconds = 0.0
+
+    def start(self) -> 'TransactionOutbox':
+        """Queue unsent intents from the store and start the submitter and receipt poller (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return self
+            self._stopping.clear()
+            self.store.release_stale(self.claim_lease)
+            for tx_id in self.store.pending():
+                self._queue.put(tx_id)
+            for name, target in (('chain-tx-submit', self._run_submitter), ('chain-tx-receipts', self._run_poller)):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def submit(self, kind: str, function: str, args, ref_id: Optional[int] = None,
+               tx_id: Optional[str] = None) -> str:
+        """Record an intent to call function(*args) and queue it for sending; returns the outbox id"""
+        return self.enqueue(self.store.create(kind, function, list(args), ref_id, tx_id))
+
+    def stage(self, kind: str, function: str, args, ref_id: Optional[int] = None) -> str:
+        """Add an intent to the caller's database session; pass the id to enqueue once it is committed"""
+        return self.store.stage(kind, function, list(args), ref_id)
+
+    def enqueue(self, tx_id: str) -> str:
+        """Queue a committed intent for sending; returns tx_id"""
+        self.start()
+        with self._lock:
+            self.recorded += 1
+        self._queue.put(tx_id)
+        return tx_id
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def connector(self):
+        """The BlockchainConnector, connected on first use; raises while the node is unreachable"""
+        with self._connector_lock:
+            if self._connector is None:
+                self._connector = self._connector_factory()
+            return self._connector
+
+    # Submitter
+
+    def _run_submitter(self):
+        while True:
+            tx_id = self._queue.get()
+            if tx_id is _STOP:
+                return
+            try:
+                self._send(tx_id)
+            except Exception:
+                # Store errors must not kill the thread; the intent stays pending for the next start
+                logger.exception('Outbox transaction %s could not be processed', tx_id)
+
+    def _send(self, tx_id: str):
+        tx = self.store.get(tx_id)
+        if tx is None or tx['status'] != PENDING:
+            return
+        try:
+            conn = self.connector()
+        except Exception as e:
+            # Not an attempt: nothing was signed
+            logger.warning('Ethereum node unavailable, transaction %s waits: %s', tx_id, e)
+            self._defer(tx_id)
+            return
+        tx = self.store.claim(tx_id)
+        if tx is None:
+            return  # Another process is signing it
+        attempts = tx['attempts']
+        nonce = conn.nonces.allocate(self.sender)
+        try:
+            tx_hash, raw_tx = conn.sign_contract_tx(conn.carbon_credit_address, conn.carbon_credit_abi,
+                                                    tx['function'], self.sender, self._private_key, nonce,
+                                                    tx['args'])
+            # Recorded before the send: whatever happens next, the poller tracks this exact transaction.
+            # The attempt count identifies this claim; if the lease ran out and the intent was claimed
+            # again meanwhile, the newer claim owns it and this signature is thrown away.
+            claimed = self.store.update(tx_id, where={'status': SIGNING, 'attempts': attempts}, status=SUBMITTED,
+                                        from_address=self.sender, nonce=nonce, tx_hash=tx_hash, raw_tx=raw_tx,
+                                        submitted_at=datetime.utcnow(), error=None)
+        except Exception as e:
+            conn.nonces.invalidate(self.sender)
+            self._attempt_failed(tx, attempts, e)
+            return
+        if not claimed:
+            logger.warning('Outbox transaction %s was reclaimed while signing; not sending', tx_id)
+            conn.nonces.invalidate(self.sender)
+            return
+        try:
+            conn.web3.eth.send_raw_transaction(raw_tx)
+            self._broadcast_at[tx_id] = time.monotonic()
+        except Exception as e:
+            # The node may still have taken it (e.g. a read timeout), so it stays submitted and the
+            # poller sorts it out: receipt, re-broadcast, or a fresh signature if the nonce is gone
+            logger.warning('Sending transaction %s (%s) failed: %s', tx_id, tx_hash, e)
+            conn.nonces.invalidate(self.sender)
+            self.store.update(tx_id, error=str(e)[:1000])
+            self._broadcast_at[tx_id] = time.monotonic() - self.rebroadcast_after + self.retry_delay
+        with self._lock:
+            self.sent += 1
+        self._notify(tx_id)
+
+    def _attempt_failed(self, tx: dict, attempts: int, error: Exception):
+        reverts = isinstance(error, ContractLogicError)
+        claim = {'status': SIGNING, 'attempts': attempts}
+        if reverts or attempts >= self.max_attempts:
+            logger.warning('Outbox transaction %s (%s) failed: %s', tx['id'], tx['function'], error)
+            if self.store.update(tx['id'], where=claim, status=FAILED, error=str(error)[:1000]):
+                with self._lock:
+                    self.failed += 1
+                self._notify(tx['id'])
+            return
+        if self.store.update(tx['id'], where=claim, status=PENDING, error=str(error)[:1000]):
+            self._defer(tx['id'])
+
+    def _defer(self, tx_id: str):
+        def requeue():
+            with self._lock:
+                self.waiting -= 1
+            self._queue.put(tx_id)
+
+        with self._lock:
+            self.waiting += 1
+        timer = threading.Timer(self.retry_delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    # Receipt poller
+
+    def _run_poller(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning('Receipt poll failed: %s', e)
+
+    def poll(self) -> int:
+        """Check every in-flight transaction once; returns how many were checked"""
+        for tx_id in self.store.release_stale(self.claim_lease):
+            logger.warning('Outbox transaction %s was left signing by a stopped process; sending it again', tx_id)
+            self._queue.put(tx_id)
+        txs = self.store.in_flight()
+        if not txs:
+            return 0
+        conn = self.connector()
+        head = conn.web3.eth.block_number
+        for tx in txs:
+            self._check(conn, head, tx)
+        return len(txs)
+
+    def _receipt(self, conn, tx_hash: str):
+        try:
+            return conn.web3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+
+    def _check(self, conn, head: int, tx: dict):
+        receipt = self._receipt(conn, tx['tx_hash'])
+        if receipt is None:
+            if tx['block_number'] is not None:
+                # Its block was reorganised away; it is back in the pool or was dropped (checked below)
+                with self._lock:
+                    self.reorgs += 1
+                self.store.update(tx['id'], block_number=None, confirmations=0)
+                self._notify(tx['id'])
+            self._check_dropped(conn, tx)
+            return
+        depth = head - receipt['blockNumber'] + 1
+        if depth < self.confirmations:
+            if tx['block_number'] != receipt['blockNumber']:
+                self.store.update(tx['id'], block_number=receipt['blockNumber'], confirmations=max(depth, 0))
+                self._notify(tx['id'])
+            return
+        fields = {'block_number': receipt['blockNumber'], 'confirmations': depth, 'gas_used': receipt['gasUsed'],
+                  'confirmed_at': datetime.utcnow()}
+        if receipt['status'] == 1:
+            handle = conn.contracts.get(conn.carbon_credit_address, conn.carbon_credit_abi)
+            fields.update(status=CONFIRMED, error=None, result={'events': _jsonable(handle.decode_events(receipt))})
+        else:
+            fields.update(status=REVERTED, error='transaction reverted')
+        self._broadcast_at.pop(tx['id'], None)
+        if not self.store.update(tx['id'], where={'status': SUBMITTED, 'tx_hash': tx['tx_hash']}, **fields):
+            return  # Another poller recorded the outcome first
+        with self._lock:
+            if fields['status'] == CONFIRMED:
+                self.confirmed += 1
+            else:
+                self.reverted += 1
+            if tx['submitted_at']:
+                self.confirm_seconds += (fields['confirmed_at']
+                                         - datetime.fromisoformat(tx['submitted_at'])).total_seconds()
+        self._notify(tx['id'])
+
+    def _check_dropped(self, conn, tx: dict):
+        """Re-broadcast a transaction the node no longer knows, or re-sign it if its nonce was taken"""
+        now = time.monotonic()
+        if now - self._broadcast_at.setdefault(tx['id'], now) < self.rebroadcast_after:
+            return
+        self._broadcast_at[tx['id']] = now
+        try:
+            conn.web3.eth.get_transaction(tx['tx_hash'])
+            return  # Still in the pool, just not mined yet
+        except TransactionNotFound:
+            pass
+        if conn.web3.eth.get_transaction_count(tx['from_address'], 'latest') > tx['nonce']:
+            # Look once more: it may have been mined between the receipt check and the count
+            if self._receipt(conn, tx['tx_hash']) is None:
+                self._resign(conn, tx, 'nonce was used by another transaction')
+            return
+        attempts = tx['attempts'] + 1
+        if attempts > self.max_attempts:
+            # Its nonce is still free: a later intent resyncs and takes it, so nothing is left stuck
+            conn.nonces.invalidate(tx['from_address'])
+            self._fail(tx, attempts, f"dropped by the node: {tx['error'] or 'not mined'}")
+            return
+        try:
+            conn.web3.eth.send_raw_transaction(tx['raw_tx'])
+            self.store.update(tx['id'], attempts=attempts)
+        except Exception as e:
+            self.store.update(tx['id'], attempts=attempts, error=str(e)[:1000])
+        with self._lock:
+            self.rebroadcasts += 1
+
+    def _resign(self, conn, tx: dict, reason: str):
+        if tx['attempts'] >= self.max_attempts:
+            self._fail(tx, tx['attempts'], reason)
+            return
+        # Conditional, so when several processes poll the same row only one of them queues the re-sign
+        resigned = self.store.update(tx['id'], where={'status': SUBMITTED, 'tx_hash': tx['tx_hash']},
+                                     status=PENDING, nonce=None, tx_hash=None, raw_tx=None, submitted_at=None,
+                                     error=reason)
+        self._broadcast_at.pop(tx['id'], None)
+        if resigned:
+            self._notify(tx['id'])
+            self._queue.put(tx['id'])
+
+    def _fail(self, tx: dict, attempts: int, reason: str):
+        self._broadcast_at.pop(tx['id'], None)
+        # Conditional like _resign: a row another poller already failed, confirmed or re-signed is left alone
+        if not self.store.update(tx['id'], where={'status': SUBMITTED, 'tx_hash': tx['tx_hash']}, status=FAILED,
+                                 attempts=attempts, error=reason[:1000]):
+            return
+        logger.warning('Outbox transaction %s (%s) failed: %s', tx['id'], tx['tx_hash'], reason)
+        with self._lock:
+            self.failed += 1
+        self._notify(tx['id'])
+
+    def _notify(self, tx_id: str):
+        if self.on_update is None:
+            return
+        try:
+            tx = self.store.get(tx_id)
+            if tx is not None:
+                self.on_update(tx)
+        except Exception:
+            logger.exception('on_update failed for outbox transaction %s', tx_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.confirmed + self.reverted
+            return {
+                'sender': self.sender,
+                'confirmations': self.confirmations,
+                'threads': len(self._threads),
+                'queued': self._queue.qsize(),
+                'waiting_retry': self.waiting,
+                'recorded': self.recorded,
+                'sent': self.sent,
+                'confirmed': self.confirmed,
+                'reverted': self.reverted,
+                'failed': self.failed,
+                'rebroadcasts': self.rebroadcasts,
+                'reorgs': self.reorgs,
+                'avg_confirm_seconds': round(self.confirm_seconds / finished, 2) if finished else None,
+            }
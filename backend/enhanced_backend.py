@@ -17,6 +17,8 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import bleach
 from marshmallow import Schema, fields, ValidationError
 from flask import Response
+from realtime.heartbeat import HeartbeatScheduler
+from spatial import point_index
 
 # Configure logging
 logging.basicConfig(
@@ -297,20 +299,24 @@ def health_check():
         }), 503
 
 # Server-Sent Events endpoint for realtime updates (basic heartbeat)
+def _heartbeat_frame():
+    data = json.dumps({
+        'type': 'heartbeat',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+    return f"data: {data}\n\n".encode()
+
+# Shared keep-alive timer: one ping per tick, serialised once for every connected client
+heartbeat = HeartbeatScheduler(
+    interval=float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15')),
+    build_frame=_heartbeat_frame
+)
+
 @app.route('/sse')
 def sse_stream():
-    def event_stream():
-        # Simple heartbeat every 15 seconds; replace with real events later
-        import time
-        while True:
-            data = json.dumps({
-                'type': 'heartbeat',
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            yield f"data: {data}\n\n"
-            time.sleep(15)
+    stream = heartbeat.open()
     headers = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Connection": "keep-alive"}
-    return Response(event_stream(), headers=headers)
+    return Response(heartbeat.iter_frames(stream, initial=_heartbeat_frame()), headers=headers)
 
 # Logging endpoint
 @app.route('/api/logs', methods=['POST'])
@@ -575,6 +581,10 @@ def init_database():
         )
     ''')
     
+    # Spatial indexes (R*Tree kept in sync by triggers) for nearby/bbox queries
+    point_index.ensure_point_index(conn, 'projects', 'latitude', 'longitude')
+    point_index.ensure_point_index(conn, 'field_data', 'latitude', 'longitude')
+    
     conn.commit()
     conn.close()
     logger.info("Database initialized successfully")
@@ -617,6 +627,35 @@ def get_projects():
         logger.error(f"Error fetching projects: {str(e)}")
         return jsonify({'error': 'Failed to fetch projects'}), 500
 
+@app.route('/api/projects/nearby', methods=['GET'])
+def get_projects_nearby():
+    """Get projects within radius_km of a point, nearest first"""
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_km = request.args.get('radius_km', 10.0, type=float)
+        limit = request.args.get('limit', 50, type=int)
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify({'error': 'lat and lon are required and must be valid coordinates'}), 400
+        if not (0 < radius_km <= 20000):
+            return jsonify({'error': 'radius_km must be between 0 and 20000'}), 400
+        
+        bbox_sql, params = point_index.where_in_bbox(
+            'projects', 'latitude', 'longitude', point_index.radius_bbox(lat, lon, radius_km))
+        candidates = execute_query(f"SELECT * FROM projects WHERE {bbox_sql}", params, fetch='all')
+        projects = point_index.within_radius(candidates, lat, lon, radius_km, limit=limit)
+        
+        return jsonify({
+            'projects': projects,
+            'total': len(projects),
+            'center': {'lat': lat, 'lon': lon},
+            'radius_km': radius_km
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching nearby projects: {str(e)}")
+        return jsonify({'error': 'Failed to fetch nearby projects'}), 500
+
 # Backward-compatible alias for legacy frontend requests
 @app.route('/projects', methods=['GET'])
 def get_projects_legacy():
@@ -737,6 +776,7 @@ def get_field_data():
     try:
         project_id = request.args.get('project_id', type=int)
         data_type = request.args.get('data_type')
+        bbox = request.args.get('bbox')
         
         query = """SELECT fd.*, p.name as project_name, u.username as collected_by_name
                    FROM field_data fd
@@ -753,6 +793,15 @@ def get_field_data():
             query += " AND fd.data_type = ?"
             params.append(data_type)
         
+        if bbox:
+            try:
+                bbox_sql, bbox_params = point_index.where_in_bbox(
+                    'field_data', 'latitude', 'longitude', point_index.parse_bbox(bbox), alias='fd')
+            except ValueError as e:
+                return jsonify({'error': 'Invalid bbox', 'message': str(e)}), 400
+            query += f" AND {bbox_sql}"
+            params.extend(bbox_params)
+        
         query += " ORDER BY fd.collected_at DESC"
         
         field_data = execute_query(query, params, fetch='all')
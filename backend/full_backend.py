@@ -3,8 +3,11 @@ from flask_cors import CORS
 import json
 import sqlite3
 from datetime import datetime
+import os
 import uuid
 from typing import Any, Dict, List, Tuple, Optional, cast
+from realtime.heartbeat import HeartbeatScheduler
+from spatial import point_index
 
 app = Flask(__name__)
 # Configure CORS to avoid duplicate headers and allow custom request headers used by the frontend
@@ -173,6 +176,10 @@ def ensure_schema():
         if not column_exists('projects', 'carbon_sequestration'):
             cursor.execute("ALTER TABLE projects ADD COLUMN carbon_sequestration REAL DEFAULT 0")
 
+        # Spatial indexes (R*Tree kept in sync by triggers) for nearby/bbox queries
+        point_index.ensure_point_index(conn, 'projects', 'latitude', 'longitude')
+        point_index.ensure_point_index(conn, 'field_data', 'location_lat', 'location_lng')
+
         conn.commit()
     finally:
         conn.close()
@@ -441,6 +448,38 @@ def get_projects():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/projects/nearby', methods=['GET'])
+def get_projects_nearby():
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_km = request.args.get('radius_km', 10.0, type=float)
+        limit = request.args.get('limit', 50, type=int)
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify({'error': 'lat and lon are required and must be valid coordinates'}), 400
+        if not (0 < radius_km <= 20000):
+            return jsonify({'error': 'radius_km must be between 0 and 20000'}), 400
+
+        bbox_sql, params = point_index.where_in_bbox(
+            'projects', 'latitude', 'longitude', point_index.radius_bbox(lat, lon, radius_km))
+
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM projects WHERE {bbox_sql}", params)
+        candidates = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        projects = point_index.within_radius(candidates, lat, lon, radius_km, limit=limit)
+        return jsonify({
+            'projects': projects,
+            'total': len(projects),
+            'center': {'lat': lat, 'lon': lon},
+            'radius_km': radius_km
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/projects/<int:project_id>', methods=['GET'])
 def get_project_by_id(project_id: int):
     try:
@@ -668,27 +707,33 @@ def issue_carbon_credits():
 def get_field_data():
     try:
         project_id = request.args.get('project_id')
+        bbox = request.args.get('bbox')
+
+        where: List[str] = []
+        params: List[Any] = []
+        if project_id:
+            where.append("fd.project_id = ?")
+            params.append(project_id)
+        if bbox:
+            try:
+                bbox_sql, bbox_params = point_index.where_in_bbox(
+                    'field_data', 'location_lat', 'location_lng', point_index.parse_bbox(bbox), alias='fd')
+            except ValueError as e:
+                return jsonify({'error': f'Invalid bbox: {e}'}), 400
+            where.append(bbox_sql)
+            params.extend(bbox_params)
 
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
 
-        if project_id:
-            cursor.execute('''
-                SELECT fd.*, p.name as project_name, u.username as collector_name
-                FROM field_data fd
-                JOIN projects p ON fd.project_id = p.id
-                LEFT JOIN users u ON fd.collected_by = u.id
-                WHERE fd.project_id = ?
-                ORDER BY fd.collected_at DESC
-            ''', (project_id,))
-        else:
-            cursor.execute('''
-                SELECT fd.*, p.name as project_name, u.username as collector_name
-                FROM field_data fd
-                JOIN projects p ON fd.project_id = p.id
-                LEFT JOIN users u ON fd.collected_by = u.id
-                ORDER BY fd.collected_at DESC
-            ''')
+        cursor.execute(f'''
+            SELECT fd.*, p.name as project_name, u.username as collector_name
+            FROM field_data fd
+            JOIN projects p ON fd.project_id = p.id
+            LEFT JOIN users u ON fd.collected_by = u.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY fd.collected_at DESC
+        ''', params)
 
         field_data: List[Dict[str, Any]] = []
         for row in cursor.fetchall():
@@ -887,24 +932,27 @@ def ingest_logs():
         return jsonify({'error': str(e)}), 500
 
 # Server-Sent Events endpoint for simple realtime heartbeats/updates
+def _ping_frame() -> bytes:
+    return f"event: ping\n" f"data: {json.dumps({'time': datetime.now().isoformat()})}\n\n".encode()
+
+# Keep-alive every 15 seconds from a single timer; the ping is built once per tick, not per client
+heartbeat = HeartbeatScheduler(
+    interval=float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15')),
+    build_frame=_ping_frame
+)
+
 @app.route('/sse', methods=['GET'])
 def sse_stream():
-    def event_stream():
-        # Initial hello event so clients know the stream is open
-        yield f"event: hello\n" f"data: {json.dumps({'status': 'connected', 'time': datetime.now().isoformat()})}\n\n"
-        # Periodic heartbeat pings
-        while True:
-            # Keep-alive every 15 seconds
-            import time
-            time.sleep(15)
-            yield f"event: ping\n" f"data: {json.dumps({'time': datetime.now().isoformat()})}\n\n"
+    stream = heartbeat.open()
+    # Initial hello event so clients know the stream is open
+    hello = f"event: hello\n" f"data: {json.dumps({'status': 'connected', 'time': datetime.now().isoformat()})}\n\n"
 
     headers = {
         'Cache-Control': 'no-cache',
         'X-Accel-Buffering': 'no',
         'Connection': 'keep-alive',
     }
-    return Response(event_stream(), mimetype='text/event-stream', headers=headers)
+    return Response(heartbeat.iter_frames(stream, initial=hello.encode()), mimetype='text/event-stream', headers=headers)
 
 @app.route('/')
 def index():
@@ -46,8 +46,10 @@ class RestorationProject(db.Model):
     description = db.Column(db.Text, nullable=True)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    boundary = db.Column(db.Text, nullable=True)  # GeoJSON Polygon/MultiPolygon, lon/lat order
     photo_path = db.Column(db.String(500), nullable=True)
     ipfs_hash = db.Column(db.String(100), nullable=True)
+    photo_renditions = db.Column(db.Text, nullable=True)  # JSON {"web": cid, "thumb": cid}
     metadata_hash = db.Column(db.String(100), nullable=True)
     ecosystem_type = db.Column(db.Enum(EcosystemType), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -91,6 +93,8 @@ class CarbonCredit(db.Model):
     issued_at = db.Column(db.DateTime, default=datetime.utcnow)
     retired = db.Column(db.Boolean, default=False)
     retired_at = db.Column(db.DateTime, nullable=True)
+    tx_hash = db.Column(db.String(66), nullable=True)  # issueCredit transaction, once signed
+    chain_status = db.Column(db.String(16), nullable=True)  # outbox status: pending, submitted, confirmed, ...
     
     project = db.relationship('RestorationProject', backref='carbon_credits')
     owner = db.relationship('User', backref='carbon_credits')
@@ -110,3 +114,138 @@ class VerificationReport(db.Model):
     
     project = db.relationship('RestorationProject', backref='verification_reports')
     verifier = db.relationship('User', backref='verification_reports')
+
+class TelemetryPoint(db.Model):
+    """Append-only GPS telemetry; rows are written in batches by the telemetry writer"""
+    __tablename__ = 'telemetry_point'
+    __table_args__ = (
+        # Also the idempotency backstop: a retried fix is dropped rather than stored twice
+        db.Index('uq_telemetry_device_ts', 'device_id', 'ts', unique=True),
+        db.Index('uq_telemetry_device_msg', 'device_id', 'message_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(64), nullable=False)
+    project_id = db.Column(db.Integer, nullable=True)
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    altitude = db.Column(db.Float, nullable=True)
+    speed = db.Column(db.Float, nullable=True)
+    ts = db.Column(db.DateTime, nullable=False)
+    message_id = db.Column(db.String(64), nullable=True)
+    inside_project_id = db.Column(db.Integer, nullable=True)  # project whose boundary contains the fix
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TelemetryRollup(db.Model):
+    """Per-device telemetry summary for one minute/hour bucket, merged incrementally on write"""
+    __tablename__ = 'telemetry_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'resolution', 'bucket_start', name='uq_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(64), nullable=False)
+    resolution = db.Column(db.String(8), nullable=False)  # '1m', '1h'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    point_count = db.Column(db.Integer, nullable=False, default=0)
+    first_ts = db.Column(db.DateTime, nullable=False)
+    last_ts = db.Column(db.DateTime, nullable=False)
+    last_lat = db.Column(db.Float, nullable=False)
+    last_lon = db.Column(db.Float, nullable=False)
+    distance_m = db.Column(db.Float, nullable=False, default=0.0)
+    speed_min = db.Column(db.Float, nullable=True)
+    speed_max = db.Column(db.Float, nullable=True)
+    speed_sum = db.Column(db.Float, nullable=False, default=0.0)
+    speed_count = db.Column(db.Integer, nullable=False, default=0)
+    alt_min = db.Column(db.Float, nullable=True)
+    alt_max = db.Column(db.Float, nullable=True)
+    alt_sum = db.Column(db.Float, nullable=False, default=0.0)
+    alt_count = db.Column(db.Integer, nullable=False, default=0)
+
+class IngestReceipt(db.Model):
+    """Idempotency record for non-telemetry gateway uploads (e.g. IoT photos) and their outcome"""
+    __tablename__ = 'ingest_receipt'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'device_id', 'dedup_key', name='uq_ingest_receipt'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # 'photo'
+    device_id = db.Column(db.String(64), nullable=False)
+    dedup_key = db.Column(db.String(128), nullable=False)  # message id or ts:<iso timestamp>
+    ipfs_hash = db.Column(db.String(100), nullable=True)
+    job_id = db.Column(db.String(32), nullable=True)  # upload job that pins the payload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadJob(db.Model):
+    """Background IPFS upload job; payload/result are JSON text (see pinning/jobs.py)"""
+    __tablename__ = 'upload_job'
+    __table_args__ = (
+        db.Index('ix_upload_job_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # 'project', 'iot_photo', 'field_data'
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MetadataBatch(db.Model):
+    """One pinned document holding many field-data metadata records under a Merkle root (see pinning/merkle.py)"""
+    __tablename__ = 'metadata_batch'
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='pinning')  # pinning, pinned
+    merkle_root = db.Column(db.String(64), nullable=True)
+    cid = db.Column(db.String(100), nullable=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    pinned_at = db.Column(db.DateTime, nullable=True)
+
+class MetadataRecord(db.Model):
+    """Field-data metadata waiting for, or included in, a MetadataBatch; proof is JSON text"""
+    __tablename__ = 'metadata_record'
+    __table_args__ = (
+        db.Index('ix_metadata_record_batch', 'batch_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), nullable=True)  # upload job that pinned the images
+    metadata_json = db.Column(db.Text, nullable=False)  # canonical JSON, exactly the bytes hashed into the leaf
+    leaf_hash = db.Column(db.String(64), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('metadata_batch.id'), nullable=True)
+    leaf_index = db.Column(db.Integer, nullable=True)
+    proof = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChainTransaction(db.Model):
+    """Outbox entry for a contract call sent in the background (see blockchain/outbox.py); args/result are JSON"""
+    __tablename__ = 'chain_transaction'
+    __table_args__ = (
+        db.Index('ix_chain_transaction_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # 'carbon_credit'
+    ref_id = db.Column(db.Integer, nullable=True)  # row the call is for, e.g. carbon_credit.id
+    function = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, signing, submitted, confirmed, reverted, failed
+    from_address = db.Column(db.String(42), nullable=True)
+    nonce = db.Column(db.Integer, nullable=True)
+    tx_hash = db.Column(db.String(66), nullable=True, index=True)
+    raw_tx = db.Column(db.Text, nullable=True)  # signed bytes, kept for re-broadcast
+    block_number = db.Column(db.Integer, nullable=True)
+    confirmations = db.Column(db.Integer, nullable=False, default=0)
+    gas_used = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    confirmed_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
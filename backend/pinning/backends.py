@@ -0,0 +1,151 @@
+"""
+Storage backends besides Pinata (``pinning.client.PinataClient``).
+
+``LocalDaemonBackend`` pins through a kubo (go-ipfs) node's HTTP RPC API.
+``FilesystemBackend`` stores the content on local disk under the CID that
+``ipfs add --cid-version=1`` would give it (see ``pinning.unixfs``). The
+load tests and benchmarks use it to exercise the upload paths with no
+external service at all.
+
+``create_backend`` picks one by name: ``pinata``, ``daemon`` or ``local``.
+"""
+import io
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import BinaryIO, Optional
+
+from pinning.cid_cache import canonical_json
+from pinning.client import GATEWAY_URL, HttpPinBackend, PinBackend, PinataClient, pin_result
+from pinning.stream import CHUNK_SIZE, PinError, SPOOL_MAX, pin_stream
+from pinning.unixfs import UnixfsHasher
+
+DEFAULT_API_ADDR = '/ip4/127.0.0.1/tcp/5001'
+
+
+def api_url(addr: str) -> str:
+    """RPC base URL from a multiaddr such as /ip4/127.0.0.1/tcp/5001 (plain URLs pass through)"""
+    if addr.startswith(('http://', 'https://')):
+        return addr.rstrip('/')
+    match = re.fullmatch(r'/(?:ip4|ip6|dns|dns4|dns6)/([^/]+)/tcp/(\d+)(/https?)?', addr)
+    if not match:
+        raise ValueError(f'unsupported IPFS API address: {addr}')
+    host, port, scheme = match.groups()
+    if ':' in host:
+        host = f'[{host}]'
+    return f"{(scheme or '/http')[1:]}://{host}:{port}/api/v0"
+
+
+class LocalDaemonBackend(HttpPinBackend):
+    name = 'daemon'
+
+    def __init__(self, addr: str = DEFAULT_API_ADDR, pool_size: int = 16, attempts: int = 2, timeout=60,
+                 spool_max: int = SPOOL_MAX, window: int = 512, backoff: float = 0.5, backoff_max: float = 8.0):
+        super().__init__(pool_size, timeout, window)
+        self.url = api_url(addr)
+        self.attempts = attempts
+        self.spool_max = spool_max
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def pin_file(self, source: BinaryIO, filename: str, content_type: str = 'application/octet-stream') -> dict:
+        start = time.perf_counter()
+        return self._record(self._add(source, filename, content_type, 'file'), start)
+
+    def pin_json(self, data, name: str, size: Optional[int] = None) -> dict:
+        start = time.perf_counter()
+        return self._record(self._add(io.BytesIO(canonical_json(data)), name, 'application/json', 'json'), start)
+
+    def _add(self, source, name, content_type, kind) -> dict:
+        try:
+            reply = pin_stream(self.session.post, f'{self.url}/add?pin=true&cid-version=1', {}, source, name,
+                               content_type=content_type, attempts=self.attempts, timeout=self.timeout,
+                               spool_max=self.spool_max, backoff=self.backoff, backoff_max=self.backoff_max,
+                               cid_key='Hash')
+        except PinError as e:
+            return pin_result(kind, name, False, status=e.status, error=str(e))
+        return pin_result(kind, name, True, cid=reply['Hash'], sha256=reply['sha256'], size=reply['size'], status=200)
+
+    def fetch(self, cid: str, path: str, max_bytes: Optional[int] = None) -> str:
+        """Write the content of cid to path; raises PinError"""
+        return self._download('POST', f'{self.url}/cat', path, f'cat {cid}', max_bytes=max_bytes,
+                              params={'arg': cid})
+
+
+class FilesystemBackend(PinBackend):
+    """Content-addressed store on local disk: <root>/<two CID chars>/<cid>"""
+
+    name = 'local'
+
+    def __init__(self, root: str, window: int = 512):
+        super().__init__(window)
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    def path_for(self, cid: str) -> str:
+        return os.path.join(self.root, cid[-3:-1], cid)
+
+    def has(self, cid: str) -> bool:
+        return os.path.exists(self.path_for(cid))
+
+    def fetch(self, cid: str, path: str, max_bytes: Optional[int] = None) -> str:
+        try:
+            size = os.path.getsize(self.path_for(cid))
+            if max_bytes is not None and size > max_bytes:
+                raise PinError(f'{cid} is {size} bytes, over the {max_bytes} byte limit', status=413)
+            shutil.copyfile(self.path_for(cid), path)
+        except OSError as e:
+            raise PinError(f'{cid} is not in the local store: {e}')
+        return path
+
+    def pin_file(self, source: BinaryIO, filename: str, content_type: str = 'application/octet-stream') -> dict:
+        start = time.perf_counter()
+        return self._record(self._store(source, filename, 'file'), start)
+
+    def pin_json(self, data, name: str, size: Optional[int] = None) -> dict:
+        start = time.perf_counter()
+        return self._record(self._store(io.BytesIO(canonical_json(data)), name, 'json'), start)
+
+    def _store(self, source, name, kind) -> dict:
+        hasher = UnixfsHasher()
+        tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        try:
+            with open(tmp, 'wb') as out:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+            cid = hasher.cid()
+            path = self.path_for(cid)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Same bytes, same CID: an existing copy is left alone
+            os.replace(tmp, path)
+        except OSError as e:
+            return pin_result(kind, name, False, error=f'local store failed: {e}')
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return pin_result(kind, name, True, cid=cid, sha256=hasher.sha256(), size=hasher.size, status=200)
+
+    def stats(self) -> dict:
+        return dict(super().stats(), root=self.root)
+
+
+def create_backend(kind: str, jwt: str = '', addr: str = DEFAULT_API_ADDR, root: Optional[str] = None,
+                   pool_size: int = 16, attempts: int = 2, spool_max: int = SPOOL_MAX, timeout=60,
+                   backoff: float = 0.5, backoff_max: float = 8.0, gateway_url: str = GATEWAY_URL) -> PinBackend:
+    http = dict(pool_size=pool_size, attempts=attempts, spool_max=spool_max, timeout=timeout, backoff=backoff,
+                backoff_max=backoff_max)
+    if kind == 'pinata':
+        return PinataClient(jwt, gateway_url=gateway_url, **http)
+    if kind == 'daemon':
+        return LocalDaemonBackend(addr, **http)
+    if kind == 'local':
+        if not root:
+            raise ValueError('the local backend needs a root directory')
+        return FilesystemBackend(root)
+    raise ValueError(f'unknown IPFS backend: {kind} (expected pinata, daemon or local)')
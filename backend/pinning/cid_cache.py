@@ -0,0 +1,110 @@
+"""
+Content-hash -> CID cache in front of the pinning service.
+
+IPFS addresses content by hash, so pinning the same bytes twice only costs
+an upload. Before each pin, the SHA-256 of the file bytes (or of the
+canonical JSON for metadata pins) is looked up in a small SQLite table. A
+hit returns the stored CID without touching the network. Entries older than
+``max_age`` are re-pinned, so a CID that has been unpinned remotely is not
+served for ever.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+FILE = 'file'
+JSON = 'json'
+
+
+def canonical_json(data) -> bytes:
+    """Byte-stable JSON encoding: sorted keys, no insignificant whitespace"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CidCache:
+    def __init__(self, path: str, max_age: Optional[float] = 30 * 86400):
+        self.path = path
+        self.max_age = max_age
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pin_cache (
+                kind TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                cid TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                pinned_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_hit_at REAL,
+                PRIMARY KEY (kind, sha256)
+            )
+        ''')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bytes_saved = 0
+        self.bytes_uploaded = 0
+
+    def get(self, kind: str, sha256: str) -> Optional[str]:
+        """Cached CID for the content hash, or None (counts as a miss)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT cid, size, pinned_at FROM pin_cache WHERE kind = ? AND sha256 = ?', (kind, sha256)
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[2] > self.max_age:
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                'UPDATE pin_cache SET hits = hits + 1, last_hit_at = ? WHERE kind = ? AND sha256 = ?',
+                (now, kind, sha256),
+            )
+            self.hits += 1
+            self.bytes_saved += row[1]
+            return row[0]
+
+    def put(self, kind: str, sha256: str, cid: str, size: int):
+        """Record a completed pin (size is the number of bytes that were uploaded)"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pin_cache (kind, sha256, cid, size, pinned_at, hits) '
+                'VALUES (?, ?, ?, ?, ?, COALESCE((SELECT hits FROM pin_cache WHERE kind = ? AND sha256 = ?), 0))',
+                (kind, sha256, cid, size, time.time(), kind, sha256),
+            )
+            self.bytes_uploaded += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total_hits = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM pin_cache').fetchone()
+            lookups = self.hits + self.misses
+            sent = self.bytes_uploaded + self.bytes_saved
+            return {
+                'entries': entries,
+                'lifetime_hits': total_hits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'bytes_uploaded': self.bytes_uploaded,
+                'bytes_saved': self.bytes_saved,
+                'upload_bytes_reduction': round(self.bytes_saved / sent, 4) if sent else None,
+            }
@@ -0,0 +1,211 @@
+"""
+Pinning backends on one pooled ``requests.Session``.
+
+Module-level ``requests.post`` opens a fresh TCP connection (and TLS
+handshake) for every pin. ``PinataClient`` keeps a single session whose
+``HTTPAdapter`` holds up to ``pool_size`` keep-alive connections, so
+concurrent pins from the upload workers and the pin pool reuse warm
+connections. The pool should be at least as large as the number of pins
+that can be in flight at once.
+
+Pins never raise for service or network errors. Each call returns a result
+dict instead:
+
+    {'ok', 'kind', 'name', 'cid', 'sha256', 'size', 'status', 'error', 'elapsed_ms'}
+
+``PinBackend`` is the interface every storage backend implements
+(``pin_file``, ``pin_json``, ``fetch``, ``stats``, ``close``). It also keeps per-kind
+call counts and latency percentiles for ``stats()``. ``PinataClient`` is the
+Pinata implementation; the local daemon and filesystem backends live in
+``pinning.backends``. Retries with backoff happen inside each call; failing
+fast while the service is down is ``pinning.resilience``'s job.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import BinaryIO, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pinning.stream import CHUNK_SIZE, PinError, SPOOL_MAX, backoff_delay, parse_reply, pin_stream, retryable
+
+FILE_URL = 'https://api.pinata.cloud/pinning/pinFileToIPFS'
+JSON_URL = 'https://api.pinata.cloud/pinning/pinJSONToIPFS'
+GATEWAY_URL = 'https://gateway.pinata.cloud/ipfs'
+
+
+def pin_result(kind: str, name: str, ok: bool, cid: Optional[str] = None, error: Optional[str] = None,
+               **extra) -> dict:
+    result = {'ok': ok, 'kind': kind, 'name': name, 'cid': cid, 'sha256': None, 'size': None,
+              'status': None, 'error': error, 'elapsed_ms': 0.0}
+    result.update(extra)
+    return result
+
+
+class PinBackend(ABC):
+    """Base class: subclasses implement pin_file/pin_json/fetch and pass each pin result through _record"""
+
+    name = 'base'
+
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._latency = {}
+        self._window = window
+
+    @abstractmethod
+    def pin_file(self, source: BinaryIO, filename: str, content_type: str = 'application/octet-stream') -> dict:
+        """Pin a file object; returns a pin_result dict"""
+
+    @abstractmethod
+    def pin_json(self, data, name: str, size: Optional[int] = None) -> dict:
+        """Pin a JSON document; returns a pin_result dict"""
+
+    @abstractmethod
+    def fetch(self, cid: str, path: str, max_bytes: Optional[int] = None) -> str:
+        """Write the content of cid to path; raises PinError, with status 413 once it outgrows max_bytes"""
+
+    def _record(self, result: dict, start: float) -> dict:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        result['elapsed_ms'] = round(elapsed_ms, 2)
+        kind = result['kind']
+        with self._lock:
+            calls = self._calls.setdefault(kind, {'calls': 0, 'failed': 0, 'bytes': 0})
+            calls['calls'] += 1
+            if result['ok']:
+                calls['bytes'] += result['size'] or 0
+            else:
+                calls['failed'] += 1
+            self._latency.setdefault(kind, deque(maxlen=self._window)).append(elapsed_ms)
+        return result
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_kind = {}
+            for kind, calls in self._calls.items():
+                samples = sorted(self._latency.get(kind, ()))
+                by_kind[kind] = dict(calls, latency_ms={
+                    'p50': round(samples[len(samples) // 2], 2) if samples else None,
+                    'p95': round(samples[int(len(samples) * 0.95)], 2) if samples else None,
+                    'max': round(samples[-1], 2) if samples else None,
+                })
+        total = sum(calls['calls'] for calls in by_kind.values())
+        return {'backend': self.name, 'calls': total, 'by_kind': by_kind}
+
+
+class HttpPinBackend(PinBackend):
+    """Backends that talk HTTP share one session with a sized keep-alive pool"""
+
+    def __init__(self, pool_size: int = 16, timeout=60, window: int = 512):
+        # timeout may be a (connect, read) tuple so an unreachable host fails in seconds, not minutes
+        super().__init__(window)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+    def _download(self, method: str, url: str, path: str, what: str, max_bytes: Optional[int] = None,
+                  **kwargs) -> str:
+        try:
+            with self.session.request(method, url, stream=True, timeout=self.timeout, **kwargs) as r:
+                if r.status_code != 200:
+                    raise PinError(f'{what} failed ({r.status_code}): {r.text[:200]}', status=r.status_code)
+                declared = r.headers.get('Content-Length', '')
+                if max_bytes is not None and declared.isdigit() and int(declared) > max_bytes:
+                    raise PinError(f'{what} is {declared} bytes, over the {max_bytes} byte limit', status=413)
+                written = 0
+                with open(path, 'wb') as out:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        written += len(chunk)
+                        # Chunked replies carry no length, so the limit is also enforced while reading
+                        if max_bytes is not None and written > max_bytes:
+                            raise PinError(f'{what} exceeds the {max_bytes} byte limit', status=413)
+                        out.write(chunk)
+        except OSError as e:
+            raise PinError(f'{what} failed: {e}')
+        return path
+
+    def connections_opened(self) -> int:
+        """Connections created so far across the session's pools (lower than calls means keep-alive works)"""
+        manager = self._adapter.poolmanager
+        return sum(manager.pools[key].num_connections for key in manager.pools.keys())
+
+    def close(self):
+        self.session.close()
+
+    def stats(self) -> dict:
+        return dict(super().stats(), pool_size=self.pool_size, connections_opened=self.connections_opened())
+
+
+class PinataClient(HttpPinBackend):
+    name = 'pinata'
+
+    def __init__(self, jwt: str, file_url: str = FILE_URL, json_url: str = JSON_URL, pool_size: int = 16,
+                 attempts: int = 2, timeout=60, spool_max: int = SPOOL_MAX, window: int = 512,
+                 backoff: float = 0.5, backoff_max: float = 8.0, gateway_url: str = GATEWAY_URL):
+        super().__init__(pool_size, timeout, window)
+        self.file_url = file_url
+        self.json_url = json_url
+        self.gateway_url = gateway_url.rstrip('/')
+        self.attempts = attempts
+        self.spool_max = spool_max
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session.headers['Authorization'] = f'Bearer {jwt}'
+
+    def pin_file(self, source: BinaryIO, filename: str, content_type: str = 'application/octet-stream') -> dict:
+        """Stream a file object to pinFileToIPFS (see pinning.stream.pin_stream)"""
+        start = time.perf_counter()
+        try:
+            reply = pin_stream(self.session.post, self.file_url, {}, source, filename, content_type=content_type,
+                               attempts=self.attempts, timeout=self.timeout, spool_max=self.spool_max,
+                               backoff=self.backoff, backoff_max=self.backoff_max)
+        except PinError as e:
+            result = pin_result('file', filename, False, status=e.status, error=str(e))
+        else:
+            result = pin_result('file', filename, True, cid=reply['IpfsHash'], sha256=reply['sha256'],
+                                size=reply['size'], status=200)
+            if 'spilled' in reply:
+                result['spilled'] = reply['spilled']
+        return self._record(result, start)
+
+    def pin_json(self, data, name: str, size: Optional[int] = None) -> dict:
+        """Pin a JSON document via pinJSONToIPFS, retrying like pin_file"""
+        start = time.perf_counter()
+        payload = {'pinataContent': data, 'pinataMetadata': {'name': name}}
+        for attempt in range(self.attempts):
+            if attempt:
+                time.sleep(backoff_delay(attempt, self.backoff, self.backoff_max))
+            try:
+                response = self.session.post(self.json_url, json=payload, timeout=self.timeout)
+            except OSError as e:
+                # Also covers requests' RequestException, which subclasses IOError
+                result = pin_result('json', name, False, error=f'upload failed: {e}')
+                continue
+            if response.status_code == 200:
+                try:
+                    reply = parse_reply(response, 'IpfsHash')
+                except PinError as e:
+                    # No status, so the breaker counts it like an outage; retrying would pin twice
+                    result = pin_result('json', name, False, error=str(e))
+                    break
+                result = pin_result('json', name, True, cid=reply['IpfsHash'], size=size, status=200)
+                break
+            result = pin_result('json', name, False, status=response.status_code,
+                                error=f'pinning rejected JSON ({response.status_code}): {response.text[:200]}')
+            if not retryable(response.status_code):
+                break
+        return self._record(result, start)
+
+    def fetch(self, cid: str, path: str, max_bytes: Optional[int] = None) -> str:
+        """Download cid from the gateway to path; raises PinError"""
+        # The API JWT is not a gateway credential, so it is not sent along
+        return self._download('GET', f'{self.gateway_url}/{cid}', path, f'gateway fetch of {cid}',
+                              max_bytes=max_bytes, headers={'Authorization': None})
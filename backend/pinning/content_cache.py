@@ -0,0 +1,162 @@
+"""
+Read-through disk cache for IPFS content.
+
+Content behind a CID never changes, so a local copy never goes stale and is
+never invalidated. It is only evicted to keep the cache within ``max_bytes``:
+least recently used entries go first. ``open`` returns an open file. It is
+opened under the cache lock, so an eviction that runs while the caller reads
+only unlinks the name. On a miss the content is fetched once, into a temp file
+renamed into place. Concurrent requests for the same CID wait for that single
+download instead of starting their own. A fetch is aborted once it exceeds
+``max_entry_bytes``.
+
+Files live under ``root/<two CID chars>/<cid>``. The LRU order is kept in
+memory and rebuilt from file access times when the process starts, so a
+restart keeps the cache warm.
+"""
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Optional
+
+# CIDv0 (base58btc) and CIDv1 (base32/base36) are plain alphanumerics; anything else is not a CID
+_CID = re.compile(r'[A-Za-z0-9]{32,128}')
+
+
+def valid_cid(cid: str) -> bool:
+    return bool(_CID.fullmatch(cid))
+
+
+class ContentCache:
+    def __init__(self, root: str, fetch: Callable[..., str], max_bytes: int = 1024 ** 3,
+                 max_entry_bytes: Optional[int] = None):
+        # fetch(cid, path, max_bytes=...) writes the content to path and raises once it outgrows max_bytes
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes or max_bytes, max_bytes)
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # cid -> size, least recently used first
+        self._loading: Dict[str, threading.Lock] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.bytes_hit = 0
+        self.bytes_fetched = 0
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard == 'tmp' or not os.path.isdir(shard_dir):
+                continue
+            for cid in os.listdir(shard_dir):
+                stat = os.stat(os.path.join(shard_dir, cid))
+                found.append((stat.st_atime, cid, stat.st_size))
+        for _, cid, size in sorted(found):
+            self._entries[cid] = size
+            self.bytes += size
+        for name in os.listdir(os.path.join(self.root, 'tmp')):
+            # Downloads interrupted by a restart
+            os.remove(os.path.join(self.root, 'tmp', name))
+
+    def path_for(self, cid: str) -> str:
+        return os.path.join(self.root, cid[-3:-1], cid)
+
+    def _open_cached(self, cid: str) -> Optional[BinaryIO]:
+        with self._lock:
+            size = self._entries.get(cid)
+            if size is None:
+                return None
+            try:
+                f = open(self.path_for(cid), 'rb')
+            except OSError:
+                # Removed behind the cache's back; fetch it again
+                del self._entries[cid]
+                self.bytes -= size
+                return None
+            self._entries.move_to_end(cid)
+            self.hits += 1
+            self.bytes_hit += size
+            return f
+
+    def open(self, cid: str) -> BinaryIO:
+        """Open file with the content of cid, fetching it on a miss; raises ValueError or the fetcher's error.
+
+        The caller closes it. The file stays readable even if the entry is evicted meanwhile.
+        """
+        if not valid_cid(cid):
+            raise ValueError(f'not a CID: {cid!r}')
+        f = self._open_cached(cid)
+        if f is not None:
+            return f
+        with self._lock:
+            loading = self._loading.setdefault(cid, threading.Lock())
+        with loading:
+            # Someone else may have fetched it while this request waited
+            f = self._open_cached(cid)
+            if f is not None:
+                return f
+            try:
+                return self._load_one(cid)
+            finally:
+                with self._lock:
+                    self._loading.pop(cid, None)
+
+    def _load_one(self, cid: str) -> BinaryIO:
+        tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        path = self.path_for(cid)
+        try:
+            self._fetch(cid, tmp, max_bytes=self.max_entry_bytes)
+            size = os.path.getsize(tmp)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+        except BaseException:
+            with self._lock:
+                self.errors += 1
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self.misses += 1
+            self.bytes_fetched += size
+            self._entries[cid] = size
+            self.bytes += size
+            f = open(path, 'rb')
+            self._evict()
+        return f
+
+    def _evict(self):
+        # Caller holds the lock. The newest entry goes last, and goes too if it alone is over max_bytes
+        while self.bytes > self.max_bytes and self._entries:
+            cid, size = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(cid))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'max_entry_bytes': self.max_entry_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'byte_hit_rate': round(self.bytes_hit / (self.bytes_hit + self.bytes_fetched), 4)
+                if self.bytes_hit + self.bytes_fetched else None,
+                'fetch_errors': self.errors,
+                'evictions': self.evictions,
+                'bytes_fetched': self.bytes_fetched,
+            }
@@ -0,0 +1,303 @@
+"""
+Background IPFS upload jobs.
+
+Endpoints stage their files, record a job and return ``202`` straight away.
+Worker threads then run the job's handler, which does the Pinata round trips
+and writes the resulting hashes back. Job state lives in a table
+(``SqlJobStore``), so jobs that were queued or running when the process
+stopped are picked up again on the next start. ``on_finish`` is called with
+the final job dict, e.g. to publish completion over SSE and remove staged files.
+
+Several processes may share the table (gunicorn workers, the debug reloader).
+A worker claims a job with a conditional UPDATE from ``queued`` to
+``running``, so only one of them runs it. While a job runs, its worker
+renews its ``updated_at`` every third of ``lease`` seconds. On start,
+a running job is only taken back once that lease has expired, meaning the
+process running it has died.
+
+A handler that raises ``RetryLater`` (e.g. while the pinning service's
+circuit breaker is open) does not fail its job. The job goes back to
+``queued`` and is picked up again after the given delay, up to
+``max_attempts`` runs in total.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from queue import Queue
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+_STOP = object()
+
+
+class RetryLater(Exception):
+    """Raised by a handler to put its job back in the queue for another run after ``delay`` seconds"""
+
+    def __init__(self, delay: float, reason: str = ''):
+        super().__init__(reason or f'retry in {delay:.0f}s')
+        self.delay = delay
+
+
+class SqlJobStore:
+    """Job persistence on a Flask-SQLAlchemy model (see models.database_models.UploadJob)"""
+
+    def __init__(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def create(self, kind: str, payload: dict, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self.app.app_context():
+            self.db.session.add(self.model(id=job_id, kind=kind, status=QUEUED, payload=json.dumps(payload)))
+            self.db.session.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.app.app_context():
+            job = self.db.session.get(self.model, job_id)
+            return self._as_dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields):
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'])
+        fields['updated_at'] = datetime.utcnow()
+        with self.app.app_context():
+            self.db.session.query(self.model).filter(self.model.id == job_id).update(fields)
+            self.db.session.commit()
+
+    def claim(self, job_id: str) -> Optional[dict]:
+        """Move a queued job to running and count the attempt; None if another worker got it first"""
+        with self.app.app_context():
+            m = self.model
+            claimed = m.query.filter(m.id == job_id, m.status == QUEUED).update(
+                {'status': RUNNING, 'attempts': m.attempts + 1, 'updated_at': datetime.utcnow()},
+                synchronize_session=False)
+            self.db.session.commit()
+            if not claimed:
+                return None
+            return self._as_dict(self.db.session.get(m, job_id))
+
+    def renew(self, job_ids: List[str]):
+        """Extend the lease of jobs this process is running"""
+        with self.app.app_context():
+            m = self.model
+            m.query.filter(m.id.in_(job_ids), m.status == RUNNING).update(
+                {'updated_at': datetime.utcnow()}, synchronize_session=False)
+            self.db.session.commit()
+
+    def pending(self, lease: float) -> List[str]:
+        """Ids of queued jobs, oldest first, after re-queueing running jobs whose lease expired"""
+        with self.app.app_context():
+            m = self.model
+            cutoff = datetime.utcnow() - timedelta(seconds=lease)
+            m.query.filter(m.status == RUNNING, m.updated_at < cutoff).update(
+                {'status': QUEUED}, synchronize_session=False)
+            self.db.session.commit()
+            return [row.id for row in m.query.with_entities(m.id).filter(m.status == QUEUED)
+                    .order_by(m.created_at.asc()).all()]
+
+    @staticmethod
+    def _as_dict(job) -> dict:
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'payload': json.loads(job.payload) if job.payload else {},
+            'result': json.loads(job.result) if job.result else None,
+            'error': job.error,
+            'attempts': job.attempts or 0,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        }
+
+
+class UploadJobQueue:
+    def __init__(self, store, handlers: Dict[str, Callable[[str, dict], dict]],
+                 on_finish: Optional[Callable[[dict], None]] = None, workers: int = 4, max_attempts: int = 10,
+                 lease: float = 300.0):
+        self.store = store
+        self.handlers = handlers
+        self.on_finish = on_finish
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._queue = Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Ids of jobs this process is running, whose leases it renews
+        self._active = set()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.running = 0
+        self.deferred = 0
+        self.waiting = 0
+        self.busy_seconds = 0.0
+
+    def start(self) -> 'UploadJobQueue':
+        """Re-queue unfinished jobs from the store and start the workers (idempotent)"""
+        with self._lock:
+            if self._threads or not self.workers:
+                return self
+            self._stopping.clear()
+            for job_id in self.store.pending(self.lease):
+                self._queue.put(job_id)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'upload-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            threading.Thread(target=self._renew_leases, name='upload-job-lease', daemon=True).start()
+        return self
+
+    @staticmethod
+    def new_id() -> str:
+        """Job id to reserve before submit(), e.g. to reference it from another row first"""
+        return uuid.uuid4().hex
+
+    def submit(self, kind: str, payload: dict, job_id: Optional[str] = None) -> str:
+        """Persist a job and queue it (starting the workers on first use); returns the job id"""
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown upload job kind: {kind}')
+        self.start()
+        job_id = self.store.create(kind, payload, job_id)
+        with self._lock:
+            self.submitted += 1
+        self._queue.put(job_id)
+        return job_id
+
+    def run_inline(self, kind: str, payload: dict, job_id: Optional[str] = None) -> dict:
+        """Run a job on the calling thread without persisting it (payload may hold live streams)"""
+        job = {'id': job_id or self.new_id(), 'kind': kind, 'status': RUNNING, 'payload': payload,
+               'result': None, 'error': None, 'attempts': 0}
+        with self._lock:
+            self.submitted += 1
+        self._finish(job, self._call(job))
+        return job
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is _STOP:
+                return
+            try:
+                self._execute(job_id)
+            except Exception:
+                # Store errors must not kill the worker; the job stays pending for the next start
+                logger.exception('Upload job %s could not be processed', job_id)
+
+    def _renew_leases(self):
+        while not self._stopping.wait(self.lease / 3):
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            try:
+                self.store.renew(active)
+            except Exception:
+                logger.exception('Could not renew upload job leases')
+
+    def _execute(self, job_id: str):
+        # Jobs already finished, or claimed by another worker or process, are skipped
+        job = self.store.claim(job_id)
+        if job is None:
+            return
+        with self._lock:
+            self._active.add(job_id)
+        try:
+            elapsed = self._call(job)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+        if job.get('retry_after') is not None and job['attempts'] < self.max_attempts:
+            self.store.update(job_id, status=QUEUED, error=job['error'][:1000])
+            self._defer(job_id, job['retry_after'])
+            return
+        if job['status'] == SUCCEEDED:
+            self.store.update(job_id, status=SUCCEEDED, result=job['result'], error=None)
+        else:
+            self.store.update(job_id, status=FAILED, error=job['error'][:1000])
+        self._finish(job, elapsed)
+
+    def _defer(self, job_id: str, delay: float):
+        def requeue():
+            with self._lock:
+                self.waiting -= 1
+            self._queue.put(job_id)
+
+        with self._lock:
+            self.deferred += 1
+            self.waiting += 1
+        timer = threading.Timer(max(delay, 0.1), requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _call(self, job: dict) -> float:
+        """Run the job's handler, recording the outcome on the job dict; returns seconds taken"""
+        with self._lock:
+            self.running += 1
+        started = time.perf_counter()
+        job.pop('retry_after', None)
+        try:
+            job['result'] = self.handlers[job['kind']](job['id'], job['payload']) or {}
+            job['status'] = SUCCEEDED
+        except RetryLater as e:
+            # Run inline (or out of attempts) this is a plain failure; _execute requeues it otherwise
+            logger.info('Upload job %s (%s) deferred: %s', job['id'], job['kind'], e)
+            job['status'] = FAILED
+            job['error'] = str(e)
+            job['retry_after'] = e.delay
+        except Exception as e:
+            logger.warning('Upload job %s (%s) failed: %s', job['id'], job['kind'], e)
+            job['status'] = FAILED
+            job['error'] = str(e)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return time.perf_counter() - started
+
+    def _finish(self, job: dict, elapsed: float):
+        with self._lock:
+            self.busy_seconds += elapsed
+            if job['status'] == SUCCEEDED:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception:
+                logger.exception('on_finish failed for upload job %s', job['id'])
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.succeeded + self.failed
+            return {
+                'workers': len(self._threads),
+                'queued': self._queue.qsize(),
+                'running': self.running,
+                'waiting_retry': self.waiting,
+                'deferred': self.deferred,
+                'submitted': self.submitted,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'avg_job_seconds': round(self.busy_seconds / finished, 3) if finished else None,
+            }
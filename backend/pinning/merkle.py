@@ -0,0 +1,280 @@
+"""
+Merkle-batched metadata pinning.
+
+Pinning each field-data submission's metadata as its own JSON document meant
+thousands of tiny pins a day, each a network round trip. ``MetadataBatcher``
+instead stores each document as a pending ``MetadataRecord`` row. A
+background thread closes a batch every ``interval`` seconds, or as soon as
+``max_records`` are waiting. It pins one document with every record and the
+Merkle root over them, then writes the batch CID, the record's leaf index and
+its inclusion proof back to each row. A single record can then be checked
+against the pinned root without fetching the rest of the batch (``verify``).
+
+Hashing follows RFC 6962 (Certificate Transparency):
+
+    leaf = sha256(0x00 || canonical JSON of the record)
+    node = sha256(0x01 || left || right)
+
+A node without a sibling is promoted to the next level unchanged. A proof is
+the list of sibling hashes from the leaf up, each tagged with the side it
+sits on.
+
+Pending rows live in the database, so records accepted before a crash are
+batched after the restart. A batch is claimed by setting ``batch_id`` on
+rows that have none, so several processes can run batchers side by side.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from pinning.cid_cache import canonical_json
+
+logger = logging.getLogger(__name__)
+
+PINNING = 'pinning'
+PINNED = 'pinned'
+
+
+def leaf_hash(data: bytes) -> bytes:
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def build_tree(leaves: List[bytes]) -> Tuple[bytes, List[List[dict]]]:
+    """Merkle root over leaf hashes plus one inclusion proof per leaf ([{'side', 'hash'}], leaf to root)"""
+    if not leaves:
+        raise ValueError('a Merkle tree needs at least one leaf')
+    proofs: List[List[dict]] = [[] for _ in leaves]
+    # positions[i] is the index of leaf i's ancestor on the current level
+    positions = list(range(len(leaves)))
+    level = list(leaves)
+    while len(level) > 1:
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        for leaf, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                side = 'left' if sibling < pos else 'right'
+                proofs[leaf].append({'side': side, 'hash': level[sibling].hex()})
+            positions[leaf] = pos // 2
+        level = parents
+    return level[0], proofs
+
+
+def verify(leaf_hex: str, proof: List[dict], root_hex: str) -> bool:
+    """True if proof links the leaf hash to the root"""
+    node = bytes.fromhex(leaf_hex)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        node = node_hash(sibling, node) if step['side'] == 'left' else node_hash(node, sibling)
+    return node.hex() == root_hex
+
+
+class SqlBatchStore:
+    """Pending records and batches on Flask-SQLAlchemy models (see MetadataRecord/MetadataBatch)"""
+
+    def __init__(self, app, db, record_model, batch_model):
+        self.app = app
+        self.db = db
+        self.record = record_model
+        self.batch = batch_model
+
+    def add(self, metadata: dict, job_id: Optional[str] = None) -> dict:
+        content = canonical_json(metadata)
+        leaf = leaf_hash(content).hex()
+        with self.app.app_context():
+            row = self.record(job_id=job_id, metadata_json=content.decode('utf-8'), leaf_hash=leaf)
+            self.db.session.add(row)
+            self.db.session.commit()
+            return {'record_id': row.id, 'leaf_hash': leaf}
+
+    def pending(self) -> int:
+        with self.app.app_context():
+            return self.record.query.filter(self.record.batch_id.is_(None)).count()
+
+    def claim(self, limit: int) -> Optional[Tuple[int, list]]:
+        """Assign up to limit pending records to a new batch; returns (batch_id, [(id, leaf_hash, metadata)])"""
+        r = self.record
+        with self.app.app_context():
+            ids = [row.id for row in r.query.with_entities(r.id).filter(r.batch_id.is_(None))
+                   .order_by(r.id).limit(limit)]
+            if not ids:
+                return None
+            batch = self.batch(status=PINNING)
+            self.db.session.add(batch)
+            self.db.session.flush()
+            # Rows another process claimed in the meantime are skipped by the batch_id IS NULL condition
+            claimed = r.query.filter(r.id.in_(ids), r.batch_id.is_(None)).update(
+                {'batch_id': batch.id}, synchronize_session=False)
+            if not claimed:
+                self.db.session.rollback()
+                return None
+            batch.record_count = claimed
+            self.db.session.commit()
+            rows = r.query.filter(r.batch_id == batch.id).order_by(r.id).all()
+            return batch.id, [(row.id, row.leaf_hash, json.loads(row.metadata_json)) for row in rows]
+
+    def complete(self, batch_id: int, root: str, cid: str, proofs: List[Tuple[int, int, list]]):
+        with self.app.app_context():
+            for record_id, index, proof in proofs:
+                self.record.query.filter(self.record.id == record_id).update(
+                    {'leaf_index': index, 'proof': json.dumps(proof)}, synchronize_session=False)
+            self.batch.query.filter(self.batch.id == batch_id).update(
+                {'status': PINNED, 'merkle_root': root, 'cid': cid, 'pinned_at': datetime.utcnow()},
+                synchronize_session=False)
+            self.db.session.commit()
+
+    def release(self, batch_id: int):
+        """Put a batch's records back in the pending pool (its pin failed or its process died)"""
+        with self.app.app_context():
+            self.record.query.filter(self.record.batch_id == batch_id).update(
+                {'batch_id': None}, synchronize_session=False)
+            self.batch.query.filter(self.batch.id == batch_id).delete(synchronize_session=False)
+            self.db.session.commit()
+
+    def stale(self, older_than: float) -> List[int]:
+        """Batches still marked pinning after older_than seconds"""
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+        with self.app.app_context():
+            b = self.batch
+            return [row.id for row in b.query.filter(b.status == PINNING, b.created_at < cutoff)]
+
+
+class MetadataBatcher:
+    def __init__(self, store, pin_json: Callable[[dict, str], str], max_records: int = 256, interval: float = 60.0,
+                 on_pinned: Optional[Callable[[dict], None]] = None, stale_after: float = 600.0):
+        self.store = store
+        self._pin_json = pin_json
+        self.max_records = max_records
+        self.interval = interval
+        self.on_pinned = on_pinned
+        self.stale_after = stale_after
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._since_flush = 0
+        self.records = 0
+        self.batches = 0
+        self.pinned_records = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> 'MetadataBatcher':
+        """Release batches orphaned by a crash and start the batching thread (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            for batch_id in self.store.stale(self.stale_after):
+                logger.info('Releasing metadata batch %s left unpinned by an earlier run', batch_id)
+                self.store.release(batch_id)
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='metadata-batcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, metadata: dict, job_id: Optional[str] = None) -> dict:
+        """Store a metadata document for the next batch; returns {'record_id', 'leaf_hash'}"""
+        self.start()
+        record = self.store.add(metadata, job_id)
+        with self._flush_lock:
+            self.records += 1
+            self._since_flush += 1
+            full = self._since_flush >= self.max_records
+        if full:
+            self._wake.set()
+        return record
+
+    def stop(self, timeout: float = 10.0):
+        """Pin whatever is pending and stop the thread (registered for interpreter shutdown)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Database trouble: the records stay pending for the next round
+                logger.exception('Metadata batch flush failed')
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Final metadata batch flush failed')
+
+    def flush(self) -> int:
+        """Pin every pending record in batches of max_records; returns the number of batches pinned"""
+        pinned = 0
+        with self._flush_lock:
+            self._since_flush = 0
+        while True:
+            claimed = self.store.claim(self.max_records)
+            if claimed is None:
+                return pinned
+            batch_id, rows = claimed
+            if not self._pin_batch(batch_id, rows):
+                return pinned
+            pinned += 1
+
+    def _pin_batch(self, batch_id: int, rows: list) -> bool:
+        root, proofs = build_tree([bytes.fromhex(leaf) for _, leaf, _ in rows])
+        document = {
+            'type': 'field_data_batch',
+            'hash': 'sha256',
+            'leaf': 'sha256(0x00 || canonical JSON of metadata)',
+            'node': 'sha256(0x01 || left || right)',
+            'merkle_root': root.hex(),
+            'created_at': datetime.utcnow().isoformat(),
+            'records': [{'record_id': record_id, 'leaf_hash': leaf, 'metadata': metadata}
+                        for record_id, leaf, metadata in rows],
+        }
+        try:
+            cid = self._pin_json(document, f'field_data_batch_{batch_id}.json')
+        except Exception as e:
+            # Pinning down or circuit open: the records go back to pending and are retried next round
+            logger.warning('Metadata batch %s (%d records) not pinned: %s', batch_id, len(rows), e)
+            self.store.release(batch_id)
+            with self._flush_lock:
+                self.failures += 1
+                self.last_error = str(e)
+            return False
+        self.store.complete(batch_id, root.hex(), cid,
+                            [(record_id, i, proofs[i]) for i, (record_id, _, _) in enumerate(rows)])
+        with self._flush_lock:
+            self.batches += 1
+            self.pinned_records += len(rows)
+        if self.on_pinned is not None:
+            try:
+                self.on_pinned({'batch_id': batch_id, 'cid': cid, 'merkle_root': root.hex(),
+                                'record_ids': [record_id for record_id, _, _ in rows]})
+            except Exception:
+                logger.exception('on_pinned failed for metadata batch %s', batch_id)
+        return True
+
+    def stats(self) -> dict:
+        pending = self.store.pending()
+        with self._flush_lock:
+            return {
+                'pending': pending,
+                'records': self.records,
+                'batches': self.batches,
+                'pinned_records': self.pinned_records,
+                'avg_batch_size': round(self.pinned_records / self.batches, 1) if self.batches else None,
+                'failures': self.failures,
+                'last_error': self.last_error,
+                'max_records': self.max_records,
+                'interval_seconds': self.interval,
+            }
@@ -0,0 +1,69 @@
+"""
+Bounded concurrent pinning.
+
+One process-wide thread pool caps the number of pins in flight across all
+requests and jobs (the global cap). ``map_ordered`` additionally limits how
+many of one caller's items may occupy the pool at once (the per-request cap),
+so a 40-image submission cannot starve everyone else. Results come back in
+input order, and a failed item does not cancel its siblings.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Tuple
+
+
+class PinPool:
+    def __init__(self, max_workers: int = 8, per_request: int = 4):
+        self.max_workers = max_workers
+        self.per_request = per_request
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ipfs-pin')
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def map_ordered(self, fn: Callable, items: Iterable, per_request: int = None) -> List[Tuple[bool, object]]:
+        """Run fn over items concurrently; returns [(ok, result_or_exception)] in input order"""
+        limit = threading.BoundedSemaphore(max(1, per_request or self.per_request))
+        futures = []
+        for item in items:
+            limit.acquire()
+            try:
+                future = self._executor.submit(self._run, fn, item)
+            except Exception:
+                limit.release()
+                raise
+            future.add_done_callback(lambda _f: limit.release())
+            futures.append(future)
+        return [f.result() for f in futures]
+
+    def _run(self, fn, item):
+        with self._lock:
+            self.in_flight += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+        try:
+            result = (True, fn(item))
+        except Exception as e:
+            result = (False, e)
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            if not result[0]:
+                self.failed += 1
+        return result
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'per_request': self.per_request,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
@@ -0,0 +1,34 @@
+"""
+Rendition worker process, started by ``RenditionPool`` as ``python -m pinning.rendition_worker``.
+
+Reads one JSON request per line on stdin (``{"path", "out_dir", "sizes"}``)
+and answers each with one JSON line, ``{"ok": true, "result": ...}`` or
+``{"ok": false, "error": ...}``. The worker is a fresh interpreter that
+imports only Pillow and ``pinning.renditions``. It inherits no locks or
+threads from the server, and it does not re-import the Flask app the way
+multiprocessing's spawn and forkserver children do.
+"""
+import json
+import os
+import sys
+
+from pinning.renditions import render
+
+
+def main():
+    # Replies go out on the original stdout; stray prints from libraries land on stderr instead
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    sys.stdout = sys.stderr
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            reply = {'ok': True, 'result': render(request['path'], request['out_dir'], request['sizes'])}
+        except Exception as e:
+            # Malformed images raise anything from OSError to SyntaxError or struct.error
+            reply = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        replies.write(json.dumps(reply) + '\n')
+        replies.flush()
+
+
+if __name__ == '__main__':
+    main()
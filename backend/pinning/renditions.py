@@ -0,0 +1,252 @@
+"""
+Web renditions and thumbnails for uploaded photos.
+
+Photos arrive at full camera resolution. Dashboards mostly need a screen-sized
+copy or a thumbnail, so each image is also rendered at a capped long edge
+(``web`` and ``thumb`` by default) and the renditions are pinned next to the
+original.
+
+Decoding and resizing is CPU-bound and holds the GIL for much of the work, so
+it runs in a few worker processes (``pinning.rendition_worker``). They are
+started with fork+exec rather than a bare fork of the threaded server, and
+stay up between images. JPEG sources are decoded at reduced scale
+(``Image.draft``), which makes the resize of a 20 MP photo several times
+cheaper than decoding it at full size. If the long edge is already within a
+rendition's cap, no rendition is produced and the original is used instead.
+"""
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from queue import Queue
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from pinning.cid_cache import sha256_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'web': 1600, 'thumb': 320}
+QUALITY = {'web': 82, 'thumb': 75}
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/tiff', 'image/heic')
+# Directory holding the pinning package, put on the workers' PYTHONPATH
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STOP = object()
+
+
+class RenditionError(Exception):
+    """A rendition could not be produced; the original is used on its own"""
+
+
+def parse_sizes(spec: str) -> Dict[str, int]:
+    """'web:1600,thumb:320' -> {'web': 1600, 'thumb': 320}"""
+    sizes = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, edge = part.partition(':')
+        if not name or not edge.isdigit() or int(edge) <= 0:
+            raise ValueError(f'invalid rendition size: {part!r} (expected name:pixels)')
+        sizes[name] = int(edge)
+    return sizes
+
+
+def is_image(content_type: Optional[str], filename: str = '') -> bool:
+    if content_type and content_type.split(';')[0].strip().lower() in IMAGE_TYPES:
+        return True
+    return os.path.splitext(filename)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff')
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """RGB copy; transparent areas go on white instead of black"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def render(path: str, out_dir: str, sizes: Dict[str, int]) -> dict:
+    """Write JPEG renditions of the image at path; returns {'width', 'height', 'renditions': {name: {...}}}.
+
+    Runs in a worker process. Each rendition is {'path', 'width', 'height', 'size', 'sha256'}; a name is
+    missing when the original already fits its cap.
+    """
+    out = {'renditions': {}}
+    with Image.open(path) as img:
+        raw_width, raw_height = img.size
+        rotated = img.getexif().get(0x0112) in (5, 6, 7, 8)  # EXIF orientations that swap the axes
+        out['width'], out['height'] = (raw_height, raw_width) if rotated else (raw_width, raw_height)
+        needed = {name: edge for name, edge in sizes.items() if max(raw_width, raw_height) > edge}
+        if not needed:
+            return out
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers the largest rendition
+        scale = max(needed.values()) / max(raw_width, raw_height)
+        img.draft('RGB', (math.ceil(raw_width * scale), math.ceil(raw_height * scale)))
+        img = _flatten(ImageOps.exif_transpose(img))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name, edge in sorted(needed.items(), key=lambda kv: -kv[1]):
+        # Largest first, so smaller renditions are resized from an already reduced image
+        img.thumbnail((edge, edge), Image.LANCZOS)
+        target = os.path.join(out_dir, f'{stem}.{name}.jpg')
+        img.save(target, 'JPEG', quality=QUALITY.get(name, 80), optimize=True, progressive=edge > 800)
+        out['renditions'][name] = {'path': target, 'width': img.width, 'height': img.height,
+                                   'size': os.path.getsize(target), 'sha256': sha256_file(target)}
+    return out
+
+
+class _Worker:
+    """One rendition_worker process, driven by a single dispatcher thread"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.proc = None
+
+    def _start(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (_PACKAGE_ROOT, env.get('PYTHONPATH'))))
+        return subprocess.Popen([sys.executable, '-m', 'pinning.rendition_worker'], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, env=env, text=True, bufsize=1)
+
+    def render(self, request: dict) -> dict:
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = self._start()
+        proc = self.proc
+        # A worker stuck on a hostile image is killed; the next image gets a fresh one
+        timer = threading.Timer(self.timeout, proc.kill)
+        timer.start()
+        try:
+            proc.stdin.write(json.dumps(request) + '\n')
+            proc.stdin.flush()
+            line = proc.stdout.readline()
+        except (OSError, ValueError):
+            line = ''
+        finally:
+            timer.cancel()
+        if not line:
+            self.close()
+            raise RenditionError('rendition worker exited (crash or timeout)')
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise RenditionError(reply['error'])
+        return reply['result']
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+
+
+class RenditionPool:
+    def __init__(self, processes: int = 2, sizes: Optional[Dict[str, int]] = None, timeout: float = 60.0):
+        self.processes = processes
+        self.sizes = dict(DEFAULT_SIZES if sizes is None else sizes)
+        self.timeout = timeout
+        self._queue = Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.images = 0
+        self.failed = 0
+        self.original_bytes = 0
+        # Per rendition: how many were made, their bytes, and the bytes of the originals they replace
+        self._made = {name: {'count': 0, 'bytes': 0, 'original_bytes': 0} for name in self.sizes}
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0 and bool(self.sizes)
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.processes):
+                thread = threading.Thread(target=self._dispatch, name=f'rendition-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _dispatch(self):
+        worker = _Worker(self.timeout)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                future, request = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(worker.render(request))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            worker.close()
+
+    def submit(self, path: str, out_dir: str) -> Optional[Future]:
+        """Queue a render for a worker process; returns a Future, or None when disabled"""
+        if not self.enabled:
+            return None
+        self._start()
+        future = Future()
+        self._queue.put((future, {'path': path, 'out_dir': out_dir, 'sizes': self.sizes}))
+        return future
+
+    def collect(self, future, original_size: int) -> Tuple[Optional[dict], Optional[str]]:
+        """Wait for a submitted render; returns (result, error) and updates the byte counters.
+
+        Any failure means "no rendition": the original has usually been pinned already and must not be lost.
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.info('Rendition failed: %s', e)
+            with self._lock:
+                self.failed += 1
+            return None, str(e)
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_size
+            for name, rendition in result['renditions'].items():
+                made = self._made.setdefault(name, {'count': 0, 'bytes': 0, 'original_bytes': 0})
+                made['count'] += 1
+                made['bytes'] += rendition['size']
+                made['original_bytes'] += original_size
+        return result, None
+
+    def shutdown(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            renditions = {}
+            for name, made in self._made.items():
+                renditions[name] = dict(
+                    made,
+                    # What a client saves per view by fetching this rendition instead of the original
+                    bytes_saved=made['original_bytes'] - made['bytes'],
+                    size_ratio=round(made['bytes'] / made['original_bytes'], 4) if made['original_bytes'] else None,
+                )
+            return {
+                'enabled': self.enabled,
+                'processes': self.processes,
+                'sizes': self.sizes,
+                'images': self.images,
+                'failed': self.failed,
+                'original_bytes': self.original_bytes,
+                'renditions': renditions,
+            }
@@ -0,0 +1,153 @@
+"""
+Circuit breaker in front of a pinning backend.
+
+Retries with backoff (``pinning.stream``) ride out a dropped connection or a
+single 502. They make a real outage worse, though: every upload still waits
+out its timeouts and retries, and the upload workers pile up behind a
+service that is not answering. ``CircuitBreaker`` counts consecutive
+service-side failures (no reply, 429 or 5xx; a 4xx says the service is up).
+After ``failure_threshold`` of them it opens. Pins are then refused at once
+for ``reset_timeout`` seconds. After that a single probe call is let through
+(half-open): success closes the breaker, failure opens it again.
+
+``ResilientBackend`` wraps any ``PinBackend`` with a breaker. A refused pin
+comes back as an ordinary failed result with ``circuit_open`` and
+``retry_after`` set, so callers can defer the work instead of failing it.
+"""
+import threading
+import time
+from typing import BinaryIO, Optional
+
+from pinning.client import PinBackend, pin_result
+from pinning.stream import retryable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when calls may go through)"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """True if a call may go ahead; in half-open state only one probe at a time is allowed"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.last_error = error
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_after': round(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)), 1)
+                if state == OPEN else 0.0,
+                'times_opened': self.opened,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+            }
+
+
+class ResilientBackend(PinBackend):
+    """Pass pins through to ``backend`` while its breaker allows; refuse them immediately otherwise"""
+
+    def __init__(self, backend: PinBackend, breaker: Optional[CircuitBreaker] = None):
+        super().__init__()
+        self.backend = backend
+        self.breaker = breaker or CircuitBreaker()
+        self.name = backend.name
+
+    def _call(self, kind: str, name: str, pin) -> dict:
+        if not self.breaker.allow():
+            # retry_after is 0 while another call holds the half-open probe; give that probe time to finish
+            retry_after = self.breaker.retry_after() or min(5.0, self.breaker.reset_timeout)
+            return pin_result(kind, name, False, error=f'{self.name} pinning unavailable (circuit open)',
+                              circuit_open=True, retry_after=retry_after)
+        try:
+            result = pin()
+        except BaseException:
+            # Never leave a half-open probe slot taken
+            self.breaker.failure('pin raised')
+            raise
+        if result['ok'] or not retryable(result['status']):
+            self.breaker.success()
+        else:
+            self.breaker.failure(result['error'])
+        return result
+
+    def pin_file(self, source: BinaryIO, filename: str, content_type: str = 'application/octet-stream') -> dict:
+        return self._call('file', filename, lambda: self.backend.pin_file(source, filename, content_type))
+
+    def pin_json(self, data, name: str, size: Optional[int] = None) -> dict:
+        return self._call('json', name, lambda: self.backend.pin_json(data, name, size=size))
+
+    def fetch(self, cid: str, path: str, max_bytes: Optional[int] = None) -> str:
+        # Reads are not gated by the breaker: a cached or gateway read does not depend on the pinning API
+        return self.backend.fetch(cid, path, max_bytes=max_bytes)
+
+    def __getattr__(self, attr):
+        # Backend-specific extras such as HttpPinBackend.connections_opened
+        if attr == 'backend':
+            raise AttributeError(attr)
+        return getattr(self.backend, attr)
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> dict:
+        return dict(self.backend.stats(), breaker=self.breaker.stats())
@@ -0,0 +1,252 @@
+"""
+Resumable chunked uploads.
+
+A client creates a session with the file's name, type and total size. It then
+PUTs consecutive byte ranges, each tagged with the offset it starts at. When a
+connection drops, the client asks for the current offset and carries on from
+there instead of restarting the transfer. Once the last byte has arrived, the
+session is finalised: the whole-file SHA-256 (kept up to date chunk by chunk)
+is checked against the one the client declared, and the assembled file is
+handed to the normal pinning path like any other staged upload.
+
+Each session is two files under ``root``: ``<id>.part`` (the bytes received so
+far, fsynced after every chunk, so its length *is* the offset) and
+``<id>.json`` (name, type, size, owner, state). The running hash lives in
+memory. After a restart it is rebuilt from the ``.part`` file on the next
+chunk.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Optional
+
+CHUNK_SIZE = 256 * 1024
+
+
+class OffsetConflict(Exception):
+    """The chunk does not start where the previous one ended; ``offset`` is where it should"""
+
+    def __init__(self, offset: int):
+        super().__init__(f'expected offset {offset}')
+        self.offset = offset
+
+
+class ChunkedUploads:
+    def __init__(self, root: str, max_size: int = 2 * 1024 ** 3, max_chunk: int = 16 * 1024 * 1024,
+                 ttl: float = 24 * 3600):
+        self.root = root
+        self.max_size = max_size
+        self.max_chunk = max_chunk
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._hashers: Dict[str, tuple] = {}  # upload id -> (sha256 object, offset it covers)
+        self.chunks = 0
+        self.bytes_received = 0
+        self.conflicts = 0
+        self.checksum_failures = 0
+        self.completed = 0
+
+    def _paths(self, upload_id: str):
+        if not upload_id.isalnum():
+            raise LookupError(upload_id)
+        base = os.path.join(self.root, upload_id)
+        return base + '.part', base + '.json'
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _write_meta(self, meta: dict):
+        _, meta_path = self._paths(meta['id'])
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def create(self, owner: str, filename: str, content_type: str, size: int, sha256: Optional[str] = None) -> dict:
+        if not isinstance(size, int) or size < 0:
+            raise ValueError('size must be a non-negative integer')
+        if size > self.max_size:
+            raise ValueError(f'upload exceeds the {self.max_size} byte limit')
+        if sha256 is not None and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+            raise ValueError('sha256 must be 64 hex characters')
+        self.purge_expired()
+        meta = {
+            'id': uuid.uuid4().hex,
+            'owner': owner,
+            'filename': filename,
+            'content_type': content_type or 'application/octet-stream',
+            'size': size,
+            'expected_sha256': sha256.lower() if sha256 else None,
+            'sha256': None,
+            'complete': False,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        part_path, _ = self._paths(meta['id'])
+        open(part_path, 'wb').close()
+        self._write_meta(meta)
+        return dict(meta, offset=0)
+
+    def get(self, upload_id: str) -> Optional[dict]:
+        """Session state including the current offset, or None if unknown or expired"""
+        try:
+            part_path, meta_path = self._paths(upload_id)
+            with open(meta_path) as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except (LookupError, OSError, ValueError):
+            return None
+        return meta
+
+    def _hasher(self, upload_id: str, part_path: str, offset: int):
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[1] == offset:
+            return cached[0]
+        # Process restarted (or first chunk): rebuild the running hash from what is on disk
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest
+
+    def append(self, upload_id: str, offset: int, stream: BinaryIO, length: Optional[int] = None,
+               chunk_sha256: Optional[str] = None) -> dict:
+        """Append one chunk at offset; returns the session state. Raises LookupError, OffsetConflict or ValueError.
+
+        Without chunk_sha256, whatever arrived before a dropped connection is kept and the next chunk resumes
+        after it. With chunk_sha256, a chunk that does not match (or ends early) is rolled back whole.
+        """
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if meta is None:
+                raise LookupError(upload_id)
+            if meta['complete']:
+                raise ValueError('upload already finalised')
+            current = meta['offset']
+            if offset != current:
+                self.conflicts += 1
+                raise OffsetConflict(current)
+            limit = min(meta['size'] - current, self.max_chunk)
+            if length is not None and length > limit:
+                raise ValueError(f'chunk of {length} bytes exceeds the {limit} allowed here')
+            part_path, _ = self._paths(upload_id)
+            running = self._hasher(upload_id, part_path, current).copy()
+            chunk_digest = hashlib.sha256()
+            written = 0
+            with open(part_path, 'r+b') as out:
+                out.seek(current)
+                try:
+                    while True:
+                        data = stream.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        if written + len(data) > limit:
+                            raise ValueError(f'chunk exceeds the {limit} bytes allowed here')
+                        out.write(data)
+                        running.update(data)
+                        chunk_digest.update(data)
+                        written += len(data)
+                    if chunk_sha256 and chunk_digest.hexdigest() != chunk_sha256.lower():
+                        self.checksum_failures += 1
+                        raise ValueError('chunk checksum mismatch')
+                except BaseException:
+                    if chunk_sha256:
+                        # Back to the last verified offset so the client resends this chunk
+                        out.truncate(current)
+                        raise
+                    self._commit(meta, out, running, current + written, written)
+                    raise
+                meta = self._commit(meta, out, running, current + written, written)
+            return meta
+
+    def _commit(self, meta: dict, out, running, offset: int, written: int) -> dict:
+        out.truncate(offset)
+        out.flush()
+        os.fsync(out.fileno())
+        self._hashers[meta['id']] = (running, offset)
+        self.chunks += 1
+        self.bytes_received += written
+        meta = {key: value for key, value in meta.items() if key != 'offset'}
+        meta['updated_at'] = time.time()
+        self._write_meta(meta)
+        return dict(meta, offset=offset)
+
+    def finalize(self, upload_id: str) -> dict:
+        """Check length and checksum of a fully received upload and mark it complete; raises LookupError/ValueError"""
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if meta is None:
+                raise LookupError(upload_id)
+            if meta['complete']:
+                return meta
+            if meta['offset'] != meta['size']:
+                raise ValueError(f"upload incomplete: {meta['offset']} of {meta['size']} bytes received")
+            part_path, _ = self._paths(upload_id)
+            sha256 = self._hasher(upload_id, part_path, meta['offset']).hexdigest()
+            if meta['expected_sha256'] and sha256 != meta['expected_sha256']:
+                self.checksum_failures += 1
+                self.discard(upload_id)
+                raise ValueError('file checksum mismatch; the upload was discarded and must be restarted')
+            meta.pop('offset')
+            meta.update(sha256=sha256, complete=True, updated_at=time.time())
+            self._write_meta(meta)
+            self._hashers.pop(upload_id, None)
+            self.completed += 1
+            return dict(meta, offset=meta['size'])
+
+    def take(self, upload_id: str, owner: str, dest_dir: str) -> dict:
+        """Move a finalised upload into dest_dir and end the session; returns a staged upload item"""
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if meta is None or meta['owner'] != owner:
+                raise LookupError(upload_id)
+            if not meta['complete']:
+                raise ValueError(f'upload {upload_id} has not been finalised')
+            part_path, meta_path = self._paths(upload_id)
+            dest_path = os.path.join(dest_dir, f"{upload_id}_{meta['filename']}")
+            os.replace(part_path, dest_path)
+            os.remove(meta_path)
+        with self._lock:
+            self._session_locks.pop(upload_id, None)
+        return {'path': dest_path, 'filename': meta['filename'], 'content_type': meta['content_type'],
+                'sha256': meta['sha256'], 'size': meta['size']}
+
+    def discard(self, upload_id: str):
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._session_locks.pop(upload_id, None)
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_expired(self) -> int:
+        """Drop sessions idle for longer than ttl"""
+        cutoff = time.time() - self.ttl
+        purged = 0
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            meta = self.get(upload_id)
+            if meta is not None and meta['updated_at'] < cutoff:
+                self.discard(upload_id)
+                purged += 1
+        return purged
+
+    def stats(self) -> dict:
+        return {
+            'open_sessions': sum(1 for name in os.listdir(self.root) if name.endswith('.json')),
+            'chunks': self.chunks,
+            'bytes_received': self.bytes_received,
+            'offset_conflicts': self.conflicts,
+            'checksum_failures': self.checksum_failures,
+            'completed': self.completed,
+        }
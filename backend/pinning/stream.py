@@ -0,0 +1,234 @@
+"""
+Streaming multipart uploads to the pinning service.
+
+``requests.post(files=...)`` builds the whole multipart body in memory before
+sending it, so a 100 MB drone image costs over 100 MB of RAM per upload.
+``MultipartStream`` yields the body in fixed-size chunks straight from the
+source and hashes the content as it goes, so encoding adds no more than a
+chunk of memory whatever the file size.
+
+A retry has to resend the same bytes. Seekable sources are simply rewound.
+That includes ``request.files`` parts: Werkzeug has already spooled each one
+into a ``SpooledTemporaryFile`` (in memory up to 500 KB, on disk beyond)
+while parsing the form, so they are read from that copy, not from the socket.
+``ReplayableReader`` tees sources that cannot seek, such as a raw
+``request.stream``, into a ``SpooledTemporaryFile`` while they are sent. The
+copy stays in memory up to ``spool_max`` and only spills to disk beyond that.
+With ``attempts=1`` nothing is copied at all. Retries wait a jittered, exponentially
+growing delay (``backoff_delay``) so a struggling service is not hit again
+straight away by every worker at once.
+"""
+import hashlib
+import os
+import random
+import tempfile
+import time
+import uuid
+from typing import BinaryIO, Callable, Dict, Iterator, Optional
+
+CHUNK_SIZE = 256 * 1024
+SPOOL_MAX = 4 * 1024 * 1024
+
+
+class ReplayableReader:
+    """Read-once stream wrapper that can rewind by replaying what it has already read"""
+
+    def __init__(self, source: BinaryIO, spool_max: int = SPOOL_MAX):
+        self._source = source
+        self._spill = tempfile.SpooledTemporaryFile(max_size=spool_max)
+        self._recorded = 0
+        self._replay_pos: Optional[int] = None
+
+    def read(self, size: int = -1) -> bytes:
+        if self._replay_pos is not None:
+            if self._replay_pos < self._recorded:
+                self._spill.seek(self._replay_pos)
+                limit = self._recorded - self._replay_pos
+                data = self._spill.read(limit if size < 0 else min(size, limit))
+                self._replay_pos += len(data)
+                return data
+            self._replay_pos = None
+        data = self._source.read(size)
+        if data:
+            self._spill.seek(self._recorded)
+            self._spill.write(data)
+            self._recorded += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0):
+        if offset != 0 or whence != 0:
+            raise OSError('ReplayableReader can only rewind to the start')
+        self._replay_pos = 0
+
+    @property
+    def spilled(self) -> bool:
+        """True if the replay buffer outgrew memory and went to disk"""
+        return bool(getattr(self._spill, '_rolled', False))
+
+    def close(self):
+        self._spill.close()
+
+
+def _seekable(source) -> bool:
+    try:
+        return bool(source.seekable())
+    except (AttributeError, ValueError, OSError):
+        return False
+
+
+def _size_of(source) -> Optional[int]:
+    """Remaining bytes of a seekable source, or None if unknown.
+
+    Measured with seek/tell rather than fstat: fileno() would roll a SpooledTemporaryFile over to disk.
+    """
+    if not _seekable(source):
+        return None
+    try:
+        position = source.tell()
+        end = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class MultipartStream:
+    """Iterable multipart/form-data body for a single file part plus optional text fields.
+
+    Pass it as ``data=`` to requests: it is sent with a Content-Length when the
+    source size is known and with chunked transfer encoding otherwise. After
+    iteration, ``sha256`` and ``size`` describe the file content that was sent.
+    """
+
+    def __init__(self, source: BinaryIO, filename: str, field: str = 'file',
+                 content_type: str = 'application/octet-stream', fields: Optional[Dict[str, str]] = None,
+                 size: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        safe_name = filename.replace('"', '_').replace('\r', '_').replace('\n', '_')
+        head = []
+        for name, value in (fields or {}).items():
+            head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+        head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                    f'filename="{safe_name}"\r\nContent-Type: {content_type}\r\n\r\n')
+        self._head = ''.join(head).encode('utf-8')
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('ascii')
+        self.file_size = size if size is not None else _size_of(source)
+        if self.file_size is not None:
+            # requests reads ``len`` for the Content-Length; without it the body is sent chunked
+            self.len = len(self._head) + self.file_size + len(self._tail)
+        self.sha256 = None
+        self.size = 0
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __iter__(self) -> Iterator[bytes]:
+        digest = hashlib.sha256()
+        self.size = 0
+        yield self._head
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            self.size += len(chunk)
+            yield chunk
+        yield self._tail
+        self.sha256 = digest.hexdigest()
+
+
+class PinError(RuntimeError):
+    """A pin that failed; ``status`` is the HTTP status when the service answered at all"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Seconds to wait before retry number ``attempt`` (1-based): full jitter over base * 2**(attempt-1)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retryable(status: Optional[int]) -> bool:
+    """Failures worth retrying: no reply at all, rate limiting or a server error"""
+    return status is None or status == 429 or status >= 500
+
+
+def parse_reply(response, cid_key: str) -> dict:
+    """JSON body of a successful pin reply; raises PinError if it is unreadable or has no cid_key"""
+    try:
+        reply = response.json()
+        if not isinstance(reply, dict) or not reply.get(cid_key):
+            raise ValueError(f'no {cid_key}')
+    except ValueError as e:
+        raise PinError(f'unreadable pinning reply ({e}): {response.text[:200]}')
+    return dict(reply)
+
+
+def pin_stream(post: Callable, url: str, headers: Dict[str, str], source: BinaryIO, filename: str,
+               content_type: str = 'application/octet-stream', fields: Optional[Dict[str, str]] = None,
+               attempts: int = 2, timeout=60, spool_max: int = SPOOL_MAX, backoff: float = 0.5,
+               backoff_max: float = 8.0, cid_key: str = 'IpfsHash') -> dict:
+    """Stream one file to a pinFileToIPFS-style endpoint; returns the JSON reply plus sha256/size.
+
+    ``post`` is ``requests.post`` or a ``Session.post``. Connection errors, 429
+    and 5xx replies are retried up to ``attempts`` times in total after a
+    ``backoff_delay``, rewinding the source (or replaying it from the spill
+    buffer if it cannot seek). ``timeout`` may be a (connect, read) tuple.
+    A 200 whose body is not JSON or lacks ``cid_key`` raises PinError with no
+    status, which the circuit breaker counts as a service failure.
+    """
+    reader = source
+    replayable = None
+    if attempts > 1 and not _seekable(source):
+        reader = replayable = ReplayableReader(source, spool_max)
+    start = source.tell() if reader is source and _seekable(source) else 0
+    last_error = None
+    try:
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(backoff_delay(attempt, backoff, backoff_max))
+                reader.seek(start)
+            body = MultipartStream(reader, filename, content_type=content_type, fields=fields)
+            try:
+                response = post(url, data=body, headers=dict(headers, **{'Content-Type': body.content_type}),
+                                timeout=timeout)
+            except OSError as e:
+                # Also covers requests' RequestException, which subclasses IOError
+                last_error = PinError(f'upload failed: {e}')
+                continue
+            if response.status_code != 200 and retryable(response.status_code):
+                last_error = PinError(f'pinning service error {response.status_code}: {response.text[:200]}',
+                                      status=response.status_code)
+                continue
+            if response.status_code != 200:
+                raise PinError(f'pinning rejected upload ({response.status_code}): {response.text[:200]}',
+                               status=response.status_code)
+            result = parse_reply(response, cid_key)
+            result.update(sha256=body.sha256, size=body.size)
+            if replayable is not None:
+                result['spilled'] = replayable.spilled
+            return result
+        raise last_error
+    finally:
+        if replayable is not None:
+            replayable.close()
+
+
+def copy_hashed(source: BinaryIO, path: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Copy a stream to path in chunks, hashing on the way; returns {'sha256', 'size'}"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as out:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return {'sha256': digest.hexdigest(), 'size': size}
@@ -0,0 +1,117 @@
+"""
+IPFS CIDs computed locally, matching ``ipfs add --cid-version=1`` defaults.
+
+Those defaults are: fixed 256 KiB chunks stored as raw leaves, a balanced
+DAG of dag-pb UnixFS file nodes with up to 174 links each, and sha2-256.
+
+``UnixfsHasher`` is fed bytes as they stream past. Only the leaf CIDs are
+kept in memory, never the content, and ``cid()`` builds the tree from them.
+A file that fits in one chunk is its own root: a ``bafkrei...`` raw CID.
+"""
+import base64
+import hashlib
+from typing import List, Tuple
+
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+
+RAW = 0x55
+DAG_PB = 0x70
+SHA2_256 = 0x12
+UNIXFS_FILE = 2
+
+
+def varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _pb_varint(field: int, value: int) -> bytes:
+    return varint(field << 3) + varint(value)
+
+
+def _pb_bytes(field: int, value: bytes) -> bytes:
+    return varint(field << 3 | 2) + varint(len(value)) + value
+
+
+def cid_v1(codec: int, digest: bytes) -> bytes:
+    return varint(1) + varint(codec) + bytes([SHA2_256, len(digest)]) + digest
+
+
+def cid_string(cid: bytes) -> str:
+    """Multibase base32 (lowercase, unpadded), the default text form of a CIDv1"""
+    return 'b' + base64.b32encode(cid).decode('ascii').lower().rstrip('=')
+
+
+# (cid, tsize, file bytes covered) for one node of the DAG
+Link = Tuple[bytes, int, int]
+
+
+def file_node(children: List[Link]) -> Tuple[bytes, Link]:
+    """Encode a dag-pb UnixFS file node over children; returns (block, link to it)"""
+    filesize = sum(covered for _, _, covered in children)
+    data = _pb_varint(1, UNIXFS_FILE) + _pb_varint(3, filesize)
+    data += b''.join(_pb_varint(4, covered) for _, _, covered in children)
+    # dag-pb canonical form: Links (field 2) before Data (field 1); each link is Hash, Name, Tsize
+    block = b''.join(_pb_bytes(2, _pb_bytes(1, cid) + _pb_bytes(2, b'') + _pb_varint(3, tsize))
+                     for cid, tsize, _ in children)
+    block += _pb_bytes(1, data)
+    cid = cid_v1(DAG_PB, hashlib.sha256(block).digest())
+    return block, (cid, len(block) + sum(tsize for _, tsize, _ in children), filesize)
+
+
+class UnixfsHasher:
+    """Incremental CID (and plain SHA-256) of a byte stream"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._leaves: List[Link] = []
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data: bytes):
+        self._sha256.update(data)
+        self.size += len(data)
+        view = memoryview(data)
+        if self._buffer:
+            take = self.chunk_size - len(self._buffer)
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) < self.chunk_size:
+                return
+            self._leaf(self._buffer)
+            self._buffer = bytearray()
+        # Whole chunks are hashed straight from the caller's buffer
+        while len(view) >= self.chunk_size:
+            self._leaf(view[:self.chunk_size])
+            view = view[self.chunk_size:]
+        self._buffer += view
+
+    def _leaf(self, chunk):
+        self._leaves.append((cid_v1(RAW, hashlib.sha256(chunk).digest()), len(chunk), len(chunk)))
+
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def cid(self) -> str:
+        if self._buffer or not self._leaves:
+            self._leaf(self._buffer)
+            self._buffer = bytearray()
+        level = self._leaves
+        while len(level) > 1:
+            level = [file_node(level[i:i + MAX_LINKS])[1] for i in range(0, len(level), MAX_LINKS)]
+        return cid_string(level[0][0])
+
+
+def cid_of_bytes(data: bytes) -> str:
+    hasher = UnixfsHasher()
+    hasher.update(data)
+    return hasher.cid()
@@ -0,0 +1,299 @@
+"""
+In-memory SSE fan-out with per-subscriber backpressure policies.
+
+Each subscriber owns a bounded buffer. When a slow dashboard lets it fill up,
+the subscriber's policy decides what happens to the next event:
+
+- ``drop_oldest``: evict the oldest buffered frame to make room
+- ``drop_newest``: discard the incoming frame
+- ``disconnect``: discard the incoming frame and close the stream after N drops
+- ``conflate``: replace a buffered frame with the same key in place, so only
+  the latest event per key (e.g. per device) is delivered; falls back to
+  ``drop_oldest`` for unkeyed events
+
+Drop, lag and lock-wait counters are kept so buffer sizes can be tuned from data.
+"""
+import json
+import threading
+import time
+from collections import deque
+from queue import Empty, Full
+from typing import Any, Hashable, Optional
+
+from realtime.heartbeat import CLOSE
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DISCONNECT = 'disconnect'
+CONFLATE = 'conflate'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT, CONFLATE)
+
+
+class TimedLock:
+    """Lock that records how often and how long callers wait to acquire it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            self.acquisitions += 1
+            return self
+        t0 = time.perf_counter()
+        self._lock.acquire()
+        waited = time.perf_counter() - t0
+        # Counters are updated while holding the lock, so they need no extra guard
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def stats(self) -> dict:
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_total_ms': round(self.wait_total * 1000, 3),
+            'wait_max_ms': round(self.wait_max * 1000, 3),
+        }
+
+
+class Subscriber:
+    """Bounded, policy-aware frame buffer with a Queue-compatible consumer API"""
+
+    def __init__(self, sub_id: int, maxsize: int = 100, policy: str = DROP_OLDEST, max_drops: int = 100):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.id = sub_id
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_drops = max_drops
+        self.created_at = time.time()
+        # Entries are [key, frame, enqueued_at]; lists so conflation can swap the frame in place
+        self._buf = deque()
+        self._keyed = {}
+        self._cond = threading.Condition(threading.Lock())
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+        self.max_lag = 0.0
+
+    # Producer side -------------------------------------------------------
+    def offer(self, frame: Any, key: Optional[Hashable] = None) -> bool:
+        """Enqueue a published frame, applying the backpressure policy; False if it was dropped"""
+        with self._cond:
+            return self._offer_locked(frame, key)
+
+    def offer_many(self, frames) -> int:
+        """Enqueue (frame, key) pairs under one lock acquisition; returns how many were kept"""
+        kept = 0
+        with self._cond:
+            for frame, key in frames:
+                if self.closed:
+                    break
+                kept += self._offer_locked(frame, key)
+        return kept
+
+    def put_nowait(self, frame: Any):
+        """Plain bounded put used for keep-alives; raises queue.Full instead of applying the policy"""
+        with self._cond:
+            if self.closed or len(self._buf) >= self.maxsize:
+                raise Full
+            self._append(None, frame)
+
+    def close(self):
+        with self._cond:
+            self._close_locked()
+
+    def discard_buffered(self) -> int:
+        """Drop every buffered frame, counted as dropped rather than delivered; returns how many"""
+        with self._cond:
+            count = sum(1 for entry in self._buf if entry[1] is not CLOSE)
+            self._buf.clear()
+            self._keyed.clear()
+            self.dropped += count
+            return count
+
+    # Consumer side -------------------------------------------------------
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        with self._cond:
+            if block and not self._buf:
+                self._cond.wait_for(lambda: self._buf, timeout)
+            if not self._buf:
+                raise Empty
+            entry = self._pop_entry()
+            lag = time.monotonic() - entry[2]
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if entry[1] is not CLOSE:
+                self.delivered += 1
+            return entry[1]
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return len(self._buf)
+
+    # Internals -----------------------------------------------------------
+    def _offer_locked(self, frame, key) -> bool:
+        if self.closed:
+            return False
+        if key is not None and self.policy == CONFLATE:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[1] = frame
+                self.conflated += 1
+                return True
+        if len(self._buf) >= self.maxsize:
+            if self.policy in (DROP_OLDEST, CONFLATE):
+                self._pop_entry()
+                self.dropped += 1
+            else:
+                self.dropped += 1
+                if self.policy == DISCONNECT and self.dropped >= self.max_drops:
+                    self._close_locked()
+                return False
+        self._append(key, frame)
+        return True
+
+    def _append(self, key, frame):
+        entry = [key, frame, time.monotonic()]
+        self._buf.append(entry)
+        if key is not None and self.policy == CONFLATE:
+            self._keyed[key] = entry
+        if len(self._buf) > self.max_depth:
+            self.max_depth = len(self._buf)
+        self._cond.notify()
+
+    def _pop_entry(self):
+        entry = self._buf.popleft()
+        if entry[0] is not None and self._keyed.get(entry[0]) is entry:
+            del self._keyed[entry[0]]
+        return entry
+
+    def _close_locked(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Release buffered frames and wake the stream generator so it exits
+        self._buf.clear()
+        self._keyed.clear()
+        self._buf.append([None, CLOSE, time.monotonic()])
+        self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = len(self._buf)
+            oldest = time.monotonic() - self._buf[0][2] if self._buf else 0.0
+        return {
+            'id': self.id,
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'depth': depth,
+            'max_depth': self.max_depth,
+            'lag_seconds': round(oldest, 3),
+            'max_lag_seconds': round(self.max_lag, 3),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'conflated': self.conflated,
+            'closed': self.closed,
+            'connected_seconds': round(time.time() - self.created_at, 1),
+        }
+
+
+class SSEBroker:
+    def __init__(self, maxsize: int = 100, policy: str = DROP_OLDEST, max_drops: int = 100):
+        # Checked here so a misconfigured default fails at startup rather than on the first subscribe
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_drops = max_drops
+        self._clients = []
+        self._lock = TimedLock()
+        self._next_id = 0
+        self.published = 0
+        # Totals carried over from subscribers that already went away
+        self._gone_dropped = 0
+        self._gone_delivered = 0
+        self.disconnected_slow = 0
+
+    def subscribe(self, maxsize: Optional[int] = None, policy: Optional[str] = None,
+                  max_drops: Optional[int] = None) -> Subscriber:
+        with self._lock:
+            self._next_id += 1
+            sub = Subscriber(
+                self._next_id,
+                maxsize=maxsize or self.maxsize,
+                policy=policy or self.policy,
+                max_drops=max_drops or self.max_drops,
+            )
+            self._clients.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            try:
+                self._clients.remove(sub)
+            except ValueError:
+                return
+            self._gone_dropped += sub.dropped
+            self._gone_delivered += sub.delivered
+            if sub.policy == DISCONNECT and sub.closed and sub.dropped >= sub.max_drops:
+                self.disconnected_slow += 1
+        sub.close()
+
+    def publish(self, event: dict, key: Optional[Hashable] = None):
+        # Serialise once for all subscribers; buffers carry ready-to-write SSE frames
+        payload = f"data: {json.dumps(event)}\n\n".encode()
+        with self._lock:
+            clients = list(self._clients)
+            self.published += 1
+        for sub in clients:
+            sub.offer(payload, key)
+            if sub.closed:
+                self.unsubscribe(sub)
+
+    def publish_many(self, events, keys=None):
+        """Fan out a batch of events; each is serialised once and each subscriber is locked once"""
+        keys = keys if keys is not None else [None] * len(events)
+        frames = [(f"data: {json.dumps(e)}\n\n".encode(), k) for e, k in zip(events, keys)]
+        if not frames:
+            return
+        with self._lock:
+            clients = list(self._clients)
+            self.published += len(frames)
+        for sub in clients:
+            sub.offer_many(frames)
+            if sub.closed:
+                self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = list(self._clients)
+            totals = {
+                'published': self.published,
+                'dropped_disconnected_clients': self._gone_dropped,
+                'delivered_disconnected_clients': self._gone_delivered,
+                'slow_consumers_disconnected': self.disconnected_slow,
+            }
+        subscribers = [s.stats() for s in clients]
+        return {
+            'defaults': {'maxsize': self.maxsize, 'policy': self.policy, 'max_drops': self.max_drops},
+            'subscriber_count': len(subscribers),
+            'totals': totals,
+            'dropped_live': sum(s['dropped'] for s in subscribers),
+            'lock': self._lock.stats(),
+            'subscribers': subscribers,
+        }
@@ -0,0 +1,146 @@
+"""
+Shared SSE keep-alive scheduler.
+
+One timer thread per process pushes a pre-serialised ping frame to every live
+stream instead of each connection sleeping in its own loop. Streams that stop
+draining their queue are evicted so their buffers are released early.
+"""
+import threading
+import time
+from queue import Queue, Empty, Full
+from typing import Callable, Iterator, Optional
+
+# Sentinel pushed into a stream's queue to make its generator return
+CLOSE = object()
+
+
+class KeepAliveStream:
+    """Queue-backed SSE stream registered with a HeartbeatScheduler"""
+
+    __slots__ = ('queue', 'on_close', 'last_seen', 'missed', 'closed')
+
+    def __init__(self, queue: Queue, on_close: Optional[Callable[[], None]] = None):
+        self.queue = queue
+        self.on_close = on_close
+        self.last_seen = time.monotonic()
+        self.missed = 0
+        self.closed = False
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+        self.missed = 0
+
+
+class HeartbeatScheduler:
+    def __init__(self, interval: float = 15.0, build_frame: Optional[Callable[[], bytes]] = None,
+                 max_missed: int = 3):
+        # build_frame is called once per tick; the resulting bytes are shared by all streams
+        self.interval = interval
+        self.max_missed = max_missed
+        self._build_frame = build_frame or (lambda: b": ping\n\n")
+        self._streams = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.ticks = 0
+        self.evicted = 0
+
+    def open(self, queue: Optional[Queue] = None, maxsize: int = 100,
+             on_close: Optional[Callable[[], None]] = None) -> KeepAliveStream:
+        """Register a stream (optionally around an existing queue) and start the timer if needed"""
+        stream = KeepAliveStream(queue if queue is not None else Queue(maxsize=maxsize), on_close)
+        with self._lock:
+            self._streams.add(stream)
+        self._ensure_started()
+        return stream
+
+    def close(self, stream: KeepAliveStream):
+        with self._lock:
+            self._streams.discard(stream)
+            if stream.closed:
+                return
+            stream.closed = True
+        if stream.on_close is not None:
+            stream.on_close()
+
+    def iter_frames(self, stream: KeepAliveStream, initial: Optional[bytes] = None) -> Iterator[bytes]:
+        """Yield queued frames until the stream is closed; unregisters on exit"""
+        try:
+            if initial is not None:
+                yield initial
+                stream.touch()
+            while not stream.closed:
+                try:
+                    frame = stream.queue.get(timeout=self.interval * self.max_missed)
+                except Empty:
+                    continue
+                if frame is CLOSE:
+                    break
+                yield frame
+                # Resumed by the server, so the previous write reached the socket
+                stream.touch()
+        finally:
+            self.close(stream)
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = len(self._streams)
+        return {
+            'interval': self.interval,
+            'live_streams': live,
+            'ticks': self.ticks,
+            'evicted': self.evicted,
+        }
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sse-heartbeat', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.tick()
+
+    def tick(self):
+        """Push one heartbeat frame to every stream and evict the ones that stopped draining"""
+        self.ticks += 1
+        with self._lock:
+            streams = list(self._streams)
+        if not streams:
+            return
+        frame = self._build_frame()
+        deadline = time.monotonic() - self.interval * self.max_missed
+        for stream in streams:
+            try:
+                stream.queue.put_nowait(frame)
+            except Full:
+                stream.missed += 1
+            if stream.missed >= self.max_missed or stream.last_seen < deadline:
+                self._evict(stream)
+
+    def _evict(self, stream: KeepAliveStream):
+        self.evicted += 1
+        # Drop buffered frames so the memory is released even if the generator never resumes.
+        # A broker Subscriber counts them as dropped; draining it with get() would count them delivered.
+        discard = getattr(stream.queue, 'discard_buffered', None)
+        if discard is not None:
+            discard()
+        else:
+            while True:
+                try:
+                    stream.queue.get_nowait()
+                except Empty:
+                    break
+        try:
+            stream.queue.put_nowait(CLOSE)
+        except Full:
+            pass
+        self.close(stream)
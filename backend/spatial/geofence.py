@@ -0,0 +1,221 @@
+"""
+Project boundary geofencing for streaming telemetry.
+
+Boundaries are GeoJSON ``Polygon``/``MultiPolygon`` geometries (lon, lat
+order, holes allowed). ``GeofenceIndex`` precomputes each fence's bounding
+box and buckets fences into a uniform lat/lon grid. A fix is then tested only
+against the few fences whose box overlaps its grid cell, so the per-point
+cost stays flat as the number of projects grows. A fence whose box would
+cover more than ``MAX_CELLS_PER_FENCE`` cells (a huge or malformed boundary)
+is not spread over the grid: it goes on a short overflow list that every
+lookup checks. ``GeofenceTracker`` follows each device's current fence and
+reports exits.
+"""
+import json
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Ring = List[Tuple[float, float]]  # closed or open list of (lon, lat)
+
+MAX_CELLS_PER_FENCE = 4096
+
+
+def parse_boundary(value) -> List[List[Ring]]:
+    """Validate a GeoJSON Polygon/MultiPolygon (dict or JSON text) into a list of polygons; raises ValueError"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('boundary must be GeoJSON')
+    if isinstance(value, dict) and value.get('type') == 'Feature':
+        value = value.get('geometry')
+    if not isinstance(value, dict) or value.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('boundary must be a GeoJSON Polygon or MultiPolygon')
+    coords = value.get('coordinates')
+    polygons = [coords] if value['type'] == 'Polygon' else coords
+    if not isinstance(polygons, list) or not polygons:
+        raise ValueError('boundary has no coordinates')
+    parsed = []
+    for polygon in polygons:
+        if not isinstance(polygon, list) or not polygon:
+            raise ValueError('boundary polygon has no rings')
+        rings = []
+        for ring in polygon:
+            try:
+                points = [(float(p[0]), float(p[1])) for p in ring]
+            except (TypeError, ValueError, IndexError):
+                raise ValueError('boundary positions must be [lon, lat] numbers')
+            if points and points[0] == points[-1]:
+                points.pop()
+            if len(points) < 3:
+                raise ValueError('boundary rings need at least 3 distinct positions')
+            if not all(-180 <= lon <= 180 and -90 <= lat <= 90 for lon, lat in points):
+                raise ValueError('boundary positions out of range')
+            rings.append(points)
+        parsed.append(rings)
+    return parsed
+
+
+def _ring_contains(ring: Ring, lon: float, lat: float) -> bool:
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > lat) != (y2 > lat) and lon < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class Fence:
+    __slots__ = ('project_id', 'polygons', 'bbox', 'area')
+
+    def __init__(self, project_id: int, polygons: List[List[Ring]]):
+        self.project_id = project_id
+        self.polygons = polygons
+        lons = [lon for polygon in polygons for lon, _ in polygon[0]]
+        lats = [lat for polygon in polygons for _, lat in polygon[0]]
+        self.bbox = (min(lons), min(lats), max(lons), max(lats))
+        # Bounding-box area breaks ties between overlapping fences: the tighter one wins
+        self.area = (self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1])
+
+    def contains(self, lat: float, lon: float) -> bool:
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        if lon < min_lon or lon > max_lon or lat < min_lat or lat > max_lat:
+            return False
+        for rings in self.polygons:
+            if _ring_contains(rings[0], lon, lat) and not any(_ring_contains(h, lon, lat) for h in rings[1:]):
+                return True
+        return False
+
+
+class GeofenceIndex:
+    """Immutable grid index over project fences; rebuild it when boundaries change"""
+
+    def __init__(self, fences: Sequence[Fence], cell_deg: Optional[float] = None,
+                 max_cells: int = MAX_CELLS_PER_FENCE):
+        self.fences = list(fences)
+        self.cell_deg = cell_deg or self._auto_cell(self.fences)
+        self._grid: Dict[Tuple[int, int], List[Fence]] = {}
+        # Fences too big for the grid; being larger than any gridded fence, they are checked last
+        self._overflow: List[Fence] = []
+        for fence in sorted(self.fences, key=lambda f: f.area):
+            min_lon, min_lat, max_lon, max_lat = fence.bbox
+            cells = ((self._cell(max_lon) - self._cell(min_lon) + 1)
+                     * (self._cell(max_lat) - self._cell(min_lat) + 1))
+            if cells > max_cells:
+                self._overflow.append(fence)
+                continue
+            for cx in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                for cy in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                    self._grid.setdefault((cx, cy), []).append(fence)
+
+    @classmethod
+    def from_boundaries(cls, boundaries: Iterable[Tuple[int, object]], cell_deg: Optional[float] = None):
+        """Build from (project_id, GeoJSON) pairs, skipping projects whose boundary does not parse"""
+        fences = []
+        for project_id, boundary in boundaries:
+            try:
+                fences.append(Fence(project_id, parse_boundary(boundary)))
+            except ValueError:
+                continue
+        return cls(fences, cell_deg)
+
+    @staticmethod
+    def _auto_cell(fences: Sequence[Fence]) -> float:
+        # About one median fence per cell keeps cell lists short without spreading big fences too thin
+        if not fences:
+            return 1.0
+        spans = sorted(max(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) for f in fences)
+        return min(max(spans[len(spans) // 2], 0.001), 10.0)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_deg)
+
+    def locate(self, lat: float, lon: float) -> Optional[int]:
+        """Project id of the (tightest) fence containing the point, or None"""
+        for fence in self._grid.get((self._cell(lon), self._cell(lat)), ()):
+            if fence.contains(lat, lon):
+                return fence.project_id
+        for fence in self._overflow:
+            if fence.contains(lat, lon):
+                return fence.project_id
+        return None
+
+    def stats(self) -> dict:
+        sizes = [len(v) for v in self._grid.values()]
+        return {
+            'fences': len(self.fences),
+            'cell_deg': self.cell_deg,
+            'cells': len(sizes),
+            'max_fences_per_cell': max(sizes) if sizes else 0,
+            'overflow_fences': len(self._overflow),
+        }
+
+
+class GeofenceTracker:
+    """Tags fixes with their fence and turns per-device fence changes into exit events.
+
+    The index is loaded lazily through ``loader`` (an iterable of
+    (project_id, boundary) pairs) and rebuilt after ``invalidate()``; readers
+    keep using the previous index until the new one is swapped in.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[int, object]]], cell_deg: Optional[float] = None):
+        self._loader = loader
+        self.cell_deg = cell_deg
+        self._index: Optional[GeofenceIndex] = None
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        # device_id -> (ts, project_id) of the newest fix seen
+        self._current: Dict[str, tuple] = {}
+        self.exits = 0
+
+    @property
+    def index(self) -> GeofenceIndex:
+        index = self._index
+        if index is None:
+            with self._load_lock:
+                if self._index is None:
+                    self._index = GeofenceIndex.from_boundaries(self._loader(), self.cell_deg)
+                index = self._index
+        return index
+
+    def invalidate(self):
+        self._index = None
+
+    def tag(self, rows: Iterable[dict], key: str = 'inside_project_id'):
+        """Set rows[key] to the containing project id (or None)"""
+        index = self.index
+        for row in rows:
+            row[key] = index.locate(row['lat'], row['lon'])
+
+    def transitions(self, rows: Iterable[dict], key: str = 'inside_project_id') -> List[dict]:
+        """Advance per-device state with tagged rows; returns geofence_exit payloads"""
+        events = []
+        with self._state_lock:
+            for row in sorted(rows, key=lambda r: r['ts']):
+                device_id, ts, inside = row['device_id'], row['ts'], row.get(key)
+                prev = self._current.get(device_id)
+                if prev is not None and ts < prev[0]:
+                    continue  # late replay; state already reflects newer fixes
+                self._current[device_id] = (ts, inside)
+                if prev is not None and prev[1] is not None and prev[1] != inside:
+                    events.append({
+                        'device_id': device_id,
+                        'project_id': prev[1],
+                        'entered_project_id': inside,
+                        'lat': row['lat'],
+                        'lon': row['lon'],
+                        'ts': ts.isoformat(),
+                    })
+            self.exits += len(events)
+        return events
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            'index': index.stats() if index is not None else None,
+            'devices_tracked': len(self._current),
+            'exits': self.exits,
+        }
@@ -0,0 +1,176 @@
+"""
+SQLite R*Tree index over latitude/longitude columns.
+
+``ensure_point_index`` creates ``<table>_rtree`` next to a table with point
+columns, backfills it, and installs triggers so inserts, coordinate updates and
+deletes keep it in sync without any application code. Queries use the R*Tree
+to narrow candidates to a bounding box and then filter exactly on the real
+columns (the R*Tree stores 32-bit floats, rounded outwards).
+
+If the SQLite build lacks the R*Tree module, a plain (lat, lon) B-tree index
+is created instead and the same helpers fall back to range predicates.
+"""
+import math
+import sqlite3
+from typing import List, Optional, Sequence, Tuple, Union
+
+KM_PER_DEG_LAT = 111.32
+_EARTH_RADIUS_KM = 6371.0088
+
+# Tables whose R*Tree has been ensured in this process
+_indexed = set()
+
+BBox = Tuple[float, float, float, float]  # (min_lon, min_lat, max_lon, max_lat), GeoJSON order
+
+
+def _table_exists(cursor, name: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def ensure_point_index(conn, table: str, lat_col: str, lon_col: str) -> bool:
+    """Create (once) and sync the spatial index for table; returns True if an R*Tree is used"""
+    rtree = f"{table}_rtree"
+    cursor = conn.cursor()
+    try:
+        created = not _table_exists(cursor, rtree)
+        if created:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {rtree} USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+            )
+    except sqlite3.OperationalError:
+        # No R*Tree module in this SQLite build; a composite index still beats a full scan
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{lat_col}_{lon_col} ON {table} ({lat_col}, {lon_col})")
+        _indexed.discard(table)
+        return False
+
+    new_point = f"NEW.{lat_col}, NEW.{lat_col}, NEW.{lon_col}, NEW.{lon_col}"
+    has_point = f"NEW.{lat_col} IS NOT NULL AND NEW.{lon_col} IS NOT NULL"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {rtree}_ai AFTER INSERT ON {table}
+        WHEN {has_point}
+        BEGIN
+            INSERT OR REPLACE INTO {rtree} VALUES (NEW.id, {new_point});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {rtree}_au AFTER UPDATE OF {lat_col}, {lon_col} ON {table}
+        BEGIN
+            DELETE FROM {rtree} WHERE id = OLD.id;
+            INSERT INTO {rtree} SELECT NEW.id, {new_point} WHERE {has_point};
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {rtree}_ad AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM {rtree} WHERE id = OLD.id;
+        END
+    ''')
+    if created:
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {rtree}
+            SELECT id, {lat_col}, {lat_col}, {lon_col}, {lon_col} FROM {table}
+            WHERE {lat_col} IS NOT NULL AND {lon_col} IS NOT NULL
+        ''')
+    _indexed.add(table)
+    return True
+
+
+def parse_bbox(text: str) -> BBox:
+    """Parse 'min_lon,min_lat,max_lon,max_lat' (min_lon > max_lon wraps the antimeridian); raises ValueError"""
+    parts = [float(p) for p in str(text).split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('bbox out of range')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def _split_antimeridian(bbox: BBox) -> List[BBox]:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon <= max_lon:
+        return [bbox]
+    return [(min_lon, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lon, max_lat)]
+
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> BBox:
+    """Bounding box containing a circle of radius_km; min_lon > max_lon when it wraps the antimeridian"""
+    dlat = radius_km / KM_PER_DEG_LAT
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEG_LAT * cos_lat) >= 180:
+        return -180.0, min_lat, 180.0, max_lat
+    dlon = radius_km / (KM_PER_DEG_LAT * cos_lat)
+    min_lon = (lon - dlon + 540) % 360 - 180
+    max_lon = (lon + dlon + 540) % 360 - 180
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class _Binder:
+    """Placeholders in one DB-API paramstyle, collecting their values in SQL order"""
+
+    def __init__(self, paramstyle: str):
+        if paramstyle not in ('qmark', 'named'):
+            raise ValueError(f"unsupported paramstyle {paramstyle!r}, expected 'qmark' or 'named'")
+        self.named = paramstyle == 'named'
+        self.values = []
+
+    def __call__(self, value: float) -> str:
+        self.values.append(value)
+        return f":bbox_{len(self.values) - 1}" if self.named else '?'
+
+    def params(self) -> Union[list, dict]:
+        if self.named:
+            return {f"bbox_{i}": value for i, value in enumerate(self.values)}
+        return self.values
+
+
+def _range_clause(lat_col: str, lon_col: str, bbox: BBox, prefix: str, bind: _Binder) -> str:
+    lat_sql = f"{prefix}{lat_col} BETWEEN {bind(bbox[1])} AND {bind(bbox[3])}"
+    lon_sql = ' OR '.join(f"{prefix}{lon_col} BETWEEN {bind(b[0])} AND {bind(b[2])}"
+                          for b in _split_antimeridian(bbox))
+    return f"{lat_sql} AND ({lon_sql})"
+
+
+def where_in_bbox(table: str, lat_col: str, lon_col: str, bbox: BBox, alias: Optional[str] = None,
+                  paramstyle: str = 'qmark') -> Tuple[str, Union[list, dict]]:
+    """WHERE predicate selecting rows of table inside bbox, and its parameters.
+
+    paramstyle 'qmark' gives '?' placeholders and a list (sqlite3); 'named'
+    gives ':bbox_<n>' placeholders and a dict (sqlite3, SQLAlchemy text()).
+    Uses the R*Tree to pick candidate ids when the table is indexed, then
+    re-checks the exact columns; plain range predicates otherwise.
+    """
+    prefix = f"{alias}." if alias else ''
+    bind = _Binder(paramstyle)
+    if table not in _indexed:
+        return _range_clause(lat_col, lon_col, bbox, prefix, bind), bind.params()
+    subquery = ' UNION ALL '.join(
+        f"SELECT id FROM {table}_rtree WHERE max_lat >= {bind(min_lat)} AND min_lat <= {bind(max_lat)}"
+        f" AND max_lon >= {bind(min_lon)} AND min_lon <= {bind(max_lon)}"
+        for min_lon, min_lat, max_lon, max_lat in _split_antimeridian(bbox)
+    )
+    exact_sql = _range_clause(lat_col, lon_col, bbox, prefix, bind)
+    return f"{prefix}id IN ({subquery}) AND {exact_sql}", bind.params()
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * _EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within_radius(rows: Sequence[dict], lat: float, lon: float, radius_km: float,
+                  lat_key: str = 'latitude', lon_key: str = 'longitude', limit: Optional[int] = None) -> List[dict]:
+    """Exact great-circle filter over bbox candidates, nearest first, with distance_km added"""
+    hits = []
+    for row in rows:
+        d = haversine_km(lat, lon, row[lat_key], row[lon_key])
+        if d <= radius_km:
+            hit = dict(row)
+            hit['distance_km'] = round(d, 3)
+            hits.append(hit)
+    hits.sort(key=lambda r: r['distance_km'])
+    return hits[:limit] if limit else hits
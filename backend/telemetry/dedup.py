@@ -0,0 +1,111 @@
+"""
+Idempotent ingest for retried gateway POSTs.
+
+A retried message is recognised by its client-supplied message id or, failing
+that, by ``(device_id, ts)``. ``RecentKeys`` remembers the most recent keys in
+memory so that a retry is rejected before it reaches the write queue, SSE
+fan-out or an IPFS upload. Keys that have aged out of the filter, or that
+arrive after a restart, are caught by unique indexes on the tables.
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+MESSAGE_ID_HEADER = 'Idempotency-Key'
+MAX_MESSAGE_ID = 64
+
+
+def message_id(data: Optional[dict] = None, header: Optional[str] = None) -> Optional[str]:
+    """Client message id from the request header or a message_id/msg_id field; None if absent"""
+    value = header
+    if not value and data:
+        value = data.get('message_id') or data.get('msg_id')
+    if value in (None, ''):
+        return None
+    value = str(value).strip()
+    if len(value) > MAX_MESSAGE_ID:
+        raise ValueError(f'message_id must be at most {MAX_MESSAGE_ID} characters')
+    return value or None
+
+
+def telemetry_key(row: dict) -> tuple:
+    if row.get('message_id'):
+        return ('msg', row['device_id'], row['message_id'])
+    return ('ts', row['device_id'], row['ts'])
+
+
+def unique_rows(rows: List[dict]) -> List[dict]:
+    """First row per (device_id, ts) and per (device_id, message_id); the unique indexes reject the rest"""
+    seen_ts, seen_msg, out = set(), set(), []
+    for row in rows:
+        ts_key = (row['device_id'], row['ts'])
+        msg_key = (row['device_id'], row['message_id']) if row.get('message_id') else None
+        if ts_key in seen_ts or msg_key in seen_msg:
+            continue
+        seen_ts.add(ts_key)
+        if msg_key is not None:
+            seen_msg.add(msg_key)
+        out.append(row)
+    return out
+
+
+class RecentKeys:
+    """Bounded, thread-safe map of recently seen idempotency keys (oldest evicted first).
+
+    Each key may carry the outcome of the original request (e.g. an IPFS hash)
+    so a retry can be answered with the same result.
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.duplicates = 0
+        self.evicted = 0
+        # Duplicates that got past the filter and were dropped by the unique index
+        self.late_duplicates = 0
+
+    def add(self, key: Hashable) -> bool:
+        """Remember key; False if it was already seen (the message is a duplicate)"""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.duplicates += 1
+                return False
+            self._keys[key] = None
+            self.accepted += 1
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+                self.evicted += 1
+            return True
+
+    def remember(self, key: Hashable, result):
+        """Attach the original request's outcome to a key that is still held"""
+        with self._lock:
+            if key in self._keys:
+                self._keys[key] = result
+
+    def result(self, key: Hashable):
+        with self._lock:
+            return self._keys.get(key)
+
+    def discard(self, key: Hashable):
+        """Forget key, e.g. when the message was not actually ingested and a retry must go through"""
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def record_late(self, count: int):
+        with self._lock:
+            self.late_duplicates += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._keys),
+                'capacity': self.capacity,
+                'accepted': self.accepted,
+                'duplicates': self.duplicates,
+                'late_duplicates': self.late_duplicates,
+                'evicted': self.evicted,
+            }
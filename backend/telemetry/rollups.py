@@ -0,0 +1,265 @@
+"""
+Incremental per-device telemetry rollups.
+
+Every batch the telemetry writer commits is folded into per-minute and
+per-hour buckets (point count, last position, distance travelled and
+min/max/mean speed and altitude) and merged into ``telemetry_rollup`` with
+an upsert in the same transaction, so summaries never need a rescan of raw
+points. Distance is accumulated between consecutive fixes of a device in
+timestamp order; fixes older than the newest one already seen (offline
+replays) still count towards the other aggregates but add no distance.
+
+The newest fix per device is kept in memory as the baseline for the next
+batch. A device first seen since the process started takes its baseline from
+its newest stored minute bucket, so the hop across a restart is not lost.
+"""
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, select
+
+# (name, bucket width in seconds), finest first
+RESOLUTIONS: Tuple[Tuple[str, int], ...] = (('1m', 60), ('1h', 3600))
+RAW = 'raw'
+
+_EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bucket_start(ts: datetime, width: int) -> datetime:
+    if width == 60:
+        return ts.replace(second=0, microsecond=0)
+    if width == 3600:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    epoch = int((ts - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % width)
+
+
+def _new_bucket(device_id, resolution, start, ts, lat, lon):
+    return {
+        'device_id': device_id,
+        'resolution': resolution,
+        'bucket_start': start,
+        'point_count': 0,
+        'first_ts': ts,
+        'last_ts': ts,
+        'last_lat': lat,
+        'last_lon': lon,
+        'distance_m': 0.0,
+        'speed_min': None, 'speed_max': None, 'speed_sum': 0.0, 'speed_count': 0,
+        'alt_min': None, 'alt_max': None, 'alt_sum': 0.0, 'alt_count': 0,
+    }
+
+
+def _fold(bucket, row, distance):
+    ts = row['ts']
+    bucket['point_count'] += 1
+    if ts < bucket['first_ts']:
+        bucket['first_ts'] = ts
+    if ts >= bucket['last_ts']:
+        bucket['last_ts'] = ts
+        bucket['last_lat'] = row['lat']
+        bucket['last_lon'] = row['lon']
+    bucket['distance_m'] += distance
+    for value, prefix in ((row.get('speed'), 'speed'), (row.get('altitude'), 'alt')):
+        if value is None:
+            continue
+        lo, hi = bucket[prefix + '_min'], bucket[prefix + '_max']
+        bucket[prefix + '_min'] = value if lo is None or value < lo else lo
+        bucket[prefix + '_max'] = value if hi is None or value > hi else hi
+        bucket[prefix + '_sum'] += value
+        bucket[prefix + '_count'] += 1
+
+
+class RollupEngine:
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = resolutions
+        # device_id -> (ts, lat, lon) of the newest fix seen, for distance continuity across batches
+        self._last: Dict[str, Tuple[datetime, float, float]] = {}
+        # Devices whose stored baseline has been looked up (found or not) by this process
+        self._seeded = set()
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def aggregate(self, rows: List[dict], staged: Optional[dict] = None) -> List[dict]:
+        """Fold a batch of telemetry rows into partial bucket aggregates.
+
+        The newest fix per device goes into ``staged``, not the engine: pass it to ``commit`` once the
+        aggregates are stored, so a failed write does not move the distance baseline past unstored points.
+        """
+        staged = {} if staged is None else staged
+        buckets: Dict[tuple, dict] = {}
+        with self._lock:
+            for row in sorted(rows, key=lambda r: (r['device_id'], r['ts'])):
+                device_id, ts, lat, lon = row['device_id'], row['ts'], row['lat'], row['lon']
+                distance = 0.0
+                prev = staged.get(device_id) or self._last.get(device_id)
+                if prev is None or ts > prev[0]:
+                    if prev is not None:
+                        distance = haversine_m(prev[1], prev[2], lat, lon)
+                    staged[device_id] = (ts, lat, lon)
+                for name, width in self.resolutions:
+                    start = bucket_start(ts, width)
+                    key = (device_id, name, start)
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        bucket = buckets[key] = _new_bucket(device_id, name, start, ts, lat, lon)
+                    _fold(bucket, row, distance)
+        return list(buckets.values())
+
+    def apply(self, conn, table, rows: List[dict]) -> dict:
+        """Merge a batch into the rollup table on an open transaction; returns the staged last fixes.
+
+        Call ``commit`` with the result after the transaction commits.
+        """
+        staged = {}
+        self._seed(conn, table, {row['device_id'] for row in rows})
+        buckets = self.aggregate(rows, staged)
+        if buckets:
+            conn.execute(self._upsert(table, conn.dialect.name), buckets)
+        return staged
+
+    def _seed(self, conn, table, device_ids):
+        """Take the baseline of devices not seen since start from their newest stored finest bucket"""
+        with self._lock:
+            missing = [d for d in device_ids if d not in self._last and d not in self._seeded]
+        if not missing:
+            return
+        finest = self.resolutions[0][0]
+        c = table.c
+        newest = (select(c.device_id, func.max(c.bucket_start).label('bucket_start'))
+                  .where(c.resolution == finest, c.device_id.in_(missing))
+                  .group_by(c.device_id).subquery())
+        stored = conn.execute(
+            select(c.device_id, c.last_ts, c.last_lat, c.last_lon)
+            .select_from(table.join(newest, and_(c.device_id == newest.c.device_id,
+                                                 c.bucket_start == newest.c.bucket_start)))
+            .where(c.resolution == finest)
+        ).all()
+        with self._lock:
+            self._seeded.update(missing)
+            for device_id, ts, lat, lon in stored:
+                # A batch committed meanwhile by this process has the newer fix
+                self._last.setdefault(device_id, (ts, lat, lon))
+
+    def commit(self, staged: dict):
+        """Make the last fixes of a stored batch the baseline for the next one"""
+        with self._lock:
+            for device_id, fix in staged.items():
+                prev = self._last.get(device_id)
+                if prev is None or fix[0] > prev[0]:
+                    self._last[device_id] = fix
+
+    def _upsert(self, table, dialect_name):
+        stmt = self._statements.get(dialect_name)
+        if stmt is not None:
+            return stmt
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            least, greatest = func.least, func.greatest
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            # SQLite's multi-argument min()/max() are scalar
+            least, greatest = func.min, func.max
+        stmt = insert(table)
+        c, ex = table.c, stmt.excluded
+        newer = ex.last_ts >= c.last_ts
+
+        def merged_min(col):
+            return least(func.coalesce(c[col], ex[col]), func.coalesce(ex[col], c[col]))
+
+        def merged_max(col):
+            return greatest(func.coalesce(c[col], ex[col]), func.coalesce(ex[col], c[col]))
+
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['device_id', 'resolution', 'bucket_start'],
+            set_={
+                'point_count': c.point_count + ex.point_count,
+                'first_ts': least(c.first_ts, ex.first_ts),
+                'last_ts': greatest(c.last_ts, ex.last_ts),
+                'last_lat': case((newer, ex.last_lat), else_=c.last_lat),
+                'last_lon': case((newer, ex.last_lon), else_=c.last_lon),
+                'distance_m': c.distance_m + ex.distance_m,
+                'speed_min': merged_min('speed_min'),
+                'speed_max': merged_max('speed_max'),
+                'speed_sum': c.speed_sum + ex.speed_sum,
+                'speed_count': c.speed_count + ex.speed_count,
+                'alt_min': merged_min('alt_min'),
+                'alt_max': merged_max('alt_max'),
+                'alt_sum': c.alt_sum + ex.alt_sum,
+                'alt_count': c.alt_count + ex.alt_count,
+            },
+        )
+        self._statements[dialect_name] = stmt
+        return stmt
+
+
+def choose_resolution(since: datetime, until: datetime, max_points: int,
+                      raw_count: Optional[int] = None, resolutions=RESOLUTIONS) -> Tuple[str, int]:
+    """Pick the most detailed level whose point count fits the budget.
+
+    Returns ``(name, width_seconds)``; ``raw`` (width 0) when the raw point count
+    is known and fits, otherwise the finest rollup whose bucket count over the
+    range fits, falling back to the coarsest rollup (to be downsampled further).
+    """
+    if raw_count is not None and raw_count <= max_points:
+        return RAW, 0
+    span = max((until - since).total_seconds(), 1.0)
+    for name, width in resolutions:
+        if math.ceil(span / width) <= max_points:
+            return name, width
+    return resolutions[-1]
+
+
+def merge_buckets(buckets: List[dict]) -> dict:
+    """Combine consecutive bucket dicts (ordered by bucket_start) into one"""
+    first = buckets[0]
+    merged = dict(first)
+    for b in buckets[1:]:
+        merged['point_count'] += b['point_count']
+        merged['first_ts'] = min(merged['first_ts'], b['first_ts'])
+        if b['last_ts'] >= merged['last_ts']:
+            merged['last_ts'], merged['last_lat'], merged['last_lon'] = b['last_ts'], b['last_lat'], b['last_lon']
+        merged['distance_m'] += b['distance_m']
+        for prefix in ('speed', 'alt'):
+            for suffix, pick in (('_min', min), ('_max', max)):
+                values = [v for v in (merged[prefix + suffix], b[prefix + suffix]) if v is not None]
+                merged[prefix + suffix] = pick(values) if values else None
+            merged[prefix + '_sum'] += b[prefix + '_sum']
+            merged[prefix + '_count'] += b[prefix + '_count']
+    return merged
+
+
+def downsample(buckets: List[dict], max_points: int) -> List[dict]:
+    """Merge runs of adjacent buckets so at most max_points remain"""
+    if len(buckets) <= max_points:
+        return buckets
+    group = math.ceil(len(buckets) / max_points)
+    return [merge_buckets(buckets[i:i + group]) for i in range(0, len(buckets), group)]
+
+
+def summarize(bucket: dict) -> dict:
+    """Public JSON shape of a bucket, with means derived from sums"""
+    def mean(prefix):
+        n = bucket[prefix + '_count']
+        return bucket[prefix + '_sum'] / n if n else None
+
+    return {
+        'bucket_start': bucket['bucket_start'].isoformat(),
+        'points': bucket['point_count'],
+        'first_ts': bucket['first_ts'].isoformat(),
+        'last_ts': bucket['last_ts'].isoformat(),
+        'last_position': {'lat': bucket['last_lat'], 'lon': bucket['last_lon']},
+        'distance_m': round(bucket['distance_m'], 2),
+        'speed': {'min': bucket['speed_min'], 'max': bucket['speed_max'], 'mean': mean('speed')},
+        'altitude': {'min': bucket['alt_min'], 'max': bucket['alt_max'], 'mean': mean('alt')},
+    }
@@ -0,0 +1,230 @@
+"""
+Write-behind persistence for IoT telemetry.
+
+Request threads hand normalised points to a bounded in-memory queue and return
+immediately; a single background writer drains the queue and group-commits
+batches every ``flush_interval_ms`` or ``flush_rows`` points, whichever comes
+first. The actual INSERT is injected as ``write_batch(rows)`` so the writer
+can be driven by SQLAlchemy in the app and by plain sqlite3 in benchmarks.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from queue import Queue, Empty, Full
+from typing import Callable, Iterable, List, Optional
+
+from telemetry.dedup import message_id
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def parse_ts(value) -> datetime:
+    """Parse an ISO-8601 string or epoch seconds/milliseconds into a naive UTC datetime"""
+    if value is None or value == '':
+        return datetime.utcnow()
+    if isinstance(value, (int, float)):
+        try:
+            seconds = value / 1000.0 if value > 1e11 else float(value)
+            return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+        except (OverflowError, OSError):
+            # Past year 9999, before 1970 on some platforms, or inf
+            raise ValueError(f'timestamp out of range: {str(value)[:32]}')
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _optional_float(data: dict, key: str):
+    value = data.get(key)
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def normalize_point(data: dict) -> dict:
+    """Validate a raw telemetry payload and return a row for the telemetry table; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('telemetry point must be an object')
+    device_id = data.get('device_id')
+    if not device_id:
+        raise ValueError('device_id is required')
+    try:
+        lat = float(data['lat'])
+        lon = float(data['lon'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('lat and lon must be numbers')
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        raise ValueError('lat/lon out of range')
+    project_id = data.get('project_id')
+    try:
+        return {
+            'device_id': str(device_id)[:64],
+            'project_id': int(project_id) if project_id not in (None, '') else None,
+            'lat': lat,
+            'lon': lon,
+            'altitude': _optional_float(data, 'altitude'),
+            'speed': _optional_float(data, 'speed'),
+            'ts': parse_ts(data.get('ts')),
+            'message_id': message_id(data),
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'invalid telemetry field: {e}')
+
+
+class TelemetryWriter:
+    def __init__(self, write_batch: Callable[[List[dict]], None], flush_rows: int = 500,
+                 flush_interval_ms: int = 200, max_queue: int = 50000,
+                 on_failed: Optional[Callable[[List[dict]], None]] = None):
+        self._write_batch = write_batch
+        # Called with a batch that could not be stored, e.g. to let the gateway's retry through
+        self.on_failed = on_failed
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        # Condition used by flush() to wait until the writer has caught up
+        self._progress = threading.Condition()
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, row: dict) -> bool:
+        """Queue one normalised row without blocking; False when the ingest queue is full"""
+        try:
+            self._queue.put_nowait(row)
+        except Full:
+            with self._count_lock:
+                self.rejected += 1
+            return False
+        with self._count_lock:
+            self.accepted += 1
+        return True
+
+    def submit_many(self, rows: Iterable[dict]) -> int:
+        """Queue rows until the queue fills; returns how many were accepted"""
+        count = 0
+        for row in rows:
+            if not self.submit(row):
+                break
+            count += 1
+        return count
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row accepted so far has been written (or failed)"""
+        target = self.accepted
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._progress:
+            while self.written + self.failed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._progress.wait(remaining if remaining is not None else 0.5)
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Flush outstanding rows and stop the writer thread (registered for interpreter shutdown)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except Full:
+            logger.warning("Telemetry queue full at shutdown; %d rows may be lost", self._queue.qsize())
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'accepted': self.accepted,
+            'rejected_queue_full': self.rejected,
+            'written': self.written,
+            'failed': self.failed,
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'last_batch_ms': round(self.last_batch_ms, 3),
+            'flush_rows': self.flush_rows,
+            'flush_interval_ms': int(self.flush_interval * 1000),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=1.0)
+            except Empty:
+                continue
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+        # Drain anything still queued behind the stop marker
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        for i in range(0, len(leftover), self.flush_rows):
+            self._commit(leftover[i:i + self.flush_rows])
+
+    def _commit(self, batch: List[dict]):
+        t0 = time.perf_counter()
+        try:
+            self._write_batch(batch)
+            ok = True
+        except Exception as first_error:
+            # One retry covers transient "database is locked" errors
+            logger.warning("Telemetry batch write failed, retrying: %s", first_error)
+            try:
+                self._write_batch(batch)
+                ok = True
+            except Exception as e:
+                logger.error("Dropping %d telemetry rows after failed write: %s", len(batch), e)
+                ok = False
+                if self.on_failed is not None:
+                    try:
+                        self.on_failed(batch)
+                    except Exception:
+                        logger.exception('on_failed failed for %d telemetry rows', len(batch))
+        self.last_batch_ms = (time.perf_counter() - t0) * 1000
+        with self._progress:
+            if ok:
+                self.written += len(batch)
+                self.batches += 1
+            else:
+                self.failed += len(batch)
+            self._progress.notify_all()
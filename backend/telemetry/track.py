@@ -0,0 +1,145 @@
+"""
+Map-ready device tracks.
+
+Raw fixes are projected to local metres and simplified with Ramer-Douglas-
+Peucker. The tolerance follows the map zoom level: a vertex is dropped if
+moving it would shift the line by less than about one screen pixel. The
+per-segment distance pass is vectorised with NumPy, so one pass over 100k
+fixes is a few array operations rather than a Python loop.
+
+Simplified tracks are cached per (device, window, tolerance). The telemetry
+writer invalidates a device's entries when it commits new fixes for it, and
+a short TTL bounds staleness for rolling "last N hours" windows.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+import numpy as np
+
+_EARTH_RADIUS_M = 6371008.8
+# Web Mercator ground resolution at the equator, zoom 0, 256 px tiles
+_METRES_PER_PIXEL_Z0 = 156543.03392
+
+
+def tolerance_for_zoom(zoom: float, lat: float = 0.0, pixels: float = 1.0) -> float:
+    """Ground distance in metres covered by `pixels` screen pixels at a Web Mercator zoom level"""
+    return pixels * _METRES_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def project(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Equirectangular projection to metres around the track's mean latitude; returns an (n, 2) array"""
+    lon = np.degrees(np.unwrap(np.radians(lon)))  # keep tracks crossing the antimeridian continuous
+    cos_lat = math.cos(math.radians(float(lat.mean()))) if len(lat) else 1.0
+    x = np.radians(lon) * _EARTH_RADIUS_M * cos_lat
+    y = np.radians(lat) * _EARTH_RADIUS_M
+    return np.column_stack((x, y))
+
+
+def _segment_distances(xy: np.ndarray, start: int, end: int) -> np.ndarray:
+    """Distances of xy[start+1:end] to the segment xy[start]-xy[end]"""
+    p = xy[start + 1:end]
+    a, b = xy[start], xy[end]
+    ab = b - a
+    denom = float(ab @ ab)
+    if denom == 0.0:
+        return np.hypot(p[:, 0] - a[0], p[:, 1] - a[1])
+    t = np.clip(((p - a) @ ab) / denom, 0.0, 1.0)
+    nearest = a + t[:, None] * ab
+    return np.hypot(p[:, 0] - nearest[:, 0], p[:, 1] - nearest[:, 1])
+
+
+def rdp_mask(xy: np.ndarray, tolerance: float) -> np.ndarray:
+    """Boolean mask of vertices kept by Ramer-Douglas-Peucker at `tolerance` (same units as xy)"""
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    # Explicit stack instead of recursion: long noisy tracks would overflow Python's call stack
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dist = _segment_distances(xy, start, end)
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify(points: list, tolerance_m: float) -> list:
+    """Simplify (lat, lon, ts) tuples in time order; returns the kept tuples"""
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+    coords = np.array([(p[0], p[1]) for p in points], dtype=float)
+    mask = rdp_mask(project(coords[:, 0], coords[:, 1]), tolerance_m)
+    return [points[i] for i in np.flatnonzero(mask)]
+
+
+class TrackCache:
+    """Small LRU of simplified tracks with a TTL and per-device invalidation"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, value); key[0] is the device id
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_devices(self, device_ids: Iterable[str]):
+        devices = set(device_ids)
+        with self._lock:
+            stale = [k for k in self._entries if k[0] in devices]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+
+def parse_zoom(value: Optional[str]) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    zoom = float(value)
+    if not 0 <= zoom <= 24:
+        raise ValueError('zoom must be between 0 and 24')
+    return zoom
@@ -0,0 +1,105 @@
+"""
+Compact binary telemetry records for constrained gateways.
+
+Each GPS fix is a fixed 44-byte little-endian record; a request body is any
+number of records back to back, sent with ``Content-Type: CONTENT_TYPE``.
+
+    offset  size  field
+    0       16    device_id   ASCII, NUL padded
+    16      4     project_id  uint32, 0 = none
+    20      4     lat         int32, degrees * 1e7
+    24      4     lon         int32, degrees * 1e7
+    28      4     altitude    float32 metres, NaN = none
+    32      4     speed       float32 m/s, NaN = none
+    36      8     ts          int64 epoch milliseconds, 0 = server receive time
+
+The same fix encoded as JSON is roughly 150 bytes. Records with ts = 0 get the
+receive time, stepped by one microsecond per record of the same device so a
+body holding several of them does not collide on the (device_id, ts) key.
+"""
+import math
+import struct
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+CONTENT_TYPE = 'application/vnd.bluecarbon.telemetry.v1'
+RECORD = struct.Struct('<16sIiiffq')
+RECORD_SIZE = RECORD.size
+
+_EPOCH = datetime(1970, 1, 1)
+# ts_ms values datetime can represent (years 1-9999)
+_TS_MIN_MS = (datetime.min - _EPOCH) // timedelta(milliseconds=1)
+_TS_MAX_MS = (datetime.max - _EPOCH) // timedelta(milliseconds=1)
+_SCALE = 1e7
+_NAN = float('nan')
+
+
+def encode_points(points: Iterable[dict]) -> bytes:
+    """Pack telemetry dicts ({device_id, project_id, lat, lon, altitude, speed, ts_ms}) into records"""
+    out = bytearray()
+    for p in points:
+        altitude = p.get('altitude')
+        speed = p.get('speed')
+        out += RECORD.pack(
+            str(p['device_id']).encode('ascii')[:16],
+            int(p.get('project_id') or 0),
+            int(round(float(p['lat']) * _SCALE)),
+            int(round(float(p['lon']) * _SCALE)),
+            _NAN if altitude is None else float(altitude),
+            _NAN if speed is None else float(speed),
+            int(p.get('ts_ms') or 0),
+        )
+    return bytes(out)
+
+
+def decode_points(body) -> Tuple[List[dict], List[int], List[dict]]:
+    """Decode a record stream into telemetry rows without copying the body.
+
+    Returns ``(rows, indices, errors)`` where ``indices`` holds each row's record
+    position so callers can report partial acceptance. Raises ValueError if the
+    body is not a whole number of records.
+    """
+    view = memoryview(body)
+    if len(view) % RECORD_SIZE:
+        raise ValueError(f'binary telemetry body must be a multiple of {RECORD_SIZE} bytes')
+    rows, indices, errors = [], [], []
+    now = None
+    # Records per device that fell back to the receive time
+    untimed = {}
+    for index, (raw_id, project_id, lat_e7, lon_e7, altitude, speed, ts_ms) in enumerate(RECORD.iter_unpack(view)):
+        device_id = raw_id.rstrip(b'\0')
+        lat = lat_e7 / _SCALE
+        lon = lon_e7 / _SCALE
+        if not device_id:
+            errors.append({'index': index, 'error': 'device_id is required'})
+            continue
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            errors.append({'index': index, 'error': 'lat/lon out of range'})
+            continue
+        try:
+            device_id = device_id.decode('ascii')
+        except UnicodeDecodeError:
+            errors.append({'index': index, 'error': 'device_id must be ASCII'})
+            continue
+        if ts_ms:
+            if not _TS_MIN_MS <= ts_ms <= _TS_MAX_MS:
+                errors.append({'index': index, 'error': 'ts out of range'})
+                continue
+            ts = _EPOCH + timedelta(milliseconds=ts_ms)
+        else:
+            now = now or datetime.utcnow()
+            step = untimed.get(device_id, 0)
+            untimed[device_id] = step + 1
+            ts = now + timedelta(microseconds=step)
+        rows.append({
+            'device_id': device_id,
+            'project_id': project_id or None,
+            'lat': lat,
+            'lon': lon,
+            'altitude': None if math.isnan(altitude) else altitude,
+            'speed': None if math.isnan(speed) else speed,
+            'ts': ts,
+            'message_id': None,
+        })
+        indices.append(index)
+    return rows, indices, errors
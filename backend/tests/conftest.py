@@ -0,0 +1,72 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+@pytest.fixture(scope='session')
+def main_module(tmp_path_factory):
+    """app/main.py imported once against a throwaway database and data directory"""
+    data_dir = tmp_path_factory.mktemp('data')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{data_dir / 'app.db'}",
+        'DATA_DIR': str(data_dir),
+        'UPLOAD_FOLDER': str(data_dir / 'uploads'),
+        'IPFS_BACKEND': 'local',
+        # Tests drive the queue, batcher and outbox themselves
+        'BACKGROUND_WORKERS': '0',
+        'JWT_SECRET_KEY': 'test-secret-key-that-is-long-enough-for-hs256',
+    })
+    sys.path.insert(0, APP_DIR)
+    import main
+    with main.app.app_context():
+        main.db.create_all()
+        main.ensure_added_columns()
+        main.ensure_ingest_indexes()
+        main.ensure_spatial_indexes()
+    return main
+
+
+@pytest.fixture
+def client(main_module):
+    return main_module.app.test_client()
+
+
+@pytest.fixture
+def make_user(main_module):
+    """Create a user; returns (user id, Authorization header)"""
+    from flask_jwt_extended import create_access_token
+    from models.database_models import ParticipantType
+
+    def make(participant_type=ParticipantType.PROJECT_DEVELOPER, **fields):
+        name = fields.pop('username', None) or f'user-{uuid.uuid4().hex[:8]}'
+        with main_module.app.app_context():
+            user = main_module.User(username=name, email=f'{name}@example.org', password_hash='x',
+                                    participant_type=participant_type, **fields)
+            main_module.db.session.add(user)
+            main_module.db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            return user.id, {'Authorization': f'Bearer {token}'}
+
+    return make
+
+
+@pytest.fixture
+def make_project(main_module):
+    """Create a restoration project owned by created_by; returns its id"""
+    from models.database_models import EcosystemType
+
+    def make(created_by, latitude=21.9, longitude=89.1, **fields):
+        fields.setdefault('name', f'project-{uuid.uuid4().hex[:8]}')
+        with main_module.app.app_context():
+            project = main_module.RestorationProject(location='test site', area_hectares=10.0, latitude=latitude,
+                                                     longitude=longitude, ecosystem_type=EcosystemType.MANGROVE,
+                                                     created_by=created_by, **fields)
+            main_module.db.session.add(project)
+            main_module.db.session.commit()
+            return project.id
+
+    return make
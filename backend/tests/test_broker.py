@@ -0,0 +1,61 @@
+import json
+import uuid
+
+import pytest
+
+from realtime.broker import CONFLATE, DISCONNECT, DROP_NEWEST, DROP_OLDEST, SSEBroker
+
+
+def _events(sub):
+    events = []
+    while sub.qsize():
+        events.append(json.loads(sub.get_nowait().decode()[len('data: '):]))
+    return events
+
+
+def test_unknown_default_policy_fails_when_the_broker_is_built():
+    with pytest.raises(ValueError, match='drop_everything'):
+        SSEBroker(policy='drop_everything')
+
+
+@pytest.mark.parametrize('policy, expected', [(DROP_OLDEST, [2, 3, 4]), (DROP_NEWEST, [0, 1, 2])])
+def test_full_buffer_drops_by_policy(policy, expected):
+    broker = SSEBroker(maxsize=3, policy=policy)
+    sub = broker.subscribe()
+    for i in range(5):
+        broker.publish({'n': i})
+    assert [event['n'] for event in _events(sub)] == expected
+    assert sub.dropped == 2 and sub.delivered == 3
+
+
+def test_conflate_keeps_the_latest_event_per_key():
+    broker = SSEBroker(policy=CONFLATE)
+    sub = broker.subscribe()
+    broker.publish_many([{'device': 'a', 'n': 1}, {'device': 'b', 'n': 1}, {'device': 'a', 'n': 2}],
+                        keys=['a', 'b', 'a'])
+    assert _events(sub) == [{'device': 'a', 'n': 2}, {'device': 'b', 'n': 1}]
+    assert sub.conflated == 1
+
+
+def test_slow_subscriber_is_disconnected_after_max_drops():
+    broker = SSEBroker(maxsize=1, policy=DISCONNECT, max_drops=2)
+    sub = broker.subscribe()
+    for i in range(3):
+        broker.publish({'n': i})
+    assert sub.closed
+    assert broker.stats()['subscriber_count'] == 0
+    assert broker.stats()['totals']['slow_consumers_disconnected'] == 1
+
+
+@pytest.mark.parametrize('path', ['/admin/sse/stats', '/admin/telemetry/stats', '/admin/upload-jobs/stats'])
+def test_admin_stats_need_an_admin_account(main_module, client, make_user, monkeypatch, path):
+    admin_name = f'ops-{uuid.uuid4().hex[:8]}'
+    _, user = make_user()
+    _, admin = make_user(username=admin_name)
+    assert client.get(path).status_code == 401
+    # Closed by default: no ADMIN_USERNAMES, no admins
+    assert client.get(path, headers=admin).status_code == 403
+
+    monkeypatch.setitem(main_module.app.config, 'ADMIN_USERNAMES', {admin_name})
+    assert client.get(path, headers=user).status_code == 403
+    assert client.get(path, headers=admin).status_code == 200
@@ -0,0 +1,53 @@
+from models.database_models import CarbonCredit, ChainTransaction, EcosystemType, ParticipantType, RestorationProject
+
+from blockchain.outbox import PENDING, SqlTxStore, TransactionOutbox
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+def _credit(project_id, user_id):
+    return {'project_id': project_id, 'amount': 2.5, 'vintage_year': 2024, 'verification_standard': 'VCS',
+            'issued_to': user_id}
+
+
+def _project(main_module, owner_id):
+    with main_module.app.app_context():
+        project = RestorationProject(name='Mangrove block 7', location='Sundarbans', area_hectares=12.0,
+                                     ecosystem_type=list(EcosystemType)[0], created_by=owner_id)
+        main_module.db.session.add(project)
+        main_module.db.session.commit()
+        return project.id
+
+
+def test_issuing_needs_a_verifier(client, main_module, make_user):
+    developer, developer_auth = make_user()
+    project_id = _project(main_module, developer)
+    assert client.post('/carbon-credits', json=_credit(project_id, developer)).status_code == 401
+    assert client.post('/carbon-credits', json=_credit(project_id, developer),
+                       headers=developer_auth).status_code == 403
+
+
+def test_intent_commits_with_the_credit(client, main_module, make_user, monkeypatch):
+    owner, _ = make_user(wallet_address='0x' + '33' * 20)
+    _, verifier_auth = make_user(ParticipantType.VALIDATOR)
+    project_id = _project(main_module, owner)
+    outbox = TransactionOutbox(SqlTxStore(main_module.app, main_module.db, ChainTransaction),
+                               lambda: None, PRIVATE_KEY)
+    queued = []
+    monkeypatch.setattr(outbox, 'enqueue', queued.append)
+    monkeypatch.setattr(main_module, 'chain_outbox', outbox)
+
+    response = client.post('/carbon-credits', json=_credit(project_id, owner), headers=verifier_auth)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert queued == [body['chain_tx_id']]
+    with main_module.app.app_context():
+        credit = main_module.db.session.get(CarbonCredit, body['id'])
+        tx = main_module.db.session.get(ChainTransaction, body['chain_tx_id'])
+        assert credit.chain_status == 'pending'
+        assert tx.status == PENDING and tx.ref_id == credit.id and tx.function == 'issueCredit'
+
+    status = client.get(body['status_url'])
+    assert status.status_code == 401
+    status = client.get(body['status_url'], headers=verifier_auth)
+    assert status.status_code == 200 and 'raw_tx' not in status.get_json()
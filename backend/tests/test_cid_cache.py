@@ -0,0 +1,74 @@
+import hashlib
+import io
+import uuid
+
+import pytest
+
+from pinning import cid_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(cid_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_canonical_json_ignores_key_order_and_whitespace():
+    assert cid_cache.canonical_json({'b': 1, 'a': [1, 2]}) == cid_cache.canonical_json({'a': [1, 2], 'b': 1})
+    assert cid_cache.canonical_json({'name': 'Sundarbans'}) == b'{"name":"Sundarbans"}'
+
+
+def test_sha256_file_streams_in_chunks(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    data = bytes(range(256)) * 5000
+    path.write_bytes(data)
+    assert cid_cache.sha256_file(str(path), chunk_size=4096) == hashlib.sha256(data).hexdigest()
+
+
+def test_hits_misses_and_bytes_saved(tmp_path, clock):
+    cache = cid_cache.CidCache(str(tmp_path / 'cache' / 'cids.db'))
+    assert cache.get(cid_cache.FILE, 'abc') is None
+    cache.put(cid_cache.FILE, 'abc', 'QmFile', 1000)
+    assert cache.get(cid_cache.FILE, 'abc') == 'QmFile'
+    assert cache.get(cid_cache.FILE, 'abc') == 'QmFile'
+    # Kinds are separate namespaces for the same hash
+    assert cache.get(cid_cache.JSON, 'abc') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['bytes_saved'], stats['bytes_uploaded']) == (2, 2, 2000, 1000)
+    assert stats['upload_bytes_reduction'] == pytest.approx(2000 / 3000, abs=1e-4)
+
+
+def test_entries_expire_and_survive_a_reopen(tmp_path, clock):
+    path = str(tmp_path / 'cids.db')
+    cache = cid_cache.CidCache(path, max_age=3600)
+    cache.put(cid_cache.JSON, 'h', 'QmOld', 10)
+    cache.get(cid_cache.JSON, 'h')
+    reopened = cid_cache.CidCache(path, max_age=3600)
+    assert reopened.get(cid_cache.JSON, 'h') == 'QmOld'
+    clock[0] += 3601
+    assert reopened.get(cid_cache.JSON, 'h') is None
+    assert reopened.stats()['expired'] == 1
+    # A re-pin refreshes the entry and keeps its lifetime hit count
+    reopened.put(cid_cache.JSON, 'h', 'QmNew', 10)
+    assert reopened.get(cid_cache.JSON, 'h') == 'QmNew'
+    assert reopened.stats()['lifetime_hits'] == 3
+
+
+def test_repeated_pins_skip_the_backend(main_module, monkeypatch):
+    calls = []
+    pin_json, pin_file = main_module.ipfs.pin_json, main_module.ipfs.pin_file
+    monkeypatch.setattr(main_module.ipfs, 'pin_json', lambda *a, **kw: calls.append('json') or pin_json(*a, **kw))
+    monkeypatch.setattr(main_module.ipfs, 'pin_file', lambda *a, **kw: calls.append('file') or pin_file(*a, **kw))
+
+    document = {'project': uuid.uuid4().hex, 'sites': [1, 2]}
+    first = main_module.upload_json_to_ipfs(document, 'meta.json')
+    second = main_module.upload_json_to_ipfs(dict(reversed(list(document.items()))), 'meta.json')
+    assert first['ok'] and second['cached'] and second['cid'] == first['cid']
+
+    content = uuid.uuid4().bytes * 100
+    sha256 = hashlib.sha256(content).hexdigest()
+    first = main_module.pin_file(io.BytesIO(content), 'a.bin', sha256=sha256)
+    second = main_module.pin_file(io.BytesIO(content), 'b.bin', sha256=sha256)
+    assert first['ok'] and second['cached'] and second['cid'] == first['cid']
+    assert calls == ['json', 'file']
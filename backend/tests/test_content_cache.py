@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pinning.content_cache import ContentCache, valid_cid
+from pinning.stream import PinError
+
+
+def _cid(n):
+    return f'bafkrei{n:052d}'
+
+
+class Gateway:
+    """In-memory content by CID that counts fetches and honours max_bytes like the real backends"""
+
+    def __init__(self, contents, delay=0.0):
+        self.contents = contents
+        self.delay = delay
+        self.fetches = []
+
+    def __call__(self, cid, path, max_bytes=None):
+        self.fetches.append(cid)
+        time.sleep(self.delay)
+        if cid not in self.contents:
+            raise PinError(f'{cid} not found', status=404)
+        data = self.contents[cid]
+        if max_bytes is not None and len(data) > max_bytes:
+            raise PinError('too big', status=413)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+def _read(cache, cid):
+    with cache.open(cid) as f:
+        return f.read()
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    gateway = Gateway({_cid(i): bytes([i]) * 400 for i in range(4)})
+    cache = ContentCache(str(tmp_path), gateway, max_bytes=1000)
+    for i in (0, 1):
+        _read(cache, _cid(i))
+    _read(cache, _cid(0))
+    _read(cache, _cid(2))
+    assert not os.path.exists(cache.path_for(_cid(1))) and os.path.exists(cache.path_for(_cid(0)))
+    assert _read(cache, _cid(0)) == bytes([0]) * 400
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions'], stats['hits'], stats['misses']) == (2, 800, 1, 2, 3)
+    assert gateway.fetches == [_cid(0), _cid(1), _cid(2)]
+
+
+def test_an_open_file_outlives_its_eviction(tmp_path):
+    gateway = Gateway({_cid(i): bytes([i]) * 600 for i in range(2)})
+    cache = ContentCache(str(tmp_path), gateway, max_bytes=1000)
+    f = cache.open(_cid(0))
+    _read(cache, _cid(1))
+    assert not os.path.exists(cache.path_for(_cid(0)))
+    with f:
+        assert f.read() == bytes([0]) * 600
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path):
+    gateway = Gateway({_cid(1): b'x' * 100}, delay=0.05)
+    cache = ContentCache(str(tmp_path), gateway)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_read(cache, _cid(1)))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [b'x' * 100] * 8 and gateway.fetches == [_cid(1)]
+
+
+def test_failed_and_oversized_fetches_leave_nothing_behind(tmp_path):
+    gateway = Gateway({_cid(1): b'x' * 2000})
+    cache = ContentCache(str(tmp_path), gateway, max_bytes=10_000, max_entry_bytes=1000)
+    with pytest.raises(PinError) as error:
+        cache.open(_cid(1))
+    assert error.value.status == 413
+    with pytest.raises(PinError):
+        cache.open(_cid(2))
+    with pytest.raises(ValueError):
+        cache.open('../../etc/passwd')
+    assert not valid_cid('Qm short') and valid_cid(_cid(1))
+    assert os.listdir(tmp_path / 'tmp') == [] and cache.stats()['fetch_errors'] == 2
+
+
+def test_restart_keeps_the_cache_warm_in_access_order(tmp_path):
+    gateway = Gateway({_cid(i): bytes([i]) * 400 for i in range(3)})
+    cache = ContentCache(str(tmp_path), gateway, max_bytes=1000)
+    for i in (0, 1):
+        _read(cache, _cid(i))
+    # Entry 1 was read long ago, entry 0 just now
+    os.utime(cache.path_for(_cid(1)), (1_000_000, 1_000_000))
+    (tmp_path / 'tmp' / 'interrupted').write_bytes(b'partial')
+    restarted = ContentCache(str(tmp_path), gateway, max_bytes=1000)
+    assert restarted.stats()['bytes'] == 800 and os.listdir(tmp_path / 'tmp') == []
+    _read(restarted, _cid(2))
+    assert not os.path.exists(restarted.path_for(_cid(1))) and os.path.exists(restarted.path_for(_cid(0)))
+    assert gateway.fetches == [_cid(0), _cid(1), _cid(2)]
+
+
+def test_ipfs_route_serves_ranges_and_etags(main_module, client, make_user, monkeypatch, tmp_path):
+    content = bytes(range(256)) * 8
+    gateway = Gateway({_cid(7): content})
+    monkeypatch.setattr(main_module, 'content_cache', ContentCache(str(tmp_path), gateway))
+    _, auth = make_user()
+    assert client.get(f'/ipfs/{_cid(7)}').status_code == 401
+    response = client.get(f'/ipfs/{_cid(7)}', headers=auth, query_string={'filename': 'site.jpg'})
+    assert response.status_code == 200 and response.data == content
+    assert response.mimetype == 'image/jpeg' and 'immutable' in response.headers['Cache-Control']
+    response = client.get(f'/ipfs/{_cid(7)}', headers=dict(auth, Range='bytes=100-199'))
+    assert response.status_code == 206 and response.data == content[100:200]
+    assert client.get(f'/ipfs/{_cid(7)}', headers=dict(auth, **{'If-None-Match': f'"{_cid(7)}"'})).status_code == 304
+    assert client.get(f'/ipfs/{_cid(8)}', headers=auth).status_code == 404
+    assert client.get('/ipfs/not-a-cid', headers=auth).status_code == 400
+    assert gateway.fetches == [_cid(7), _cid(8)]
@@ -0,0 +1,117 @@
+import copy
+import json
+import os
+
+import pytest
+from eth_abi import encode
+from eth_utils import keccak
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+from blockchain.connector import CARBON_CREDIT_ABI_PATH, BlockchainConnector
+from blockchain.contracts import ContractCache, abi_hash
+
+TWIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'carbon_credit_twin.vy')
+PROJECT = 'Sundarbans mangrove restoration, block 7'
+
+
+@pytest.fixture(scope='module')
+def abi():
+    with open(CARBON_CREDIT_ABI_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def chain(abi):
+    vyper = pytest.importorskip('vyper')
+    with open(TWIN) as f:
+        twin = vyper.compile_code(f.read(), output_formats=['abi', 'bytecode'])
+    web3 = Web3(EthereumTesterProvider())
+    sender = web3.eth.accounts[0]
+    deploy = web3.eth.contract(abi=twin['abi'], bytecode=twin['bytecode']).constructor().transact({'from': sender})
+    address = web3.eth.wait_for_transaction_receipt(deploy)['contractAddress']
+    return web3, address, sender
+
+
+@pytest.fixture
+def connector(chain, abi):
+    web3, address, _ = chain
+    connector = BlockchainConnector.__new__(BlockchainConnector)
+    connector.web3, connector.contracts, connector._chain_id = web3, ContractCache(web3), None
+    connector.carbon_credit_abi, connector.carbon_credit_address = abi, address
+    return connector
+
+
+def test_one_handle_per_address_and_abi(chain, abi):
+    web3, address, _ = chain
+    cache = ContractCache(web3)
+    handle = cache.get(address, abi)
+    assert cache.get(address.lower(), abi) is handle
+    assert cache.get(address, json.dumps(abi)) is handle
+    assert cache.get(address, copy.deepcopy(abi)) is handle
+    assert cache.get(address, abi[:3]) is not handle
+    assert cache.stats() == {'contracts': 2, 'hits': 3, 'misses': 2}
+    assert abi_hash(abi) == abi_hash(json.dumps(list(abi), indent=2))
+
+
+def test_memoised_encoding_matches_web3(chain, abi):
+    web3, address, _ = chain
+    handle = ContractCache(web3).get(address, abi)
+    owners = [web3.eth.accounts[1], web3.eth.accounts[2]]
+    for name, args in (('issueCredits', (owners, [5, 7], PROJECT)), ('issueCredit', (owners[0], 3, PROJECT)),
+                       ('getCredit', (0,)), ('nextId', ())):
+        expected = handle.contract.functions[name](*args)._encode_transaction_data()
+        assert Web3.to_hex(handle.function(name).encode(args)) == expected
+    with pytest.raises(AttributeError):
+        handle.function('burn')
+
+
+def test_calls_and_transactions_round_trip_through_the_fast_path(connector, chain, abi):
+    web3, address, sender = chain
+    owner = web3.eth.accounts[3]
+    tx = connector._build_contract_tx(address, abi, 'issueCredit', sender, web3.eth.get_transaction_count(sender),
+                                      (owner, 42, PROJECT))
+    tx.pop('nonce')
+    web3.eth.wait_for_transaction_receipt(web3.eth.send_transaction(tx))
+    credit_id = connector.call_smart_contract(address, abi, 'nextId') - 1
+    fast = connector.call_smart_contract(address, abi, 'getCredit', credit_id)
+    slow = connector.contracts.get(address, abi).contract.functions.getCredit(credit_id).call()
+    assert fast == list(slow) and fast[:3] == [owner, 42, PROJECT]
+
+
+def test_receipt_events_decode_like_web3(chain, abi):
+    web3, address, sender = chain
+    handle = ContractCache(web3).get(address, abi)
+    owners = [web3.eth.accounts[4], web3.eth.accounts[5]]
+    receipt = web3.eth.wait_for_transaction_receipt(
+        handle.contract.functions.issueCredits(owners, [1, 2], PROJECT).transact({'from': sender}))
+    events = handle.decode_events(receipt)
+    expected = handle.contract.events.CreditIssued().process_receipt(receipt)
+    assert [e['event'] for e in events] == ['CreditIssued', 'CreditIssued']
+    assert [e['args'] for e in events] == [dict(e['args']) for e in expected]
+    assert [e['log_index'] for e in events] == [e['logIndex'] for e in expected]
+    # Logs from other contracts in the same receipt are ignored
+    foreign = dict(receipt, logs=[dict(log, address=sender) for log in receipt['logs']])
+    assert handle.decode_events(foreign) == []
+
+
+def test_overloads_structs_and_indexed_events(chain):
+    web3, address, _ = chain
+    owner = web3.eth.accounts[1]
+    abi = [
+        {'type': 'function', 'name': 'mint', 'inputs': [{'name': 'a', 'type': 'uint256'}], 'outputs': []},
+        {'type': 'function', 'name': 'mint', 'inputs': [{'name': 'a', 'type': 'address'}], 'outputs': []},
+        {'type': 'function', 'name': 'save', 'inputs': [{'name': 's', 'type': 'tuple', 'components': [
+            {'name': 'x', 'type': 'uint256'}]}], 'outputs': []},
+        {'type': 'function', 'name': 'holders', 'inputs': [], 'outputs': [{'name': '', 'type': 'address[]'}]},
+        {'type': 'event', 'name': 'Tagged', 'anonymous': False, 'inputs': [
+            {'name': 'owner', 'type': 'address', 'indexed': True},
+            {'name': 'label', 'type': 'string', 'indexed': True},
+            {'name': 'amount', 'type': 'uint256', 'indexed': False}]},
+    ]
+    handle = ContractCache(web3).get(address, abi)
+    assert handle.function('mint') is None and handle.function('save') is None and handle.function('holders') is None
+    log = {'address': address.lower(), 'logIndex': 0, 'data': encode(['uint256'], [9]),
+           'topics': [keccak(text='Tagged(address,string,uint256)'), encode(['address'], [owner]), keccak(text='x')]}
+    [event] = handle.decode_events({'logs': [log]})
+    assert event['args'] == {'owner': owner, 'label': keccak(text='x'), 'amount': 9}
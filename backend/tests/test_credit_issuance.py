@@ -0,0 +1,92 @@
+import json
+import os
+import re
+
+import pytest
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+from blockchain.connector import CARBON_CREDIT_ABI_PATH, BlockchainConnector
+from blockchain.contracts import ContractCache
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(BACKEND_DIR, 'blockchain', 'CarbonCredit.sol')
+TWIN = os.path.join(BACKEND_DIR, 'benchmarks', 'carbon_credit_twin.vy')
+PROJECT = 'Sundarbans mangrove restoration, block 7'
+
+
+def _signatures(abi):
+    return {(entry['type'], f"{entry['name']}({','.join(arg['type'] for arg in entry['inputs'])})")
+            for entry in abi if entry['type'] in ('function', 'event')}
+
+
+def _source_signatures():
+    with open(SOURCE) as f:
+        source = f.read()
+    found = set()
+    for kind, name, params in re.findall(r'\b(function|event)\s+(\w+)\s*\(([^)]*)\)', source):
+        types = [param.split()[0] for param in params.split(',') if param.strip()]
+        found.add((kind, f"{name}({','.join(types)})"))
+    # Getters solc generates for public state variables
+    for key, name in re.findall(r'mapping\((\w+)\s*=>\s*\w+\)\s+public\s+(\w+)', source):
+        found.add(('function', f'{name}({key})'))
+    for name in re.findall(r'^\s*uint256\s+public\s+(\w+)\s*;', source, re.M):
+        found.add(('function', f'{name}()'))
+    return found
+
+
+@pytest.fixture(scope='module')
+def abi():
+    with open(CARBON_CREDIT_ABI_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def twin():
+    vyper = pytest.importorskip('vyper')
+    with open(TWIN) as f:
+        return vyper.compile_code(f.read(), output_formats=['abi', 'bytecode'])
+
+
+@pytest.fixture
+def deployed(twin, abi):
+    web3 = Web3(EthereumTesterProvider())
+    sender = web3.eth.accounts[0]
+    deploy = web3.eth.contract(abi=twin['abi'], bytecode=twin['bytecode']).constructor().transact({'from': sender})
+    address = web3.eth.wait_for_transaction_receipt(deploy)['contractAddress']
+    connector = BlockchainConnector.__new__(BlockchainConnector)
+    connector.web3, connector.contracts = web3, ContractCache(web3)
+    connector.carbon_credit_abi, connector.carbon_credit_address = abi, address
+    return connector, sender
+
+
+def test_abi_covers_every_function_and_event_in_the_source(abi):
+    assert _signatures(abi) == _source_signatures()
+
+
+def test_twin_compiles_to_the_same_interface(abi, twin):
+    assert _signatures(twin['abi']) == _signatures(abi)
+
+
+def test_planned_chunks_fit_their_gas(deployed):
+    connector, sender = deployed
+    owners = [Web3.to_checksum_address(f'0x{i + 1:040x}') for i in range(120)]
+    amounts = list(range(1, 121))
+    plan = connector.plan_credit_batches(sender, owners, amounts, PROJECT)
+    assert plan[0][0] == 0 and plan[-1][1] == len(owners)
+    assert all(prev[1] == nxt[0] for prev, nxt in zip(plan, plan[1:]))
+    contract = connector.web3.eth.contract(address=connector.carbon_credit_address, abi=connector.carbon_credit_abi)
+    for start, end, gas in plan:
+        assert gas <= 9_000_000
+        tx_hash = contract.functions.issueCredits(owners[start:end], amounts[start:end], PROJECT).transact(
+            {'from': sender, 'gas': gas})
+        receipt = connector.web3.eth.wait_for_transaction_receipt(tx_hash)
+        assert receipt['status'] == 1 and receipt['gasUsed'] <= gas
+    assert contract.functions.nextId().call() == len(owners)
+    assert contract.functions.getCredit(119).call()[:3] == [owners[119], 120, PROJECT]
+
+
+def test_plan_rejects_a_budget_below_one_credit(deployed):
+    connector, sender = deployed
+    with pytest.raises(ValueError):
+        connector.plan_credit_batches(sender, [sender], [1], PROJECT, max_gas=100_000)
@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+from telemetry.dedup import unique_rows
+from telemetry.store import TelemetryWriter
+
+
+def _row(device_id, ts, message_id=None):
+    return {'device_id': device_id, 'ts': ts, 'message_id': message_id}
+
+
+def test_unique_rows_keeps_first_per_ts_and_message_id():
+    t0, t1, t2 = datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 0, 0, 1), datetime(2024, 1, 1, 0, 0, 2)
+    rows = [
+        _row('a', t0, 'm1'),
+        _row('a', t0, 'm2'),  # same ts as the first
+        _row('a', t1, 'm1'),  # same message id as the first
+        _row('b', t0, 'm1'),  # other device
+        _row('a', t2),
+        _row('a', t2),
+    ]
+    assert unique_rows(rows) == [rows[0], rows[3], rows[4]]
+
+
+def test_unique_rows_batch_passes_the_unique_indexes():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE point (device_id TEXT, ts TEXT, message_id TEXT)')
+    conn.execute('CREATE UNIQUE INDEX ix_ts ON point (device_id, ts)')
+    conn.execute('CREATE UNIQUE INDEX ix_msg ON point (device_id, message_id)')
+    ts = datetime(2024, 1, 1)
+    batch = [_row('a', ts, 'm1'), _row('a', ts, 'm1'), _row('a', datetime(2024, 1, 2), 'm2')]
+    insert = 'INSERT INTO point VALUES (:device_id, :ts, :message_id)'
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.executemany(insert, batch)
+    with conn:
+        conn.executemany(insert, unique_rows(batch))
+    assert conn.execute('SELECT COUNT(*) FROM point').fetchone()[0] == 2
+
+
+def test_writer_reports_batches_it_could_not_store():
+    lost = []
+    done = threading.Event()
+
+    def write_batch(rows):
+        raise sqlite3.OperationalError('database is locked')
+
+    def on_failed(rows):
+        lost.extend(rows)
+        done.set()
+
+    writer = TelemetryWriter(write_batch, flush_rows=2, flush_interval_ms=10, on_failed=on_failed).start()
+    rows = [_row('a', datetime(2024, 1, 1, 0, 0, i)) for i in range(2)]
+    writer.submit_many(rows)
+    assert done.wait(5)
+    writer.stop()
+    assert lost == rows
+    assert writer.stats()['failed'] == 2
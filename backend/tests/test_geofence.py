@@ -0,0 +1,112 @@
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from spatial import geofence
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _square(lon, lat, size, hole=None):
+    ring = [[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]
+    rings = [ring]
+    if hole is not None:
+        hlon, hlat, hsize = hole
+        rings.append([[hlon, hlat], [hlon + hsize, hlat], [hlon + hsize, hlat + hsize], [hlon, hlat + hsize]])
+    return {'type': 'Polygon', 'coordinates': rings}
+
+
+def _fix(device, second, lat, lon, inside=None):
+    return {'device_id': device, 'ts': T0 + timedelta(seconds=second), 'lat': lat, 'lon': lon,
+            'inside_project_id': inside}
+
+
+@pytest.mark.parametrize('value, message', [
+    ('not json', 'GeoJSON'),
+    ({'type': 'Point', 'coordinates': [0, 0]}, 'Polygon'),
+    ({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [0, 0]]]}, '3 distinct'),
+    ({'type': 'Polygon', 'coordinates': [[[0, 0], [200, 0], [0, 1]]]}, 'out of range'),
+])
+def test_bad_boundaries_are_rejected(value, message):
+    with pytest.raises(ValueError, match=message):
+        geofence.parse_boundary(value)
+
+
+def test_holes_and_feature_wrappers():
+    feature = json.dumps({'type': 'Feature', 'geometry': _square(0, 0, 10, hole=(4, 4, 2))})
+    fence = geofence.Fence(1, geofence.parse_boundary(feature))
+    assert fence.contains(1, 1)
+    assert not fence.contains(5, 5)
+    assert not fence.contains(11, 1)
+
+
+def test_grid_lookup_matches_a_linear_scan():
+    rng = random.Random(7)
+    boundaries = [(i, _square(rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(0.1, 3))) for i in range(200)]
+    index = geofence.GeofenceIndex.from_boundaries(boundaries)
+    fences = sorted(index.fences, key=lambda f: f.area)
+    for _ in range(2000):
+        lat, lon = rng.uniform(-12, 14), rng.uniform(-12, 14)
+        expected = next((f.project_id for f in fences if f.contains(lat, lon)), None)
+        assert index.locate(lat, lon) == expected
+
+
+def test_tightest_fence_wins_and_huge_fences_overflow():
+    index = geofence.GeofenceIndex.from_boundaries(
+        [(1, {'type': 'Polygon', 'coordinates': [[[-170, -80], [170, -80], [170, 80], [-170, 80]]]}),
+         (2, _square(0, 0, 1)), (3, _square(0.2, 0.2, 0.5))], cell_deg=0.5)
+    assert index.stats()['overflow_fences'] == 1
+    assert index.locate(0.4, 0.4) == 3
+    assert index.locate(0.9, 0.9) == 2
+    assert index.locate(50, 50) == 1
+    assert index.locate(85, 0) is None
+    assert geofence.GeofenceIndex.from_boundaries([(9, 'nope')]).stats()['fences'] == 0
+
+
+def test_tracker_reports_exits_once_and_ignores_late_replays():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return [(7, _square(0, 0, 1))]
+
+    tracker = geofence.GeofenceTracker(loader)
+    rows = [_fix('d', 0, 0.5, 0.5), _fix('d', 1, 0.6, 0.6), _fix('d', 2, 5, 5), _fix('d', 3, 6, 6)]
+    tracker.tag(rows)
+    assert [r['inside_project_id'] for r in rows] == [7, 7, None, None]
+    events = tracker.transitions(reversed(rows))
+    assert [(e['project_id'], e['entered_project_id'], e['lat']) for e in events] == [(7, None, 5)]
+    assert tracker.transitions([_fix('d', 1, 0.5, 0.5, inside=7)]) == []
+    tracker.tag([{'lat': 0, 'lon': 0}])
+    tracker.invalidate()
+    tracker.tag([{'lat': 0, 'lon': 0}])
+    assert len(loads) == 2 and tracker.stats()['exits'] == 1
+
+
+def test_leaving_a_project_over_http_broadcasts_an_exit(main_module, client, make_user, make_project):
+    user_id, auth = make_user()
+    project_id = make_project(user_id, latitude=-40.5, longitude=-120.5)
+    response = client.put(f'/projects/{project_id}/boundary', headers=auth,
+                          json={'boundary': _square(-121, -41, 1)})
+    assert response.status_code == 200
+    assert client.put(f'/projects/{project_id}/boundary', headers=auth,
+                      json={'boundary': {'type': 'Point'}}).status_code == 400
+
+    sub = main_module.broker.subscribe(maxsize=1000)
+    try:
+        device = f'buoy-{uuid.uuid4().hex[:8]}'
+        points = [{'device_id': device, 'lat': lat, 'lon': lon, 'ts': 1704067200 + i}
+                  for i, (lat, lon) in enumerate([(-40.5, -120.5), (-40.4, -120.4), (-30.0, -120.0)])]
+        response = client.post('/iot/telemetry/batch', json=points,
+                               headers={'X-IOT-Key': main_module.app.config['IOT_API_KEY']})
+        assert response.get_json()['accepted'] == 3
+        events = []
+        while sub.qsize():
+            events.append(json.loads(sub.get_nowait().decode()[len('data: '):]))
+    finally:
+        main_module.broker.unsubscribe(sub)
+    exits = [e['payload'] for e in events if e['type'] == 'geofence_exit']
+    assert [(e['device_id'], e['project_id'], e['entered_project_id']) for e in exits] == [(device, project_id, None)]
@@ -0,0 +1,39 @@
+from queue import Queue
+
+from realtime.broker import SSEBroker
+from realtime.heartbeat import CLOSE, HeartbeatScheduler
+
+
+def test_stalled_stream_is_evicted_after_max_missed_ticks():
+    heartbeat = HeartbeatScheduler(interval=3600, max_missed=2)
+    closed = []
+    stream = heartbeat.open(Queue(maxsize=1), on_close=lambda: closed.append(True))
+    heartbeat.tick()  # fills the queue
+    heartbeat.tick()  # missed 1
+    assert not stream.closed
+    heartbeat.tick()  # missed 2
+    assert stream.closed and closed == [True]
+    assert stream.queue.get_nowait() is CLOSE
+    assert heartbeat.stats() == {'interval': 3600, 'live_streams': 0, 'ticks': 3, 'evicted': 1}
+
+
+def test_evicted_subscriber_counts_its_buffer_as_dropped():
+    broker = SSEBroker(maxsize=10)
+    heartbeat = HeartbeatScheduler(interval=3600)
+    sub = broker.subscribe()
+    stream = heartbeat.open(sub, on_close=lambda: broker.unsubscribe(sub))
+    for i in range(4):
+        broker.publish({'n': i})
+    heartbeat._evict(stream)
+    assert sub.delivered == 0 and sub.dropped == 4
+    totals = broker.stats()['totals']
+    assert totals['delivered_disconnected_clients'] == 0 and totals['dropped_disconnected_clients'] == 4
+
+
+def test_frames_are_yielded_until_close():
+    heartbeat = HeartbeatScheduler(interval=3600)
+    stream = heartbeat.open()
+    stream.queue.put(b'data: 1\n\n')
+    stream.queue.put(CLOSE)
+    assert list(heartbeat.iter_frames(stream, initial=b': hello\n\n')) == [b': hello\n\n', b'data: 1\n\n']
+    assert stream.closed and heartbeat.stats()['live_streams'] == 0
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from pinning import merkle
+from pinning.merkle import build_tree, leaf_hash, verify
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 4, 5, 7, 8, 9, 16, 17])
+def test_every_proof_links_its_leaf_to_the_root(count):
+    leaves = [leaf_hash(f'record {i}'.encode()) for i in range(count)]
+    root, proofs = build_tree(leaves)
+    assert len(proofs) == count
+    for leaf, proof in zip(leaves, proofs):
+        assert verify(leaf.hex(), proof, root.hex())
+
+
+def test_proof_does_not_verify_another_leaf():
+    leaves = [leaf_hash(f'record {i}'.encode()) for i in range(5)]
+    root, proofs = build_tree(leaves)
+    assert not verify(leaves[1].hex(), proofs[0], root.hex())
+    assert not verify(leaf_hash(b'forged').hex(), proofs[0], root.hex())
+
+
+def test_empty_tree_is_rejected():
+    with pytest.raises(ValueError):
+        build_tree([])
+
+
+class FakePins:
+    def __init__(self):
+        self.documents = []
+        self.down = False
+
+    def __call__(self, document, filename):
+        if self.down:
+            raise RuntimeError('pinning service unavailable')
+        self.documents.append(document)
+        return f'bafytest{len(self.documents)}'
+
+
+@pytest.fixture
+def batcher(main_module):
+    from models.database_models import MetadataBatch, MetadataRecord
+    store = merkle.SqlBatchStore(main_module.app, main_module.db, MetadataRecord, MetadataBatch)
+    pins = FakePins()
+    batcher = merkle.MetadataBatcher(store, pins, max_records=4, interval=3600)
+    batcher.pins = pins
+    yield batcher
+    batcher.stop()
+
+
+def test_batcher_pins_full_batches_with_verifiable_proofs(batcher, main_module):
+    from models.database_models import MetadataBatch, MetadataRecord
+    # Straight to the store: add() would wake the batching thread at 4 records
+    records = [batcher.store.add({'site': 'A', 'reading': i}) for i in range(10)]
+    assert batcher.flush() == 3
+    assert [len(doc['records']) for doc in batcher.pins.documents] == [4, 4, 2]
+    with main_module.app.app_context():
+        for record in records:
+            row = main_module.db.session.get(MetadataRecord, record['record_id'])
+            batch = main_module.db.session.get(MetadataBatch, row.batch_id)
+            assert batch.status == merkle.PINNED and batch.cid.startswith('bafytest')
+            assert verify(row.leaf_hash, json.loads(row.proof), batch.merkle_root)
+    assert batcher.stats()['pending'] == 0 and batcher.stats()['pinned_records'] == 10
+
+
+def test_failed_pin_returns_records_to_pending(batcher):
+    batcher.store.add({'site': 'B', 'reading': 1})
+    batcher.pins.down = True
+    assert batcher.flush() == 0
+    assert batcher.stats()['pending'] == 1 and batcher.stats()['failures'] == 1
+    batcher.pins.down = False
+    assert batcher.flush() == 1
+    assert batcher.stats()['pending'] == 0
+
+
+def test_field_data_record_is_pending_then_pinned_with_a_proof(batcher, main_module, client, make_user,
+                                                               monkeypatch):
+    monkeypatch.setattr(main_module, 'metadata_batcher', batcher)
+    monkeypatch.setattr(main_module.upload_jobs, 'workers', 0)
+    _, auth = make_user()
+    response = client.post('/field-data', headers=auth, data={
+        'project_id': '1', 'data_type': 'soil_sample', 'description': 'core 3',
+        'location': json.dumps({'lat': 21.9, 'lon': 89.1})})
+    assert response.status_code == 201, response.get_json()
+    record_url = response.get_json()['record_url']
+
+    assert client.get(record_url).status_code == 401
+    record = client.get(record_url, headers=auth).get_json()
+    assert record['status'] == 'pending' and record['metadata']['data_type'] == 'soil_sample'
+
+    assert batcher.flush() == 1
+    record = client.get(record_url, headers=auth).get_json()
+    assert record['status'] == 'pinned' and record['verified'] is True
+    assert record['batch']['cid'] == 'bafytest1'
+    assert record['leaf_hash'] in {entry['leaf_hash'] for entry in batcher.pins.documents[0]['records']}
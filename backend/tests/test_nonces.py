@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from blockchain.nonces import NonceManager
+
+SENDER = '0x00000000000000000000000000000000000000aa'
+
+
+def test_allocates_consecutive_nonces_after_one_sync():
+    node = {'count': 7, 'calls': 0}
+
+    def pending_count(address):
+        node['calls'] += 1
+        return node['count']
+
+    nonces = NonceManager(pending_count)
+    assert [nonces.allocate(SENDER) for _ in range(3)] == [7, 8, 9]
+    assert nonces.allocate(SENDER, 4) == 10
+    assert nonces.peek(SENDER) == 14
+    assert node['calls'] == 1
+
+
+def test_invalidate_resyncs_with_the_node():
+    node = {'count': 3}
+    nonces = NonceManager(lambda address: node['count'])
+    assert nonces.allocate(SENDER) == 3
+    assert nonces.allocate(SENDER) == 4
+    # The send for 4 failed and the node only ever saw 3
+    node['count'] = 4
+    nonces.invalidate(SENDER)
+    assert nonces.allocate(SENDER) == 4
+    assert nonces.stats()['syncs'] == 2
+
+
+def test_reserve_resyncs_when_the_send_raises():
+    nonces = NonceManager(lambda address: 0)
+    with pytest.raises(RuntimeError):
+        with nonces.reserve(SENDER, 2):
+            raise RuntimeError('send failed')
+    assert nonces.peek(SENDER) is None
+    assert nonces.allocate(SENDER) == 0
+
+
+def test_concurrent_allocations_never_repeat():
+    nonces = NonceManager(lambda address: 0)
+    seen, lock = [], threading.Lock()
+
+    def worker():
+        for _ in range(200):
+            nonce = nonces.allocate(SENDER)
+            with lock:
+                seen.append(nonce)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seen) == list(range(1600))
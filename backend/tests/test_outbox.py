@@ -0,0 +1,284 @@
+import hashlib
+import itertools
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from web3.exceptions import ContractLogicError, TransactionNotFound
+
+from blockchain.nonces import NonceManager
+from blockchain.outbox import CONFIRMED, FAILED, PENDING, SIGNING, SUBMITTED, TransactionOutbox
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+class MemoryTxStore:
+    """SqlTxStore's interface over a dict, with the same conditional updates"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+
+    def create(self, kind, function, args, ref_id=None, tx_id=None):
+        tx_id = tx_id or f'tx{next(self._order)}'
+        with self._lock:
+            self._rows[tx_id] = {
+                'id': tx_id, 'kind': kind, 'ref_id': ref_id, 'function': function, 'args': list(args),
+                'status': PENDING, 'from_address': None, 'nonce': None, 'tx_hash': None, 'raw_tx': None,
+                'block_number': None, 'confirmations': 0, 'gas_used': None, 'result': None, 'error': None,
+                'attempts': 0, 'created_at': datetime.utcnow().isoformat(), 'submitted_at': None,
+                'confirmed_at': None, 'updated_at': time.monotonic(),
+            }
+        return tx_id
+
+    def get(self, tx_id):
+        with self._lock:
+            row = self._rows.get(tx_id)
+            return dict(row) if row is not None else None
+
+    def update(self, tx_id, where=None, **fields):
+        with self._lock:
+            row = self._rows[tx_id]
+            if any(row[column] != value for column, value in (where or {}).items()):
+                return False
+            for key, value in fields.items():
+                row[key] = value.isoformat() if isinstance(value, datetime) else value
+            row['updated_at'] = time.monotonic()
+            return True
+
+    def claim(self, tx_id):
+        with self._lock:
+            row = self._rows[tx_id]
+            if row['status'] != PENDING:
+                return None
+            row.update(status=SIGNING, attempts=row['attempts'] + 1, updated_at=time.monotonic())
+            return dict(row)
+
+    def release_stale(self, lease):
+        cutoff = time.monotonic() - lease
+        with self._lock:
+            stale = [row for row in self._rows.values() if row['status'] == SIGNING and row['updated_at'] <= cutoff]
+            for row in stale:
+                row['status'] = PENDING
+            return [row['id'] for row in stale]
+
+    def pending(self):
+        with self._lock:
+            return [tx_id for tx_id, row in self._rows.items() if row['status'] == PENDING]
+
+    def in_flight(self, limit=500):
+        with self._lock:
+            return [dict(row) for row in self._rows.values() if row['status'] == SUBMITTED][:limit]
+
+
+class FakeChain:
+    """Just enough of BlockchainConnector for the outbox: signing, sending and receipts"""
+
+    def __init__(self):
+        self.sent = []
+        self.mined_nonces = 0  # nonces used on chain, by any transaction
+        self.receipts = {}
+        self.sign_hook = None
+        self.nonces = NonceManager(lambda address: self.mined_nonces)
+        self.carbon_credit_address = '0x' + '22' * 20
+        self.carbon_credit_abi = []
+        self.web3 = SimpleNamespace(eth=SimpleNamespace(
+            send_raw_transaction=self.sent.append,
+            get_transaction_receipt=self._receipt,
+            get_transaction=self._transaction,
+            get_transaction_count=lambda address, block: self.mined_nonces,
+            block_number=100,
+        ))
+        self.contracts = SimpleNamespace(get=lambda address, abi: SimpleNamespace(decode_events=lambda r: []))
+
+    def sign_contract_tx(self, address, abi, function, sender, private_key, nonce, args):
+        if self.sign_hook is not None:
+            self.sign_hook()
+        digest = hashlib.sha256(f'{function}{args}{nonce}'.encode()).hexdigest()
+        return '0x' + digest, '0xraw' + digest
+
+    def _receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def _transaction(self, tx_hash):
+        raise TransactionNotFound(tx_hash)
+
+
+def _outbox(store, chain, **kwargs):
+    kwargs.setdefault('poll_interval', 3600)
+    kwargs.setdefault('retry_delay', 3600)
+    return TransactionOutbox(store, lambda: chain, PRIVATE_KEY, **kwargs)
+
+
+def test_two_outboxes_on_one_store_sign_each_intent_once():
+    store, chain = MemoryTxStore(), FakeChain()
+    ids = [store.create('carbon_credit', 'issueCredit', [i]) for i in range(40)]
+    outboxes = [_outbox(store, chain).start() for _ in range(2)]
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(store.get(tx_id)['status'] != SUBMITTED for tx_id in ids):
+        time.sleep(0.01)
+    for outbox in outboxes:
+        outbox.stop()
+    assert [store.get(tx_id)['status'] for tx_id in ids] == [SUBMITTED] * len(ids)
+    assert [store.get(tx_id)['attempts'] for tx_id in ids] == [1] * len(ids)
+    assert len(chain.sent) == len(ids)
+    assert sorted(store.get(tx_id)['raw_tx'] for tx_id in ids) == sorted(chain.sent)
+
+
+def test_signature_is_dropped_when_the_claim_was_taken_over():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', ['0xowner', 1, 'P'])
+    outbox = _outbox(store, chain)
+
+    def lease_expires_mid_sign():
+        # Another process finds the claim stale and takes the intent over
+        assert store.release_stale(0) == [tx_id]
+        assert store.claim(tx_id) is not None
+
+    chain.sign_hook = lease_expires_mid_sign
+    outbox._send(tx_id)
+    tx = store.get(tx_id)
+    assert chain.sent == []
+    assert tx['status'] == SIGNING and tx['attempts'] == 2 and tx['tx_hash'] is None
+
+
+def test_failed_sign_releases_the_claim():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain)
+
+    def node_timeout():
+        raise TimeoutError('estimate_gas timed out')
+
+    chain.sign_hook = node_timeout
+    outbox._send(tx_id)
+    tx = store.get(tx_id)
+    assert tx['status'] == PENDING and tx['attempts'] == 1 and 'timed out' in tx['error']
+    assert outbox.stats()['waiting_retry'] == 1
+
+
+def test_reverting_call_fails_without_retry():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain)
+
+    def reverts():
+        raise ContractLogicError('execution reverted: not an issuer')
+
+    chain.sign_hook = reverts
+    outbox._send(tx_id)
+    assert store.get(tx_id)['status'] == FAILED
+    assert outbox.stats()['failed'] == 1 and outbox.stats()['waiting_retry'] == 0
+
+
+def test_taken_nonce_is_signed_again_once():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain, rebroadcast_after=0)
+    outbox._send(tx_id)
+    first = store.get(tx_id)
+    assert first['status'] == SUBMITTED and first['nonce'] == 0
+
+    # Another transaction from the same account was mined on nonce 0
+    chain.mined_nonces = 1
+    outbox._check(chain, chain.web3.eth.block_number, first)
+    # A second poller holding the same stale row must not queue the intent again
+    outbox._check(chain, chain.web3.eth.block_number, first)
+    assert store.get(tx_id)['status'] == PENDING
+    assert outbox.stats()['queued'] == 1
+
+    chain.nonces.invalidate(outbox.sender)
+    outbox._send(outbox._queue.get_nowait())
+    second = store.get(tx_id)
+    assert second['status'] == SUBMITTED
+    assert second['nonce'] == 1 and second['attempts'] == 2
+    assert second['tx_hash'] != first['tx_hash']
+
+
+def test_start_releases_claims_left_by_a_stopped_process():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    store.claim(tx_id)
+    outbox = _outbox(store, chain, claim_lease=0).start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and store.get(tx_id)['status'] != SUBMITTED:
+        time.sleep(0.01)
+    outbox.stop()
+    assert store.get(tx_id)['status'] == SUBMITTED
+    assert chain.sent == [store.get(tx_id)['raw_tx']]
+
+
+def test_reorged_receipt_goes_back_to_waiting_then_confirms():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain, confirmations=2)
+    outbox._send(tx_id)
+    tx_hash = store.get(tx_id)['tx_hash']
+
+    chain.receipts[tx_hash] = {'blockNumber': 100, 'status': 1, 'gasUsed': 51000}
+    assert outbox.poll() == 1
+    assert store.get(tx_id)['block_number'] == 100 and store.get(tx_id)['status'] == SUBMITTED
+
+    # Block 100 is reorganised away and the transaction is back in the pool
+    del chain.receipts[tx_hash]
+    outbox.poll()
+    tx = store.get(tx_id)
+    assert tx['status'] == SUBMITTED and tx['block_number'] is None and tx['confirmations'] == 0
+    assert outbox.stats()['reorgs'] == 1
+
+    chain.receipts[tx_hash] = {'blockNumber': 101, 'status': 1, 'gasUsed': 51000}
+    chain.web3.eth.block_number = 102
+    outbox.poll()
+    tx = store.get(tx_id)
+    assert tx['status'] == CONFIRMED and tx['block_number'] == 101 and tx['confirmations'] == 2
+    assert tx['gas_used'] == 51000 and tx['tx_hash'] == tx_hash
+
+
+def test_forgotten_transaction_is_rebroadcast_with_the_same_bytes():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain, rebroadcast_after=0)
+    outbox._send(tx_id)
+    first = store.get(tx_id)
+
+    # No receipt, not in the pool, and its nonce is still free
+    outbox.poll()
+    tx = store.get(tx_id)
+    assert chain.sent == [first['raw_tx'], first['raw_tx']]
+    assert tx['status'] == SUBMITTED and tx['tx_hash'] == first['tx_hash'] and tx['nonce'] == first['nonce']
+    assert tx['attempts'] == 2
+    assert outbox.stats()['rebroadcasts'] == 1
+
+
+def test_rebroadcasts_stop_after_max_attempts():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain, rebroadcast_after=0, max_attempts=2)
+    outbox._send(tx_id)
+    outbox.poll()  # attempt 2: rebroadcast
+    stale = store.get(tx_id)
+    outbox.poll()  # attempt 3: over the limit
+    tx = store.get(tx_id)
+    assert tx['status'] == FAILED and tx['attempts'] == 3 and tx['error'].startswith('dropped by the node')
+    assert len(chain.sent) == 2
+
+    # A second poller still holding the submitted row neither counts nor overwrites the failure
+    outbox._check(chain, chain.web3.eth.block_number, stale)
+    assert outbox.stats()['failed'] == 1
+    assert store.get(tx_id)['attempts'] == 3
+
+
+def test_fail_leaves_a_row_another_process_confirmed():
+    store, chain = MemoryTxStore(), FakeChain()
+    tx_id = store.create('carbon_credit', 'issueCredit', [1])
+    outbox = _outbox(store, chain)
+    outbox._send(tx_id)
+    stale = store.get(tx_id)
+    store.update(tx_id, status=CONFIRMED, block_number=100)
+    outbox._fail(stale, stale['attempts'] + 1, 'dropped by the node: not mined')
+    assert store.get(tx_id)['status'] == CONFIRMED
+    assert outbox.stats()['failed'] == 0
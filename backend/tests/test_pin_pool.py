@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from pinning.parallel import PinPool
+
+
+@pytest.fixture
+def pool():
+    pool = PinPool(max_workers=4, per_request=2)
+    yield pool
+    pool.shutdown()
+
+
+def _tracked(active, lock, peak, delay=0.01):
+    def pin(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(delay)
+        with lock:
+            active[0] -= 1
+        return item * 10
+    return pin
+
+
+def test_results_keep_input_order_and_failures_stay_local(pool):
+    def pin(item):
+        time.sleep(0.001 * (10 - item))
+        if item == 3:
+            raise OSError('gateway timeout')
+        return f'cid-{item}'
+
+    results = pool.map_ordered(pin, range(10))
+    assert [value for ok, value in results if ok] == [f'cid-{i}' for i in range(10) if i != 3]
+    assert not results[3][0] and isinstance(results[3][1], OSError)
+    stats = pool.stats()
+    assert (stats['completed'], stats['failed'], stats['in_flight']) == (10, 1, 0)
+
+
+def test_one_request_never_exceeds_its_cap(pool):
+    active, peak, lock = [0], [0], threading.Lock()
+    assert [v for _, v in pool.map_ordered(_tracked(active, lock, peak), range(12))] == [i * 10 for i in range(12)]
+    assert peak[0] == 2
+    peak[0] = 0
+    pool.map_ordered(_tracked(active, lock, peak), range(12), per_request=3)
+    assert peak[0] == 3
+
+
+def test_concurrent_requests_share_the_global_cap(pool):
+    active, peak, lock = [0], [0], threading.Lock()
+    pin = _tracked(active, lock, peak, delay=0.02)
+    callers = [threading.Thread(target=pool.map_ordered, args=(pin, range(8))) for _ in range(4)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join()
+    assert peak[0] <= 4
+    assert pool.stats()['peak_in_flight'] <= 4 and pool.stats()['completed'] == 32
+
+
+def test_field_data_job_reports_failed_images(main_module, monkeypatch):
+    def pin_image(item):
+        if item['filename'] == 'bad.jpg':
+            raise OSError('upload failed')
+        return {'cid': f"cid-{item['filename']}", 'renditions': {}}
+
+    monkeypatch.setattr(main_module, '_pin_image', pin_image)
+    monkeypatch.setattr(main_module, 'metadata_batcher', None)
+    monkeypatch.setattr(main_module, '_pin_metadata', lambda metadata, name: f"meta-{len(metadata['images'])}")
+    files = [{'filename': name} for name in ('a.jpg', 'bad.jpg', 'c.jpg')]
+    result = main_module._run_field_data_upload('job', {'files': files, 'metadata': {'collected_at': 'now'}})
+    assert result['images'] == ['cid-a.jpg', 'cid-c.jpg']
+    assert result['failed_images'] == [{'filename': 'bad.jpg', 'error': 'upload failed'}]
+    assert result['metadata_hash'] == 'meta-2'
+
+
+def test_unexpected_errors_fail_the_job(main_module, monkeypatch):
+    monkeypatch.setattr(main_module, '_pin_image', lambda item: {}['cid'])
+    monkeypatch.setattr(main_module, 'metadata_batcher', None)
+    with pytest.raises(KeyError):
+        main_module._run_field_data_upload('job', {'files': [{'filename': 'a.jpg'}], 'metadata': {'collected_at': 'now'}})
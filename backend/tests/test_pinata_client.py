@@ -0,0 +1,130 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from pinning import stream
+from pinning.client import PinataClient
+from pinning.stream import PinError, parse_reply
+
+
+class PinataStub(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 server answering from a per-path script of (status, body) replies"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size + 2)[:size]
+                if not size:
+                    return body
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _reply(self):
+        server = self.server
+        body = self._read_body()
+        server.seen.append((self.command, self.path, self.headers.get('Authorization'), len(body)))
+        script = server.script.get(self.path, [])
+        status, payload = script.pop(0) if script else (404, 'no script')
+        data = payload if isinstance(payload, bytes) else (
+            json.dumps(payload) if isinstance(payload, dict) else payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _reply
+
+
+@pytest.fixture
+def pinata(monkeypatch):
+    monkeypatch.setattr(stream.time, 'sleep', lambda seconds: None)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PinataStub)
+    server.seen, server.script = [], {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    client = PinataClient('secret-jwt', file_url=f'{base}/pinning/pinFileToIPFS',
+                          json_url=f'{base}/pinning/pinJSONToIPFS', gateway_url=f'{base}/ipfs/',
+                          attempts=3, timeout=5)
+    yield client, server
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_pins_reuse_one_keep_alive_connection(pinata):
+    client, server = pinata
+    server.script['/pinning/pinFileToIPFS'] = [(200, {'IpfsHash': f'QmFile{i}'}) for i in range(5)]
+    server.script['/pinning/pinJSONToIPFS'] = [(200, {'IpfsHash': 'QmJson'})]
+    for i in range(5):
+        result = client.pin_file(io.BytesIO(b'x' * 1000), f'{i}.jpg', 'image/jpeg')
+        assert result['ok'] and result['cid'] == f'QmFile{i}' and result['size'] == 1000
+    assert client.pin_json({'a': 1}, 'meta.json', size=7)['cid'] == 'QmJson'
+    assert client.connections_opened() == 1
+    assert {auth for _, _, auth, _ in server.seen} == {'Bearer secret-jwt'}
+    stats = client.stats()
+    assert stats['by_kind']['file']['calls'] == 5 and stats['by_kind']['file']['bytes'] == 5000
+    assert stats['by_kind']['json']['bytes'] == 7
+
+
+def test_json_pins_retry_service_errors_only(pinata):
+    client, server = pinata
+    server.script['/pinning/pinJSONToIPFS'] = [(503, 'busy'), (429, 'slow down'), (200, {'IpfsHash': 'QmOk'})]
+    assert client.pin_json({'a': 1}, 'meta.json')['cid'] == 'QmOk'
+    server.script['/pinning/pinJSONToIPFS'] = [(401, 'bad jwt'), (200, {'IpfsHash': 'QmNever'})]
+    result = client.pin_json({'a': 1}, 'meta.json')
+    assert not result['ok'] and result['status'] == 401 and 'bad jwt' in result['error']
+    assert len(server.seen) == 4
+    assert client.stats()['by_kind']['json']['failed'] == 1
+
+
+def test_unreadable_success_reply_is_not_retried(pinata):
+    client, server = pinata
+    server.script['/pinning/pinJSONToIPFS'] = [(200, '<html>proxy</html>'), (200, {'IpfsHash': 'QmTwice'})]
+    result = client.pin_json({'a': 1}, 'meta.json')
+    assert not result['ok'] and result['status'] is None and 'unreadable pinning reply' in result['error']
+    server.script['/pinning/pinFileToIPFS'] = [(200, {'Other': 'x'})]
+    result = client.pin_file(io.BytesIO(b'abc'), 'a.bin')
+    assert not result['ok'] and result['status'] is None
+    assert len(server.seen) == 2
+
+
+def test_gateway_fetch_drops_the_api_token_and_enforces_the_limit(pinata, tmp_path):
+    client, server = pinata
+    server.script['/ipfs/QmPhoto'] = [(200, b'p' * 4096), (200, b'p' * 4096)]
+    path = client.fetch('QmPhoto', str(tmp_path / 'photo'))
+    assert open(path, 'rb').read() == b'p' * 4096
+    with pytest.raises(PinError) as error:
+        client.fetch('QmPhoto', str(tmp_path / 'big'), max_bytes=1024)
+    assert error.value.status == 413
+    assert [(method, auth) for method, _, auth, _ in server.seen] == [('GET', None), ('GET', None)]
+
+
+@pytest.mark.parametrize('body, text', [
+    ({'IpfsHash': 'QmOk', 'PinSize': 3}, None),
+    (['QmOk'], 'list'),
+    ({'IpfsHash': ''}, 'empty'),
+    (ValueError('Expecting value'), 'not json'),
+])
+def test_parse_reply(body, text):
+    def read():
+        if isinstance(body, Exception):
+            raise body
+        return body
+
+    response = SimpleNamespace(json=read, text=str(text))
+    if text is None:
+        assert parse_reply(response, 'IpfsHash') == body
+    else:
+        with pytest.raises(PinError, match='unreadable pinning reply') as error:
+            parse_reply(response, 'IpfsHash')
+        assert error.value.status is None
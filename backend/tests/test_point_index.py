@@ -0,0 +1,87 @@
+import random
+import sqlite3
+
+import pytest
+
+from spatial import point_index
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE sites (id INTEGER PRIMARY KEY, latitude REAL, longitude REAL)")
+    assert point_index.ensure_point_index(conn, 'sites', 'latitude', 'longitude')
+    yield conn
+    conn.close()
+
+
+def _rtree(conn):
+    return {row[0]: row[1:] for row in conn.execute("SELECT id, min_lat, min_lon FROM sites_rtree")}
+
+
+def _in_bbox(conn, bbox, paramstyle='qmark'):
+    sql, params = point_index.where_in_bbox('sites', 'latitude', 'longitude', bbox, paramstyle=paramstyle)
+    return sorted(row[0] for row in conn.execute(f"SELECT id FROM sites WHERE {sql}", params))
+
+
+def test_triggers_keep_the_rtree_in_sync(conn):
+    conn.execute("INSERT INTO sites VALUES (1, 21.9, 89.1), (2, 15.4, 73.8), (3, NULL, NULL)")
+    assert set(_rtree(conn)) == {1, 2}
+    conn.execute("UPDATE sites SET latitude = 10.0, longitude = 76.0 WHERE id = 2")
+    assert _rtree(conn)[2] == pytest.approx((10.0, 76.0))
+    conn.execute("UPDATE sites SET latitude = 9.9, longitude = 79.1 WHERE id = 3")
+    conn.execute("UPDATE sites SET latitude = NULL WHERE id = 1")
+    assert set(_rtree(conn)) == {2, 3}
+    conn.execute("DELETE FROM sites WHERE id = 2")
+    assert set(_rtree(conn)) == {3}
+
+
+def test_existing_rows_are_backfilled():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE sites (id INTEGER PRIMARY KEY, latitude REAL, longitude REAL)")
+    conn.execute("INSERT INTO sites VALUES (1, 21.9, 89.1), (2, NULL, 73.8)")
+    point_index.ensure_point_index(conn, 'sites', 'latitude', 'longitude')
+    assert set(_rtree(conn)) == {1}
+
+
+@pytest.mark.parametrize('paramstyle', ['qmark', 'named'])
+def test_bbox_query_matches_a_full_scan(conn, paramstyle):
+    rng = random.Random(7)
+    points = [(i, rng.uniform(-60, 60), rng.uniform(-180, 180)) for i in range(1, 2001)]
+    conn.executemany("INSERT INTO sites VALUES (?, ?, ?)", points)
+    # The last box crosses the antimeridian
+    for bbox in [(80.0, 5.0, 95.0, 25.0), (-10.0, -10.0, 10.0, 10.0), (170.0, -30.0, -170.0, 30.0)]:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        expected = sorted(i for i, lat, lon in points if min_lat <= lat <= max_lat
+                          and (min_lon <= lon <= max_lon if min_lon <= max_lon else lon >= min_lon or lon <= max_lon))
+        assert expected and _in_bbox(conn, bbox, paramstyle) == expected
+
+
+def test_named_params_are_a_dict():
+    sql, params = point_index.where_in_bbox('unindexed', 'lat', 'lon', (170.0, -1.0, -170.0, 1.0), alias='t',
+                                            paramstyle='named')
+    assert '?' not in sql and set(params) == {f'bbox_{i}' for i in range(6)}
+    assert all(f':{name}' in sql for name in params)
+    with pytest.raises(ValueError):
+        point_index.where_in_bbox('unindexed', 'lat', 'lon', (0, 0, 1, 1), paramstyle='format')
+
+
+def test_field_data_bbox_and_nearby_routes(main_module, client, make_user, make_project):
+    from models.database_models import FieldData
+    user_id, auth = make_user()
+    project_id = make_project(user_id)
+    with main_module.app.app_context():
+        for lat, lon in [(21.95, 89.15), (21.5, 88.5), (15.4, 73.8)]:
+            main_module.db.session.add(FieldData(project_id=project_id, collector_id=user_id, data_type='soil',
+                                                 latitude=lat, longitude=lon))
+        main_module.db.session.commit()
+
+    assert client.get('/field-data?bbox=89,21.8,89.3,22').status_code == 401
+    body = client.get(f'/field-data?bbox=89,21.8,89.3,22&project_id={project_id}', headers=auth).get_json()
+    assert [(row['latitude'], row['longitude']) for row in body['field_data']] == [(21.95, 89.15)]
+    body = client.get(f'/field-data?bbox=88,21,90,23&project_id={project_id}', headers=auth).get_json()
+    assert body['total'] == 2
+    assert client.get('/field-data?bbox=1,2,3', headers=auth).status_code == 400
+
+    nearby = client.get('/projects/nearby?lat=21.9&lon=89.1&radius_km=5').get_json()
+    assert project_id in [p['id'] for p in nearby['projects']]
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+from PIL import Image
+
+from pinning.renditions import RenditionPool, is_image, parse_sizes, render
+
+SIZES = {'web': 1600, 'thumb': 320}
+
+
+def _photo(path, size=(3000, 2000), mode='RGB', color=(30, 120, 60), fmt='JPEG', orientation=None):
+    img = Image.new(mode, size, color)
+    kwargs = {}
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs['exif'] = exif
+    img.save(path, fmt, **kwargs)
+    return str(path)
+
+
+@pytest.fixture
+def pool():
+    pool = RenditionPool(processes=1, sizes=SIZES, timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def test_parse_sizes_and_is_image():
+    assert parse_sizes('web:1600, thumb:320,') == SIZES
+    for spec in ('web', 'web:0', 'web:big', ':10'):
+        with pytest.raises(ValueError):
+            parse_sizes(spec)
+    assert is_image('image/JPEG; charset=binary') and is_image(None, 'DRONE.TIF')
+    assert not is_image('application/pdf', 'report.pdf')
+
+
+def test_renditions_cap_the_long_edge(tmp_path):
+    result = render(_photo(tmp_path / 'site.jpg'), str(tmp_path), SIZES)
+    assert (result['width'], result['height']) == (3000, 2000)
+    web, thumb = result['renditions']['web'], result['renditions']['thumb']
+    assert (web['width'], web['height']) == (1600, 1067) and (thumb['width'], thumb['height']) == (320, 213)
+    with Image.open(web['path']) as img:
+        assert img.format == 'JPEG' and img.size == (1600, 1067)
+    assert web['size'] == os.path.getsize(web['path']) and len(web['sha256']) == 64
+
+
+def test_small_originals_get_no_rendition_they_do_not_need(tmp_path):
+    result = render(_photo(tmp_path / 'small.jpg', size=(800, 600)), str(tmp_path), SIZES)
+    assert list(result['renditions']) == ['thumb']
+    assert render(_photo(tmp_path / 'tiny.jpg', size=(300, 200)), str(tmp_path), SIZES)['renditions'] == {}
+
+
+def test_exif_rotation_and_transparency(tmp_path):
+    result = render(_photo(tmp_path / 'portrait.jpg', orientation=6), str(tmp_path), SIZES)
+    assert (result['width'], result['height']) == (2000, 3000)
+    assert (result['renditions']['web']['width'], result['renditions']['web']['height']) == (1067, 1600)
+
+    result = render(_photo(tmp_path / 'logo.png', size=(1000, 1000), mode='RGBA', color=(0, 0, 0, 0), fmt='PNG'),
+                    str(tmp_path), SIZES)
+    with Image.open(result['renditions']['thumb']['path']) as img:
+        assert img.getpixel((5, 5)) == pytest.approx((255, 255, 255), abs=2)
+
+
+def test_pool_survives_undecodable_images(pool, tmp_path):
+    bad = tmp_path / 'bad.jpg'
+    bad.write_bytes(b'\xff\xd8 not really a jpeg')
+    result, error = pool.collect(pool.submit(str(bad), str(tmp_path)), 100)
+    assert result is None and 'UnidentifiedImageError' in error
+    path = _photo(tmp_path / 'site.jpg')
+    result, error = pool.collect(pool.submit(path, str(tmp_path)), os.path.getsize(path))
+    assert error is None and set(result['renditions']) == {'web', 'thumb'}
+    stats = pool.stats()
+    assert (stats['images'], stats['failed'], stats['renditions']['web']['count']) == (1, 1, 1)
+    assert stats['renditions']['web']['original_bytes'] == os.path.getsize(path)
+
+
+def test_disabled_pool_renders_nothing(tmp_path):
+    assert RenditionPool(processes=0).submit(str(tmp_path / 'x.jpg'), str(tmp_path)) is None
+    assert not RenditionPool(processes=2, sizes={}).enabled
+
+
+def test_photo_uploads_pin_their_renditions(main_module, pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(main_module, 'image_renditions', pool)
+    path = _photo(tmp_path / 'mangrove.jpg', size=(2400, 1800))
+    pinned = main_module._pin_image({'path': path, 'filename': 'mangrove.jpg', 'content_type': 'image/jpeg'})
+    assert pinned['cid'] and set(pinned['renditions']) == {'web', 'thumb'}
+    assert 'rendition_error' not in pinned
+
+    bad = tmp_path / 'broken.jpg'
+    bad.write_bytes(b'\xff\xd8\xff truncated')
+    pinned = main_module._pin_image({'path': str(bad), 'filename': 'broken.jpg', 'content_type': 'image/jpeg'})
+    assert pinned['cid'] and pinned['renditions'] == {} and pinned['rendition_error']
@@ -0,0 +1,144 @@
+import io
+import json
+import time
+
+import pytest
+
+from pinning.client import PinBackend, pin_result
+from pinning.jobs import SUCCEEDED, RetryLater, SqlJobStore, UploadJobQueue
+from pinning.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResilientBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScriptedBackend(PinBackend):
+    """Answers each pin with the next status from a script (200 pins, None is no reply)"""
+
+    name = 'scripted'
+
+    def __init__(self, *statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def _pin(self, kind, name):
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            return pin_result(kind, name, True, cid=f'Qm{self.calls}', status=200)
+        return pin_result(kind, name, False, status=status, error=f'status {status}')
+
+    def pin_file(self, source, filename, content_type='application/octet-stream'):
+        return self._pin('file', filename)
+
+    def pin_json(self, data, name, size=None):
+        return self._pin('json', name)
+
+    def fetch(self, cid, path, max_bytes=None):
+        return path
+
+
+def test_breaker_opens_probes_once_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.failure('502')
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure('502')
+    assert breaker.state == OPEN and not breaker.allow()
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+    clock.now += 20
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.failure('still down')
+    assert breaker.state == OPEN and breaker.stats()['times_opened'] == 2
+    clock.now += 30
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.stats()['consecutive_failures'] == 0
+    assert breaker.stats()['rejected'] == 2
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    backend = ResilientBackend(ScriptedBackend(400, 401, 413, 400, 404),
+                               CircuitBreaker(failure_threshold=2, clock=Clock()))
+    for _ in range(5):
+        assert not backend.pin_json({}, 'x.json')['ok']
+    assert backend.breaker.state == CLOSED
+
+
+def test_open_breaker_refuses_pins_without_calling_the_service():
+    clock = Clock()
+    scripted = ScriptedBackend(503, None, 429)
+    backend = ResilientBackend(scripted, CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock))
+    for _ in range(3):
+        backend.pin_file(io.BytesIO(b'x'), 'a.jpg')
+    refused = backend.pin_json({}, 'meta.json')
+    assert refused['circuit_open'] and refused['retry_after'] == pytest.approx(30) and scripted.calls == 3
+    clock.now += 30
+    # The half-open probe is in flight: a concurrent pin is told to come back shortly
+    assert backend.breaker.allow()
+    assert backend.pin_json({}, 'meta.json')['retry_after'] == 5.0
+    backend.breaker.success()
+    assert backend.pin_json({}, 'meta.json')['ok'] and scripted.calls == 4
+    assert backend.stats()['breaker']['state'] == CLOSED
+
+
+def test_a_raising_pin_releases_the_probe():
+    clock = Clock()
+    scripted = ScriptedBackend()
+    scripted.pin_json = lambda data, name, size=None: 1 / 0
+    backend = ResilientBackend(scripted, CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock))
+    with pytest.raises(ZeroDivisionError):
+        backend.pin_json({}, 'x')
+    clock.now += 5
+    with pytest.raises(ZeroDivisionError):
+        backend.pin_json({}, 'x')
+    assert backend.breaker.state == OPEN
+
+
+def test_queued_job_is_deferred_while_the_breaker_is_open(main_module):
+    runs = []
+
+    def handler(job_id, payload):
+        runs.append(time.monotonic())
+        if len(runs) == 1:
+            raise RetryLater(0.1, 'pinning unavailable (circuit open)')
+        return {'cid': 'QmLater'}
+
+    queue = UploadJobQueue(SqlJobStore(main_module.app, main_module.db, main_module.UploadJob),
+                           {'pin': handler}, workers=1)
+    try:
+        job_id = queue.submit('pin', {})
+        deadline = time.monotonic() + 10
+        while queue.store.get(job_id)['status'] != SUCCEEDED and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        queue.stop()
+    job = queue.store.get(job_id)
+    assert job['status'] == SUCCEEDED and job['attempts'] == 2 and job['result'] == {'cid': 'QmLater'}
+    assert runs[1] - runs[0] >= 0.1 and queue.stats()['deferred'] == 1
+
+
+def test_inline_upload_answers_503_with_retry_after(main_module, client, make_user, monkeypatch):
+    clock = Clock()
+    backend = ResilientBackend(ScriptedBackend(), CircuitBreaker(failure_threshold=1, reset_timeout=42, clock=clock))
+    backend.breaker.failure('pinning service error 502')
+    monkeypatch.setattr(main_module, 'ipfs', backend)
+    monkeypatch.setattr(main_module.upload_jobs, 'workers', 0)
+    monkeypatch.setattr(main_module, 'metadata_batcher', None)
+    _, auth = make_user()
+    form = {'project_id': '1', 'data_type': 'water_quality', 'location': json.dumps({'lat': 21.9, 'lon': 89.1})}
+    response = client.post('/field-data', headers=auth, data=form)
+    assert response.status_code == 503 and response.headers['Retry-After'] == '42'
+    assert 'circuit open' in response.get_json()['message']
+    clock.now += 42
+    response = client.post('/field-data', headers=auth, data=form)
+    assert response.status_code == 201 and response.get_json()['metadata_hash'] == 'Qm1'
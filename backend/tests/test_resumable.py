@@ -0,0 +1,134 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from pinning import resumable
+from pinning.resumable import ChunkedUploads, OffsetConflict
+
+CONTENT = os.urandom(700 * 1024 + 3)
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class DroppedConnection(io.RawIOBase):
+    """Delivers the first `cut` bytes, then fails like a reset socket"""
+
+    def __init__(self, data, cut):
+        self._data = io.BytesIO(data[:cut])
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._data.readinto(buffer)
+        if not n:
+            raise ConnectionResetError('connection reset by peer')
+        return n
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ChunkedUploads(str(tmp_path), max_size=len(CONTENT), max_chunk=512 * 1024)
+
+
+def test_dropped_chunk_resumes_after_the_bytes_that_arrived(uploads):
+    session = uploads.create('alice', 'site.jpg', 'image/jpeg', len(CONTENT), sha256=SHA256)
+    with pytest.raises(ConnectionResetError):
+        uploads.append(session['id'], 0, DroppedConnection(CONTENT, 300_000))
+    offset = uploads.get(session['id'])['offset']
+    assert offset == 300_000
+    with pytest.raises(OffsetConflict) as conflict:
+        uploads.append(session['id'], 0, io.BytesIO(CONTENT[:10]))
+    assert conflict.value.offset == offset
+    uploads.append(session['id'], offset, io.BytesIO(CONTENT[offset:offset + 400_000]))
+    uploads.append(session['id'], offset + 400_000, io.BytesIO(CONTENT[offset + 400_000:]))
+    final = uploads.finalize(session['id'])
+    assert final['complete'] and final['sha256'] == SHA256
+    stats = uploads.stats()
+    assert (stats['offset_conflicts'], stats['completed'], stats['bytes_received']) == (1, 1, len(CONTENT))
+
+
+def test_chunk_checksum_rolls_back_bad_or_partial_chunks(uploads):
+    upload_id = uploads.create('alice', 'a.bin', None, len(CONTENT))['id']
+    first = CONTENT[:100_000]
+    with pytest.raises(ValueError, match='checksum'):
+        uploads.append(upload_id, 0, io.BytesIO(first), chunk_sha256=hashlib.sha256(b'other').hexdigest())
+    with pytest.raises(ConnectionResetError):
+        uploads.append(upload_id, 0, DroppedConnection(first, 50_000), chunk_sha256=hashlib.sha256(first).hexdigest())
+    assert uploads.get(upload_id)['offset'] == 0
+    assert uploads.append(upload_id, 0, io.BytesIO(first), chunk_sha256=hashlib.sha256(first).hexdigest())['offset'] \
+        == 100_000
+
+
+def test_restart_rebuilds_the_running_hash_from_disk(uploads, tmp_path):
+    upload_id = uploads.create('alice', 'a.bin', None, len(CONTENT), sha256=SHA256)['id']
+    uploads.append(upload_id, 0, io.BytesIO(CONTENT[:400_000]))
+    restarted = ChunkedUploads(str(tmp_path), max_size=len(CONTENT), max_chunk=512 * 1024)
+    restarted.append(upload_id, 400_000, io.BytesIO(CONTENT[400_000:]))
+    assert restarted.finalize(upload_id)['sha256'] == SHA256
+
+
+def test_limits_and_wrong_file_checksum(uploads):
+    with pytest.raises(ValueError):
+        uploads.create('alice', 'a.bin', None, len(CONTENT) + 1)
+    with pytest.raises(ValueError):
+        uploads.create('alice', 'a.bin', None, 10, sha256='xyz')
+    upload_id = uploads.create('alice', 'a.bin', None, len(CONTENT), sha256='0' * 64)['id']
+    with pytest.raises(ValueError, match='exceeds'):
+        uploads.append(upload_id, 0, io.BytesIO(CONTENT[:600 * 1024]))
+    assert uploads.get(upload_id)['offset'] == 512 * 1024
+    with pytest.raises(ValueError, match='incomplete'):
+        uploads.finalize(upload_id)
+    uploads.append(upload_id, 512 * 1024, io.BytesIO(CONTENT[512 * 1024:]))
+    with pytest.raises(ValueError, match='checksum mismatch'):
+        uploads.finalize(upload_id)
+    assert uploads.get(upload_id) is None
+    assert uploads.get('../../etc/passwd') is None
+
+
+def test_idle_sessions_expire(uploads, monkeypatch):
+    upload_id = uploads.create('alice', 'a.bin', None, 10)['id']
+    now = resumable.time.time()
+    monkeypatch.setattr(resumable.time, 'time', lambda: now + uploads.ttl + 1)
+    assert uploads.purge_expired() == 1 and uploads.get(upload_id) is None
+
+
+def test_chunked_upload_over_http_feeds_a_field_data_job(main_module, client, make_user, monkeypatch):
+    monkeypatch.setattr(main_module.upload_jobs, 'start', lambda: main_module.upload_jobs)
+    _, alice = make_user()
+    _, mallory = make_user()
+    response = client.post('/uploads', headers=alice,
+                           json={'filename': '../drone 1.jpg', 'content_type': 'image/jpeg',
+                                 'size': len(CONTENT), 'sha256': SHA256})
+    assert response.status_code == 201
+    session = response.get_json()
+    url = session['upload_url']
+    assert session['filename'] == 'drone_1.jpg' and response.headers['Upload-Offset'] == '0'
+
+    assert client.put(url, headers=mallory, data=CONTENT, query_string={'offset': 0}).status_code == 404
+    assert client.put(url, headers=alice, data=CONTENT[:10]).status_code == 400
+    response = client.put(url, headers=dict(alice, **{'Upload-Offset': '0'}), data=CONTENT[:300_000])
+    assert response.get_json()['offset'] == 300_000
+    response = client.put(url, headers=dict(alice, **{'Upload-Offset': '0'}), data=CONTENT[:300_000])
+    assert response.status_code == 409 and response.headers['Upload-Offset'] == '300000'
+    assert client.post(f'{url}/finalize', headers=alice).status_code == 409
+    bad_chunk = {'Upload-Offset': '300000', 'X-Chunk-SHA256': '0' * 64}
+    assert client.put(url, headers=dict(alice, **bad_chunk), data=CONTENT[300_000:]).get_json()['offset'] == 300_000
+    client.put(url, headers=dict(alice, **{'Upload-Offset': '300000'}), data=CONTENT[300_000:])
+    assert client.get(url, headers=alice).get_json()['offset'] == len(CONTENT)
+
+    form = {'project_id': '1', 'data_type': 'photo', 'location': json.dumps({'lat': 21.9, 'lon': 89.1}),
+            'upload_ids': session['id']}
+    assert client.post('/field-data', headers=alice, data=form).status_code == 409
+    final = client.post(f'{url}/finalize', headers=alice).get_json()
+    assert final['complete'] and final['sha256'] == SHA256
+    assert client.post('/field-data', headers=mallory, data=form).status_code == 409
+    response = client.post('/field-data', headers=alice, data=form)
+    assert response.status_code == 202
+    # The assembled file moved into the job's staging directory and the session is gone
+    assert client.get(url, headers=alice).status_code == 404
+    job = main_module.upload_jobs.store.get(response.get_json()['job_id'])
+    staged = job['payload']['files'][0]
+    assert staged['sha256'] == SHA256 and open(staged['path'], 'rb').read() == CONTENT
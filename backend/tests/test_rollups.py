@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from models.database_models import TelemetryRollup
+from telemetry.rollups import RollupEngine, haversine_m
+
+TABLE = TelemetryRollup.__table__
+T0 = datetime(2026, 3, 1, 6, 0, 0)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    TABLE.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def _fix(seconds, lat, lon, device='buoy-1', speed=None, altitude=None):
+    return {'device_id': device, 'ts': T0 + timedelta(seconds=seconds), 'lat': lat, 'lon': lon,
+            'speed': speed, 'altitude': altitude}
+
+
+def _write(rollups, engine, rows):
+    with engine.begin() as conn:
+        staged = rollups.apply(conn, TABLE, rows)
+    rollups.commit(staged)
+
+
+def _bucket(engine, resolution, device='buoy-1'):
+    with engine.connect() as conn:
+        rows = conn.execute(select(TABLE).where(TABLE.c.device_id == device, TABLE.c.resolution == resolution)
+                            .order_by(TABLE.c.bucket_start)).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def test_batches_merge_into_one_bucket(engine):
+    rollups = RollupEngine()
+    _write(rollups, engine, [_fix(0, 21.90, 89.10, speed=1.0, altitude=3.0),
+                             _fix(10, 21.91, 89.10, speed=3.0)])
+    _write(rollups, engine, [_fix(20, 21.92, 89.10, speed=2.0, altitude=1.0),
+                             _fix(5, 21.95, 89.20, speed=9.0)])  # late fix: aggregates only
+    minute, = _bucket(engine, '1m')
+    assert minute['point_count'] == 4
+    assert minute['first_ts'] == T0 and minute['last_ts'] == T0 + timedelta(seconds=20)
+    assert (minute['last_lat'], minute['last_lon']) == (21.92, 89.10)
+    expected = haversine_m(21.90, 89.10, 21.91, 89.10) + haversine_m(21.91, 89.10, 21.92, 89.10)
+    assert minute['distance_m'] == pytest.approx(expected)
+    assert (minute['speed_min'], minute['speed_max'], minute['speed_sum'], minute['speed_count']) == (1.0, 9.0, 15.0, 4)
+    assert (minute['alt_min'], minute['alt_max'], minute['alt_count']) == (1.0, 3.0, 2)
+    hour, = _bucket(engine, '1h')
+    assert hour['point_count'] == 4 and hour['distance_m'] == pytest.approx(expected)
+
+
+def test_distance_spans_minute_buckets(engine):
+    rollups = RollupEngine()
+    _write(rollups, engine, [_fix(50, 21.90, 89.10), _fix(70, 21.91, 89.10)])
+    first, second = _bucket(engine, '1m')
+    assert first['distance_m'] == 0.0
+    assert second['distance_m'] == pytest.approx(haversine_m(21.90, 89.10, 21.91, 89.10))
+
+
+def test_restart_takes_the_baseline_from_stored_rollups(engine):
+    rows = [_fix(0, 21.90, 89.10), _fix(30, 21.91, 89.10), _fix(90, 21.93, 89.12), _fix(4000, 21.95, 89.15)]
+    _write(RollupEngine(), engine, rows[:2])
+    # A new process: nothing in memory for buoy-1
+    _write(RollupEngine(), engine, rows[2:])
+
+    reference = create_engine('sqlite://')
+    TABLE.create(reference)
+    _write(RollupEngine(), reference, rows)
+    for resolution in ('1m', '1h'):
+        assert [b['distance_m'] for b in _bucket(engine, resolution)] == pytest.approx(
+            [b['distance_m'] for b in _bucket(reference, resolution)])
+    total = sum(b['distance_m'] for b in _bucket(engine, '1h'))
+    assert total == pytest.approx(sum(haversine_m(a['lat'], a['lon'], b['lat'], b['lon'])
+                                      for a, b in zip(rows, rows[1:])))
+
+
+def test_failed_write_does_not_move_the_baseline(engine):
+    rollups = RollupEngine()
+    _write(rollups, engine, [_fix(0, 21.90, 89.10)])
+    with pytest.raises(RuntimeError):
+        with engine.begin() as conn:
+            rollups.apply(conn, TABLE, [_fix(10, 22.50, 89.10)])
+            raise RuntimeError('insert of the raw points failed')
+    _write(rollups, engine, [_fix(20, 21.91, 89.10)])
+    minute, = _bucket(engine, '1m')
+    assert minute['point_count'] == 2
+    assert minute['distance_m'] == pytest.approx(haversine_m(21.90, 89.10, 21.91, 89.10))
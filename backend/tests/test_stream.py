@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.formparser import parse_form_data
+from werkzeug.test import create_environ
+
+from pinning import stream
+from pinning.stream import MultipartStream, PinError, ReplayableReader, pin_stream
+
+CONTENT = os.urandom(600 * 1024 + 17)
+
+
+class Unseekable(io.RawIOBase):
+    """A request body: read() only"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+
+class FakeService:
+    """Consumes each streamed body like a server would and answers from a script"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.bodies = []
+
+    def __call__(self, url, data, headers, timeout):
+        self.bodies.append((b''.join(data), headers['Content-Type'], getattr(data, 'len', None)))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        status, body = reply
+        return SimpleNamespace(status_code=status, text=str(body), json=lambda: body)
+
+
+def _parse(body, content_type):
+    environ = create_environ(method='POST', input_stream=io.BytesIO(body), content_type=content_type,
+                             content_length=len(body))
+    _, form, files = parse_form_data(environ)
+    return form, files
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(stream.time, 'sleep', lambda seconds: None)
+
+
+def test_body_is_valid_multipart_with_a_matching_length():
+    body = MultipartStream(io.BytesIO(CONTENT), 'drone "1".jpg', content_type='image/jpeg',
+                           fields={'pinataMetadata': '{"name": "x"}'}, chunk_size=64 * 1024)
+    data = b''.join(body)
+    assert body.len == len(data)
+    assert body.sha256 == hashlib.sha256(CONTENT).hexdigest() and body.size == len(CONTENT)
+    form, files = _parse(data, body.content_type)
+    assert form['pinataMetadata'] == '{"name": "x"}'
+    assert files['file'].filename == 'drone _1_.jpg' and files['file'].read() == CONTENT
+
+
+def test_unknown_size_is_sent_without_a_length():
+    body = MultipartStream(Unseekable(CONTENT), 'a.bin')
+    assert not hasattr(body, 'len')
+    assert _parse(b''.join(body), body.content_type)[1]['file'].read() == CONTENT
+
+
+def test_retry_rewinds_a_seekable_source():
+    service = FakeService((503, 'busy'), (200, {'IpfsHash': 'QmTest'}))
+    source = io.BytesIO(b'prefix' + CONTENT)
+    source.seek(6)
+    result = pin_stream(service, 'http://pin', {}, source, 'a.bin', attempts=2)
+    assert result['IpfsHash'] == 'QmTest' and result['size'] == len(CONTENT)
+    first, second = service.bodies
+    assert _parse(first[0], first[1])[1]['file'].read() == CONTENT
+    assert _parse(second[0], second[1])[1]['file'].read() == CONTENT
+    assert 'spilled' not in result
+
+
+def test_retry_replays_an_unseekable_source_from_the_spill_copy():
+    service = FakeService(ConnectionError('reset by peer'), (200, {'IpfsHash': 'QmTest'}))
+    result = pin_stream(service, 'http://pin', {}, Unseekable(CONTENT), 'a.bin', attempts=2,
+                        spool_max=64 * 1024)
+    assert result['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert result['spilled'] is True
+    assert _parse(*service.bodies[1][:2])[1]['file'].read() == CONTENT
+
+
+def test_client_errors_are_not_retried():
+    service = FakeService((400, 'bad request'), (200, {'IpfsHash': 'QmTest'}))
+    with pytest.raises(PinError) as error:
+        pin_stream(service, 'http://pin', {}, io.BytesIO(CONTENT), 'a.bin', attempts=3)
+    assert error.value.status == 400 and len(service.bodies) == 1
+
+
+def test_last_error_is_raised_when_attempts_run_out():
+    service = FakeService((502, 'bad gateway'), (429, 'slow down'))
+    with pytest.raises(PinError) as error:
+        pin_stream(service, 'http://pin', {}, io.BytesIO(CONTENT), 'a.bin', attempts=2)
+    assert error.value.status == 429
+
+
+def test_replayable_reader_rewinds_only_to_the_start():
+    reader = ReplayableReader(Unseekable(b'0123456789'))
+    assert reader.read(4) == b'0123'
+    reader.seek(0)
+    assert reader.read() == b'0123'
+    assert reader.read() == b'456789'
+    with pytest.raises(OSError):
+        reader.seek(3)
+    reader.close()
@@ -0,0 +1,63 @@
+import json
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def post_batch(main_module, client):
+    headers = {'X-IOT-Key': main_module.app.config['IOT_API_KEY']}
+
+    def post(body, content_type='application/json'):
+        data = body if isinstance(body, (str, bytes)) else json.dumps(body)
+        return client.post('/iot/telemetry/batch', data=data, content_type=content_type, headers=headers)
+
+    return post
+
+
+def _point(device, second, **fields):
+    return dict({'device_id': device, 'lat': 21.9, 'lon': 89.1, 'ts': 1704067200 + second}, **fields)
+
+
+def test_json_array_reports_bad_points_by_index(post_batch):
+    device = f'buoy-{uuid.uuid4().hex[:8]}'
+    response = post_batch([_point(device, 0), _point(device, 1, lat=95), _point(device, 2)])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['accepted'], body['rejected'], body['duplicates']) == (2, 1, 0)
+    assert [error['index'] for error in body['errors']] == [1]
+
+
+def test_points_object_and_replayed_points(post_batch):
+    device = f'buoy-{uuid.uuid4().hex[:8]}'
+    points = [_point(device, i) for i in range(3)]
+    assert post_batch({'points': points}).get_json()['accepted'] == 3
+    body = post_batch({'points': points + [_point(device, 3)]}).get_json()
+    assert (body['accepted'], body['duplicates']) == (1, 3)
+
+
+@pytest.mark.parametrize('content_type', ['application/x-ndjson', 'application/ndjson', 'application/jsonlines'])
+def test_ndjson_skips_blank_lines_and_rejects_bad_ones(post_batch, content_type):
+    device = f'buoy-{uuid.uuid4().hex[:8]}'
+    lines = [json.dumps(_point(device, 0)), '', '{not json', json.dumps(_point(device, 1)), '[]']
+    body = post_batch('\n'.join(lines) + '\n', content_type).get_json()
+    assert (body['accepted'], body['rejected']) == (2, 2)
+    # Blank lines are not numbered: indices count points
+    assert [error['index'] for error in body['errors']] == [1, 3]
+
+
+def test_body_that_is_not_a_list_is_rejected(post_batch):
+    assert post_batch({'device_id': 'x'}).status_code == 400
+    assert post_batch('not json at all').status_code == 400
+
+
+def test_oversized_batch_is_refused(post_batch, main_module, monkeypatch):
+    monkeypatch.setitem(main_module.app.config, 'TELEMETRY_BATCH_MAX', 2)
+    device = f'buoy-{uuid.uuid4().hex[:8]}'
+    assert post_batch([_point(device, i) for i in range(3)]).status_code == 413
+    ndjson = '\n'.join(json.dumps(_point(device, i)) for i in range(3))
+    assert post_batch(ndjson, 'application/x-ndjson').status_code == 413
+
+
+def test_wrong_key_is_unauthorized(client):
+    assert client.post('/iot/telemetry/batch', json=[], headers={'X-IOT-Key': 'wrong'}).status_code == 401
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+from telemetry.store import TelemetryWriter, normalize_point, parse_ts
+
+
+@pytest.mark.parametrize('value', [10 ** 30, float('inf'), -10 ** 30])
+def test_parse_ts_out_of_range_is_value_error(value):
+    with pytest.raises(ValueError):
+        parse_ts(value)
+
+
+def test_parse_ts_seconds_and_milliseconds():
+    assert parse_ts(1704067200) == datetime(2024, 1, 1)
+    assert parse_ts(1704067200000) == datetime(2024, 1, 1)
+    assert parse_ts('2024-01-01T01:00:00+01:00') == datetime(2024, 1, 1)
+
+
+def test_normalize_point_validates_and_converts():
+    row = normalize_point({'device_id': 'dev-1', 'lat': '1.5', 'lon': 2, 'altitude': '', 'speed': '3.5',
+                           'ts': 1704067200, 'project_id': '7', 'message_id': 'm-1'})
+    assert row == {'device_id': 'dev-1', 'project_id': 7, 'lat': 1.5, 'lon': 2.0, 'altitude': None, 'speed': 3.5,
+                   'ts': datetime(2024, 1, 1), 'message_id': 'm-1'}
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    {'lat': 1, 'lon': 2},
+    {'device_id': 'd', 'lat': 'x', 'lon': 2},
+    {'device_id': 'd', 'lat': 91, 'lon': 2},
+    {'device_id': 'd', 'lat': 1, 'lon': 2, 'ts': 10 ** 30},
+    {'device_id': 'd', 'lat': 1, 'lon': 2, 'speed': 'fast'},
+])
+def test_normalize_point_rejects_bad_payloads(data):
+    with pytest.raises(ValueError):
+        normalize_point(data)
+
+
+def test_writer_group_commits_and_flushes_on_stop():
+    batches = []
+    writer = TelemetryWriter(batches.append, flush_rows=4, flush_interval_ms=50).start()
+    rows = [{'device_id': 'dev-1', 'n': i} for i in range(10)]
+    assert writer.submit_many(rows) == 10
+    assert writer.flush(5)
+    writer.stop()
+    assert [row for batch in batches for row in batch] == rows
+    assert max(len(batch) for batch in batches) <= 4
+    assert writer.stats()['written'] == 10
+
+
+def test_writer_rejects_when_the_queue_is_full():
+    writer = TelemetryWriter(lambda rows: None, max_queue=2)
+    assert writer.submit_many({'n': i} for i in range(5)) == 2
+    assert writer.stats()['rejected_queue_full'] == 1
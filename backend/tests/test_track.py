@@ -0,0 +1,110 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from telemetry import track
+
+
+def _reference_rdp(xy, tolerance):
+    """Textbook recursive RDP over plain tuples"""
+    def distance(p, a, b):
+        ax, ay = a
+        dx, dy = b[0] - ax, b[1] - ay
+        if dx == dy == 0:
+            return math.hypot(p[0] - ax, p[1] - ay)
+        t = max(0.0, min(1.0, ((p[0] - ax) * dx + (p[1] - ay) * dy) / (dx * dx + dy * dy)))
+        return math.hypot(p[0] - ax - t * dx, p[1] - ay - t * dy)
+
+    def recurse(start, end, keep):
+        if end - start < 2:
+            return
+        dists = [distance(xy[i], xy[start], xy[end]) for i in range(start + 1, end)]
+        i = max(range(len(dists)), key=dists.__getitem__)
+        if dists[i] > tolerance:
+            split = start + 1 + i
+            keep.add(split)
+            recurse(start, split, keep)
+            recurse(split, end, keep)
+
+    keep = {0, len(xy) - 1}
+    recurse(0, len(xy) - 1, keep)
+    return sorted(keep)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_mask_matches_the_recursive_algorithm(seed):
+    rng = random.Random(seed)
+    x = y = 0.0
+    points = []
+    for _ in range(400):
+        x += rng.uniform(0, 20)
+        y += rng.gauss(0, 15)
+        points.append((x, y))
+    for tolerance in (1.0, 10.0, 50.0):
+        mask = track.rdp_mask(np.array(points), tolerance)
+        assert list(np.flatnonzero(mask)) == _reference_rdp(points, tolerance)
+
+
+def test_straight_line_keeps_only_its_ends_and_spikes_survive():
+    xy = np.column_stack((np.arange(100, dtype=float), np.zeros(100)))
+    assert list(np.flatnonzero(track.rdp_mask(xy, 0.5))) == [0, 99]
+    xy[40, 1] = 10.0
+    assert list(np.flatnonzero(track.rdp_mask(xy, 0.5))) == [0, 39, 40, 41, 99]
+
+
+def test_dropped_fixes_stay_within_tolerance():
+    rng = np.random.default_rng(3)
+    lat = 21.9 + np.cumsum(rng.normal(0, 1e-4, 5000))
+    lon = 89.1 + np.cumsum(rng.normal(0, 1e-4, 5000))
+    points = [(a, b, i) for i, (a, b) in enumerate(zip(lat, lon))]
+    kept = track.simplify(points, 25.0)
+    assert kept[0] == points[0] and kept[-1] == points[-1] and len(kept) < len(points) / 2
+    xy = track.project(lat, lon)
+    kept_idx = [p[2] for p in kept]
+    for start, end in zip(kept_idx, kept_idx[1:]):
+        if end - start > 1:
+            assert track._segment_distances(xy, start, end).max() <= 25.0 + 1e-6
+
+
+def test_long_noisy_track_does_not_recurse():
+    rng = np.random.default_rng(1)
+    xy = np.column_stack((np.arange(100_000, dtype=float), rng.normal(0, 5, 100_000)))
+    assert track.rdp_mask(xy, 1.0).sum() > 1000
+
+
+def test_antimeridian_crossing_stays_continuous():
+    xy = track.project(np.array([0.0, 0.0, 0.0]), np.array([179.9, -179.95, -179.8]))
+    steps = np.diff(xy[:, 0])
+    assert (steps > 0).all() and steps.max() < 20_000
+
+
+def test_tolerance_halves_per_zoom_level():
+    assert track.tolerance_for_zoom(0) == pytest.approx(156543.03392)
+    assert track.tolerance_for_zoom(12) == pytest.approx(track.tolerance_for_zoom(11) / 2)
+    assert track.tolerance_for_zoom(10, lat=60) == pytest.approx(track.tolerance_for_zoom(10) / 2)
+    with pytest.raises(ValueError):
+        track.parse_zoom('25')
+
+
+def test_short_tracks_and_zero_tolerance_are_returned_as_is():
+    points = [(0.0, 0.0, 1), (0.0, 1e-6, 2), (0.0, 2e-6, 3)]
+    assert track.simplify(points[:2], 10) == points[:2]
+    assert track.simplify(points, 0) == points
+
+
+def test_cache_invalidates_per_device_and_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(track.time, 'monotonic', lambda: now[0])
+    cache = track.TrackCache(maxsize=2, ttl=60)
+    cache.put(('a', 1), 'track a')
+    cache.put(('b', 1), 'track b')
+    cache.invalidate_devices(['a'])
+    assert cache.get(('a', 1)) is None and cache.get(('b', 1)) == 'track b'
+    now[0] += 61
+    assert cache.get(('b', 1)) is None
+    cache.put(('c', 1), 1)
+    cache.put(('d', 1), 2)
+    cache.put(('e', 1), 3)
+    assert cache.get(('c', 1)) is None and cache.stats()['entries'] == 2
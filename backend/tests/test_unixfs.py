@@ -0,0 +1,166 @@
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+from pinning import unixfs
+from pinning.backends import FilesystemBackend
+
+# Published `ipfs add --cid-version=1` results for single-block content
+KNOWN = {
+    b'': 'bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku',
+    b'hello world': 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e',
+    b'hello world\n': 'bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4',
+}
+
+
+def _varint(buf, pos):
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _fields(buf):
+    """Decode a protobuf message into [(field, value)]; length-delimited values stay bytes"""
+    out, pos = [], 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        if key & 7 == 2:
+            size, pos = _varint(buf, pos)
+            out.append((key >> 3, bytes(buf[pos:pos + size])))
+            pos += size
+        else:
+            value, pos = _varint(buf, pos)
+            out.append((key >> 3, value))
+    return out
+
+
+def _decode_cid(text):
+    raw = base64.b32decode(text[1:].upper() + '=' * (-len(text[1:]) % 8))
+    version, pos = _varint(raw, 0)
+    codec, pos = _varint(raw, pos)
+    assert version == 1 and raw[pos:pos + 2] == bytes([0x12, 32])
+    return codec, raw[pos + 2:]
+
+
+class BlockRecorder(unixfs.UnixfsHasher):
+    """Keeps every block it makes, keyed by CID, so the tree can be walked"""
+
+    def __init__(self, chunk_size=unixfs.CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.blocks = {}
+
+    def _leaf(self, chunk):
+        super()._leaf(chunk)
+        self.blocks[self._leaves[-1][0]] = bytes(chunk)
+
+
+def _walk(blocks, cid):
+    """Reassemble the file under cid, checking each dag-pb node as it goes; returns (content, depth)"""
+    codec, digest = _decode_cid(unixfs.cid_string(cid))
+    if codec == unixfs.RAW:
+        return blocks[cid], 0
+    block = _node_block(blocks, cid)
+    assert codec == unixfs.DAG_PB and hashlib.sha256(block).digest() == digest
+    fields = _fields(block)
+    # Canonical dag-pb: all links, then the data field
+    assert [f for f, _ in fields] == [2] * (len(fields) - 1) + [1]
+    data = dict((f, v) for f, v in _fields(fields[-1][1]) if f != 4)
+    blocksizes = [v for f, v in _fields(fields[-1][1]) if f == 4]
+    assert data[1] == unixfs.UNIXFS_FILE
+    assert len(fields) - 1 <= unixfs.MAX_LINKS
+    content, depths = b'', set()
+    for (_, link), blocksize in zip(fields[:-1], blocksizes, strict=True):
+        link = dict(_fields(link))
+        assert link[2] == b''
+        child, depth = _walk(blocks, link[1])
+        assert len(child) == blocksize
+        assert link[3] == (len(child) if depth == 0 else len(_node_block(blocks, link[1])) + _tsize(blocks, link[1]))
+        content += child
+        depths.add(depth)
+    assert data[3] == len(content) and len(depths) == 1
+    return content, depths.pop() + 1
+
+
+def _node_block(blocks, cid):
+    return blocks[('node', cid)]
+
+
+def _tsize(blocks, cid):
+    return sum(dict(_fields(link))[3] for f, link in _fields(_node_block(blocks, cid)) if f == 2)
+
+
+@pytest.fixture
+def record_nodes(monkeypatch):
+    blocks = {}
+    original = unixfs.file_node
+
+    def file_node(children):
+        block, link = original(children)
+        blocks[('node', link[0])] = block
+        return block, link
+
+    monkeypatch.setattr(unixfs, 'file_node', file_node)
+    return blocks
+
+
+@pytest.mark.parametrize('content, cid', KNOWN.items())
+def test_single_block_content_matches_published_cids(content, cid):
+    assert unixfs.cid_of_bytes(content) == cid
+
+
+def test_one_full_chunk_is_still_a_raw_leaf():
+    content = os.urandom(unixfs.CHUNK_SIZE)
+    codec, digest = _decode_cid(unixfs.cid_of_bytes(content))
+    assert codec == unixfs.RAW and digest == hashlib.sha256(content).digest()
+
+
+def test_multi_chunk_file_is_one_balanced_dag_pb_node(record_nodes):
+    content = os.urandom(2 * unixfs.CHUNK_SIZE + 1234)
+    hasher = BlockRecorder()
+    hasher.update(content)
+    cid = hasher.cid()
+    assert cid.startswith('bafybei')
+    hasher.blocks.update(record_nodes)
+    root = unixfs.cid_v1(unixfs.DAG_PB, _decode_cid(cid)[1])
+    assert _walk(hasher.blocks, root) == (content, 1)
+
+
+def test_more_than_max_links_leaves_adds_a_level(record_nodes):
+    # Small chunks keep the data small; the tree shape does not depend on the chunk size
+    content = os.urandom(64 * (unixfs.MAX_LINKS * 2 + 5))
+    hasher = BlockRecorder(chunk_size=64)
+    hasher.update(content)
+    root = unixfs.cid_v1(unixfs.DAG_PB, _decode_cid(hasher.cid())[1])
+    hasher.blocks.update(record_nodes)
+    assert _walk(hasher.blocks, root) == (content, 2)
+    top = [link for f, link in _fields(_node_block(hasher.blocks, root)) if f == 2]
+    assert len(top) == 3
+
+
+@pytest.mark.parametrize('piece', [1, 1000, unixfs.CHUNK_SIZE - 1, unixfs.CHUNK_SIZE + 7])
+def test_cid_does_not_depend_on_how_bytes_arrive(piece):
+    content = os.urandom(3 * unixfs.CHUNK_SIZE + 99) if piece > 1 else os.urandom(5000)
+    hasher = unixfs.UnixfsHasher()
+    for i in range(0, len(content), piece):
+        hasher.update(memoryview(content)[i:i + piece])
+    assert hasher.cid() == unixfs.cid_of_bytes(content)
+    assert hasher.sha256() == hashlib.sha256(content).hexdigest() and hasher.size == len(content)
+
+
+def test_local_store_is_content_addressed(tmp_path):
+    backend = FilesystemBackend(str(tmp_path))
+    content = os.urandom(unixfs.CHUNK_SIZE + 10)
+    first = backend.pin_file(io.BytesIO(content), 'a.bin')
+    second = backend.pin_file(io.BytesIO(content), 'b.bin')
+    assert first['cid'] == second['cid'] == unixfs.cid_of_bytes(content)
+    assert backend.pin_file(io.BytesIO(b'hello world\n'), 'hello.txt')['cid'] == KNOWN[b'hello world\n']
+    assert open(backend.fetch(first['cid'], str(tmp_path / 'out')), 'rb').read() == content
+    assert os.listdir(tmp_path / 'tmp') == []
@@ -0,0 +1,38 @@
+import json
+
+
+def _submit_field_data(client, auth):
+    response = client.post('/field-data', headers=auth, data={
+        'project_id': '1', 'data_type': 'water_quality', 'location': json.dumps({'lat': 21.9, 'lon': 89.1})})
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()
+
+
+def test_job_status_is_only_visible_to_its_submitter(main_module, client, make_user, monkeypatch):
+    # Leave the job queued: submit() would otherwise start the workers
+    monkeypatch.setattr(main_module.upload_jobs, 'start', lambda: main_module.upload_jobs)
+    _, owner = make_user()
+    _, other = make_user()
+    status_url = _submit_field_data(client, owner)['status_url']
+
+    assert client.get(status_url).status_code == 401
+    assert client.get(status_url, headers=other).status_code == 404
+    job = client.get(status_url, headers=owner).get_json()
+    assert job['status'] == 'queued' and job['kind'] == 'field_data'
+    assert 'payload' not in job
+
+
+def test_missing_job_is_not_found(client, make_user):
+    _, auth = make_user()
+    assert client.get('/upload-jobs/does-not-exist', headers=auth).status_code == 404
+
+
+def test_first_request_starts_the_background_workers_once(main_module, client, monkeypatch):
+    started = []
+    monkeypatch.setitem(main_module.app.config, 'BACKGROUND_WORKERS', True)
+    monkeypatch.setattr(main_module, '_background_started', False)
+    monkeypatch.setattr(main_module.upload_jobs, 'start', lambda: started.append('upload_jobs'))
+    monkeypatch.setattr(main_module.metadata_batcher, 'start', lambda: started.append('metadata_batcher'))
+    client.get('/health')
+    client.get('/health')
+    assert started == ['upload_jobs', 'metadata_batcher']
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+from telemetry.wire import decode_points, encode_points
+
+
+def test_decode_points_spreads_untimed_records_per_device():
+    body = encode_points([{'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 0} for _ in range(3)]
+                         + [{'device_id': 'dev-2', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 0}])
+    rows, indices, errors = decode_points(body)
+    assert errors == [] and indices == [0, 1, 2, 3]
+    dev1 = [row['ts'] for row in rows if row['device_id'] == 'dev-1']
+    assert len(set(dev1)) == 3
+
+
+def test_decode_points_rejects_out_of_range_ts_only():
+    body = encode_points([
+        {'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 2 ** 62},
+        {'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': -2 ** 62},
+        {'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 1704067200000},
+    ])
+    rows, indices, errors = decode_points(body)
+    assert indices == [2]
+    assert rows[0]['ts'] == datetime(2024, 1, 1)
+    assert [error['index'] for error in errors] == [0, 1]
+    assert {error['error'] for error in errors} == {'ts out of range'}
+
+
+def test_encode_decode_round_trip():
+    points = [
+        {'device_id': 'dev-1', 'project_id': 3, 'lat': -33.8688197, 'lon': 151.2092955, 'altitude': 12.5,
+         'speed': 1.25, 'ts_ms': 1704067200123},
+        {'device_id': 'dev-2', 'lat': 0.0, 'lon': 0.0, 'ts_ms': 1704067200000},
+    ]
+    rows, indices, errors = decode_points(encode_points(points))
+    assert errors == [] and indices == [0, 1]
+    assert rows[0]['device_id'] == 'dev-1' and rows[0]['project_id'] == 3
+    assert abs(rows[0]['lat'] - points[0]['lat']) < 1e-7 and abs(rows[0]['lon'] - points[0]['lon']) < 1e-7
+    assert rows[0]['altitude'] == 12.5 and rows[0]['speed'] == 1.25
+    assert rows[0]['ts'] == datetime(2024, 1, 1, 0, 0, 0, 123000)
+    assert rows[1]['project_id'] is None and rows[1]['altitude'] is None and rows[1]['speed'] is None
+
+
+def test_partial_record_is_rejected():
+    body = encode_points([{'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 1}])
+    with pytest.raises(ValueError):
+        decode_points(body[:-1])
+
+
+def test_bad_records_are_reported_by_index():
+    body = encode_points([
+        {'device_id': '', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 1},
+        {'device_id': 'dev-1', 'lat': 95.0, 'lon': 2.0, 'ts_ms': 1},
+        {'device_id': 'dev-1', 'lat': 1.0, 'lon': 2.0, 'ts_ms': 1},
+    ])
+    rows, indices, errors = decode_points(memoryview(body))
+    assert indices == [2]
+    assert errors == [{'index': 0, 'error': 'device_id is required'}, {'index': 1, 'error': 'lat/lon out of range'}]